@@ -1,40 +1,239 @@
+import asyncio
 import logging
+from functools import partial
 
+from .deadline import TickDeadline, TickOverran
 from .errors import RetryableError
-from .port_synchronizer import PortSynchronizer
-from .ports import Clock
+from .events import EventBus, FatalError, RetryScheduled
+from .leader import LeaderElection
+from .logs import logged_tick
+from .metrics import Metrics, collect_scheduler
+from .port_synchronizer import AsyncPortSynchronizer, PortSynchronizer
+from .ports import AsyncClock, Clock
+from .reload import AsyncReloader, Reloader
+from .retry_log import RetryLog
+from .scheduler import Scheduler
+from .tracing import span
+from .transport import Connections
 
 
-class Application:
+def _get_retry_delay(
+    error: RetryableError, retry_interval: float, events: EventBus, log: RetryLog
+) -> float:
+    """Report a retryable error, and answer how long to wait it out."""
+    is_logged = log.error(error)
+    if error.get_retry_immediately():
+        delay = 0.0
+        if is_logged:
+            logging.info("Retrying immediately")
+    else:
+        delay = retry_interval
+        if is_logged:
+            logging.info("Retrying in %d seconds", retry_interval)
+    events.publish(RetryScheduled(repr(error), delay))
+    return delay
+
+
+def _count_tick(metrics: Metrics | None, error: RetryableError | None) -> None:
+    if metrics is not None:
+        metrics.count_tick(error)
+
+
+class Application:  # pylint: disable=too-many-instance-attributes
     """The lifecycle: synchronize, wait, and retry whatever is worth retrying.
 
     Anything a retry cannot fix is left to propagate, for the entry point to
     turn into an exit code.
+
+    Given `connections` set to prewarm, their connections are opened again
+    shortly before each tick, for it not to pay for opening them itself.
+    Given a `tick_deadline`, every request a tick makes is bound by it.
+    Given `metrics`, every tick is counted, and so is what it failed on,
+    and the scheduler's lag is exported.
+    Given `events`, retries and the error that stopped it are published.
+    Retryable errors are logged through a RetryLog, for a service away for
+    hours not to fill the logs with the same traceback.
+    Given a `leader` election, ticks are only run while leading, and a
+    standby looks again every so often whether it now does.
+    Given a `reloader`, changes to the config file are applied before the
+    next tick, whether it leads or not.
     """
 
-    def __init__(
+    def __init__(  # pylint: disable=too-many-arguments
         self,
         synchronizer: PortSynchronizer,
         clock: Clock,
         retry_interval: float,
         success_interval: float,
+        scheduler: Scheduler | None = None,
+        *,
+        connections: Connections | None = None,
+        tick_deadline: TickDeadline | None = None,
+        metrics: Metrics | None = None,
+        events: EventBus | None = None,
+        leader: LeaderElection | None = None,
+        reloader: Reloader | None = None,
     ) -> None:
         self._synchronizer = synchronizer
-        self._clock = clock
+        self._scheduler = scheduler or Scheduler(clock)
+        if metrics is not None:
+            metrics.register("scheduler", partial(collect_scheduler, self._scheduler))
         self._retry_interval = retry_interval
         self._success_interval = success_interval
+        self._connections = connections
+        self._tick_deadline = tick_deadline
+        self._metrics = metrics
+        self._events = events or EventBus()
+        self._retry_log = RetryLog(clock)
+        self._leader = leader
+        self._reloader = reloader
+
+    def _reload(self) -> None:
+        if self._reloader is None or (change := self._reloader.reload()) is None:
+            return
+        self._retry_interval = change.retry_interval
+        self._success_interval = change.success_interval
+        self._tick_deadline = change.tick_deadline
+        self._synchronizer.reconfigure(
+            change.wait_for_first_port_duration, change.forwarder, change.service
+        )
+        for close in change.retired:
+            close()
+
+    def _synchronize(self) -> float:
+        """Synchronize once, and answer how long to wait before the next time."""
+        self._reload()
+        if self._leader is not None and not self._leader.is_leader():
+            return self._leader.get_standby_interval()
+        try:
+            with logged_tick(), span("tick"):
+                if self._tick_deadline is None:
+                    self._synchronizer.synchronize()
+                else:
+                    with self._tick_deadline.enforce():
+                        self._synchronizer.synchronize()
+        except RetryableError as error:
+            _count_tick(self._metrics, error)
+            return _get_retry_delay(
+                error, self._retry_interval, self._events, self._retry_log
+            )
+        _count_tick(self._metrics, None)
+        self._retry_log.success()
+        return self._success_interval
+
+    def _tick(self) -> float:
+        delay = self._synchronize()
+        if self._connections is not None:
+            lead = self._connections.get_prewarm_lead()
+            if 0 < lead < delay:
+                # Run once: prewarm answers None, so it is not scheduled again.
+                self._scheduler.schedule(self._connections.prewarm, delay - lead)
+        return delay
 
     def run(self) -> None:
         """Run until an error no retry can fix, which is then raised."""
+        self._scheduler.schedule(self._tick)
+        try:
+            self._scheduler.run()
+        except Exception as error:
+            self._events.publish(FatalError(repr(error)))
+            raise
+
+
+class AsyncApplication:  # pylint: disable=too-many-instance-attributes
+    """The same lifecycle on asyncio, where cancelling `run` cancels whatever
+    it is awaiting, a request midway included.
+
+    A tick outliving its `tick_deadline` is cancelled, which asyncio can do
+    and threads cannot, and retried like any other that failed.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        synchronizer: AsyncPortSynchronizer,
+        clock: AsyncClock,
+        retry_interval: float,
+        success_interval: float,
+        connections: Connections | None = None,
+        *,
+        tick_deadline: TickDeadline | None = None,
+        metrics: Metrics | None = None,
+        events: EventBus | None = None,
+        leader: LeaderElection | None = None,
+        reloader: AsyncReloader | None = None,
+    ) -> None:
+        self._synchronizer = synchronizer
+        self._clock = clock
+        self._retry_interval = retry_interval
+        self._success_interval = success_interval
+        self._connections = connections
+        self._tick_deadline = tick_deadline
+        self._metrics = metrics
+        self._events = events or EventBus()
+        self._retry_log = RetryLog(clock)
+        self._leader = leader
+        self._reloader = reloader
+
+    async def _reload(self) -> None:
+        if self._reloader is None or (change := self._reloader.reload()) is None:
+            return
+        self._retry_interval = change.retry_interval
+        self._success_interval = change.success_interval
+        self._tick_deadline = change.tick_deadline
+        self._synchronizer.reconfigure(
+            change.wait_for_first_port_duration, change.forwarder, change.service
+        )
+        for close in change.retired:
+            await close()
+
+    async def _synchronize(self) -> None:
+        if self._tick_deadline is None:
+            await self._synchronizer.synchronize()
+            return
+        try:
+            with self._tick_deadline.enforce():
+                async with asyncio.timeout(self._tick_deadline.get_duration()):
+                    await self._synchronizer.synchronize()
+        except TimeoutError as error:
+            raise TickOverran() from error
+
+    async def _wait(self, delay: float) -> None:
+        """Wait out `delay`, prewarming the connections towards its end."""
+        if self._connections is not None:
+            lead = self._connections.get_prewarm_lead()
+            if 0 < lead < delay:
+                await self._clock.sleep(delay - lead)
+                due = self._clock.monotonic() + lead
+                await self._connections.prewarm_async()
+                # The prewarm's own time comes out of the lead, not after it.
+                delay = max(0.0, due - self._clock.monotonic())
+        await self._clock.sleep(delay)
+
+    async def run(self) -> None:
+        """Run until an error no retry can fix, which is then raised."""
+        try:
+            await self._run()
+        except Exception as error:
+            self._events.publish(FatalError(repr(error)))
+            raise
+
+    async def _run(self) -> None:
         while True:
+            await self._reload()
+            if self._leader is not None and not self._leader.is_leader():
+                await self._clock.sleep(self._leader.get_standby_interval())
+                continue
             try:
-                self._synchronizer.synchronize()
+                with logged_tick(), span("tick"):
+                    await self._synchronize()
             except RetryableError as error:
-                logging.error("Retryable error in lifecycle", exc_info=error)
-                if error.get_retry_immediately():
-                    logging.info("Retrying immediately")
-                else:
-                    logging.info("Retrying in %d seconds", self._retry_interval)
-                    self._clock.sleep(self._retry_interval)
+                _count_tick(self._metrics, error)
+                delay = _get_retry_delay(
+                    error, self._retry_interval, self._events, self._retry_log
+                )
             else:
-                self._clock.sleep(self._success_interval)
+                _count_tick(self._metrics, None)
+                self._retry_log.success()
+                delay = self._success_interval
+            if delay:
+                await self._wait(delay)
@@ -1,3 +1,4 @@
+import asyncio
 import time
 
 
@@ -9,3 +10,13 @@ class SystemClock:
 
     def sleep(self, duration: float) -> None:
         time.sleep(duration)
+
+
+class AsyncSystemClock:
+    """The real clock, waited on without holding up the event loop."""
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    async def sleep(self, duration: float) -> None:
+        await asyncio.sleep(duration)
@@ -1,10 +1,41 @@
+import os
+import re
+import tempfile
+import tomllib
 from dataclasses import dataclass
-from os import getenv
+from os.path import isfile
+from typing import overload
 
+from .deadline import DEFAULT_TICK_DEADLINE
 from .errors import ReturnCodes
+from .health import DEFAULT_STALE_INTERVALS
+from .history import DAY, DEFAULT_HISTORY_RETENTION_DAYS
+from .leader import DEFAULT_LEASE_DURATION
+from .limiter import DEFAULT_LIMIT_PER_HOST
+from .middleware import (
+    DEFAULT_FORWARDER_CHAIN,
+    DEFAULT_SERVICE_CHAIN,
+    FORWARDER_MIDDLEWARES,
+    SERVICE_MIDDLEWARES,
+    TIMING,
+)
+from .recorder import DEFAULT_RECORDED_EXCHANGES
+from .resolver import DEFAULT_DNS_CACHE_TTL, DEFAULT_DNS_STALE_TIMEOUT
+from .timeouts import (
+    DEFAULT_TIMEOUT,
+    DEFAULT_TIMEOUT_CEILING,
+    DEFAULT_TIMEOUT_FLOOR,
+    DEFAULT_TIMEOUT_MULTIPLIER,
+)
+from .tls import TlsSettings
+from .transport import DEFAULT_KEEPALIVE_EXPIRY, DEFAULT_POOL_SIZE, ConnectionSettings
 
 QBITTORRENT_SERVICE_TYPE = "qbittorrent"
 
+# What RUNTIME may pick: blocking calls on the main thread, or asyncio.
+SYNC_RUNTIME = "sync"
+ASYNCIO_RUNTIME = "asyncio"
+
 
 class ConfigurationError(Exception):
     """Exception raised when the environment does not describe a usable setup.
@@ -18,11 +49,44 @@ class ConfigurationError(Exception):
         self.return_code = return_code
 
 
+class _Settings:
+    """Where the configuration is read from: the file CONFIG_FILE names, if
+    any, then the environment for whatever the file leaves out.
+
+    The names read are remembered, for a file setting one that nothing reads,
+    misspelt for instance, to be told rather than silently ignored.
+    """
+
+    def __init__(self, path: str | None, values: dict[str, str]) -> None:
+        self._path = path
+        self._values = values
+        self._read: set[str] = set()
+
+    @overload
+    def get(self, name: str) -> str | None: ...
+    @overload
+    def get(self, name: str, default: str) -> str: ...
+    def get(self, name: str, default: str | None = None) -> str | None:
+        self._read.add(name)
+        return self._values.get(name, os.environ.get(name, default))
+
+    def describe(self, name: str) -> str:
+        """Name a setting as where it is read from, for errors to point at it."""
+        if name in self._values:
+            return f"Setting {name} in {self._path}"
+        return f"Environment variable {name}"
+
+    def get_unread(self) -> list[str]:
+        return sorted(self._values.keys() - self._read)
+
+
 @dataclass(frozen=True)
 class QBittorrentConfig:
     url: str
     username: str
     password: str
+    tls: TlsSettings = TlsSettings()
+    timeout: int = DEFAULT_TIMEOUT
 
 
 # What SERVICE_TYPE picked, widened as more services become supported.
@@ -30,61 +94,348 @@ type ServiceConfig = QBittorrentConfig
 
 
 @dataclass(frozen=True)
-class Config:
+class Config:  # pylint: disable=too-many-instance-attributes
     gluetun_url: str
     gluetun_api_key: str | None
+    gluetun_tls: TlsSettings
+    gluetun_timeout: int
     gluetun_port_wait_duration: int
+    gluetun_port_cache_ttl: int
     retry_interval: int
     success_interval: int
+    # How long a tick may take, or 0 for as long as it takes.
+    tick_deadline: int
+    host_concurrency_limit: int
+    connections: ConnectionSettings
+    # Where to serve the local endpoints from, if anywhere.
+    server_address: tuple[str, int] | None
+    # Whether to count what glueforward does, and serve it there.
+    metrics: bool
+    # Where to write the file `glueforward healthcheck` checks, if anywhere.
+    health_file: str | None
+    # How many SUCCESS_INTERVALs without a success make glueforward degraded.
+    health_stale_intervals: int
+    # Where to export each tick's spans, if anywhere: a file, a collector.
+    trace_file: str | None
+    trace_otlp_url: str | None
+    # Where profiles and allocation diffs are written when signalled for.
+    profile_directory: str
+    # How many of the last exchanges with the services to keep, or 0 for none.
+    flight_recorder_size: int
+    # Where to record the ports and failures seen, if anywhere, and for how
+    # long, in seconds.
+    history_file: str | None
+    history_retention: int
+    # The lease replicas share to elect which one synchronizes, if any, and
+    # how long a leader keeps it without renewing it.
+    leader_lease_file: str | None
+    leader_lease_duration: int
+    # What each side's calls go through, outermost first, by name.
+    gluetun_middlewares: tuple[str, ...]
+    service_middlewares: tuple[str, ...]
+    runtime: str
     service: ServiceConfig
+    # The file read on top of the environment, if any, and watched for changes.
+    config_file: str | None = None
+
+
+def _format_value(path: str, name: str, value: object) -> str:
+    """Write a TOML value as the environment would hold it."""
+    match value:
+        # Before int, which bool is a subclass of.
+        case bool():
+            return str(value).lower()
+        case int() | str():
+            return str(value)
+        case list() if all(isinstance(item, str) for item in value):
+            return ",".join(value)
+    raise ConfigurationError(
+        ReturnCodes.INVALID_CONFIG_FILE,
+        f"Setting {name} in {path} must be a string, an integer, a boolean or "
+        f"a list of strings, got {value!r}",
+    )
+
+
+def _read_config_file(path: str) -> dict[str, str]:
+    try:
+        with open(path, "rb") as file:
+            table = tomllib.load(file)
+    except (OSError, tomllib.TOMLDecodeError) as error:
+        raise ConfigurationError(
+            ReturnCodes.INVALID_CONFIG_FILE,
+            f"Could not read the config file {path}: {error}",
+        ) from error
+    return {name: _format_value(path, name, value) for name, value in table.items()}
+
+
+def _get_settings() -> _Settings:
+    """Read the config file CONFIG_FILE names, which only the environment can."""
+    if (path := os.environ.get("CONFIG_FILE")) is None:
+        return _Settings(None, {})
+    return _Settings(path, _read_config_file(path))
 
 
-def _get_required(name: str) -> str:
-    """Read an environment variable that has no sensible default."""
-    if (value := getenv(name)) is None:
+def _get_required(settings: _Settings, name: str) -> str:
+    """Read a setting that has no sensible default."""
+    if (value := settings.get(name)) is None:
         raise ConfigurationError(
             ReturnCodes.MISSING_ENVIRONMENT_VARIABLE,
-            f"Environment variable {name} is required",
+            f"{settings.describe(name)} is required",
         )
     return value
 
 
-def _get_integer(name: str, default: int) -> int:
+def _get_integer(settings: _Settings, name: str, default: int) -> int:
     """Read a duration in seconds, which has to be a whole number."""
-    if (value := getenv(name)) is None:
+    if (value := settings.get(name)) is None:
         return default
     try:
         return int(value)
     except ValueError as error:
         raise ConfigurationError(
             ReturnCodes.INVALID_ENVIRONMENT_VARIABLE,
-            f"Environment variable {name} must be an integer, got {value!r}",
+            f"{settings.describe(name)} must be an integer, got {value!r}",
         ) from error
 
 
-def _get_service_config() -> ServiceConfig:
+def _get_boolean(settings: _Settings, name: str, default: bool) -> bool:
+    """Read a switch, as true or false."""
+    if (value := settings.get(name)) is None:
+        return default
+    if value.lower() not in ("true", "false"):
+        raise ConfigurationError(
+            ReturnCodes.INVALID_ENVIRONMENT_VARIABLE,
+            f"{settings.describe(name)} must be true or false, got {value!r}",
+        )
+    return value.lower() == "true"
+
+
+def _get_host_concurrency_limit(settings: _Settings) -> int:
+    """Read how many requests a host is sent at once, which cannot be none."""
+    limit = _get_integer(settings, "HOST_CONCURRENCY_LIMIT", DEFAULT_LIMIT_PER_HOST)
+    if limit < 1:
+        raise ConfigurationError(
+            ReturnCodes.INVALID_ENVIRONMENT_VARIABLE,
+            f"{settings.describe('HOST_CONCURRENCY_LIMIT')} must be 1 or more, "
+            f"got {limit}",
+        )
+    return limit
+
+
+def _get_connection_settings(settings: _Settings) -> ConnectionSettings:
+    keepalive_expiry = _get_integer(
+        settings, "CONNECTION_KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY
+    )
+    # Off by default: it is one more request to each service every tick.
+    prewarm_lead = _get_integer(settings, "CONNECTION_PREWARM_LEAD", 0)
+    if 0 < prewarm_lead and keepalive_expiry <= prewarm_lead:
+        # A connection opened that early would be closed before the tick.
+        raise ConfigurationError(
+            ReturnCodes.INVALID_ENVIRONMENT_VARIABLE,
+            f"{settings.describe('CONNECTION_PREWARM_LEAD')} must be shorter than "
+            f"CONNECTION_KEEPALIVE_EXPIRY ({keepalive_expiry}), got {prewarm_lead}",
+        )
+    return ConnectionSettings(
+        keepalive_expiry=keepalive_expiry,
+        pool_size=_get_integer(settings, "CONNECTION_POOL_SIZE", DEFAULT_POOL_SIZE),
+        tcp_keepalive=_get_boolean(settings, "TCP_KEEPALIVE", False),
+        prewarm_lead=prewarm_lead,
+        dns_cache_ttl=_get_integer(settings, "DNS_CACHE_TTL", DEFAULT_DNS_CACHE_TTL),
+        dns_stale_timeout=_get_integer(
+            settings, "DNS_STALE_TIMEOUT", DEFAULT_DNS_STALE_TIMEOUT
+        ),
+        adaptive_timeouts=_get_boolean(settings, "ADAPTIVE_TIMEOUTS", False),
+        timeout_multiplier=_get_integer(
+            settings, "ADAPTIVE_TIMEOUT_MULTIPLIER", DEFAULT_TIMEOUT_MULTIPLIER
+        ),
+        timeout_floor=_get_integer(
+            settings, "ADAPTIVE_TIMEOUT_FLOOR", DEFAULT_TIMEOUT_FLOOR
+        ),
+        timeout_ceiling=_get_integer(
+            settings, "ADAPTIVE_TIMEOUT_CEILING", DEFAULT_TIMEOUT_CEILING
+        ),
+    )
+
+
+def _get_tls_settings(settings: _Settings, prefix: str) -> TlsSettings:
+    """Read whom to trust for one service, from {prefix}_CA_FILE and
+    {prefix}_CERT_SHA256. The fingerprint may be written with colons, as
+    openssl prints it."""
+    ca_file = settings.get(f"{prefix}_CA_FILE")
+    if ca_file is not None and not isfile(ca_file):
+        raise ConfigurationError(
+            ReturnCodes.INVALID_ENVIRONMENT_VARIABLE,
+            f"{settings.describe(f'{prefix}_CA_FILE')} must name a file, "
+            f"got {ca_file!r}",
+        )
+    if (pinned := settings.get(f"{prefix}_CERT_SHA256")) is not None:
+        pinned = pinned.replace(":", "").lower()
+        if not re.fullmatch(r"[0-9a-f]{64}", pinned):
+            raise ConfigurationError(
+                ReturnCodes.INVALID_ENVIRONMENT_VARIABLE,
+                f"{settings.describe(f'{prefix}_CERT_SHA256')} must be a SHA-256 "
+                f"fingerprint in hex, got {settings.get(f'{prefix}_CERT_SHA256')!r}",
+            )
+    return TlsSettings(ca_file=ca_file, pinned_sha256=pinned)
+
+
+def _get_address(settings: _Settings, name: str) -> tuple[str, int] | None:
+    """Read an optional address to listen on, as host:port."""
+    if (value := settings.get(name)) is None:
+        return None
+    host, _, port = value.rpartition(":")
+    try:
+        return host, int(port)
+    except ValueError as error:
+        raise ConfigurationError(
+            ReturnCodes.INVALID_ENVIRONMENT_VARIABLE,
+            f"{settings.describe(name)} must be an address as host:port, "
+            f"got {value!r}",
+        ) from error
+
+
+def _get_metrics(settings: _Settings, server_address: tuple[str, int] | None) -> bool:
+    """Read whether to serve metrics, which takes a server to serve them on."""
+    metrics = _get_boolean(settings, "METRICS", False)
+    if metrics and server_address is None:
+        raise ConfigurationError(
+            ReturnCodes.MISSING_ENVIRONMENT_VARIABLE,
+            f"{settings.describe('SERVER_ADDRESS')} is required to serve METRICS",
+        )
+    return metrics
+
+
+def _get_chain(
+    settings: _Settings,
+    name: str,
+    default: tuple[str, ...],
+    allowed: tuple[str, ...],
+    metrics: bool,
+) -> tuple[str, ...]:
+    """Read a chain of middlewares, as their names separated by commas, each
+    named once at most. An empty one leaves the calls as they are, which
+    metrics, timing them, cannot have."""
+    if (value := settings.get(name)) is None:
+        return default
+    chain = tuple(part.strip() for part in value.split(",") if part.strip())
+    if any(part not in allowed for part in chain) or len(set(chain)) < len(chain):
+        raise ConfigurationError(
+            ReturnCodes.INVALID_ENVIRONMENT_VARIABLE,
+            f"{settings.describe(name)} must name each of "
+            f"{', '.join(allowed)} once at most, got {value!r}",
+        )
+    if metrics and TIMING not in chain:
+        raise ConfigurationError(
+            ReturnCodes.INVALID_ENVIRONMENT_VARIABLE,
+            f"{settings.describe(name)} must name {TIMING} to serve METRICS, "
+            f"got {value!r}",
+        )
+    return chain
+
+
+def _get_runtime(settings: _Settings) -> str:
+    runtime = settings.get("RUNTIME", SYNC_RUNTIME)
+    if runtime not in (SYNC_RUNTIME, ASYNCIO_RUNTIME):
+        raise ConfigurationError(
+            ReturnCodes.INVALID_ENVIRONMENT_VARIABLE,
+            f"{settings.describe('RUNTIME')} must be {SYNC_RUNTIME} or "
+            f"{ASYNCIO_RUNTIME}, got {runtime!r}",
+        )
+    return runtime
+
+
+def _get_service_config(settings: _Settings) -> ServiceConfig:
     """Read the configuration of the service SERVICE_TYPE names, qBittorrent by default."""
-    service_type = getenv("SERVICE_TYPE", QBITTORRENT_SERVICE_TYPE)
+    service_type = settings.get("SERVICE_TYPE", QBITTORRENT_SERVICE_TYPE)
     if service_type != QBITTORRENT_SERVICE_TYPE:
         raise ConfigurationError(
             ReturnCodes.UNKNOWN_SERVICE_TYPE,
             f"Invalid SERVICE_TYPE: {service_type}",
         )
     return QBittorrentConfig(
-        url=_get_required("QBITTORRENT_URL"),
-        username=_get_required("QBITTORRENT_USERNAME"),
-        password=_get_required("QBITTORRENT_PASSWORD"),
+        url=_get_required(settings, "QBITTORRENT_URL"),
+        username=_get_required(settings, "QBITTORRENT_USERNAME"),
+        password=_get_required(settings, "QBITTORRENT_PASSWORD"),
+        tls=_get_tls_settings(settings, "QBITTORRENT"),
+        timeout=_get_integer(settings, "QBITTORRENT_TIMEOUT", DEFAULT_TIMEOUT),
     )
 
 
+def get_health_file() -> str:
+    """Read where the health file is, all a healthcheck needs to know."""
+    return _get_required(_get_settings(), "HEALTH_FILE")
+
+
+def get_history_file() -> str:
+    """Read where the port history is, all `glueforward history` needs."""
+    return _get_required(_get_settings(), "HISTORY_FILE")
+
+
 def get_configuration() -> Config:
-    """Read the whole environment, or raise ConfigurationError."""
-    return Config(
-        gluetun_url=_get_required("GLUETUN_URL"),
+    """Read the whole configuration, from the config file and the
+    environment, or raise ConfigurationError."""
+    settings = _get_settings()
+    server_address = _get_address(settings, "SERVER_ADDRESS")
+    metrics = _get_metrics(settings, server_address)
+    config = Config(
+        gluetun_url=_get_required(settings, "GLUETUN_URL"),
         # Optional: gluetun's control server may be set up unauthenticated.
-        gluetun_api_key=getenv("GLUETUN_API_KEY"),
-        gluetun_port_wait_duration=_get_integer("GLUETUN_PORT_WAIT_DURATION", 300),
-        retry_interval=_get_integer("RETRY_INTERVAL", 10),
-        success_interval=_get_integer("SUCCESS_INTERVAL", 60 * 5),
-        service=_get_service_config(),
+        gluetun_api_key=settings.get("GLUETUN_API_KEY"),
+        gluetun_tls=_get_tls_settings(settings, "GLUETUN"),
+        gluetun_timeout=_get_integer(settings, "GLUETUN_TIMEOUT", DEFAULT_TIMEOUT),
+        gluetun_port_wait_duration=_get_integer(
+            settings, "GLUETUN_PORT_WAIT_DURATION", 300
+        ),
+        # Off by default: a single deployment asks once a tick, and never twice.
+        gluetun_port_cache_ttl=_get_integer(settings, "GLUETUN_PORT_CACHE_TTL", 0),
+        retry_interval=_get_integer(settings, "RETRY_INTERVAL", 10),
+        success_interval=_get_integer(settings, "SUCCESS_INTERVAL", 60 * 5),
+        tick_deadline=_get_integer(settings, "TICK_DEADLINE", DEFAULT_TICK_DEADLINE),
+        host_concurrency_limit=_get_host_concurrency_limit(settings),
+        connections=_get_connection_settings(settings),
+        server_address=server_address,
+        metrics=metrics,
+        health_file=settings.get("HEALTH_FILE"),
+        health_stale_intervals=_get_integer(
+            settings, "HEALTH_STALE_INTERVALS", DEFAULT_STALE_INTERVALS
+        ),
+        trace_file=settings.get("TRACE_FILE"),
+        trace_otlp_url=settings.get("TRACE_OTLP_URL"),
+        profile_directory=settings.get("PROFILE_DIRECTORY", tempfile.gettempdir()),
+        flight_recorder_size=_get_integer(
+            settings, "FLIGHT_RECORDER_SIZE", DEFAULT_RECORDED_EXCHANGES
+        ),
+        history_file=settings.get("HISTORY_FILE"),
+        history_retention=_get_integer(
+            settings, "HISTORY_RETENTION_DAYS", DEFAULT_HISTORY_RETENTION_DAYS
+        )
+        * DAY,
+        leader_lease_file=settings.get("LEADER_LEASE_FILE"),
+        leader_lease_duration=_get_integer(
+            settings, "LEADER_LEASE_DURATION", DEFAULT_LEASE_DURATION
+        ),
+        gluetun_middlewares=_get_chain(
+            settings,
+            "GLUETUN_MIDDLEWARES",
+            DEFAULT_FORWARDER_CHAIN,
+            FORWARDER_MIDDLEWARES,
+            metrics,
+        ),
+        service_middlewares=_get_chain(
+            settings,
+            "SERVICE_MIDDLEWARES",
+            DEFAULT_SERVICE_CHAIN,
+            SERVICE_MIDDLEWARES,
+            metrics,
+        ),
+        runtime=_get_runtime(settings),
+        service=_get_service_config(settings),
+        config_file=os.environ.get("CONFIG_FILE"),
     )
+    if unread := settings.get_unread():
+        raise ConfigurationError(
+            ReturnCodes.INVALID_CONFIG_FILE,
+            f"The config file {config.config_file} sets {', '.join(unread)}, "
+            "which no setting is read from",
+        )
+    return config
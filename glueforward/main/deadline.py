@@ -0,0 +1,121 @@
+import asyncio
+import io
+import logging
+import sys
+import threading
+import traceback
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from .errors import RetryableError
+from .ports import AsyncClock, Clock
+
+# Far longer than a healthy tick takes, and far less than forever.
+DEFAULT_TICK_DEADLINE = 60
+# Long enough for a tick whose every request was bound by the deadline to
+# have ended, so that one still running past it is stuck elsewhere.
+WATCHDOG_GRACE = 1
+
+
+class TickOverran(RetryableError):
+    """Exception raised when a tick is given up on for outliving its deadline"""
+
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args, "Synchronizing took longer than TICK_DEADLINE")
+
+
+@dataclass(frozen=True)
+class _Deadline:
+    clock: Clock | AsyncClock
+    at: float
+
+
+# What the tick under way has left, for every request it makes to be
+# bound by. Threads started for the tick are handed a copy of it.
+_current: ContextVar[_Deadline | None] = ContextVar("deadline", default=None)
+
+
+def get_remaining() -> float | None:
+    """Seconds left before the current tick's deadline, or None outside one."""
+    if (deadline := _current.get()) is None:
+        return None
+    return deadline.at - deadline.clock.monotonic()
+
+
+@contextmanager
+def bound(duration: float, clock: Clock | AsyncClock) -> Iterator[None]:
+    """Bind every request made within to `duration` seconds from now, as a
+    tick's deadline does, with no watchdog to bark past it."""
+    token = _current.set(_Deadline(clock, clock.monotonic() + duration))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def _get_stack(thread_id: int, task: asyncio.Task[object] | None) -> str:
+    """Where a thread is at, and the task it runs if any."""
+    # The only way to another thread's stack short of a signal.
+    frame = sys._current_frames().get(thread_id)  # pylint: disable=protected-access
+    stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+    if task is not None:
+        buffer = io.StringIO()
+        task.print_stack(file=buffer)
+        stack += buffer.getvalue()
+    return stack
+
+
+class TickDeadline:
+    """How long a tick may take, which every request it makes is bound by.
+
+    Requests are given whatever the tick has left at most, so a service
+    accepting connections but never answering ends the tick on time, with a
+    retryable error. Anything else holding a tick up past its deadline, and
+    WATCHDOG_GRACE more, has the stack of the thread running it logged, for
+    there is no stopping a thread from outside.
+    """
+
+    def __init__(self, duration: float, clock: Clock | AsyncClock) -> None:
+        self._duration = duration
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._overruns = 0
+
+    def get_duration(self) -> float:
+        return self._duration
+
+    def get_overruns(self) -> int:
+        """How many ticks the watchdog caught still running."""
+        with self._lock:
+            return self._overruns
+
+    def _bark(self, thread_id: int, task: asyncio.Task[object] | None) -> None:
+        logging.error(
+            "Tick still running %.0f seconds past its deadline, stuck at:\n%s",
+            WATCHDOG_GRACE,
+            _get_stack(thread_id, task),
+        )
+        with self._lock:
+            self._overruns += 1
+
+    @contextmanager
+    def enforce(self) -> Iterator[None]:
+        """Bind what runs within to the deadline, and watch it overrun."""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        watchdog = threading.Timer(
+            self._duration + WATCHDOG_GRACE,
+            self._bark,
+            (threading.get_ident(), task),
+        )
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            with bound(self._duration, self._clock):
+                yield
+        finally:
+            watchdog.cancel()
@@ -8,6 +8,7 @@ class ReturnCodes(IntEnum):
     UNKNOWN_SERVICE_TYPE = 2
     UNRETRYABLE_EXCEPTION_IN_LIFECYCLE = 3
     INVALID_ENVIRONMENT_VARIABLE = 4
+    INVALID_CONFIG_FILE = 5
 
 
 class RetryableError(Exception):
@@ -0,0 +1,157 @@
+import logging
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Protocol
+
+# Events a sink may fall behind by before new ones are dropped for it.
+DEFAULT_SINK_QUEUE_SIZE = 256
+# How long exiting waits for each sink to catch up, at most.
+DRAIN_TIMEOUT = 1
+
+
+@dataclass(frozen=True)
+class PortObserved:
+    """Gluetun answered a tick, with a port or with None."""
+
+    port: int | None
+
+
+@dataclass(frozen=True)
+class PortApplied:
+    """The service was set to a port other than the one it last was."""
+
+    port: int
+
+
+@dataclass(frozen=True)
+class PortUnchanged:
+    """The service was set to the port it already had, as every tick does."""
+
+    port: int
+
+
+@dataclass(frozen=True)
+class AuthRenewed:
+    """A service was logged into, at first or once its session expired."""
+
+    service: str
+
+
+@dataclass(frozen=True)
+class RetryScheduled:
+    """A tick failed in a way worth retrying, `delay` seconds from now."""
+
+    error: str
+    delay: float
+
+
+@dataclass(frozen=True)
+class FatalError:
+    """The lifecycle stopped on an error no retry can fix."""
+
+    error: str
+
+
+type Event = (
+    PortObserved | PortApplied | PortUnchanged | AuthRenewed | RetryScheduled | FatalError
+)
+
+
+class EventSink(Protocol):
+    """Anything to be handed the lifecycle's events, off its thread."""
+
+    def handle(self, event: Event) -> None: ...
+
+
+class _SinkWorker:
+    """Hands one sink its events, in order, on a thread of its own."""
+
+    def __init__(self, sink: EventSink, queue_size: int) -> None:
+        self.sink = sink
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._queue: queue.Queue[Event | None] = queue.Queue(queue_size)
+        name = f"events-{type(sink).__name__}"
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, event: Event) -> bool:
+        """Queue an event, or drop it, answering whether it is the first the
+        sink missed: warned of once, rather than for every event after."""
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+                return self._dropped == 1
+        return False
+
+    def get_dropped(self) -> int:
+        with self._lock:
+            return self._dropped
+
+    def _run(self) -> None:
+        while (event := self._queue.get()) is not None:
+            try:
+                self.sink.handle(event)
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                logging.warning(
+                    "%s failed to handle %r: %r", type(self.sink).__name__, event, error
+                )
+
+    def close(self, timeout: float) -> None:
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+class EventBus:
+    """Carries the lifecycle's events to every sink subscribed.
+
+    Publishing only queues an event for each sink, never waiting on any: a
+    sink too slow to keep up has its events dropped, and counted, rather
+    than hold up the tick publishing them.
+    """
+
+    def __init__(self) -> None:
+        self._workers: list[_SinkWorker] = []
+        self._lock = threading.Lock()
+
+    def subscribe(
+        self, sink: EventSink, queue_size: int = DEFAULT_SINK_QUEUE_SIZE
+    ) -> None:
+        worker = _SinkWorker(sink, queue_size)
+        with self._lock:
+            self._workers = [*self._workers, worker]
+
+    def publish(self, event: Event) -> None:
+        # Replaced rather than changed on subscribing, so read without a lock.
+        for worker in self._workers:
+            if worker.put(event):
+                logging.warning(
+                    "%s falls behind: its events are being dropped",
+                    type(worker.sink).__name__,
+                )
+
+    def get_dropped(self) -> dict[str, int]:
+        """How many events the sinks missed, by their class's name."""
+        dropped: dict[str, int] = {}
+        for worker in self._workers:
+            name = type(worker.sink).__name__
+            dropped[name] = dropped.get(name, 0) + worker.get_dropped()
+        return dropped
+
+    def close(self, timeout: float = DRAIN_TIMEOUT) -> None:
+        """Give each sink up to `timeout` seconds to handle what it was sent."""
+        for worker in self._workers:
+            worker.close(timeout)
+
+
+class LoggingSink(EventSink):
+    """Logs every event, for debugging what the lifecycle went through."""
+
+    def handle(self, event: Event) -> None:
+        logging.debug("Event: %r", event)
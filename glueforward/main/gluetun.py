@@ -4,9 +4,16 @@ from typing import TypedDict
 import httpx
 
 from .errors import RetryableError
+from .limiter import HostLimiter
+from .responses import Body, read_body, read_body_async
+from .timeouts import DEFAULT_TIMEOUT
+from .tls import TlsSettings
+from .tracing import traced, traced_async
+from .transport import Connections, get_host
 
 # What gluetun's control server answers for as long as no port is forwarded.
 NO_FORWARDED_PORT = 0
+PORT_FORWARD_PATH = "/v1/portforward"
 
 
 class GluetunAuthFailed(Exception):
@@ -50,6 +57,32 @@ class _PortForwardedResponseModel(TypedDict):
     port: int
 
 
+def _get_error_for_status(status_code: int, body: Body) -> Exception:
+    snippet = body.get_snippet()
+    if status_code == 401:
+        return GluetunAuthFailed(snippet)
+    if status_code >= 500:
+        return GluetunServerError(status_code, snippet)
+    # Anything else is gluetun answering out of character, or not gluetun.
+    return GluetunUnexpectedResponse(status_code, snippet)
+
+
+def _read_port(response: httpx.Response, body: Body) -> int | None:
+    """Read the port out of an answer, or None while there is none."""
+    if not response.is_success:
+        raise _get_error_for_status(response.status_code, body)
+    try:
+        data: _PortForwardedResponseModel = body.get_json()
+        port = data["port"]
+    except (ValueError, KeyError, TypeError) as exception:
+        raise GluetunUnexpectedResponse(body.get_snippet()) from exception
+    return None if port == NO_FORWARDED_PORT else port
+
+
+def _get_headers(api_key: None | str) -> dict[str, str]:
+    return {"X-API-Key": api_key} if api_key else {}
+
+
 class GluetunClient:
     """gluetun's control server, seen through the one endpoint we call.
 
@@ -59,35 +92,80 @@ class GluetunClient:
 
     _client: httpx.Client
 
-    def __init__(self, url: str, api_key: None | str):
-        self._client = httpx.Client(base_url=url)
-        if api_key:
-            self._client.headers.update({"X-API-Key": api_key})
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        url: str,
+        api_key: None | str,
+        limiter: HostLimiter | None = None,
+        connections: Connections | None = None,
+        *,
+        tls: TlsSettings = TlsSettings(),
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self._connections = connections or Connections()
+        self._client = self._connections.open_client(
+            url, headers=_get_headers(api_key), tls=tls, timeout=timeout
+        )
+        self._url = url
+        self._host = get_host(url)
+        self._limiter = limiter or HostLimiter()
         logging.debug("Gluetun client created with base url %s", url)
 
-    @staticmethod
-    def _get_error_for_status(exception: httpx.HTTPStatusError) -> Exception:
-        status_code = exception.response.status_code
-        text = exception.response.text
-        if status_code == 401:
-            return GluetunAuthFailed(text)
-        if status_code >= 500:
-            return GluetunServerError(status_code, text)
-        # Anything else is gluetun answering out of character, or not gluetun.
-        return GluetunUnexpectedResponse(status_code, text)
+    def close(self) -> None:
+        """Close the connections, once replaced by another client."""
+        self._connections.close_client(self._client)
 
+    @traced("gluetun.get_forwarded_port")
     def get_forwarded_port(self) -> int | None:
         """Return the forwarded port, or None while gluetun has none."""
         try:
-            response = self._client.get(url="/v1/portforward")
-            response.raise_for_status()
+            with (
+                self._limiter.slot(self._host),
+                self._client.stream("GET", PORT_FORWARD_PATH) as response,
+            ):
+                body = read_body(response)
         except (httpx.NetworkError, httpx.TimeoutException) as exception:
-            raise GluetunUnreachable(self._client.base_url) from exception
-        except httpx.HTTPStatusError as exception:
-            raise self._get_error_for_status(exception) from exception
+            raise GluetunUnreachable(self._url) from exception
+        return _read_port(response, body)
+
+
+class AsyncGluetunClient:
+    """The same GluetunClient, on asyncio: its request can be cancelled midway."""
+
+    _client: httpx.AsyncClient
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        url: str,
+        api_key: None | str,
+        limiter: HostLimiter | None = None,
+        connections: Connections | None = None,
+        *,
+        tls: TlsSettings = TlsSettings(),
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self._connections = connections or Connections()
+        self._client = self._connections.open_async_client(
+            url, headers=_get_headers(api_key), tls=tls, timeout=timeout
+        )
+        self._url = url
+        self._host = get_host(url)
+        self._limiter = limiter or HostLimiter()
+        logging.debug("Async gluetun client created with base url %s", url)
+
+    async def aclose(self) -> None:
+        """Close the connections, once replaced by another client."""
+        await self._connections.close_async_client(self._client)
+
+    @traced_async("gluetun.get_forwarded_port")
+    async def get_forwarded_port(self) -> int | None:
+        """Return the forwarded port, or None while gluetun has none."""
         try:
-            data: _PortForwardedResponseModel = response.json()
-            port = data["port"]
-        except (ValueError, KeyError, TypeError) as exception:
-            raise GluetunUnexpectedResponse(response.text[:200]) from exception
-        return None if port == NO_FORWARDED_PORT else port
+            async with (
+                self._limiter.async_slot(self._host),
+                self._client.stream("GET", PORT_FORWARD_PATH) as response,
+            ):
+                body = await read_body_async(response)
+        except (httpx.NetworkError, httpx.TimeoutException) as exception:
+            raise GluetunUnreachable(self._url) from exception
+        return _read_port(response, body)
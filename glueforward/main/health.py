@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from enum import StrEnum
+
+from .ports import AsyncClock, Clock, PortListener
+from .server import Reply
+
+# Where the local server answers it, which any HTTP health probe can ask.
+HEALTH_PATH = "/health"
+# How many success intervals may pass without one before it is a problem:
+# one late tick is routine, three in a row are not.
+DEFAULT_STALE_INTERVALS = 3
+
+
+class HealthStatus(StrEnum):
+    # No port applied yet, which every deployment starts with.
+    STARTING = "starting"
+    READY = "ready"
+    # Another replica leads, as the lease was last found to say.
+    STANDBY = "standby"
+    # A port was applied, or the lease checked, but not for too long since.
+    DEGRADED = "degraded"
+
+
+# What probes and the healthcheck take as healthy.
+HEALTHY_STATUSES = (HealthStatus.READY, HealthStatus.STANDBY)
+
+
+class Health(PortListener):
+    """Whether glueforward is doing its job, for orchestrators to act on.
+
+    Ready once a port has been applied, degraded once the last successful
+    update is more than `stale_after` seconds old, whatever held up the
+    next: a retry loop, a tunnel with no port, or a tick stuck somewhere.
+    A standby replica's job is to check the lease instead, so it is healthy
+    as long as the last check that found another replica leading is not
+    older than that either.
+
+    Given a `path`, a file is also written there on every success, which
+    `glueforward healthcheck` checks from a process of its own: how old the
+    file is tells how long ago the last success was, with no clock shared.
+    """
+
+    def __init__(
+        self, clock: Clock | AsyncClock, stale_after: float, path: str | None = None
+    ) -> None:
+        self._clock = clock
+        self._stale_after = stale_after
+        self._path = path
+        self._lock = threading.Lock()
+        # Held through a write, for the file to end as the latest one left it.
+        self._write_lock = threading.Lock()
+        # The port last applied, and when.
+        self._applied: tuple[int, float] | None = None
+        # When another replica was last found leading, while this one stands by.
+        self._standby_at: float | None = None
+
+    def port_applied(self, port: int) -> None:
+        with self._lock:
+            self._applied = (port, self._clock.monotonic())
+            self._standby_at = None
+        if self._path is not None:
+            self._write(self._path)
+
+    def standing_by(self) -> None:
+        """Record that the lease was just found held by another replica."""
+        with self._lock:
+            self._standby_at = self._clock.monotonic()
+        if self._path is not None:
+            self._write(self._path)
+
+    def set_stale_after(self, stale_after: float) -> None:
+        """Judge from now on by another window, the health file included."""
+        with self._lock:
+            self._stale_after = stale_after
+            written = self._applied is not None or self._standby_at is not None
+        if self._path is None or not written:
+            return
+        try:
+            # Rewritten as of the last success still, for its age to hold.
+            written_at = os.stat(self._path).st_mtime_ns
+        except OSError as error:
+            logging.warning("Could not write the health file: %r", error)
+            return
+        self._write(self._path, written_at)
+
+    def _write(self, path: str, written_at: int | None = None) -> None:
+        """Replace the health file whole, for a check never to read half of it.
+
+        Each write goes through a temporary file of its own, since a standby's
+        election writes from another thread than the ticks do.
+        """
+        with self._write_lock:
+            with self._lock:
+                content = {
+                    "port": None if self._applied is None else self._applied[0],
+                    "stale_after": self._stale_after,
+                    "standby": self._standby_at is not None,
+                }
+            try:
+                descriptor, temporary = tempfile.mkstemp(
+                    dir=os.path.dirname(path) or ".", suffix=".tmp"
+                )
+            except OSError as error:
+                # Only the healthcheck suffers from it, and it will say so.
+                logging.warning("Could not write the health file: %r", error)
+                return
+            try:
+                with open(descriptor, "w", encoding="utf-8") as file:
+                    json.dump(content, file)
+                if written_at is not None:
+                    os.utime(temporary, ns=(written_at, written_at))
+                os.replace(temporary, path)
+            except OSError as error:
+                logging.warning("Could not write the health file: %r", error)
+                os.unlink(temporary)
+
+    def get_status(self) -> HealthStatus:
+        with self._lock:
+            applied, standby_at = self._applied, self._standby_at
+        if standby_at is not None:
+            status, since = HealthStatus.STANDBY, standby_at
+        elif applied is not None:
+            status, since = HealthStatus.READY, applied[1]
+        else:
+            return HealthStatus.STARTING
+        if self._clock.monotonic() - since > self._stale_after:
+            return HealthStatus.DEGRADED
+        return status
+
+    def serve(self, _: dict[str, str]) -> Reply:
+        """Answer 200 when healthy, and 503 otherwise, which probes go by."""
+        status = self.get_status()
+        with self._lock:
+            port = None if self._applied is None else self._applied[0]
+        body = json.dumps({"status": status, "port": port}).encode()
+        return Reply(200 if status in HEALTHY_STATUSES else 503, body)
+
+
+def check_health_file(path: str) -> HealthStatus:
+    """Tell from the health file how glueforward is doing, as Health would."""
+    try:
+        age = time.time() - os.stat(path).st_mtime
+        with open(path, encoding="utf-8") as file:
+            content = json.load(file)
+        stale_after = float(content["stale_after"])
+    except FileNotFoundError:
+        return HealthStatus.STARTING
+    except OSError:
+        # There, but out of reach, which a healthcheck is not to crash on.
+        return HealthStatus.DEGRADED
+    except (ValueError, KeyError, TypeError):
+        # Not a file Health wrote, which says nothing good.
+        return HealthStatus.DEGRADED
+    if age > stale_after:
+        return HealthStatus.DEGRADED
+    # Missing from a file written by a version that did not stand by.
+    if content.get("standby", False):
+        return HealthStatus.STANDBY
+    return HealthStatus.READY
@@ -0,0 +1,237 @@
+import logging
+import sqlite3
+import statistics
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass, field
+
+from .clock import SystemClock
+from .events import (
+    Event,
+    EventSink,
+    FatalError,
+    PortApplied,
+    PortObserved,
+    RetryScheduled,
+)
+from .ports import Clock
+
+# A quarter's worth: enough to tell a trend, and a few megabytes at most.
+DEFAULT_HISTORY_RETENTION_DAYS = 90
+# What the history command looks back over unless told otherwise.
+DEFAULT_REPORT_DAYS = 30
+# Rows kept in memory before being written together, and for how long at most.
+BATCH_SIZE = 32
+FLUSH_INTERVAL = 60
+
+DAY = 24 * 60 * 60
+
+# What a row records.
+OBSERVED = "observed"
+APPLIED = "applied"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    -- When, in seconds since the epoch.
+    at REAL NOT NULL,
+    -- The gluetun the port came from.
+    gluetun TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    -- The port observed or applied, NULL when gluetun had none.
+    port INTEGER,
+    -- For a port applied, how long since gluetun first answered it.
+    delay REAL,
+    -- For a failure, what it failed on.
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS events_by_kind ON events (gluetun, kind, at);
+CREATE INDEX IF NOT EXISTS events_by_age ON events (at);
+"""
+
+type _Row = tuple[float, str, str, int | None, float | None, str | None]
+
+
+class PortHistory(EventSink):  # pylint: disable=too-many-instance-attributes
+    """Records the ports gluetun answers and the service is set to, and
+    the failures between, in an SQLite file at `path`.
+
+    As a sink, it is handed the events off the lifecycle's thread, and keeps
+    them until BATCH_SIZE are due, or the oldest is FLUSH_INTERVAL seconds
+    old, to write them in one transaction. Rows older than `retention`
+    seconds are pruned on every write, for the file to stay bounded.
+    """
+
+    def __init__(
+        self, path: str, gluetun: str, retention: float, clock: Clock | None = None
+    ) -> None:
+        self._gluetun = gluetun
+        self._retention = retention
+        self._clock = clock or SystemClock()
+        self._lock = threading.Lock()
+        self._rows: list[_Row] = []
+        self._flushed_at = self._clock.monotonic()
+        # The port gluetun last answered, and when it first did.
+        self._observed: tuple[int | None, float] = (None, 0.0)
+        # Opened now, for a path that cannot be written to stop glueforward
+        # from starting, rather than be found out once events come.
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    def _get_row(self, event: Event, at: float) -> _Row | None:
+        match event:
+            case PortObserved(port=port):
+                if port != self._observed[0]:
+                    self._observed = (port, at)
+                return (at, self._gluetun, OBSERVED, port, None, None)
+            case PortApplied(port=port):
+                observed_port, observed_at = self._observed
+                delay = at - observed_at if port == observed_port else None
+                return (at, self._gluetun, APPLIED, port, delay, None)
+            case RetryScheduled(error=error) | FatalError(error=error):
+                return (at, self._gluetun, FAILED, None, None, error)
+        return None
+
+    def handle(self, event: Event) -> None:
+        with self._lock:
+            if (row := self._get_row(event, time.time())) is None:
+                return
+            self._rows.append(row)
+            is_due = self._clock.monotonic() - self._flushed_at >= FLUSH_INTERVAL
+            if len(self._rows) >= BATCH_SIZE or is_due:
+                self._flush()
+
+    def _flush(self) -> None:
+        rows, self._rows = self._rows, []
+        self._flushed_at = self._clock.monotonic()
+        try:
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)", rows
+                )
+                self._connection.execute(
+                    "DELETE FROM events WHERE at < ?",
+                    (time.time() - self._retention,),
+                )
+        except sqlite3.Error as error:
+            logging.warning(
+                "Could not write %d rows of history: %r", len(rows), error
+            )
+
+    def close(self) -> None:
+        """Write whatever is left, and close the file."""
+        with self._lock:
+            if self._rows:
+                self._flush()
+            self._connection.close()
+
+
+@dataclass
+class HistoryReport:  # pylint: disable=too-many-instance-attributes
+    """What the history tells of one gluetun, over the days asked for."""
+
+    gluetun: str
+    days: float
+    observations: int = 0
+    # Observations of no port at all.
+    missing: int = 0
+    # How long each port lived, for those replaced since.
+    lifetimes: list[float] = field(default_factory=list)
+    # How many times the port applied changed.
+    changes: int = 0
+    # From gluetun first answering a port to the service being set to it.
+    delays: list[float] = field(default_factory=list)
+    failures: dict[str, int] = field(default_factory=dict)
+
+    def get_change_rate(self) -> float:
+        """The port's changes, per day."""
+        return self.changes / self.days if self.days else 0.0
+
+
+# The ports applied, each once per change, and until when each lived.
+_CHANGES = """
+WITH applied AS (
+    SELECT at, port, LAG(port) OVER (ORDER BY at) AS previous
+    FROM events WHERE gluetun = :gluetun AND kind = 'applied'
+), changes AS (
+    SELECT at, LEAD(at) OVER (ORDER BY at) AS until
+    FROM applied WHERE previous IS NULL OR port != previous
+)
+SELECT at, until FROM changes WHERE at >= :since
+"""
+
+
+def _read_report(
+    connection: sqlite3.Connection, gluetun: str, since: float, days: float
+) -> HistoryReport:
+    report = HistoryReport(gluetun, days)
+    parameters = {"gluetun": gluetun, "since": since}
+    for kind, port, delay, error in connection.execute(
+        "SELECT kind, port, delay, error FROM events "
+        "WHERE gluetun = :gluetun AND at >= :since",
+        parameters,
+    ):
+        if kind == OBSERVED:
+            report.observations += 1
+            report.missing += int(port is None)
+        elif kind == FAILED:
+            report.failures[error] = report.failures.get(error, 0) + 1
+        # Applied, to a port gluetun was seen answering first.
+        elif delay is not None:
+            report.delays.append(delay)
+    for at, until in connection.execute(_CHANGES, parameters):
+        report.changes += 1
+        if until is not None:
+            report.lifetimes.append(until - at)
+    return report
+
+
+def read_history(path: str, days: float) -> list[HistoryReport]:
+    """Report on the last `days` days of the history at `path`, one report
+    per gluetun, opening it read only: glueforward may be writing it."""
+    now = time.time()
+    since = now - days * DAY
+    with closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True)) as connection:
+        oldest = connection.execute("SELECT MIN(at) FROM events").fetchone()[0]
+        # Only as many days as were recorded, for the rates to be told right.
+        recorded = (now - max(since, oldest or since)) / DAY
+        gluetuns = connection.execute("SELECT DISTINCT gluetun FROM events")
+        return [
+            _read_report(connection, gluetun, since, recorded)
+            for (gluetun,) in gluetuns.fetchall()
+        ]
+
+
+def _format_duration(seconds: float) -> str:
+    for unit, length in (("d", DAY), ("h", 60 * 60), ("m", 60)):
+        if seconds >= 2 * length:
+            return f"{seconds / length:.1f}{unit}"
+    return f"{seconds:.1f}s"
+
+
+def _format_percentiles(values: list[float]) -> str:
+    if not values:
+        return "none yet"
+    if len(values) == 1:
+        return _format_duration(values[0])
+    # The 50th, 90th and 99th of the 99 cut points between percentiles.
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return ", ".join(
+        f"p{rank} {_format_duration(cuts[rank - 1])}" for rank in (50, 90, 99)
+    )
+
+
+def format_report(report: HistoryReport) -> str:
+    failures = sorted(report.failures.items(), key=lambda item: -item[1])
+    lines = [
+        f"{report.gluetun}, over {report.days:.1f} days:",
+        f"  Observations: {report.observations}, {report.missing} without a port",
+        f"  Port changes: {report.changes}, {report.get_change_rate():.2f} a day",
+        f"  Port lifetime: {_format_percentiles(report.lifetimes)}",
+        f"  Propagation delay: {_format_percentiles(report.delays)}",
+        f"  Failures: {sum(report.failures.values())}",
+        *(f"    {count} × {error}" for error, count in failures),
+    ]
+    return "\n".join(lines)
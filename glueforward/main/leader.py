@@ -0,0 +1,187 @@
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+
+from .health import Health
+
+# Long enough for a leader to renew it through a busy moment, short enough
+# for a standby to take over before an update is missed.
+DEFAULT_LEASE_DURATION = 15
+# How many times a lease is renewed within its duration, so that a renewal
+# or two running late does not lose it.
+RENEWALS_PER_LEASE = 3
+
+
+@dataclass(frozen=True)
+class Lease:
+    """Who leads, until when, and with what fencing token.
+
+    The token is one more every time the lease changes hands, so that a
+    leader that lost it, while paused for instance, can tell it did.
+    """
+
+    holder: str
+    token: int
+    # In seconds since the epoch, for replicas to agree on it.
+    expires_at: float
+
+
+def get_holder() -> str:
+    """What tells this replica from the others, its container included."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaseFile:
+    """A lease on leadership, kept in a file every replica can lock.
+
+    Each read or write holds an exclusive lock on the file for as long as it
+    takes, so that two replicas never both take a lease that expired. The
+    replicas share a host, or a filesystem whose locks do, and its clock.
+    """
+
+    def __init__(self, path: str, holder: str, duration: float) -> None:
+        self._path = path
+        self._holder = holder
+        self._duration = duration
+
+    @contextmanager
+    def _locked(self) -> Iterator[int]:
+        descriptor = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX)
+            yield descriptor
+        finally:
+            os.close(descriptor)
+
+    @staticmethod
+    def _read(descriptor: int) -> Lease | None:
+        os.lseek(descriptor, 0, os.SEEK_SET)
+        content = os.read(descriptor, 4096)
+        try:
+            return Lease(**json.loads(content))
+        except (ValueError, TypeError):
+            # Empty, as first created, or not a lease.
+            return None
+
+    @staticmethod
+    def _write(descriptor: int, lease: Lease) -> None:
+        os.ftruncate(descriptor, 0)
+        os.lseek(descriptor, 0, os.SEEK_SET)
+        os.write(descriptor, json.dumps(asdict(lease)).encode())
+
+    def try_acquire(self) -> int | None:
+        """Take the lease, or renew it if held, answering the fencing token
+        it is held with, or None while another replica holds it."""
+        with self._locked() as descriptor:
+            now = time.time()
+            lease = self._read(descriptor)
+            if lease is None:
+                token = 1
+            elif lease.holder == self._holder:
+                token = lease.token
+            elif lease.expires_at <= now:
+                token = lease.token + 1
+            else:
+                return None
+            expires_at = now + self._duration
+            self._write(descriptor, Lease(self._holder, token, expires_at))
+            return token
+
+    def _is_held(self, lease: Lease, token: int) -> bool:
+        return (lease.holder, lease.token) == (self._holder, token)
+
+    def holds(self, token: int) -> bool:
+        """Whether the lease is still held with `token`, and unexpired."""
+        with self._locked() as descriptor:
+            lease = self._read(descriptor)
+        if lease is None:
+            return False
+        return self._is_held(lease, token) and lease.expires_at > time.time()
+
+    def release(self, token: int) -> None:
+        """Give the lease up now, if still held, for a standby not to wait
+        for it to expire."""
+        with self._locked() as descriptor:
+            lease = self._read(descriptor)
+            if lease is not None and self._is_held(lease, token):
+                self._write(descriptor, Lease(self._holder, token, 0))
+
+
+class LeaderElection:
+    """Decides which of the replicas sharing a LeaseFile synchronizes.
+
+    A thread of its own keeps trying to take the lease, or renew it, a few
+    times per `duration`, whatever a tick is doing. Before each tick,
+    `is_leader` reads the lease again for its fencing token, so that one
+    replica only ever synchronizes at a time: a leader that lost the lease
+    stops as soon as it looks. A standby takes over within `duration`, and
+    the interval it checks in, of a leader dying.
+
+    Given `health`, every check that finds another replica leading is told
+    to it, for a standby to be healthy while it can check.
+    """
+
+    def __init__(
+        self, lease: LeaseFile, duration: float, health: Health | None = None
+    ) -> None:
+        self._lease = lease
+        self._health = health
+        self._interval = duration / RENEWALS_PER_LEASE
+        self._token: int | None = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="leader-election", daemon=True
+        )
+        self._thread.start()
+
+    def get_standby_interval(self) -> float:
+        """How soon a standby is to look again whether it leads."""
+        return self._interval
+
+    def _elect(self) -> None:
+        try:
+            token = self._lease.try_acquire()
+        except OSError as error:
+            logging.warning("Could not take the leader lease: %r", error)
+            token = None
+        else:
+            if token is None and self._health is not None:
+                self._health.standing_by()
+        if token is not None and token != self._token:
+            logging.info("Leading, with fencing token %d", token)
+        elif token is None and self._token is not None:
+            logging.warning("No longer leading, another replica took over")
+        self._token = token
+
+    def _run(self) -> None:
+        while True:
+            self._elect()
+            if self._stopped.wait(self._interval):
+                return
+
+    def is_leader(self) -> bool:
+        if (token := self._token) is None:
+            return False
+        try:
+            return self._lease.holds(token)
+        except OSError as error:
+            logging.warning("Could not check the leader lease: %r", error)
+            return False
+
+    def stop(self) -> None:
+        """Stop electing, and hand the lease over if held."""
+        self._stopped.set()
+        self._thread.join()
+        if (token := self._token) is None:
+            return
+        try:
+            self._lease.release(token)
+        except OSError as error:
+            logging.warning("Could not hand the leader lease over: %r", error)
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+
+from .clock import SystemClock
+from .deadline import TickOverran, get_remaining
+from .ports import Clock
+
+# Enough for a deployment's own calls never to queue, few enough for a burst
+# of them not to swamp a WebUI.
+DEFAULT_LIMIT_PER_HOST = 2
+
+
+@dataclass(frozen=True)
+class HostStatistics:
+    """How much one host held its callers back, for telling a bottleneck apart."""
+
+    in_flight: int
+    queue_depth: int
+    wait_count: int
+    wait_seconds: float
+
+
+class _HostQueue:
+    def __init__(self) -> None:
+        self.in_flight = 0
+        # Each waiter is woken by being called, from whichever thread frees
+        # the slot it is handed.
+        self.waiters: deque[Callable[[], None]] = deque()
+        self.wait_count = 0
+        self.wait_seconds = 0.0
+
+
+def _resolve(future: asyncio.Future[None]) -> None:
+    """Wake a task waiting on `future`, unless it has been cancelled since."""
+    if not future.done():
+        future.set_result(None)
+
+
+class HostLimiter:
+    """Caps how many requests run at once against each host.
+
+    Requests over the cap queue up and are let through first come, first
+    served: a slot being freed is handed straight to the oldest waiter, so a
+    newcomer can never overtake the queue. A host is identified by its
+    address and port, since that is what takes the connections.
+
+    Threads and asyncio tasks wait in the same queues, each in its own way.
+    """
+
+    def __init__(
+        self,
+        limit_per_host: int = DEFAULT_LIMIT_PER_HOST,
+        clock: Clock | None = None,
+    ) -> None:
+        self._limit_per_host = limit_per_host
+        self._clock = clock or SystemClock()
+        self._lock = threading.Lock()
+        self._hosts: dict[str, _HostQueue] = {}
+
+    def _take_or_queue(self, host: str, wake: Callable[[], None]) -> bool:
+        """Take one of `host`'s slots, or queue `wake` up for one and say so."""
+        with self._lock:
+            queue = self._hosts.setdefault(host, _HostQueue())
+            if queue.in_flight < self._limit_per_host and not queue.waiters:
+                queue.in_flight += 1
+                return False
+            queue.waiters.append(wake)
+            return True
+
+    def _record_wait(self, host: str, start: float) -> None:
+        waited = self._clock.monotonic() - start
+        with self._lock:
+            queue = self._hosts[host]
+            queue.wait_count += 1
+            queue.wait_seconds += waited
+        logging.debug(
+            "Waited %.3f seconds for a connection to %s",
+            waited,
+            host,
+            extra={"endpoint": host, "latency": waited},
+        )
+
+    def _leave(self, host: str, wake: Callable[[], None]) -> None:
+        """Give up waiting in `host`'s queue, passing the slot on if handed
+        it meanwhile, or it leaks."""
+        with self._lock:
+            waiters = self._hosts[host].waiters
+            was_handed_the_slot = wake not in waiters
+            if not was_handed_the_slot:
+                waiters.remove(wake)
+        if was_handed_the_slot:
+            self._release(host)
+
+    def _release(self, host: str) -> None:
+        with self._lock:
+            queue = self._hosts[host]
+            if queue.waiters:
+                # The slot changes hands without ever being free.
+                queue.waiters.popleft()()
+            else:
+                queue.in_flight -= 1
+
+    @contextmanager
+    def slot(self, host: str) -> Iterator[None]:
+        """Hold one of `host`'s slots, waiting in line for it if need be, for
+        as long as the tick under way has left at most."""
+        turn = threading.Event()
+        wake = turn.set
+        if self._take_or_queue(host, wake):
+            start = self._clock.monotonic()
+            if not turn.wait(get_remaining()):
+                self._leave(host, wake)
+                raise TickOverran()
+            self._record_wait(host, start)
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    async def _acquire_async(self, host: str) -> None:
+        loop = asyncio.get_running_loop()
+        turn: asyncio.Future[None] = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(_resolve, turn)
+
+        if not self._take_or_queue(host, wake):
+            return
+        start = self._clock.monotonic()
+        try:
+            await turn
+        except asyncio.CancelledError:
+            self._leave(host, wake)
+            raise
+        self._record_wait(host, start)
+
+    @asynccontextmanager
+    async def async_slot(self, host: str) -> AsyncIterator[None]:
+        """Hold one of `host`'s slots, awaiting it in line if need be."""
+        await self._acquire_async(host)
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    def get_statistics(self) -> dict[str, HostStatistics]:
+        with self._lock:
+            return {
+                host: HostStatistics(
+                    in_flight=queue.in_flight,
+                    queue_depth=len(queue.waiters),
+                    wait_count=queue.wait_count,
+                    wait_seconds=queue.wait_seconds,
+                )
+                for host, queue in self._hosts.items()
+            }
@@ -0,0 +1,131 @@
+import copy
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import traceback
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import UTC, datetime
+from typing import Any
+
+# Records the thread writing them may fall behind by before new ones are
+# dropped, rather than hold up whoever logs them.
+LOG_QUEUE_SIZE = 1024
+
+# What every JSON line carries, null when a record has nothing to say of it.
+FIELDS = ("port", "endpoint", "latency", "error", "tick")
+
+_tick: ContextVar[int | None] = ContextVar("tick", default=None)
+_ticks = itertools.count(1)
+
+
+@contextmanager
+def logged_tick() -> Iterator[int]:
+    """Number a tick, for every record logged during it to tell which."""
+    token = _tick.set(next(_ticks))
+    try:
+        yield _tick.get() or 0
+    finally:
+        _tick.reset(token)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a line of JSON, with the same keys every time.
+
+    Beside the time, level, logger and message, the FIELDS are read from
+    what the record was given as `extra`, `error` defaulting to the class
+    of the exception it carries, if any, whose traceback comes last.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        line: dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, UTC).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        line |= {field: getattr(record, field, None) for field in FIELDS}
+        if record.exc_info is not None and record.exc_info[0] is not None:
+            line["error"] = line["error"] or record.exc_info[0].__name__
+            line["traceback"] = "".join(traceback.format_exception(*record.exc_info))
+        return json.dumps(line, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to a QueueListener, never waiting on it.
+
+    A record finding the queue full is dropped, and counted; the first
+    record to find room again is preceded by a warning of how many were.
+    Each record is also stamped with the tick it was logged during, which
+    only the thread logging it knows.
+    """
+
+    def __init__(self, records: queue.Queue[logging.LogRecord]) -> None:
+        super().__init__(records)
+        self._lock = threading.Lock()
+        self._dropped = 0
+        self._unreported = 0
+
+    def get_dropped(self) -> int:
+        with self._lock:
+            return self._dropped
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Merge the record's arguments into its message, as they may change
+        by the time it is written, but leave it otherwise whole for the
+        formatter: unlike QueueHandler's, it stays within the process."""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.tick = _tick.get()
+        return record
+
+    def _get_warning(self, dropped: int) -> logging.LogRecord:
+        return self.prepare(
+            logging.makeLogRecord(
+                {
+                    "name": __name__,
+                    "levelno": logging.WARNING,
+                    "levelname": logging.getLevelName(logging.WARNING),
+                    "msg": "Dropped %d log records, the queue being full",
+                    "args": (dropped,),
+                }
+            )
+        )
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        with self._lock:
+            try:
+                if self._unreported:
+                    self.queue.put_nowait(self._get_warning(self._unreported))
+                    self._unreported = 0
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self._dropped += 1
+                self._unreported += 1
+
+
+def start_queue_logging(
+    handler: logging.Handler, size: int = LOG_QUEUE_SIZE
+) -> tuple[DroppingQueueHandler, logging.handlers.QueueListener]:
+    """Have the root logger write through `handler` on a thread of its own,
+    so that a stalled output holds up nothing but that thread."""
+    records: queue.Queue[logging.LogRecord] = queue.Queue(size)
+    listener = logging.handlers.QueueListener(records, handler)
+    queue_handler = DroppingQueueHandler(records)
+    logging.getLogger().handlers[:] = [queue_handler]
+    listener.start()
+    return queue_handler, listener
+
+
+def get_dropped() -> int:
+    """How many records the root logger dropped, writing through a queue."""
+    return sum(
+        handler.get_dropped()
+        for handler in logging.getLogger().handlers
+        if isinstance(handler, DroppingQueueHandler)
+    )
@@ -1,27 +1,87 @@
+import argparse
+import asyncio
+import atexit
 import logging
 import logging.config as logging_config
 import signal
+import sqlite3
 import sys
+from collections.abc import Callable, Coroutine, Sequence
+from functools import partial
 from os import getenv
 from typing import assert_never
 
-from .application import Application
-from .clock import SystemClock
+from . import tracing
+from .application import Application, AsyncApplication
+from .clock import AsyncSystemClock, SystemClock
 from .config import (
+    ASYNCIO_RUNTIME,
     Config,
     ConfigurationError,
     QBittorrentConfig,
     get_configuration,
+    get_health_file,
+    get_history_file,
 )
+from .deadline import TickDeadline
 from .errors import ReturnCodes
-from .gluetun import GluetunClient
-from .port_synchronizer import PortSynchronizer
-from .ports import ServiceClient
-from .qbittorrent import QBittorrentClient
+from .events import EventBus, LoggingSink
+from .health import HEALTH_PATH, HEALTHY_STATUSES, Health, check_health_file
+from .gluetun import AsyncGluetunClient, GluetunClient
+from .history import DEFAULT_REPORT_DAYS, PortHistory, format_report, read_history
+from .leader import LeaderElection, LeaseFile, get_holder
+from .limiter import HostLimiter
+from .logs import JsonFormatter, start_queue_logging
+from .metrics import (
+    METRICS_PATH,
+    Metrics,
+    collect_connections,
+    collect_dropped,
+    collect_host_limiter,
+    collect_latency,
+    collect_resolution,
+)
+from .middleware import (
+    compile_chain,
+    get_async_forwarder_middlewares,
+    get_async_service_middlewares,
+    get_forwarder_middlewares,
+    get_service_middlewares,
+)
+from .port_board import PortBoard
+from .port_synchronizer import AsyncPortSynchronizer, PortSynchronizer
+from .profiling import ALLOCATIONS_SIGNAL, PROFILE_SIGNAL, Profiler
+from .ports import (
+    AsyncClock,
+    AsyncPortForwarder,
+    AsyncServiceClient,
+    Clock,
+    PortForwarder,
+    PortListener,
+    ServiceClient,
+)
+from .qbittorrent import AsyncQBittorrentClient, QBittorrentClient
+from .recorder import RECORDER_PATH, FlightRecorder
+from .reload import Built, ConfigReloader, ConfigWatcher
+from .server import LocalServer
+from .trace_exporters import FileExporter, OtlpExporter
+from .tracing import SpanExporter
+from .transport import Connections
+
+# The path the forwarded port is served on, the same as gluetun's own.
+PORT_PATH = "/v1/portforward"
+
+HEALTHCHECK_COMMAND = "healthcheck"
+HISTORY_COMMAND = "history"
+
+# What LOG_FORMAT may pick instead of text, the default.
+JSON_LOG_FORMAT = "json"
 
 
 def configure_logging() -> None:
-    """Configure logging from the LOG_LEVEL environment variable"""
+    """Configure logging from the LOG_LEVEL and LOG_FORMAT environment
+    variables. Logged as JSON, records are written on a thread of their own,
+    for a stalled output never to hold up the lifecycle."""
     log_level = (
         environment_log_level
         if (environment_log_level := getenv("LOG_LEVEL"))
@@ -50,22 +110,370 @@ def configure_logging() -> None:
     logging.basicConfig(
         level=log_level, format="%(asctime)s [%(levelname)s] %(message)s"
     )
+    if getenv("LOG_FORMAT") == JSON_LOG_FORMAT:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+        _, listener = start_queue_logging(handler)
+        # Exiting, whatever the reason, the records queued are written still.
+        atexit.register(listener.stop)
 
 
-def build_service_client(config: Config) -> ServiceClient:
+def _get_credentials(service: QBittorrentConfig) -> dict[str, str]:
+    return {"username": service.username, "password": service.password}
+
+
+def build_service_client(
+    config: Config,
+    limiter: HostLimiter,
+    connections: Connections,
+    events: EventBus | None = None,
+) -> QBittorrentClient:
     """Create the client of the one service the configuration names."""
     match config.service:
         case QBittorrentConfig() as service:
             return QBittorrentClient(
                 url=service.url,
-                credentials={
-                    "username": service.username,
-                    "password": service.password,
-                },
+                credentials=_get_credentials(service),
+                limiter=limiter,
+                connections=connections,
+                tls=service.tls,
+                timeout=service.timeout,
+                events=events,
+            )
+    assert_never(config.service)
+
+
+def build_async_service_client(
+    config: Config,
+    limiter: HostLimiter,
+    connections: Connections,
+    events: EventBus | None = None,
+) -> AsyncQBittorrentClient:
+    """Create the asyncio client of the one service the configuration names."""
+    match config.service:
+        case QBittorrentConfig() as service:
+            return AsyncQBittorrentClient(
+                url=service.url,
+                credentials=_get_credentials(service),
+                limiter=limiter,
+                connections=connections,
+                tls=service.tls,
+                timeout=service.timeout,
+                events=events,
             )
     assert_never(config.service)
 
 
+def build_tick_deadline(
+    config: Config, clock: Clock | AsyncClock
+) -> TickDeadline | None:
+    if config.tick_deadline == 0:
+        return None
+    return TickDeadline(config.tick_deadline, clock)
+
+
+def build_health(config: Config) -> Health:
+    stale_after = config.success_interval * config.health_stale_intervals
+    return Health(SystemClock(), stale_after, config.health_file)
+
+
+def build_metrics(
+    config: Config, limiter: HostLimiter, connections: Connections, events: EventBus
+) -> Metrics | None:
+    """Count what glueforward does, if asked to, along with what its
+    components count on their own."""
+    if not config.metrics:
+        return None
+    metrics = Metrics(SystemClock())
+    metrics.register("limiter", partial(collect_host_limiter, limiter))
+    metrics.register("connections", partial(collect_connections, connections))
+    metrics.register("resolution", partial(collect_resolution, connections))
+    metrics.register("latency", partial(collect_latency, connections))
+    metrics.register("dropped", partial(collect_dropped, events))
+    return metrics
+
+
+def build_recorder(config: Config) -> FlightRecorder | None:
+    if config.flight_recorder_size == 0:
+        return None
+    secrets = (config.gluetun_api_key, config.service.password)
+    return FlightRecorder(config.flight_recorder_size, secrets)
+
+
+def build_history(config: Config) -> PortHistory | None:
+    if config.history_file is None:
+        return None
+    return PortHistory(
+        config.history_file, config.gluetun_url, config.history_retention
+    )
+
+
+def build_leader_election(
+    config: Config, health: Health | None = None
+) -> LeaderElection | None:
+    if config.leader_lease_file is None:
+        return None
+    duration = config.leader_lease_duration
+    lease = LeaseFile(config.leader_lease_file, get_holder(), duration)
+    return LeaderElection(lease, duration, health)
+
+
+def build_config_watcher(
+    config: Config, recorder: FlightRecorder | None = None
+) -> ConfigWatcher | None:
+    if config.config_file is None:
+        return None
+    return ConfigWatcher(config.config_file, config, recorder)
+
+
+def start_event_bus(config: Config) -> EventBus:
+    """Publish the lifecycle's events to every sink configured, and have
+    them catch up on exiting, whatever the reason."""
+    events = EventBus()
+    events.subscribe(LoggingSink())
+    if port_history := build_history(config):
+        events.subscribe(port_history)
+        # Registered first, to run once the sinks have caught up.
+        atexit.register(port_history.close)
+    atexit.register(events.close)
+    return events
+
+
+def build_span_exporters(config: Config) -> list[SpanExporter]:
+    exporters: list[SpanExporter] = []
+    if config.trace_file is not None:
+        exporters.append(FileExporter(config.trace_file))
+    if config.trace_otlp_url is not None:
+        exporters.append(OtlpExporter(config.trace_otlp_url))
+    return exporters
+
+
+def build_forwarder(
+    config: Config,
+    clock: Clock,
+    limiter: HostLimiter,
+    connections: Connections,
+    metrics: Metrics | None = None,
+) -> Built[PortForwarder, Callable[[], None]]:
+    """Create the gluetun client, wrapped in its chain of middlewares."""
+    client = GluetunClient(
+        url=config.gluetun_url,
+        api_key=config.gluetun_api_key,
+        limiter=limiter,
+        connections=connections,
+        tls=config.gluetun_tls,
+        timeout=config.gluetun_timeout,
+    )
+    forwarder = compile_chain(
+        client,
+        config.gluetun_middlewares,
+        get_forwarder_middlewares(clock, config.gluetun_port_cache_ttl, metrics),
+    )
+    return forwarder, client.close
+
+
+def build_async_forwarder(
+    config: Config,
+    clock: AsyncClock,
+    limiter: HostLimiter,
+    connections: Connections,
+    metrics: Metrics | None = None,
+) -> Built[AsyncPortForwarder, Callable[[], Coroutine[None, None, None]]]:
+    """Create the asyncio gluetun client, wrapped in its chain of middlewares."""
+    client = AsyncGluetunClient(
+        url=config.gluetun_url,
+        api_key=config.gluetun_api_key,
+        limiter=limiter,
+        connections=connections,
+        tls=config.gluetun_tls,
+        timeout=config.gluetun_timeout,
+    )
+    forwarder = compile_chain(
+        client,
+        config.gluetun_middlewares,
+        get_async_forwarder_middlewares(clock, config.gluetun_port_cache_ttl, metrics),
+    )
+    return forwarder, client.aclose
+
+
+def build_service(
+    config: Config,
+    limiter: HostLimiter,
+    connections: Connections,
+    metrics: Metrics | None = None,
+    events: EventBus | None = None,
+) -> Built[ServiceClient, Callable[[], None]]:
+    """Create the service's client, wrapped in its chain of middlewares."""
+    client = build_service_client(config, limiter, connections, events)
+    service = compile_chain(
+        client, config.service_middlewares, get_service_middlewares(metrics)
+    )
+    return service, client.close
+
+
+def build_async_service(
+    config: Config,
+    limiter: HostLimiter,
+    connections: Connections,
+    metrics: Metrics | None = None,
+    events: EventBus | None = None,
+) -> Built[AsyncServiceClient, Callable[[], Coroutine[None, None, None]]]:
+    """Create the service's asyncio client, wrapped in its chain of middlewares."""
+    client = build_async_service_client(config, limiter, connections, events)
+    service = compile_chain(
+        client, config.service_middlewares, get_async_service_middlewares(metrics)
+    )
+    return service, client.aclose
+
+
+def build_application(  # pylint: disable=too-many-arguments
+    config: Config,
+    limiter: HostLimiter,
+    connections: Connections,
+    listeners: Sequence[PortListener],
+    metrics: Metrics | None = None,
+    *,
+    events: EventBus | None = None,
+    leader: LeaderElection | None = None,
+    watcher: ConfigWatcher | None = None,
+    health: Health | None = None,
+) -> Application:
+    clock = SystemClock()
+    forwarder = build_forwarder(config, clock, limiter, connections, metrics)
+    service = build_service(config, limiter, connections, metrics, events)
+    reloader = None
+    if watcher is not None:
+        # Rebuilt alike, for a side reloaded to go on sharing what it did.
+        reloader = ConfigReloader(
+            watcher,
+            partial(
+                build_forwarder,
+                clock=clock,
+                limiter=limiter,
+                connections=connections,
+                metrics=metrics,
+            ),
+            partial(
+                build_service,
+                limiter=limiter,
+                connections=connections,
+                metrics=metrics,
+                events=events,
+            ),
+            partial(build_tick_deadline, clock=clock),
+            forwarder=forwarder,
+            service=service,
+            health=health,
+        )
+    listeners = [*listeners]
+    if metrics is not None:
+        listeners.append(metrics)
+    return Application(
+        synchronizer=PortSynchronizer(
+            forwarder=forwarder[0],
+            service=service[0],
+            clock=clock,
+            wait_for_first_port_duration=config.gluetun_port_wait_duration,
+            listeners=listeners,
+            events=events,
+        ),
+        clock=clock,
+        retry_interval=config.retry_interval,
+        success_interval=config.success_interval,
+        connections=connections,
+        tick_deadline=build_tick_deadline(config, clock),
+        metrics=metrics,
+        events=events,
+        leader=leader,
+        reloader=reloader,
+    )
+
+
+def build_async_application(  # pylint: disable=too-many-arguments
+    config: Config,
+    limiter: HostLimiter,
+    connections: Connections,
+    listeners: Sequence[PortListener],
+    metrics: Metrics | None = None,
+    *,
+    events: EventBus | None = None,
+    leader: LeaderElection | None = None,
+    watcher: ConfigWatcher | None = None,
+    health: Health | None = None,
+) -> AsyncApplication:
+    clock = AsyncSystemClock()
+    forwarder = build_async_forwarder(config, clock, limiter, connections, metrics)
+    service = build_async_service(config, limiter, connections, metrics, events)
+    reloader = None
+    if watcher is not None:
+        reloader = ConfigReloader(
+            watcher,
+            partial(
+                build_async_forwarder,
+                clock=clock,
+                limiter=limiter,
+                connections=connections,
+                metrics=metrics,
+            ),
+            partial(
+                build_async_service,
+                limiter=limiter,
+                connections=connections,
+                metrics=metrics,
+                events=events,
+            ),
+            partial(build_tick_deadline, clock=clock),
+            forwarder=forwarder,
+            service=service,
+            health=health,
+        )
+    listeners = [*listeners]
+    if metrics is not None:
+        listeners.append(metrics)
+    return AsyncApplication(
+        synchronizer=AsyncPortSynchronizer(
+            forwarder=forwarder[0],
+            service=service[0],
+            clock=clock,
+            wait_for_first_port_duration=config.gluetun_port_wait_duration,
+            listeners=listeners,
+            events=events,
+        ),
+        clock=clock,
+        retry_interval=config.retry_interval,
+        success_interval=config.success_interval,
+        connections=connections,
+        tick_deadline=build_tick_deadline(config, clock),
+        metrics=metrics,
+        events=events,
+        leader=leader,
+        reloader=reloader,
+    )
+
+
+def start_local_server(
+    address: tuple[str, int],
+    board: PortBoard,
+    *,
+    health: Health | None = None,
+    metrics: Metrics | None = None,
+    recorder: FlightRecorder | None = None,
+) -> LocalServer:
+    """Serve the port applied to co-located consumers, how glueforward is
+    doing, the metrics if counted, and the exchanges if recorded, on threads
+    of their own."""
+    server = LocalServer(address)
+    server.add_route(PORT_PATH, board.serve)
+    if health is not None:
+        server.add_route(HEALTH_PATH, health.serve)
+    if metrics is not None:
+        server.add_route(METRICS_PATH, metrics.serve)
+    if recorder is not None:
+        server.add_route(RECORDER_PATH, recorder.serve)
+    server.start()
+    return server
+
+
 def handle_sigterm(*_: object) -> None:
     """Shut down on SIGTERM, the signal a container is stopped with.
 
@@ -76,30 +484,153 @@ def handle_sigterm(*_: object) -> None:
     sys.exit(0)
 
 
-def main() -> None:
-    """Run the application, and turn whatever stops it into an exit code."""
+def install_profiler(directory: str) -> Profiler:
+    """Profile, or track allocations, when signalled to, writing to
+    `directory`: a container is diagnosed as it runs, not once restarted."""
+    profiler = Profiler(directory)
+    signal.signal(PROFILE_SIGNAL, profiler.toggle_profile)
+    signal.signal(ALLOCATIONS_SIGNAL, profiler.compare_allocations)
+    return profiler
+
+
+async def run_until_sigterm(application: AsyncApplication) -> None:
+    """Run the application until SIGTERM, which cancels whatever it awaits.
+
+    A request in flight is abandoned on the spot, rather than waited out the
+    way the blocking runtime has to.
+    """
+    task = asyncio.ensure_future(application.run())
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+    try:
+        await task
+    except asyncio.CancelledError:
+        logging.info("Received SIGTERM, shutting down")
+
+
+def _parse_arguments(arguments: Sequence[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="glueforward",
+        description="Keep a service listening on the port gluetun forwards. "
+        "Configured through environment variables, or a config file, see the README.",
+    )
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser(
+        HEALTHCHECK_COMMAND,
+        help="exit 0 if glueforward is ready, 1 otherwise, from HEALTH_FILE",
+    )
+    history = commands.add_parser(
+        HISTORY_COMMAND,
+        help="report how long ports lived, how often they changed, and how long "
+        "each change took to apply, from HISTORY_FILE",
+    )
+    history.add_argument(
+        "--days",
+        type=float,
+        default=DEFAULT_REPORT_DAYS,
+        help=f"how many days to look back over (default: {DEFAULT_REPORT_DAYS})",
+    )
+    return parser.parse_args(arguments)
+
+
+def healthcheck() -> int:
+    """Tell a container's HEALTHCHECK how glueforward is doing, in its terms.
+
+    Only the health file is read, so checking costs little more than
+    starting the process that does it.
+    """
+    try:
+        status = check_health_file(get_health_file())
+    except ConfigurationError as error:
+        print(error, file=sys.stderr)
+        return error.return_code
+    print(status)
+    return 0 if status in HEALTHY_STATUSES else 1
+
+
+def report_history(days: float) -> int:
+    """Tell how the ports recorded in the last `days` days fared."""
+    try:
+        reports = read_history(get_history_file(), days)
+    except ConfigurationError as error:
+        print(error, file=sys.stderr)
+        return error.return_code
+    except sqlite3.Error as error:
+        print(f"Could not read the history: {error}", file=sys.stderr)
+        return 1
+    print("\n\n".join(map(format_report, reports)) or "No history recorded yet")
+    return 0
+
+
+def main(arguments: Sequence[str] | None = None) -> None:
+    """Run the application, or the command given, and turn whatever stops
+    it into an exit code."""
+    parsed = _parse_arguments(arguments)
+    if parsed.command == HEALTHCHECK_COMMAND:
+        sys.exit(healthcheck())
+    if parsed.command == HISTORY_COMMAND:
+        sys.exit(report_history(parsed.days))
     signal.signal(signal.SIGTERM, handle_sigterm)
     configure_logging()
+    recorder: FlightRecorder | None = None
     try:
         config = get_configuration()
-        clock = SystemClock()
-        Application(
-            synchronizer=PortSynchronizer(
-                forwarder=GluetunClient(
-                    url=config.gluetun_url,
-                    api_key=config.gluetun_api_key,
-                ),
-                service=build_service_client(config),
-                clock=clock,
-                wait_for_first_port_duration=config.gluetun_port_wait_duration,
-            ),
-            clock=clock,
-            retry_interval=config.retry_interval,
-            success_interval=config.success_interval,
-        ).run()
+        install_profiler(config.profile_directory)
+        # Shared, so that both sides count against a host they have in common.
+        limiter = HostLimiter(config.host_concurrency_limit)
+        recorder = build_recorder(config)
+        connections = Connections(
+            config.connections, recorder=recorder, limiter=limiter
+        )
+        if exporters := build_span_exporters(config):
+            tracing.enable(exporters)
+            # Exiting, whatever the reason, the last spans are exported still.
+            atexit.register(tracing.disable)
+        events = start_event_bus(config)
+        board = PortBoard()
+        health = build_health(config)
+        metrics = build_metrics(config, limiter, connections, events)
+        if config.server_address is not None:
+            start_local_server(
+                config.server_address,
+                board,
+                health=health,
+                metrics=metrics,
+                recorder=recorder,
+            )
+        if leader := build_leader_election(config, health):
+            # Exiting, whatever the reason, the lease is handed over at once.
+            atexit.register(leader.stop)
+        listeners = [board, health]
+        if config.runtime == ASYNCIO_RUNTIME:
+            application = build_async_application(
+                config,
+                limiter,
+                connections,
+                listeners,
+                metrics,
+                events=events,
+                leader=leader,
+                watcher=build_config_watcher(config, recorder),
+                health=health,
+            )
+            asyncio.run(run_until_sigterm(application))
+        else:
+            build_application(
+                config,
+                limiter,
+                connections,
+                listeners,
+                metrics,
+                events=events,
+                leader=leader,
+                watcher=build_config_watcher(config, recorder),
+                health=health,
+            ).run()
     except ConfigurationError as error:
         logging.critical("%s", error)
         sys.exit(error.return_code)
     except Exception as error:  # pylint: disable=broad-exception-caught
         logging.critical("Unretryable error in lifecycle", exc_info=error)
+        if recorder is not None:
+            logging.critical("Exchanges leading to it:\n%s", recorder.dump())
         sys.exit(ReturnCodes.UNRETRYABLE_EXCEPTION_IN_LIFECYCLE)
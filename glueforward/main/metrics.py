@@ -0,0 +1,394 @@
+import threading
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Callable, Iterator, Mapping, Sequence
+from contextlib import contextmanager
+
+from . import logs, tracing
+from .errors import RetryableError
+from .events import EventBus
+from .limiter import HostLimiter
+from .port_cache import AsyncCachedPortForwarder, CachedPortForwarder
+from .ports import (
+    AsyncClock,
+    AsyncPortForwarder,
+    AsyncServiceClient,
+    Clock,
+    PortForwarder,
+    PortListener,
+    ServiceClient,
+)
+from .scheduler import Scheduler
+from .server import Reply
+from .transport import Connections
+
+# Where the local server exposes them, where Prometheus looks by default.
+METRICS_PATH = "/metrics"
+# Prometheus' text exposition format, which OpenMetrics scrapers read too.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Prometheus' own defaults, from a LAN round trip to a service timing out.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# From a port applied in the tick that saw it, to one waiting out retries.
+PROPAGATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+
+GET_FORWARDED_PORT = "get_forwarded_port"
+SET_PORT = "set_port"
+
+# Renders the series of what counts on its own, read afresh on every scrape.
+type Collector = Callable[[], Iterator[str]]
+
+
+class Histogram:
+    """Observations counted into fixed buckets, as Prometheus expects them.
+
+    Not thread-safe on its own: Metrics holds its lock around it.
+    """
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self._buckets = buckets
+        # One more than there are buckets, for whatever is above them all.
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect_left(self._buckets, value)] += 1
+        self._sum += value
+
+    def render(self, name: str) -> Iterator[str]:
+        """The histogram's lines, its buckets' counts being cumulative."""
+        yield f"# TYPE {name} histogram"
+        cumulative = 0
+        bounds = [*map(str, self._buckets), "+Inf"]
+        for bound, count in zip(bounds, self._counts):
+            cumulative += count
+            yield f'{name}_bucket{{le="{bound}"}} {cumulative}'
+        yield f"{name}_sum {self._sum}"
+        yield f"{name}_count {cumulative}"
+
+
+def render_family(
+    name: str, kind: str, samples: Mapping[str, float], label: str = "host"
+) -> Iterator[str]:
+    """A series' lines, one sample per value of its `label`."""
+    yield f"# TYPE {name} {kind}"
+    for value, sample in samples.items():
+        yield f'{name}{{{label}="{value}"}} {sample}'
+
+
+def collect_host_limiter(limiter: HostLimiter) -> Iterator[str]:
+    """How much each host held its callers back, for telling a bottleneck."""
+    hosts = limiter.get_statistics().items()
+    yield from render_family(
+        "glueforward_host_requests_in_flight",
+        "gauge",
+        {host: statistics.in_flight for host, statistics in hosts},
+    )
+    yield from render_family(
+        "glueforward_host_queue_depth",
+        "gauge",
+        {host: statistics.queue_depth for host, statistics in hosts},
+    )
+    yield from render_family(
+        "glueforward_host_waits_total",
+        "counter",
+        {host: statistics.wait_count for host, statistics in hosts},
+    )
+    yield from render_family(
+        "glueforward_host_wait_seconds_total",
+        "counter",
+        {host: statistics.wait_seconds for host, statistics in hosts},
+    )
+
+
+def collect_connections(connections: Connections) -> Iterator[str]:
+    """How often each host's requests found a connection open, how long
+    opening one took when they did not, and whether its TLS session resumed."""
+    hosts = connections.get_statistics().items()
+    yield from render_family(
+        "glueforward_host_requests_total",
+        "counter",
+        {host: statistics.requests for host, statistics in hosts},
+    )
+    yield from render_family(
+        "glueforward_host_reused_requests_total",
+        "counter",
+        {host: statistics.reused for host, statistics in hosts},
+    )
+    yield from render_family(
+        "glueforward_host_connection_reuse_ratio",
+        "gauge",
+        {host: statistics.get_reuse_ratio() for host, statistics in hosts},
+    )
+    yield from render_family(
+        "glueforward_host_connections_opened_total",
+        "counter",
+        {host: statistics.connections_opened for host, statistics in hosts},
+    )
+    yield from render_family(
+        "glueforward_host_connect_seconds_total",
+        "counter",
+        {host: statistics.connect_seconds for host, statistics in hosts},
+    )
+    yield "# TYPE glueforward_tls_handshakes_total counter"
+    for host, statistics in hosts:
+        for kind, handshakes in (
+            ("full", statistics.full_handshakes),
+            ("resumed", statistics.resumed_handshakes),
+        ):
+            labels = f'host="{host}",kind="{kind}"'
+            yield f"glueforward_tls_handshakes_total{{{labels}}} {handshakes}"
+
+
+def collect_resolution(connections: Connections) -> Iterator[str]:
+    """How each host's name was resolved, by lookups or the cache."""
+    hosts = connections.get_resolution_statistics().items()
+    yield from render_family(
+        "glueforward_dns_lookups_total",
+        "counter",
+        {host: statistics.lookups for host, statistics in hosts},
+    )
+    yield from render_family(
+        "glueforward_dns_lookup_failures_total",
+        "counter",
+        {host: statistics.failures for host, statistics in hosts},
+    )
+    yield from render_family(
+        "glueforward_dns_cached_answers_total",
+        "counter",
+        {host: statistics.cached_answers for host, statistics in hosts},
+    )
+    yield from render_family(
+        "glueforward_dns_stale_answers_total",
+        "counter",
+        {host: statistics.stale_answers for host, statistics in hosts},
+    )
+    yield from render_family(
+        "glueforward_dns_lookup_seconds_total",
+        "counter",
+        {host: statistics.lookup_seconds for host, statistics in hosts},
+    )
+
+
+def collect_latency(connections: Connections) -> Iterator[str]:
+    """How long each endpoint took over its latest requests, which its
+    timeout follows."""
+    endpoints = connections.get_latency_statistics().items()
+    yield from render_family(
+        "glueforward_endpoint_latency_samples",
+        "gauge",
+        {endpoint: statistics.samples for endpoint, statistics in endpoints},
+        label="endpoint",
+    )
+    yield "# TYPE glueforward_endpoint_latency_seconds gauge"
+    for endpoint, statistics in endpoints:
+        for quantile, latency in (("0.5", statistics.p50), ("0.99", statistics.p99)):
+            labels = f'endpoint="{endpoint}",quantile="{quantile}"'
+            yield f"glueforward_endpoint_latency_seconds{{{labels}}} {latency}"
+
+
+def collect_dropped(events: EventBus) -> Iterator[str]:
+    """What was dropped rather than wait on a sink, an exporter or the log."""
+    yield from render_family(
+        "glueforward_dropped_events_total",
+        "counter",
+        events.get_dropped(),
+        label="sink",
+    )
+    yield "# TYPE glueforward_dropped_spans_total counter"
+    yield f"glueforward_dropped_spans_total {tracing.get_dropped()}"
+    yield "# TYPE glueforward_dropped_log_records_total counter"
+    yield f"glueforward_dropped_log_records_total {logs.get_dropped()}"
+
+
+def collect_scheduler(scheduler: Scheduler) -> Iterator[str]:
+    """How late the scheduler ran its last job, which a tick overrunning or
+    a stalled job pushes back every job after it."""
+    yield "# TYPE glueforward_scheduler_lag_seconds gauge"
+    yield f"glueforward_scheduler_lag_seconds {scheduler.get_lag()}"
+
+
+def collect_port_cache(
+    cache: CachedPortForwarder | AsyncCachedPortForwarder,
+) -> Iterator[str]:
+    """How often the forwarded port was answered without asking gluetun."""
+    statistics = cache.get_statistics()
+    yield from render_family(
+        "glueforward_port_cache_lookups_total",
+        "counter",
+        {
+            "hit": statistics.hits,
+            "miss": statistics.misses,
+            "coalesced": statistics.coalesced,
+        },
+        label="result",
+    )
+
+
+def _get_retryable_errors(cls: type[RetryableError] = RetryableError) -> Iterator[str]:
+    """The names of every retryable error, for each to be counted from 0."""
+    for subclass in cls.__subclasses__():
+        yield subclass.__name__
+        yield from _get_retryable_errors(subclass)
+
+
+class Metrics(PortListener):  # pylint: disable=too-many-instance-attributes
+    """What glueforward does, counted for Prometheus to scrape.
+
+    Recording costs a lock and a few additions, and nothing is formatted
+    until a scrape asks for it. How long a port change takes to reach the
+    service is timed from the first answer carrying it, to its application.
+    """
+
+    def __init__(self, clock: Clock | AsyncClock) -> None:
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._ticks = 0
+        self._successes = 0
+        self._errors: Counter[str] = Counter()
+        self._latencies = {
+            GET_FORWARDED_PORT: Histogram(LATENCY_BUCKETS),
+            SET_PORT: Histogram(LATENCY_BUCKETS),
+        }
+        self._propagation = Histogram(PROPAGATION_BUCKETS)
+        # The port last seen on the forwarder, and since when if not applied yet.
+        self._seen: tuple[int | None, float | None] = (None, None)
+        # The port last applied, and since when it has been.
+        self._applied: tuple[int, float] | None = None
+        self._collectors: dict[str, Collector] = {}
+
+    def register(self, name: str, collector: Collector) -> None:
+        """Render `collector`'s series on every scrape, in place of whatever
+        was registered as `name` before, such as a component since rebuilt."""
+        with self._lock:
+            self._collectors[name] = collector
+
+    def count_tick(self, error: RetryableError | None) -> None:
+        with self._lock:
+            self._ticks += 1
+            if error is None:
+                self._successes += 1
+            else:
+                self._errors[type(error).__name__] += 1
+
+    @contextmanager
+    def time(self, operation: str) -> Iterator[None]:
+        """Time `operation`, which may be GET_FORWARDED_PORT or SET_PORT,
+        whether it succeeds or not."""
+        started_at = self._clock.monotonic()
+        try:
+            yield
+        finally:
+            latency = self._clock.monotonic() - started_at
+            with self._lock:
+                self._latencies[operation].observe(latency)
+
+    def port_observed(self, port: int | None) -> None:
+        """Note a port the forwarder answered, for its propagation to be timed."""
+        with self._lock:
+            if port is not None and port != self._seen[0]:
+                self._seen = (port, self._clock.monotonic())
+
+    def port_applied(self, port: int) -> None:
+        now = self._clock.monotonic()
+        with self._lock:
+            seen_port, seen_at = self._seen
+            if port == seen_port and seen_at is not None:
+                self._propagation.observe(now - seen_at)
+                self._seen = (port, None)
+            if self._applied is None or self._applied[0] != port:
+                self._applied = (port, now)
+
+    def render(self) -> str:
+        with self._lock:
+            lines = [
+                "# TYPE glueforward_ticks_total counter",
+                f"glueforward_ticks_total {self._ticks}",
+                "# TYPE glueforward_successes_total counter",
+                f"glueforward_successes_total {self._successes}",
+                "# TYPE glueforward_retryable_errors_total counter",
+            ]
+            errors = dict.fromkeys(sorted(_get_retryable_errors()), 0) | self._errors
+            lines += [
+                f'glueforward_retryable_errors_total{{error="{name}"}} {count}'
+                for name, count in errors.items()
+            ]
+            for operation, histogram in self._latencies.items():
+                lines.extend(histogram.render(f"glueforward_{operation}_seconds"))
+            name = "glueforward_port_propagation_seconds"
+            lines.extend(self._propagation.render(name))
+            if self._applied is not None:
+                port, applied_at = self._applied
+                lines += [
+                    "# TYPE glueforward_forwarded_port gauge",
+                    f"glueforward_forwarded_port {port}",
+                    "# TYPE glueforward_forwarded_port_age_seconds gauge",
+                    "glueforward_forwarded_port_age_seconds "
+                    f"{self._clock.monotonic() - applied_at}",
+                ]
+            collectors = list(self._collectors.values())
+        # Outside the lock: each collector takes its component's own.
+        for collect in collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+    def serve(self, _: dict[str, str]) -> Reply:
+        return Reply(200, self.render().encode(), CONTENT_TYPE)
+
+
+class TimedPortForwarder(PortForwarder):
+    """A PortForwarder whose every answer, and how long it took, is counted."""
+
+    def __init__(self, forwarder: PortForwarder, metrics: Metrics) -> None:
+        self._forwarder = forwarder
+        self._metrics = metrics
+
+    def get_forwarded_port(self) -> int | None:
+        with self._metrics.time(GET_FORWARDED_PORT):
+            port = self._forwarder.get_forwarded_port()
+        self._metrics.port_observed(port)
+        return port
+
+
+class TimedServiceClient(ServiceClient):
+    """A ServiceClient whose every port written is timed."""
+
+    def __init__(self, service: ServiceClient, metrics: Metrics) -> None:
+        self._service = service
+        self._metrics = metrics
+
+    def warm_up(self) -> None:
+        self._service.warm_up()
+
+    def set_port(self, port: int) -> None:
+        with self._metrics.time(SET_PORT):
+            self._service.set_port(port)
+
+
+class AsyncTimedPortForwarder(AsyncPortForwarder):
+    """The same TimedPortForwarder, on asyncio."""
+
+    def __init__(self, forwarder: AsyncPortForwarder, metrics: Metrics) -> None:
+        self._forwarder = forwarder
+        self._metrics = metrics
+
+    async def get_forwarded_port(self) -> int | None:
+        with self._metrics.time(GET_FORWARDED_PORT):
+            port = await self._forwarder.get_forwarded_port()
+        self._metrics.port_observed(port)
+        return port
+
+
+class AsyncTimedServiceClient(AsyncServiceClient):
+    """The same TimedServiceClient, on asyncio."""
+
+    def __init__(self, service: AsyncServiceClient, metrics: Metrics) -> None:
+        self._service = service
+        self._metrics = metrics
+
+    async def warm_up(self) -> None:
+        await self._service.warm_up()
+
+    async def set_port(self, port: int) -> None:
+        with self._metrics.time(SET_PORT):
+            await self._service.set_port(port)
@@ -0,0 +1,169 @@
+from collections.abc import Callable, Mapping, Sequence
+from functools import partial
+
+from .metrics import (
+    AsyncTimedPortForwarder,
+    AsyncTimedServiceClient,
+    Metrics,
+    TimedPortForwarder,
+    TimedServiceClient,
+    collect_port_cache,
+)
+from .port_cache import AsyncCachedPortForwarder, CachedPortForwarder
+from .ports import (
+    AsyncClock,
+    AsyncPortForwarder,
+    AsyncServiceClient,
+    Clock,
+    PortForwarder,
+    ServiceClient,
+)
+
+# What a chain names its middlewares by.
+TIMING = "timing"
+CACHE = "cache"
+DEDUPE = "dedupe"
+
+# What each side may be wrapped in.
+FORWARDER_MIDDLEWARES = (CACHE, TIMING)
+SERVICE_MIDDLEWARES = (DEDUPE, TIMING)
+
+# What each side is wrapped in unless configured otherwise, outermost first:
+# the cache answers before the requests it saves get timed.
+DEFAULT_FORWARDER_CHAIN = (CACHE, TIMING)
+DEFAULT_SERVICE_CHAIN = (TIMING,)
+
+# What the cache's counts are collected as, in place of a cache rebuilt since.
+PORT_CACHE_COLLECTOR = "port_cache"
+
+# Wraps a PortForwarder or a ServiceClient into one doing something more.
+type Middleware[C] = Callable[[C], C]
+
+
+def _unwrapped[T](component: T) -> T:
+    """A middleware with nothing to do, which is left out of the chain."""
+    return component
+
+
+def _counted[F, P: (CachedPortForwarder, AsyncCachedPortForwarder)](
+    cache: Callable[[F], P], metrics: Metrics | None
+) -> Callable[[F], P]:
+    """Have each cache `cache` builds counted on `metrics`, if any."""
+    if metrics is None:
+        return cache
+
+    def build_counted(forwarder: F) -> P:
+        built = cache(forwarder)
+        metrics.register(PORT_CACHE_COLLECTOR, partial(collect_port_cache, built))
+        return built
+
+    return build_counted
+
+
+def compile_chain[T](
+    component: T, chain: Sequence[str], middlewares: Mapping[str, Middleware[T]]
+) -> T:
+    """Wrap `component` in the `middlewares` that `chain` names, the first
+    outermost.
+
+    Done once, at startup: each call then only goes through a method per
+    middleware in the chain, and none for one with nothing to do.
+    """
+    for name in reversed(chain):
+        component = middlewares[name](component)
+    return component
+
+
+def get_forwarder_middlewares(
+    clock: Clock, cache_ttl: float, metrics: Metrics | None
+) -> dict[str, Middleware[PortForwarder]]:
+    return {
+        CACHE: _counted(
+            partial(CachedPortForwarder, clock=clock, ttl=cache_ttl), metrics
+        ),
+        TIMING: (
+            _unwrapped
+            if metrics is None
+            else partial(TimedPortForwarder, metrics=metrics)
+        ),
+    }
+
+
+def get_async_forwarder_middlewares(
+    clock: AsyncClock, cache_ttl: float, metrics: Metrics | None
+) -> dict[str, Middleware[AsyncPortForwarder]]:
+    return {
+        CACHE: _counted(
+            partial(AsyncCachedPortForwarder, clock=clock, ttl=cache_ttl), metrics
+        ),
+        TIMING: (
+            _unwrapped
+            if metrics is None
+            else partial(AsyncTimedPortForwarder, metrics=metrics)
+        ),
+    }
+
+
+def get_service_middlewares(
+    metrics: Metrics | None,
+) -> dict[str, Middleware[ServiceClient]]:
+    return {
+        DEDUPE: DedupedServiceClient,
+        TIMING: (
+            _unwrapped
+            if metrics is None
+            else partial(TimedServiceClient, metrics=metrics)
+        ),
+    }
+
+
+def get_async_service_middlewares(
+    metrics: Metrics | None,
+) -> dict[str, Middleware[AsyncServiceClient]]:
+    return {
+        DEDUPE: AsyncDedupedServiceClient,
+        TIMING: (
+            _unwrapped
+            if metrics is None
+            else partial(AsyncTimedServiceClient, metrics=metrics)
+        ),
+    }
+
+
+class DedupedServiceClient(ServiceClient):
+    """A ServiceClient only set to a port other than the one it last was.
+
+    Every tick otherwise sets the service's port, whether it changed or not,
+    which also puts it back should the service have been reset to another.
+    Deduped, that write is saved, for a service known to keep its port.
+    """
+
+    def __init__(self, service: ServiceClient) -> None:
+        self._service = service
+        self._port: int | None = None
+
+    def warm_up(self) -> None:
+        self._service.warm_up()
+
+    def set_port(self, port: int) -> None:
+        if port == self._port:
+            return
+        self._service.set_port(port)
+        self._port = port
+
+
+class AsyncDedupedServiceClient(AsyncServiceClient):
+    """The same DedupedServiceClient, on asyncio."""
+
+    def __init__(self, service: AsyncServiceClient) -> None:
+        self._service = service
+        self._port: int | None = None
+
+    async def warm_up(self) -> None:
+        await self._service.warm_up()
+
+    async def set_port(self, port: int) -> None:
+        if port == self._port:
+            return
+        await self._service.set_port(port)
+        self._port = port
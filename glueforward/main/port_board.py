@@ -0,0 +1,51 @@
+import json
+import math
+import threading
+
+from .gluetun import NO_FORWARDED_PORT
+from .ports import PortListener
+from .server import Reply
+
+# How long a long poll may hold a connection open, whatever it asks for.
+MAX_WAIT = 300
+DEFAULT_WAIT = 60
+
+
+class PortBoard(PortListener):
+    """The port last applied to the service, for consumers that would
+    otherwise each poll gluetun on their own.
+
+    Served in gluetun's own shape, so that switching a consumer over is a
+    matter of changing its URL. A consumer passing `differs_from` is only
+    answered once the port differs from it, or with a 304 when `timeout`
+    runs out first: it hears of a change the moment it is applied.
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._port = NO_FORWARDED_PORT
+
+    def port_applied(self, port: int) -> None:
+        with self._condition:
+            self._port = port
+            self._condition.notify_all()
+
+    def wait_for_change(self, than: int, timeout: float) -> int:
+        """Return the port once it is not `than`, or `than` after `timeout`."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._port != than, timeout)
+            return self._port
+
+    def serve(self, query: dict[str, str]) -> Reply:
+        try:
+            differs_from = int(query.get("differs_from", -1))
+            timeout = float(query.get("timeout", DEFAULT_WAIT))
+        except ValueError:
+            return Reply(400, b'{"error": "differs_from and timeout must be numbers"}')
+        # NaN would slip past the cap below, and wait for ever.
+        if not math.isfinite(timeout):
+            return Reply(400, b'{"error": "timeout must be a finite number"}')
+        port = self.wait_for_change(differs_from, min(timeout, MAX_WAIT))
+        if port == differs_from:
+            return Reply(304)
+        return Reply(200, json.dumps({"port": port}).encode())
@@ -0,0 +1,174 @@
+import asyncio
+import threading
+from collections import Counter
+from collections.abc import Callable, Coroutine
+from dataclasses import dataclass
+
+from .ports import AsyncClock, AsyncPortForwarder, Clock, PortForwarder
+
+
+@dataclass(frozen=True)
+class CacheStatistics:
+    """How often the forwarded port came from the cache rather than gluetun."""
+
+    hits: int
+    misses: int
+    coalesced: int
+
+
+class _Flight:
+    """One request to the forwarder, whose answer every caller waiting shares."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.port: int | None = None
+        # Whatever stopped the request, for waiters never to take it for None.
+        self.error: BaseException | None = None
+        # Set by an invalidation arriving mid-flight: the answer is still
+        # handed to whoever waits on it, but not cached for anyone after.
+        self.is_stale = False
+
+
+class _AsyncFlight:
+    """The same flight, whose answer is a task every caller awaits."""
+
+    def __init__(
+        self, fly: Callable[["_AsyncFlight"], Coroutine[None, None, int | None]]
+    ) -> None:
+        self.is_stale = False
+        self.task = asyncio.create_task(fly(self))
+
+
+class _PortCache[F: (_Flight, _AsyncFlight)]:
+    """What both caches share: the port last answered, the flight to the
+    forwarder if one is under way, and the counts."""
+
+    def __init__(self, clock: Clock | AsyncClock, ttl: float) -> None:
+        self._clock = clock
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        # The port last answered, and until when it may be answered again.
+        self._entry: tuple[int | None, float] = (None, float("-inf"))
+        self._flight: F | None = None
+        self._counts: Counter[str] = Counter()
+
+    def get_statistics(self) -> CacheStatistics:
+        with self._lock:
+            return CacheStatistics(
+                hits=self._counts["hits"],
+                misses=self._counts["misses"],
+                coalesced=self._counts["coalesced"],
+            )
+
+    def invalidate(self) -> None:
+        """Forget the cached port, for when something says it has changed.
+
+        A request in flight is forgotten too: callers from now on send one
+        of their own, rather than share an answer from before.
+        """
+        with self._lock:
+            self._entry = (None, float("-inf"))
+            if self._flight is not None:
+                self._flight.is_stale = True
+                self._flight = None
+
+    def _get_cached(self) -> tuple[bool, int | None]:
+        """Answer from memory if the entry is still fresh, and count it."""
+        port, expires_at = self._entry
+        if is_fresh := self._clock.monotonic() < expires_at:
+            self._counts["hits"] += 1
+        return is_fresh, port
+
+    def _land(self, flight: F, port: int | None) -> None:
+        """Cache what `flight` brought back, unless invalidated since."""
+        if not flight.is_stale:
+            self._entry = (port, self._clock.monotonic() + self._ttl)
+
+    def _end(self, flight: F) -> None:
+        """No longer have callers join `flight`, unless a newer one took over."""
+        if self._flight is flight:
+            self._flight = None
+
+
+class CachedPortForwarder(_PortCache[_Flight], PortForwarder):
+    """A PortForwarder answering from memory for `ttl` seconds after asking.
+
+    Callers arriving while a request is already in flight wait for its
+    answer rather than sending their own, so however many ask at once, the
+    forwarder is asked once. Errors are never cached: the next caller asks
+    again.
+    """
+
+    def __init__(self, forwarder: PortForwarder, clock: Clock, ttl: float) -> None:
+        super().__init__(clock, ttl)
+        self._forwarder = forwarder
+
+    def _fly(self, flight: _Flight) -> int | None:
+        """Ask the forwarder on behalf of everyone waiting on `flight`."""
+        try:
+            flight.port = self._forwarder.get_forwarded_port()
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                if flight.error is None:
+                    self._land(flight, flight.port)
+                self._end(flight)
+            flight.done.set()
+        return flight.port
+
+    def get_forwarded_port(self) -> int | None:
+        with self._lock:
+            is_fresh, port = self._get_cached()
+            if is_fresh:
+                return port
+            if (flight := self._flight) is None:
+                self._counts["misses"] += 1
+                flight = self._flight = _Flight()
+                is_leader = True
+            else:
+                self._counts["coalesced"] += 1
+                is_leader = False
+        if is_leader:
+            return self._fly(flight)
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.port
+
+
+class AsyncCachedPortForwarder(_PortCache[_AsyncFlight], AsyncPortForwarder):
+    """The same CachedPortForwarder on asyncio.
+
+    A caller being cancelled only stops it waiting: the request it shares
+    carries on for the others.
+    """
+
+    def __init__(
+        self, forwarder: AsyncPortForwarder, clock: AsyncClock, ttl: float
+    ) -> None:
+        super().__init__(clock, ttl)
+        self._forwarder = forwarder
+
+    async def _fly(self, flight: _AsyncFlight) -> int | None:
+        try:
+            port = await self._forwarder.get_forwarded_port()
+        finally:
+            with self._lock:
+                self._end(flight)
+        with self._lock:
+            self._land(flight, port)
+        return port
+
+    async def get_forwarded_port(self) -> int | None:
+        with self._lock:
+            is_fresh, port = self._get_cached()
+            if is_fresh:
+                return port
+            if (flight := self._flight) is None:
+                self._counts["misses"] += 1
+                flight = self._flight = _AsyncFlight(self._fly)
+            else:
+                self._counts["coalesced"] += 1
+        return await asyncio.shield(flight.task)
@@ -1,7 +1,21 @@
+import asyncio
+import contextvars
 import logging
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
 
 from .errors import RetryableError
-from .ports import Clock, PortForwarder, ServiceClient
+from .events import EventBus, PortApplied, PortObserved, PortUnchanged
+from .ports import (
+    AsyncClock,
+    AsyncPortForwarder,
+    AsyncServiceClient,
+    Clock,
+    PortForwarder,
+    PortListener,
+    ServiceClient,
+)
+from .tracing import traced, traced_async
 
 
 class NoForwardedPortYet(RetryableError):
@@ -23,27 +37,39 @@ class ForwardedPortNeverCame(Exception):
         )
 
 
-class PortSynchronizer:
-    """Keeps the service listening on whichever port the VPN forwards.
+def _get_worst_error(
+    error: BaseException, other: BaseException | None
+) -> BaseException:
+    """Pick which of two errors raised side by side to report: one no retry
+    can fix comes first, since retrying would only meet it again. The other
+    is noted on it, and each keeps its own cause."""
+    if other is None:
+        return error
+    worst, lesser = (
+        (other, error) if isinstance(error, RetryableError) else (error, other)
+    )
+    worst.add_note(f"Raised alongside {lesser!r}")
+    return worst
 
-    Nothing is remembered between two runs: the port is written afresh every
-    time, since anything may have edited it since.
-    """
+
+class _FirstPortDeadline:
+    """What both synchronizers share: the wait for a first port, and who to
+    tell once one is applied."""
 
     def __init__(
         self,
-        forwarder: PortForwarder,
-        service: ServiceClient,
-        clock: Clock,
+        clock: Clock | AsyncClock,
         wait_for_first_port_duration: float,
+        listeners: Sequence[PortListener],
+        events: EventBus | None,
     ) -> None:
-        self._forwarder = forwarder
-        self._service = service
         self._clock = clock
-        self._wait_for_first_port_until = (
-            clock.monotonic() + wait_for_first_port_duration
-        )
+        self._started_at = clock.monotonic()
+        self._wait_for_first_port_duration = wait_for_first_port_duration
         self._has_ever_forwarded_port = False
+        self._listeners = listeners
+        self._events = events or EventBus()
+        self._applied_port: int | None = None
 
     def _get_error_for_missing_port(self) -> Exception:
         """Tell a tunnel still being negotiated from one that never will be.
@@ -54,14 +80,128 @@ class PortSynchronizer:
         """
         if self._has_ever_forwarded_port:
             return NoForwardedPortYet()
-        if self._clock.monotonic() >= self._wait_for_first_port_until:
+        waited = self._clock.monotonic() - self._started_at
+        if waited >= self._wait_for_first_port_duration:
             return ForwardedPortNeverCame()
         return NoForwardedPortYet()
 
-    def synchronize(self) -> None:
-        port = self._forwarder.get_forwarded_port()
+    def _check_port(self, port: int | None) -> int:
+        """Let a forwarded port through, or raise what its absence means."""
+        self._events.publish(PortObserved(port))
         if port is None:
             raise self._get_error_for_missing_port()
         self._has_ever_forwarded_port = True
+        return port
+
+    def _announce(self, port: int) -> None:
+        logging.info("Listening port set to %d", port, extra={"port": port})
+        for listener in self._listeners:
+            listener.port_applied(port)
+        if port == self._applied_port:
+            self._events.publish(PortUnchanged(port))
+        else:
+            self._applied_port = port
+            self._events.publish(PortApplied(port))
+
+
+class PortSynchronizer(_FirstPortDeadline):
+    """Keeps the service listening on whichever port the VPN forwards.
+
+    Nothing is remembered between two runs: the port is written afresh every
+    time, since anything may have edited it since.
+
+    The service is warmed up on a thread of its own while the port is being
+    asked for, so that a login is off the critical path, and long done by
+    the time a first port comes.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        forwarder: PortForwarder,
+        service: ServiceClient,
+        clock: Clock,
+        wait_for_first_port_duration: float,
+        listeners: Sequence[PortListener] = (),
+        *,
+        events: EventBus | None = None,
+    ) -> None:
+        super().__init__(clock, wait_for_first_port_duration, listeners, events)
+        self._forwarder = forwarder
+        self._service = service
+        self._warmer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="warm-up")
+
+    def reconfigure(
+        self,
+        wait_for_first_port_duration: float,
+        forwarder: PortForwarder | None = None,
+        service: ServiceClient | None = None,
+    ) -> None:
+        """Synchronize with these from the next run on, keeping either side
+        left to None, and its session with it, as it is."""
+        self._wait_for_first_port_duration = wait_for_first_port_duration
+        self._forwarder = forwarder or self._forwarder
+        self._service = service or self._service
+
+    @traced("synchronize")
+    def synchronize(self) -> None:
+        # Run in the tick's context, for the warm-up to keep to its deadline.
+        context = contextvars.copy_context()
+        warming = self._warmer.submit(context.run, self._service.warm_up)
+        try:
+            port = self._forwarder.get_forwarded_port()
+        except Exception as error:
+            # Even with no port to write, credentials the service rejects are
+            # worth hearing about now rather than once one comes. Raised as
+            # they are, for each to keep its own cause.
+            # pylint: disable-next=raise-missing-from
+            raise _get_worst_error(error, warming.exception())
+        if (error := warming.exception()) is not None:
+            raise error
+        port = self._check_port(port)
         self._service.set_port(port)
-        logging.info("Listening port set to %d", port)
+        self._announce(port)
+
+
+class AsyncPortSynchronizer(_FirstPortDeadline):
+    """The same PortSynchronizer, awaiting both sides on asyncio, and the
+    warm-up alongside the port."""
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        forwarder: AsyncPortForwarder,
+        service: AsyncServiceClient,
+        clock: AsyncClock,
+        wait_for_first_port_duration: float,
+        listeners: Sequence[PortListener] = (),
+        *,
+        events: EventBus | None = None,
+    ) -> None:
+        super().__init__(clock, wait_for_first_port_duration, listeners, events)
+        self._forwarder = forwarder
+        self._service = service
+
+    def reconfigure(
+        self,
+        wait_for_first_port_duration: float,
+        forwarder: AsyncPortForwarder | None = None,
+        service: AsyncServiceClient | None = None,
+    ) -> None:
+        """The same as PortSynchronizer.reconfigure."""
+        self._wait_for_first_port_duration = wait_for_first_port_duration
+        self._forwarder = forwarder or self._forwarder
+        self._service = service or self._service
+
+    @traced_async("synchronize")
+    async def synchronize(self) -> None:
+        port, warmed = await asyncio.gather(
+            self._forwarder.get_forwarded_port(),
+            self._service.warm_up(),
+            return_exceptions=True,
+        )
+        if isinstance(port, BaseException):
+            raise _get_worst_error(port, warmed)
+        if isinstance(warmed, BaseException):
+            raise warmed
+        port = self._check_port(port)
+        await self._service.set_port(port)
+        self._announce(port)
@@ -20,6 +20,41 @@ class PortForwarder(Protocol):
 
 
 class ServiceClient(Protocol):
-    """The application whose listening port is kept in sync with the VPN's."""
+    """The application whose listening port is kept in sync with the VPN's.
+
+    `warm_up` gets done ahead of time whatever `set_port` would otherwise do
+    first, logging in for instance, so that it is asked while the port is
+    still on its way. It is cheap once warm, and may be called every time.
+    """
+
+    def warm_up(self) -> None: ...
 
     def set_port(self, port: int) -> None: ...
+
+
+class AsyncClock(Protocol):
+    """A Clock whose waiting leaves the event loop free to run anything else."""
+
+    def monotonic(self) -> float: ...
+
+    async def sleep(self, duration: float) -> None: ...
+
+
+class AsyncPortForwarder(Protocol):
+    """A PortForwarder whose request can be awaited, and cancelled midway."""
+
+    async def get_forwarded_port(self) -> int | None: ...
+
+
+class AsyncServiceClient(Protocol):
+    """A ServiceClient whose requests can be awaited, and cancelled midway."""
+
+    async def warm_up(self) -> None: ...
+
+    async def set_port(self, port: int) -> None: ...
+
+
+class PortListener(Protocol):
+    """Anything to be told once a port has been written to the service."""
+
+    def port_applied(self, port: int) -> None: ...
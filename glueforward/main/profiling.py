@@ -0,0 +1,83 @@
+import cProfile
+import logging
+import os
+import signal
+import time
+import tracemalloc
+
+# Left unhandled, either would kill the process, so no one sends them idly.
+PROFILE_SIGNAL = signal.SIGUSR1
+ALLOCATIONS_SIGNAL = signal.SIGUSR2
+
+# Enough of a stack to tell httpx's allocations from logging's and ours.
+TRACEMALLOC_FRAMES = 10
+# The lines of a diff worth reading: the rest is noise past the first few.
+MAX_ALLOCATION_LINES = 50
+
+
+class Profiler:
+    """Profiles a running glueforward on demand, and tracks what it allocates.
+
+    Each PROFILE_SIGNAL turns profiling of the main thread, where every tick
+    runs, on or off; turned off, the stats are written to `directory`, for
+    pstats or snakeviz to read. Each ALLOCATIONS_SIGNAL writes there the
+    memory allocated since the one before, by line: the first starts
+    tracking, which costs nothing until then.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self._directory = directory
+        self._profile: cProfile.Profile | None = None
+        self._snapshot: tracemalloc.Snapshot | None = None
+        # Numbered, for two written within the same second to both be kept.
+        self._written = 0
+
+    def _get_path(self, kind: str, extension: str) -> str:
+        self._written += 1
+        name = f"glueforward-{kind}-{time.strftime('%Y%m%dT%H%M%S')}-{self._written}"
+        return os.path.join(self._directory, f"{name}.{extension}")
+
+    def toggle_profile(self, *_: object) -> None:
+        """Start profiling, or stop and write what was profiled."""
+        if (profile := self._profile) is None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+            logging.info("Profiling started, until the next signal")
+            return
+        profile.disable()
+        self._profile = None
+        path = self._get_path("profile", "prof")
+        try:
+            profile.dump_stats(path)
+        except OSError as error:
+            logging.warning("Could not write the profile: %r", error)
+            return
+        logging.info("Profile written to %s", path)
+
+    def compare_allocations(self, *_: object) -> None:
+        """Write what was allocated since the last time, by line, or since
+        tracking started the first time."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._snapshot = None
+            logging.info("Tracking allocations, until the next signal")
+            return
+        # Only what glueforward and its dependencies allocated.
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        statistics = (
+            snapshot.statistics("lineno")
+            if self._snapshot is None
+            else snapshot.compare_to(self._snapshot, "lineno")
+        )
+        self._snapshot = snapshot
+        path = self._get_path("allocations", "txt")
+        try:
+            with open(path, "w", encoding="utf-8") as file:
+                for statistic in statistics[:MAX_ALLOCATION_LINES]:
+                    print(statistic, file=file)
+        except OSError as error:
+            logging.warning("Could not write the allocations: %r", error)
+            return
+        logging.info("Allocations written to %s", path)
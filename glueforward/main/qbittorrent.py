@@ -4,7 +4,14 @@ import logging
 import httpx
 
 from .errors import RetryableError
-from .ports import ServiceClient
+from .events import AuthRenewed, EventBus
+from .limiter import HostLimiter
+from .ports import AsyncServiceClient, ServiceClient
+from .responses import Body, read_body, read_body_async
+from .timeouts import DEFAULT_TIMEOUT
+from .tls import TlsSettings
+from .tracing import traced, traced_async
+from .transport import Connections, get_host
 
 
 class QBittorrentServerError(RetryableError):
@@ -61,65 +68,193 @@ class QBittorrentAuthenticationNeeded(RetryableError):
         )
 
 
-class QBittorrentClient(ServiceClient):
+LOGIN_PATH = "/api/v2/auth/login"
+SET_PREFERENCES_PATH = "/api/v2/app/setPreferences"
 
-    _client: httpx.Client
+
+def _get_preferences_form(port: int) -> dict[str, str]:
+    """The form setting the listening port, and nothing qBittorrent may override."""
+    data = {"listen_port": port, "random_port": False, "upnp": False}
+    return {"json": json.dumps(data)}
+
+
+class _QBittorrentClientBase[C: (httpx.Client, httpx.AsyncClient)]:
+    """What both clients share: the session, and what each answer means."""
+
+    _client: C
     _credentials: dict[str, str]
 
-    def __init__(self, url: str, credentials: dict[str, str]):
+    def __init__(
+        self,
+        client: C,
+        url: str,
+        credentials: dict[str, str],
+        limiter: HostLimiter | None,
+        events: EventBus | None,
+    ):
+        self._client = client
+        self._url = url
         self._credentials = credentials
-        self._client = httpx.Client(base_url=url)
-        logging.debug("qBittorrent client created with base url %s", url)
+        self._host = get_host(url)
+        self._limiter = limiter or HostLimiter()
+        self._events = events or EventBus()
 
     def _get_is_authenticated(self) -> bool:
         return len(self._client.cookies) > 0
 
+    def _reset_authentication(self) -> None:
+        self._client.cookies.clear()
+        logging.debug("qBittorrent client authentication reset")
+
+    def _get_unreachable_error(self) -> Exception:
+        return QBittorrentUnreachable(self._url)
+
+    @staticmethod
+    def _get_login_error(status_code: int, body: Body) -> Exception:
+        if status_code == 401:
+            return QBittorrentInvalidCredentials()
+        if status_code == 403:
+            return QBittorrentBanned(body.get_snippet())
+        if status_code >= 500:
+            return QBittorrentServerError()
+        return QBittorrentUnexpectedResponse(status_code)
+
+    def _get_set_preferences_error(self, status_code: int) -> Exception:
+        if status_code == 403:
+            # Authenticated earlier, so this is an expired session: renew it.
+            logging.warning("qBittorrent session expired")
+            self._reset_authentication()
+            return QBittorrentAuthenticationNeeded()
+        if status_code >= 500:
+            return QBittorrentServerError()
+        return QBittorrentUnexpectedResponse(status_code)
+
+
+class QBittorrentClient(_QBittorrentClientBase[httpx.Client], ServiceClient):
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        url: str,
+        credentials: dict[str, str],
+        limiter: HostLimiter | None = None,
+        connections: Connections | None = None,
+        *,
+        tls: TlsSettings = TlsSettings(),
+        timeout: float = DEFAULT_TIMEOUT,
+        events: EventBus | None = None,
+    ):
+        self._connections = connections or Connections()
+        client = self._connections.open_client(url, tls=tls, timeout=timeout)
+        super().__init__(client, url, credentials, limiter, events)
+        logging.debug("qBittorrent client created with base url %s", url)
+
+    def close(self) -> None:
+        """Close the connections, and the session, once replaced."""
+        self._connections.close_client(self._client)
+
+    @traced("qbittorrent.authenticate")
     def _authenticate(self) -> None:
         logging.debug("Authenticating to qBittorrent")
         try:
-            response = self._client.post(
-                url="/api/v2/auth/login",
-                data=self._credentials,
-            )
-            response.raise_for_status()
+            with (
+                self._limiter.slot(self._host),
+                self._client.stream(
+                    "POST", LOGIN_PATH, data=self._credentials
+                ) as response,
+            ):
+                body = read_body(response)
         except (httpx.NetworkError, httpx.TimeoutException) as exception:
-            raise QBittorrentUnreachable(self._client.base_url) from exception
-        except httpx.HTTPStatusError as exception:
-            status_code = exception.response.status_code
-            if status_code == 401:
-                raise QBittorrentInvalidCredentials() from exception
-            if status_code == 403:
-                raise QBittorrentBanned(exception.response.text) from exception
-            if status_code >= 500:
-                raise QBittorrentServerError() from exception
-            raise QBittorrentUnexpectedResponse(status_code) from exception
+            raise self._get_unreachable_error() from exception
+        if not response.is_success:
+            raise self._get_login_error(response.status_code, body)
         self._client.cookies.update(response.cookies)
         logging.debug("qBittorrent client authenticated")
+        self._events.publish(AuthRenewed("qbittorrent"))
 
-    def _reset_authentication(self) -> None:
-        self._client.cookies.clear()
-        logging.debug("qBittorrent client authentication reset")
+    def warm_up(self) -> None:
+        if not self._get_is_authenticated():
+            self._authenticate()
 
+    @traced("qbittorrent.set_port")
     def set_port(self, port: int) -> None:
+        self.warm_up()
+        try:
+            with (
+                self._limiter.slot(self._host),
+                self._client.stream(
+                    "POST", SET_PREFERENCES_PATH, data=_get_preferences_form(port)
+                ) as response,
+            ):
+                # Read only for the connection to be reused.
+                read_body(response)
+        except (httpx.NetworkError, httpx.TimeoutException) as exception:
+            raise self._get_unreachable_error() from exception
+        if not response.is_success:
+            raise self._get_set_preferences_error(response.status_code)
+        logging.info("Successfully set qBittorrent port")
+
+
+class AsyncQBittorrentClient(
+    _QBittorrentClientBase[httpx.AsyncClient], AsyncServiceClient
+):
+    """The same QBittorrentClient, on asyncio: its requests can be cancelled midway."""
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        url: str,
+        credentials: dict[str, str],
+        limiter: HostLimiter | None = None,
+        connections: Connections | None = None,
+        *,
+        tls: TlsSettings = TlsSettings(),
+        timeout: float = DEFAULT_TIMEOUT,
+        events: EventBus | None = None,
+    ):
+        self._connections = connections or Connections()
+        client = self._connections.open_async_client(url, tls=tls, timeout=timeout)
+        super().__init__(client, url, credentials, limiter, events)
+        logging.debug("Async qBittorrent client created with base url %s", url)
+
+    async def aclose(self) -> None:
+        """Close the connections, and the session, once replaced."""
+        await self._connections.close_async_client(self._client)
+
+    @traced_async("qbittorrent.authenticate")
+    async def _authenticate(self) -> None:
+        logging.debug("Authenticating to qBittorrent")
+        try:
+            async with (
+                self._limiter.async_slot(self._host),
+                self._client.stream(
+                    "POST", LOGIN_PATH, data=self._credentials
+                ) as response,
+            ):
+                body = await read_body_async(response)
+        except (httpx.NetworkError, httpx.TimeoutException) as exception:
+            raise self._get_unreachable_error() from exception
+        if not response.is_success:
+            raise self._get_login_error(response.status_code, body)
+        self._client.cookies.update(response.cookies)
+        logging.debug("qBittorrent client authenticated")
+        self._events.publish(AuthRenewed("qbittorrent"))
+
+    async def warm_up(self) -> None:
         if not self._get_is_authenticated():
-            self._authenticate()
-        data = {"listen_port": port, "random_port": False, "upnp": False}
+            await self._authenticate()
+
+    @traced_async("qbittorrent.set_port")
+    async def set_port(self, port: int) -> None:
+        await self.warm_up()
         try:
-            response = self._client.post(
-                url="/api/v2/app/setPreferences",
-                data={"json": json.dumps(data)},
-            )
-            response.raise_for_status()
+            async with (
+                self._limiter.async_slot(self._host),
+                self._client.stream(
+                    "POST", SET_PREFERENCES_PATH, data=_get_preferences_form(port)
+                ) as response,
+            ):
+                await read_body_async(response)
         except (httpx.NetworkError, httpx.TimeoutException) as exception:
-            raise QBittorrentUnreachable(self._client.base_url) from exception
-        except httpx.HTTPStatusError as exception:
-            status_code = exception.response.status_code
-            if status_code == 403:
-                # Authenticated earlier, so this is an expired session: renew it.
-                logging.warning("qBittorrent session expired")
-                self._reset_authentication()
-                raise QBittorrentAuthenticationNeeded() from exception
-            if status_code >= 500:
-                raise QBittorrentServerError() from exception
-            raise QBittorrentUnexpectedResponse(status_code) from exception
+            raise self._get_unreachable_error() from exception
+        if not response.is_success:
+            raise self._get_set_preferences_error(response.status_code)
         logging.info("Successfully set qBittorrent port")
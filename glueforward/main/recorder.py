@@ -0,0 +1,276 @@
+import json
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator
+from dataclasses import asdict, dataclass
+
+import httpx
+
+from .ports import Clock
+from .responses import SNIPPET_SIZE
+from .server import Reply
+
+# Enough for the last few ticks' worth, retries included, in a few kilobytes.
+DEFAULT_RECORDED_EXCHANGES = 64
+# Where the local server answers the exchanges recorded.
+RECORDER_PATH = "/debug/exchanges"
+# What a secret reads as, wherever an exchange showed it.
+REDACTED = "[redacted]"
+
+
+@dataclass(frozen=True)
+class Exchange:
+    """One request to a service, and how it went."""
+
+    # When it was sent, in seconds since the epoch.
+    at: float
+    method: str
+    # The service's host, and the path asked for.
+    endpoint: str
+    # None when no answer came, for `error`.
+    status: int | None
+    # Until the answer started, or the request failed.
+    latency: float
+    # The start of the answer, up to SNIPPET_SIZE bytes.
+    body: str = ""
+    error: str | None = None
+
+
+@dataclass(frozen=True)
+class _Recorded:
+    """An exchange as kept, with what formatting and redacting it costs left
+    for when it is read, which a failure only rarely calls for."""
+
+    at: float
+    method: str
+    endpoint: str
+    status: int | None
+    latency: float
+    body: bytes = b""
+    error: BaseException | None = None
+
+
+class FlightRecorder:
+    """The last `size` exchanges with the services, for a failure to be told
+    by what led to it rather than by its last error alone.
+
+    Exchanges are kept whole in a ring, so that its memory never grows, and
+    only formatted when read, every one of `secrets` redacted then.
+    """
+
+    def __init__(self, size: int, secrets: Iterable[str | None] = ()) -> None:
+        self._recorded: deque[_Recorded] = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._secrets = [secret for secret in secrets if secret]
+
+    def add_secrets(self, *secrets: str | None) -> None:
+        """Redact these too, such as credentials changed as glueforward runs."""
+        with self._lock:
+            self._secrets.extend(secret for secret in secrets if secret)
+
+    def record(self, recorded: _Recorded) -> None:
+        with self._lock:
+            self._recorded.append(recorded)
+
+    def _redact(self, text: str) -> str:
+        for secret in self._secrets:
+            text = text.replace(secret, REDACTED)
+        return text
+
+    def get_exchanges(self) -> list[Exchange]:
+        """The exchanges recorded, oldest first."""
+        with self._lock:
+            recorded = list(self._recorded)
+        return [
+            Exchange(
+                at=entry.at,
+                method=entry.method,
+                endpoint=self._redact(entry.endpoint),
+                status=entry.status,
+                latency=entry.latency,
+                body=self._redact(entry.body.decode(errors="replace")),
+                error=None if entry.error is None else self._redact(repr(entry.error)),
+            )
+            for entry in recorded
+        ]
+
+    def dump(self) -> str:
+        """The exchanges recorded, a line each, for the logs."""
+        lines = (
+            " ".join(
+                (
+                    time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(exchange.at)),
+                    exchange.method,
+                    exchange.endpoint,
+                    str(exchange.status or "-"),
+                    f"{exchange.latency:.3f}s",
+                    exchange.error or repr(exchange.body),
+                )
+            )
+            for exchange in self.get_exchanges()
+        )
+        return "\n".join(lines) or "No exchange recorded"
+
+    def serve(self, _: dict[str, str]) -> Reply:
+        exchanges = [asdict(exchange) for exchange in self.get_exchanges()]
+        return Reply(200, json.dumps({"exchanges": exchanges}).encode())
+
+
+class _Snippet:
+    """Keeps the start of a body as it streams through, and records the
+    exchange once it is closed, read through or not."""
+
+    def __init__(self, record: Callable[[bytes], None]) -> None:
+        self._record = record
+        self._content = bytearray()
+
+    def keep(self, chunk: bytes) -> None:
+        if len(self._content) < SNIPPET_SIZE:
+            self._content += chunk[: SNIPPET_SIZE - len(self._content)]
+
+    def close(self) -> None:
+        self._record(bytes(self._content))
+
+
+class _RecordedStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, snippet: _Snippet) -> None:
+        self._stream = stream
+        self._snippet = snippet
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._stream:
+            self._snippet.keep(chunk)
+            yield chunk
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._snippet.close()
+
+
+class _AsyncRecordedStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, snippet: _Snippet) -> None:
+        self._stream = stream
+        self._snippet = snippet
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            self._snippet.keep(chunk)
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._snippet.close()
+
+
+class _Recording:
+    """What recording one request takes, for either transport to share."""
+
+    def __init__(
+        self,
+        recorder: FlightRecorder,
+        clock: Clock,
+        host: str,
+        request: httpx.Request,
+    ) -> None:
+        self._recorder = recorder
+        self._clock = clock
+        self._host = host
+        self._request = request
+        self._at = time.time()
+        self._started_at = clock.monotonic()
+
+    def _record(
+        self,
+        status: int | None,
+        latency: float,
+        body: bytes = b"",
+        error: BaseException | None = None,
+    ) -> None:
+        self._recorder.record(
+            _Recorded(
+                at=self._at,
+                method=self._request.method,
+                endpoint=self._host + self._request.url.path,
+                status=status,
+                latency=latency,
+                body=body,
+                error=error,
+            )
+        )
+
+    def failed(self, error: BaseException) -> None:
+        self._record(None, self._clock.monotonic() - self._started_at, error=error)
+
+    def answered(self, response: httpx.Response) -> _Snippet:
+        # Timed now, when the answer starts, however long it takes to read.
+        latency = self._clock.monotonic() - self._started_at
+        status = response.status_code
+        return _Snippet(lambda body: self._record(status, latency, body))
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """Records every request sent through `transport` to `host`."""
+
+    def __init__(
+        self,
+        transport: httpx.BaseTransport,
+        host: str,
+        recorder: FlightRecorder,
+        clock: Clock,
+    ) -> None:
+        self._transport = transport
+        self._host = host
+        self._recorder = recorder
+        self._clock = clock
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        recording = _Recording(self._recorder, self._clock, self._host, request)
+        try:
+            response = self._transport.handle_request(request)
+        except Exception as error:
+            recording.failed(error)
+            raise
+        # Always so, from a transport of this kind.
+        if isinstance(response.stream, httpx.SyncByteStream):  # pragma: no branch
+            snippet = recording.answered(response)
+            response.stream = _RecordedStream(response.stream, snippet)
+        return response
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    """The same RecordingTransport, for asyncio."""
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        host: str,
+        recorder: FlightRecorder,
+        clock: Clock,
+    ) -> None:
+        self._transport = transport
+        self._host = host
+        self._recorder = recorder
+        self._clock = clock
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        recording = _Recording(self._recorder, self._clock, self._host, request)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except Exception as error:
+            recording.failed(error)
+            raise
+        if isinstance(response.stream, httpx.AsyncByteStream):  # pragma: no branch
+            snippet = recording.answered(response)
+            response.stream = _AsyncRecordedStream(response.stream, snippet)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
@@ -0,0 +1,181 @@
+import logging
+import os
+from collections.abc import Callable, Coroutine
+from dataclasses import dataclass, fields, replace
+
+from .config import Config, ConfigurationError, get_configuration
+from .deadline import TickDeadline
+from .health import Health
+from .ports import AsyncPortForwarder, AsyncServiceClient, PortForwarder, ServiceClient
+from .recorder import FlightRecorder
+
+# What the gluetun side is built from, rebuilt whenever one of them changes.
+FORWARDER_SETTINGS = (
+    "gluetun_url",
+    "gluetun_api_key",
+    "gluetun_tls",
+    "gluetun_timeout",
+    "gluetun_port_cache_ttl",
+    "gluetun_middlewares",
+)
+# What the service's side is built from, its session lost when rebuilt.
+SERVICE_SETTINGS = ("service", "service_middlewares")
+# What the health check's window is made of.
+HEALTH_SETTINGS = ("success_interval", "health_stale_intervals")
+# What a reload applies as glueforward runs. Anything else, such as the
+# server's address or the runtime, only applies on restarting.
+RELOADED_SETTINGS = (
+    *FORWARDER_SETTINGS,
+    *SERVICE_SETTINGS,
+    *HEALTH_SETTINGS,
+    "gluetun_port_wait_duration",
+    "retry_interval",
+    "tick_deadline",
+)
+_ALL_SETTINGS = tuple(field.name for field in fields(Config))
+
+
+def _get_changed(before: Config, after: Config, names: tuple[str, ...]) -> list[str]:
+    return [name for name in names if getattr(before, name) != getattr(after, name)]
+
+
+class ConfigWatcher:
+    """Reads the configuration again whenever its config file changes.
+
+    A change is only taken once the whole configuration it makes is valid:
+    until then, glueforward runs on as it was, and says why.
+    """
+
+    def __init__(
+        self, path: str, config: Config, recorder: FlightRecorder | None = None
+    ) -> None:
+        self._path = path
+        self._config = config
+        self._recorder = recorder
+        self._stamp = self._get_stamp()
+
+    def _get_stamp(self) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def poll(self) -> tuple[Config, Config] | None:
+        """Answer the configuration before and after the file changed, if it
+        did since the last time, in what a reload applies."""
+        if (stamp := self._get_stamp()) == self._stamp:
+            return None
+        self._stamp = stamp
+        try:
+            config = get_configuration()
+        except ConfigurationError as error:
+            logging.warning("Kept the configuration as it was: %s", error)
+            return None
+        unapplied = [
+            name
+            for name in _get_changed(self._config, config, _ALL_SETTINGS)
+            if name not in RELOADED_SETTINGS
+        ]
+        if unapplied:
+            logging.warning(
+                "Changes to %s only apply on restarting", ", ".join(unapplied)
+            )
+        before = self._config
+        self._config = replace(
+            before, **{name: getattr(config, name) for name in RELOADED_SETTINGS}
+        )
+        if self._config == before:
+            return None
+        if self._recorder is not None:
+            # The secrets replaced are kept, for the exchanges that showed them.
+            self._recorder.add_secrets(
+                self._config.gluetun_api_key, self._config.service.password
+            )
+        return before, self._config
+
+
+@dataclass(frozen=True)
+class Reconfiguration[F, S, C]:
+    """What an application runs on from the next tick on."""
+
+    retry_interval: float
+    success_interval: float
+    tick_deadline: TickDeadline | None
+    wait_for_first_port_duration: float
+    # Either side, when rebuilt; None when kept as it was.
+    forwarder: F | None
+    service: S | None
+    # What closes the clients of the sides replaced, once they are.
+    retired: tuple[C, ...] = ()
+
+
+# A side as built: what is called, and what closes its client once replaced.
+type Built[T, C] = tuple[T, C]
+
+
+class ConfigReloader[F, S, C]:
+    """Turns changes to the config file into a Reconfiguration, rebuilding
+    only the side whose settings changed, for the other to keep its
+    connections and its session.
+
+    `forwarder` and `service` are the sides glueforward started with, as
+    built, for their clients to be closed once replaced. Given `health`, its
+    window follows the success interval.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        watcher: ConfigWatcher,
+        build_forwarder: Callable[[Config], Built[F, C]],
+        build_service: Callable[[Config], Built[S, C]],
+        build_tick_deadline: Callable[[Config], TickDeadline | None],
+        *,
+        forwarder: Built[F, C],
+        service: Built[S, C],
+        health: Health | None = None,
+    ) -> None:
+        self._watcher = watcher
+        self._build_forwarder = build_forwarder
+        self._build_service = build_service
+        self._build_tick_deadline = build_tick_deadline
+        self._close_forwarder = forwarder[1]
+        self._close_service = service[1]
+        self._health = health
+
+    def reload(self) -> Reconfiguration[F, S, C] | None:
+        """Answer what to run on, if the config file changed since."""
+        if (change := self._watcher.poll()) is None:
+            return None
+        before, after = change
+        changed = _get_changed(before, after, RELOADED_SETTINGS)
+        logging.info("Reloaded the configuration, with new %s", ", ".join(changed))
+        forwarder = service = None
+        retired: list[C] = []
+        if _get_changed(before, after, FORWARDER_SETTINGS):
+            retired.append(self._close_forwarder)
+            forwarder, self._close_forwarder = self._build_forwarder(after)
+        if _get_changed(before, after, SERVICE_SETTINGS):
+            retired.append(self._close_service)
+            service, self._close_service = self._build_service(after)
+        if self._health is not None and _get_changed(before, after, HEALTH_SETTINGS):
+            self._health.set_stale_after(
+                after.success_interval * after.health_stale_intervals
+            )
+        return Reconfiguration(
+            retry_interval=after.retry_interval,
+            success_interval=after.success_interval,
+            tick_deadline=self._build_tick_deadline(after),
+            wait_for_first_port_duration=after.gluetun_port_wait_duration,
+            forwarder=forwarder,
+            service=service,
+            retired=tuple(retired),
+        )
+
+
+# What the blocking and the asyncio application reload with, the clients of
+# the latter being closed by awaiting.
+type Reloader = ConfigReloader[PortForwarder, ServiceClient, Callable[[], None]]
+type AsyncReloader = ConfigReloader[
+    AsyncPortForwarder, AsyncServiceClient, Callable[[], Coroutine[None, None, None]]
+]
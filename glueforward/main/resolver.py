@@ -0,0 +1,295 @@
+import asyncio
+import ipaddress
+import logging
+import socket
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+
+import httpcore
+
+from .clock import SystemClock
+from .ports import Clock
+from .tracing import span
+
+# How long a resolved address is used before it is looked up again.
+DEFAULT_DNS_CACHE_TTL = 60
+# How long to wait on a lookup when an expired address can be used instead.
+DEFAULT_DNS_STALE_TIMEOUT = 1
+
+# A lookup stalled on one host must not hold up the others'.
+_MAX_LOOKUPS = 4
+
+# What a failed connection is worth looking the host up again for.
+_CONNECT_ERRORS = (httpcore.ConnectError, httpcore.ConnectTimeout)
+
+
+@dataclass(frozen=True)
+class ResolutionStatistics:
+    """How a host's name was resolved, and how long that took."""
+
+    lookups: int
+    failures: int
+    # Answers from the cache while still fresh, and once expired, for want
+    # of a lookup answering in time.
+    cached_answers: int
+    stale_answers: int
+    lookup_seconds: float
+
+
+class _HostCounts:
+    def __init__(self) -> None:
+        self.lookups = 0
+        self.failures = 0
+        self.cached_answers = 0
+        self.stale_answers = 0
+        self.lookup_seconds = 0.0
+
+
+@dataclass
+class _Entry:
+    address: str
+    expires_at: float
+
+
+def _get_is_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+def _get_address(host: str) -> str:
+    try:
+        infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    except OSError:
+        raise
+    except Exception as error:
+        # Such as a name IDNA cannot encode: as much a failure to resolve,
+        # which callers fall back from like any other.
+        raise OSError(f"Could not look {host!r} up: {error!r}") from error
+    return str(infos[0][4][0])
+
+
+class Resolver:  # pylint: disable=too-many-instance-attributes
+    """Resolves the services' hostnames, remembering the answers for a while.
+
+    Docker's embedded DNS stalls at times, and every new connection would
+    otherwise wait on it. An address is used for `ttl` seconds; past that,
+    it is looked up again, but if the lookup fails or takes more than
+    `stale_timeout` seconds, the expired address is used meanwhile. A
+    connection to an address failing has it looked up again at once, so
+    that a container given a new one is found there promptly.
+
+    Lookups run on threads of their own, one at a time per host, which is
+    what lets blocking and asyncio callers alike give up on waiting for one.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_DNS_CACHE_TTL,
+        stale_timeout: float = DEFAULT_DNS_STALE_TIMEOUT,
+        clock: Clock | None = None,
+    ) -> None:
+        self._ttl = ttl
+        self._stale_timeout = stale_timeout
+        self._clock = clock or SystemClock()
+        self._lock = threading.Lock()
+        self._entries: dict[str, _Entry] = {}
+        self._lookups: dict[str, Future[str]] = {}
+        self._hosts: dict[str, _HostCounts] = {}
+        self._executor = ThreadPoolExecutor(_MAX_LOOKUPS, thread_name_prefix="resolver")
+
+    def _end_lookup(self, host: str, started_at: float, address: str | None) -> float:
+        """Count a lookup, which found `address` unless None, and answer how
+        long it took."""
+        duration = self._clock.monotonic() - started_at
+        with self._lock:
+            # Submitted under this lock, so registered by now; forgotten
+            # however the lookup ended, for the next caller to start one.
+            del self._lookups[host]
+            counts = self._hosts.setdefault(host, _HostCounts())
+            counts.lookups += 1
+            counts.lookup_seconds += duration
+            if address is None:
+                counts.failures += 1
+            else:
+                expires_at = self._clock.monotonic() + self._ttl
+                self._entries[host] = _Entry(address, expires_at)
+        return duration
+
+    def _look_up(self, host: str) -> str:
+        started_at = self._clock.monotonic()
+        try:
+            address = _get_address(host)
+        except BaseException:
+            self._end_lookup(host, started_at, None)
+            raise
+        duration = self._end_lookup(host, started_at, address)
+        logging.debug(
+            "Resolved %s to %s in %.3f seconds",
+            host,
+            address,
+            duration,
+            extra={"endpoint": host, "latency": duration},
+        )
+        return address
+
+    def _get_cached(self, host: str) -> str | tuple[_Entry | None, Future[str]]:
+        """The address of `host` if still fresh, else its expired entry if
+        any, and its lookup under way."""
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry is not None and self._clock.monotonic() < entry.expires_at:
+                self._hosts[host].cached_answers += 1
+                return entry.address
+            if (lookup := self._lookups.get(host)) is None:
+                lookup = self._lookups[host] = self._executor.submit(self._look_up, host)
+            return entry, lookup
+
+    def _get_fallback(self, host: str, entry: _Entry | None, error: Exception) -> str:
+        """The expired address to use when a lookup let us down, if there is one."""
+        if entry is None:
+            raise httpcore.ConnectError(f"Could not resolve {host}: {error!r}") from error
+        with self._lock:
+            self._hosts[host].stale_answers += 1
+        logging.warning(
+            "Could not resolve %s in time (%r), using %s from before",
+            host,
+            error,
+            entry.address,
+        )
+        return entry.address
+
+    def _get_timeout(self, entry: _Entry | None) -> float | None:
+        # Without an address to fall back on, there is nothing to do but wait.
+        return None if entry is None else self._stale_timeout
+
+    def resolve(self, host: str) -> str:
+        """The address to connect to `host` at."""
+        if _get_is_address(host):
+            return host
+        if isinstance(cached := self._get_cached(host), str):
+            return cached
+        entry, lookup = cached
+        try:
+            return lookup.result(timeout=self._get_timeout(entry))
+        except (OSError, TimeoutError) as error:
+            return self._get_fallback(host, entry, error)
+
+    async def resolve_async(self, host: str) -> str:
+        """The same resolve, waited on without holding up the event loop."""
+        if _get_is_address(host):
+            return host
+        if isinstance(cached := self._get_cached(host), str):
+            return cached
+        entry, lookup = cached
+        try:
+            # Shielded: the lookup is shared, and not this caller's to cancel.
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(lookup)),
+                self._get_timeout(entry),
+            )
+        except (OSError, TimeoutError) as error:
+            return self._get_fallback(host, entry, error)
+
+    def expire(self, host: str) -> None:
+        """Have the next connection to `host` look it up again."""
+        with self._lock:
+            if (entry := self._entries.get(host)) is not None:
+                entry.expires_at = float("-inf")
+
+    def get_statistics(self) -> dict[str, ResolutionStatistics]:
+        with self._lock:
+            return {
+                host: ResolutionStatistics(
+                    lookups=counts.lookups,
+                    failures=counts.failures,
+                    cached_answers=counts.cached_answers,
+                    stale_answers=counts.stale_answers,
+                    lookup_seconds=counts.lookup_seconds,
+                )
+                for host, counts in self._hosts.items()
+            }
+
+
+class ResolvingBackend(httpcore.NetworkBackend):
+    """A blocking httpcore network backend, connecting through a Resolver."""
+
+    def __init__(self, resolver: Resolver, backend: httpcore.NetworkBackend) -> None:
+        self._resolver = resolver
+        self._backend = backend
+
+    def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: float | None = None,
+        local_address: str | None = None,
+        socket_options: Any = None,
+    ) -> httpcore.NetworkStream:
+        with span("dns.resolve", host=host):
+            address = self._resolver.resolve(host)
+        try:
+            return self._backend.connect_tcp(
+                address, port, timeout, local_address, socket_options
+            )
+        except _CONNECT_ERRORS:
+            self._resolver.expire(host)
+            if (new_address := self._resolver.resolve(host)) == address:
+                raise
+            logging.info("%s moved from %s to %s", host, address, new_address)
+            return self._backend.connect_tcp(
+                new_address, port, timeout, local_address, socket_options
+            )
+
+    def connect_unix_socket(
+        self, path: str, timeout: float | None = None, socket_options: Any = None
+    ) -> httpcore.NetworkStream:
+        return self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    def sleep(self, seconds: float) -> None:
+        self._backend.sleep(seconds)
+
+
+class AsyncResolvingBackend(httpcore.AsyncNetworkBackend):
+    """The same backend, on asyncio."""
+
+    def __init__(
+        self, resolver: Resolver, backend: httpcore.AsyncNetworkBackend
+    ) -> None:
+        self._resolver = resolver
+        self._backend = backend
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: float | None = None,
+        local_address: str | None = None,
+        socket_options: Any = None,
+    ) -> httpcore.AsyncNetworkStream:
+        with span("dns.resolve", host=host):
+            address = await self._resolver.resolve_async(host)
+        try:
+            return await self._backend.connect_tcp(
+                address, port, timeout, local_address, socket_options
+            )
+        except _CONNECT_ERRORS:
+            self._resolver.expire(host)
+            if (new_address := await self._resolver.resolve_async(host)) == address:
+                raise
+            logging.info("%s moved from %s to %s", host, address, new_address)
+            return await self._backend.connect_tcp(
+                new_address, port, timeout, local_address, socket_options
+            )
+
+    async def connect_unix_socket(
+        self, path: str, timeout: float | None = None, socket_options: Any = None
+    ) -> httpcore.AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
@@ -0,0 +1,65 @@
+import json
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+
+# Far more than gluetun or qBittorrent ever answer, and far less than the
+# page of HTML a URL pointing somewhere else may well bring back.
+MAX_BODY_SIZE = 64 * 1024
+# How much of a body errors and logs are given to show.
+SNIPPET_SIZE = 200
+
+
+@dataclass(frozen=True)
+class Body:
+    """A response body, read up to MAX_BODY_SIZE bytes and no further."""
+
+    content: bytes
+    # Whether there was more to it, left unread.
+    is_truncated: bool = False
+
+    def get_snippet(self) -> str:
+        """The start of the body, short enough for an error or a log line."""
+        return self.content[:SNIPPET_SIZE].decode(errors="replace")
+
+    def get_json(self) -> Any:
+        """Parse the body as JSON, straight from its bytes.
+
+        Raises ValueError if it is not JSON, or too large to be read whole.
+        """
+        if self.is_truncated:
+            raise ValueError(f"Body larger than {MAX_BODY_SIZE} bytes")
+        return json.loads(self.content)
+
+
+def _add_chunk(content: bytearray, chunk: bytes, limit: int) -> Body | None:
+    """Add a chunk to the body read so far, and return it once over `limit`."""
+    content += chunk
+    if len(content) > limit:
+        return Body(bytes(content[:limit]), is_truncated=True)
+    return None
+
+
+def read_body(response: httpx.Response, limit: int = MAX_BODY_SIZE) -> Body:
+    """Read a streamed response's body, up to `limit` bytes.
+
+    The rest is left unread, and the connection closed rather than reused,
+    which is cheaper than reading through whatever a wrong URL answers.
+    """
+    content = bytearray()
+    for chunk in response.iter_bytes():
+        if (body := _add_chunk(content, chunk, limit)) is not None:
+            return body
+    return Body(bytes(content))
+
+
+async def read_body_async(
+    response: httpx.Response, limit: int = MAX_BODY_SIZE
+) -> Body:
+    """The same read_body, for a response streamed on asyncio."""
+    content = bytearray()
+    async for chunk in response.aiter_bytes():
+        if (body := _add_chunk(content, chunk, limit)) is not None:
+            return body
+    return Body(bytes(content))
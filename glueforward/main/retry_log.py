@@ -0,0 +1,72 @@
+import logging
+
+from .errors import RetryableError
+from .ports import AsyncClock, Clock
+
+# How often a run of the same error is summed up for as long as it lasts.
+DEFAULT_SUMMARY_INTERVAL = 60 * 60
+
+
+class RetryLog:
+    """Logs the lifecycle's retryable errors, without repeating any.
+
+    The first of a run of the same error is logged whole, traceback and
+    all, and so is the first after one of another type. One of the same
+    type with another message gets a line, without its traceback. The same
+    error again is only counted, and summed up as repeated so many times
+    once the run ends, and every `summary_interval` seconds until then.
+
+    Only the last error is remembered, so however long a service is away,
+    logging it costs the same few lines, and the same few bytes.
+    """
+
+    def __init__(
+        self,
+        clock: Clock | AsyncClock,
+        summary_interval: float = DEFAULT_SUMMARY_INTERVAL,
+    ) -> None:
+        self._clock = clock
+        self._summary_interval = summary_interval
+        # The type and message of the error last logged, None after a success.
+        self._last: tuple[type[RetryableError], str] | None = None
+        # How many times it was repeated since it, or its last summary, was.
+        self._repeated = 0
+        self._since = 0.0
+
+    def _summarize(self, now: float) -> None:
+        # Only ever repeated after an error, but said so for the type checker.
+        if self._repeated and self._last is not None:
+            logging.error(
+                "Last error repeated %d times in %d seconds",
+                self._repeated,
+                now - self._since,
+                extra={"error": self._last[0].__name__},
+            )
+        self._repeated = 0
+        self._since = now
+
+    def error(self, error: RetryableError) -> bool:
+        """Log `error`, or only count it, answering whether it was logged."""
+        now = self._clock.monotonic()
+        key = (type(error), str(error))
+        if key == self._last:
+            self._repeated += 1
+            if now - self._since >= self._summary_interval:
+                self._summarize(now)
+            return False
+        self._summarize(now)
+        if self._last is not None and self._last[0] is key[0]:
+            logging.error(
+                "Retryable error in lifecycle: %r",
+                error,
+                extra={"error": type(error).__name__},
+            )
+        else:
+            logging.error("Retryable error in lifecycle", exc_info=error)
+        self._last = key
+        return True
+
+    def success(self) -> None:
+        """End the run of errors, if any, the next one being logged whole."""
+        self._summarize(self._clock.monotonic())
+        self._last = None
@@ -0,0 +1,135 @@
+import itertools
+import logging
+import math
+import random
+from collections.abc import Callable
+
+from .ports import Clock
+
+# A job answers how long to wait until it runs again, or None to stop.
+type Job = Callable[[], float | None]
+
+# How often running late is warned of, at most: its lag tells the rest.
+LAG_WARNING_INTERVAL = 60 * 60
+
+# Breaks ties between jobs due at the same time, in the order they came.
+_identifiers = itertools.count()
+
+
+class Timer:
+    """A job waiting on the wheel, and the handle it is cancelled through.
+
+    The same handle is put back on the wheel every time its job asks to run
+    again, so it stays valid for as long as the job keeps running.
+    """
+
+    __slots__ = ("job", "deadline", "tick", "identifier", "is_cancelled")
+
+    def __init__(self, job: Job) -> None:
+        self.job = job
+        self.identifier = next(_identifiers)
+        self.deadline = 0.0
+        self.tick = 0
+        self.is_cancelled = False
+
+
+class Scheduler:  # pylint: disable=too-many-instance-attributes
+    """Runs jobs when they are due, on a hashed timing wheel.
+
+    Each job lands in the slot its deadline falls in, so scheduling and
+    cancelling it cost the same whether one job is pending or thousands are.
+    Jobs more than a revolution away share their slot with nearer ones, and
+    are told apart by the absolute tick they are due on.
+
+    Waiting goes through the Clock, straight to the next deadline rather than
+    slot by slot, which lets a fake clock drive the whole thing.
+    """
+
+    def __init__(
+        self,
+        clock: Clock,
+        resolution: float = 1.0,
+        slot_count: int = 512,
+        rng: random.Random | None = None,
+    ) -> None:
+        self._clock = clock
+        self._resolution = resolution
+        self._slots: list[dict[int, Timer]] = [{} for _ in range(slot_count)]
+        # The absolute tick no pending job can be due before.
+        self._cursor = math.floor(clock.monotonic() / resolution)
+        self._pending = 0
+        self._rng = rng or random.Random()
+        self._lag = 0.0
+        self._lag_warned_at: float | None = None
+
+    def get_pending_count(self) -> int:
+        return self._pending
+
+    def get_lag(self) -> float:
+        """How late the last job ran, past its deadline, in seconds."""
+        return self._lag
+
+    def _is_lag_warning_due(self, now: float) -> bool:
+        warned_at = self._lag_warned_at
+        return warned_at is None or now - warned_at >= LAG_WARNING_INTERVAL
+
+    def _insert(self, timer: Timer, delay: float) -> None:
+        timer.deadline = self._clock.monotonic() + delay
+        # A deadline already behind the cursor is due on the cursor's tick.
+        timer.tick = max(self._cursor, math.floor(timer.deadline / self._resolution))
+        self._slots[timer.tick % len(self._slots)][timer.identifier] = timer
+        self._pending += 1
+
+    def schedule(self, job: Job, delay: float = 0.0, spread: float = 0.0) -> Timer:
+        """Run `job` in `delay` seconds, plus a random share of `spread`.
+
+        Spreading jobs that share an interval over it keeps them from all
+        coming due at once, and staying that way on every run after.
+        """
+        timer = Timer(job)
+        self._insert(timer, delay + self._rng.uniform(0, spread))
+        return timer
+
+    def cancel(self, timer: Timer) -> None:
+        """Never run `timer` again, whether it is pending or running now."""
+        timer.is_cancelled = True
+        if self._slots[timer.tick % len(self._slots)].pop(timer.identifier, None):
+            self._pending -= 1
+
+    def _pop_next(self) -> Timer | None:
+        """Take the pending job due first off the wheel, if there is one."""
+        if self._pending == 0:
+            return None
+        for _ in range(len(self._slots)):
+            slot = self._slots[self._cursor % len(self._slots)]
+            due = [timer for timer in slot.values() if timer.tick == self._cursor]
+            if due:
+                timer = min(due, key=lambda timer: (timer.deadline, timer.identifier))
+                del slot[timer.identifier]
+                self._pending -= 1
+                return timer
+            self._cursor += 1
+        # A whole revolution was empty: skip straight to the nearest job,
+        # rather than sweeping every revolution until it comes around.
+        self._cursor = min(
+            timer.tick for slot in self._slots for timer in slot.values()
+        )
+        return self._pop_next()
+
+    def run(self) -> None:
+        """Run jobs as they come due, until none is left pending.
+
+        Whatever a job raises is left to propagate, along with the jobs still
+        pending, for the caller to decide on.
+        """
+        while (timer := self._pop_next()) is not None:
+            if (remaining := timer.deadline - self._clock.monotonic()) > 0:
+                self._clock.sleep(remaining)
+            now = self._clock.monotonic()
+            self._lag = now - timer.deadline
+            if self._lag > self._resolution and self._is_lag_warning_due(now):
+                logging.warning("Scheduler running %.1f seconds late", self._lag)
+                self._lag_warned_at = now
+            delay = timer.job()
+            if delay is not None and not timer.is_cancelled:
+                self._insert(timer, delay)
@@ -0,0 +1,68 @@
+import http.server
+import logging
+import threading
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+from urllib.parse import parse_qsl, urlsplit
+
+
+@dataclass(frozen=True)
+class Reply:
+    status: int
+    body: bytes = b""
+    content_type: str = "application/json"
+
+
+# Answers a GET on one path, given its query string's parameters.
+type Route = Callable[[dict[str, str]], Reply]
+
+
+class LocalServer:
+    """A small HTTP server for whatever runs next to glueforward.
+
+    Every request is answered on a thread of its own, never the lifecycle's,
+    so a route keeps answering while a tick is in progress, and a route
+    blocking on purpose (a long poll) holds up nothing but its own caller.
+    """
+
+    def __init__(self, address: tuple[str, int]) -> None:
+        self._routes: dict[str, Route] = {}
+        self._server = http.server.ThreadingHTTPServer(address, self._build_handler())
+        self._server.daemon_threads = True
+
+    def add_route(self, path: str, route: Route) -> None:
+        self._routes[path] = route
+
+    def get_address(self) -> tuple[str, int]:
+        host, port = self._server.server_address[:2]
+        return str(host), port
+
+    def _build_handler(self) -> type[http.server.BaseHTTPRequestHandler]:
+        routes = self._routes
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:  # pylint: disable=invalid-name
+                url = urlsplit(self.path)
+                route = routes.get(url.path)
+                reply = Reply(404) if route is None else route(dict(parse_qsl(url.query)))
+                self.send_response(reply.status)
+                self.send_header("Content-Type", reply.content_type)
+                self.send_header("Content-Length", str(len(reply.body)))
+                self.end_headers()
+                self.wfile.write(reply.body)
+
+            # pylint: disable-next=redefined-builtin
+            def log_message(self, format: str, *args: Any) -> None:
+                """Log requests at debug level, rather than to stderr."""
+                logging.debug("Local server: " + format, *args)
+
+        return Handler
+
+    def start(self) -> None:
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logging.info("Local server listening on %s:%d", *self.get_address())
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,83 @@
+import math
+import threading
+from collections import deque
+from dataclasses import dataclass
+
+# httpx's own, what every request had before timeouts could be set.
+DEFAULT_TIMEOUT = 5
+DEFAULT_TIMEOUT_MULTIPLIER = 4
+DEFAULT_TIMEOUT_FLOOR = 1
+DEFAULT_TIMEOUT_CEILING = 60
+
+# Recent enough to follow a service slowing down, many enough for a p99.
+_WINDOW = 100
+# Below which a p99 says little, and the configured timeout stands.
+_MIN_SAMPLES = 20
+
+
+@dataclass(frozen=True)
+class LatencyStatistics:
+    """How long an endpoint took to answer, over its latest requests."""
+
+    samples: int
+    p50: float
+    p99: float
+
+
+def _get_percentile(ordered: list[float], percentile: float) -> float:
+    """The nearest-rank percentile of a sorted, non-empty list."""
+    rank = math.ceil(percentile / 100 * len(ordered))
+    return ordered[rank - 1]
+
+
+class AdaptiveTimeouts:
+    """Follows each endpoint's latency, and times its requests out after it.
+
+    An endpoint is allowed `multiplier` times its p99 latency, bounded by
+    `floor` and `ceiling`: a gluetun answering in milliseconds is given up
+    on in a second rather than five, a loaded qBittorrent is waited on for
+    as long as it has been taking. A request timing out counts as taking
+    its whole timeout, so an endpoint slowing down soon gets more of it.
+    """
+
+    def __init__(
+        self,
+        multiplier: float = DEFAULT_TIMEOUT_MULTIPLIER,
+        floor: float = DEFAULT_TIMEOUT_FLOOR,
+        ceiling: float = DEFAULT_TIMEOUT_CEILING,
+    ) -> None:
+        self._multiplier = multiplier
+        self._floor = floor
+        self._ceiling = ceiling
+        self._lock = threading.Lock()
+        self._latencies: dict[str, deque[float]] = {}
+
+    def get_timeout(self, endpoint: str, default: float) -> float:
+        """The timeout for a request to `endpoint`, or `default` until its
+        latency is known well enough."""
+        with self._lock:
+            latencies = self._latencies.get(endpoint, ())
+            if len(latencies) < _MIN_SAMPLES:
+                return default
+            p99 = _get_percentile(sorted(latencies), 99)
+        return min(max(p99 * self._multiplier, self._floor), self._ceiling)
+
+    def observe(self, endpoint: str, latency: float) -> None:
+        with self._lock:
+            latencies = self._latencies.setdefault(endpoint, deque(maxlen=_WINDOW))
+            latencies.append(latency)
+
+    def get_statistics(self) -> dict[str, LatencyStatistics]:
+        with self._lock:
+            ordered = {
+                endpoint: sorted(latencies)
+                for endpoint, latencies in self._latencies.items()
+            }
+        return {
+            endpoint: LatencyStatistics(
+                samples=len(latencies),
+                p50=_get_percentile(latencies, 50),
+                p99=_get_percentile(latencies, 99),
+            )
+            for endpoint, latencies in ordered.items()
+        }
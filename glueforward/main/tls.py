@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import ssl
+from dataclasses import dataclass
+from typing import Any
+
+import certifi
+import httpx
+
+
+@dataclass(frozen=True)
+class TlsSettings:
+    """Whom to trust, for one service reached over HTTPS."""
+
+    # A CA bundle to verify the certificate with, instead of the usual ones.
+    ca_file: str | None = None
+    # The SHA-256 fingerprint of the one certificate to accept, in hex.
+    # Without a CA bundle as well, it is all that is checked, which is what
+    # a self-signed certificate needs.
+    pinned_sha256: str | None = None
+
+
+class ResumingContext(ssl.SSLContext):
+    """An SSLContext resuming the TLS session it last kept for a host.
+
+    A resumed handshake skips the certificate exchange and its verification,
+    which is most of what a handshake costs. httpx has no way to hand a
+    session over, but every connection it opens goes through its context:
+    `wrap_socket` when blocking, `wrap_bio` on asyncio.
+    """
+
+    def __new__(cls, *_: Any, **__: Any) -> "ResumingContext":
+        return super().__new__(cls, ssl.PROTOCOL_TLS_CLIENT)
+
+    def __init__(self, pinned_sha256: str | None = None) -> None:
+        super().__init__()
+        self._pinned_sha256 = pinned_sha256
+        self._sessions: dict[str, ssl.SSLSession] = {}
+
+    def _get_session(
+        self, server_hostname: str | bytes | None, session: ssl.SSLSession | None
+    ) -> ssl.SSLSession | None:
+        if session is not None or server_hostname is None:
+            return session
+        if isinstance(server_hostname, bytes):
+            server_hostname = server_hostname.decode("ascii")
+        return self._sessions.get(server_hostname)
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def wrap_socket(  # type: ignore[override]
+        self,
+        sock: Any,
+        server_side: bool = False,
+        do_handshake_on_connect: bool = True,
+        suppress_ragged_eofs: bool = True,
+        server_hostname: str | bytes | None = None,
+        session: ssl.SSLSession | None = None,
+    ) -> ssl.SSLSocket:
+        return super().wrap_socket(
+            sock,
+            server_side=server_side,
+            do_handshake_on_connect=do_handshake_on_connect,
+            suppress_ragged_eofs=suppress_ragged_eofs,
+            server_hostname=server_hostname,
+            session=self._get_session(server_hostname, session),
+        )
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def wrap_bio(  # type: ignore[override]
+        self,
+        incoming: ssl.MemoryBIO,
+        outgoing: ssl.MemoryBIO,
+        server_side: bool = False,
+        server_hostname: str | bytes | None = None,
+        session: ssl.SSLSession | None = None,
+    ) -> ssl.SSLObject:
+        return super().wrap_bio(
+            incoming,
+            outgoing,
+            server_side=server_side,
+            server_hostname=server_hostname,
+            session=self._get_session(server_hostname, session),
+        )
+
+    def keep_session(self, hostname: str, session: ssl.SSLSession) -> None:
+        """Keep `session` for the next connection to `hostname` to resume."""
+        self._sessions[hostname] = session
+
+    def check_pin(self, ssl_object: Any) -> None:
+        """Refuse a peer whose certificate is not the one pinned, if any."""
+        if self._pinned_sha256 is None:
+            return
+        fingerprint = hashlib.sha256(ssl_object.getpeercert(True)).hexdigest()
+        if fingerprint != self._pinned_sha256:
+            logging.error(
+                "Certificate of %s has fingerprint %s, not the one pinned",
+                ssl_object.server_hostname,
+                fingerprint,
+            )
+            raise httpx.ConnectError("Certificate does not match the one pinned")
+
+
+def create_ssl_context(tls: TlsSettings) -> ResumingContext:
+    context = ResumingContext(tls.pinned_sha256)
+    if tls.ca_file is not None:
+        context.load_verify_locations(tls.ca_file)
+    elif tls.pinned_sha256 is not None:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    else:
+        # The same bundle httpx trusts by default.
+        context.load_verify_locations(certifi.where())
+    return context
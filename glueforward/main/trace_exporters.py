@@ -0,0 +1,111 @@
+import json
+import logging
+import logging.handlers
+from collections.abc import Sequence
+from dataclasses import asdict
+from typing import Any
+
+import httpx
+
+from .timeouts import DEFAULT_TIMEOUT
+from .tracing import Attribute, Span, SpanExporter
+
+# Enough for days of ticks, and little enough for a container's disk.
+DEFAULT_TRACE_FILE_SIZE = 10 * 1024 * 1024
+DEFAULT_TRACE_FILE_BACKUPS = 2
+
+# What OTLP calls the service spans come from, and a failed span.
+SERVICE_NAME = "glueforward"
+_STATUS_ERROR = 2
+
+
+class FileExporter(SpanExporter):
+    """Writes spans to a file as JSON lines, starting a new file once it
+    reaches `max_bytes`, and keeping `backups` of the previous ones."""
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = DEFAULT_TRACE_FILE_SIZE,
+        backups: int = DEFAULT_TRACE_FILE_BACKUPS,
+    ) -> None:
+        # Rotating files is all the handler is used for: records are spans.
+        self._handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True
+        )
+
+    def export(self, spans: Sequence[Span]) -> None:
+        for span in spans:
+            line = json.dumps(asdict(span))
+            self._handler.emit(logging.makeLogRecord({"msg": line}))
+
+
+def _get_value(value: Attribute) -> dict[str, Any]:
+    # Tested first, since a bool is an int too.
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # 64-bit integers are strings in OTLP's JSON, as JavaScript has none.
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": value}
+
+
+def _get_attributes(attributes: dict[str, Attribute]) -> list[dict[str, Any]]:
+    return [
+        {"key": key, "value": _get_value(value)} for key, value in attributes.items()
+    ]
+
+
+def _get_otlp_span(span: Span) -> dict[str, Any]:
+    otlp_span: dict[str, Any] = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        # Internal: glueforward's own steps, its requests included.
+        "kind": 1,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": _get_attributes(span.attributes),
+    }
+    if span.parent_id is not None:
+        otlp_span["parentSpanId"] = span.parent_id
+    if span.error is not None:
+        otlp_span["status"] = {"code": _STATUS_ERROR, "message": span.error}
+    return otlp_span
+
+
+def get_otlp_payload(spans: Sequence[Span]) -> dict[str, Any]:
+    """The body of an OTLP/HTTP export request, in its JSON encoding."""
+    resource: dict[str, Attribute] = {"service.name": SERVICE_NAME}
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": _get_attributes(resource)},
+                "scopeSpans": [
+                    {
+                        "scope": {"name": SERVICE_NAME},
+                        "spans": [_get_otlp_span(span) for span in spans],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+class OtlpExporter(SpanExporter):
+    """Sends spans to an OpenTelemetry collector, as OTLP/HTTP with JSON.
+
+    `url` is the collector's traces endpoint, usually
+    http://collector:4318/v1/traces. Its client is its own, for exporting
+    not to count against the services' connections, nor be traced itself.
+    """
+
+    def __init__(self, url: str, timeout: float = DEFAULT_TIMEOUT) -> None:
+        self._url = url
+        self._client = httpx.Client(timeout=timeout)
+
+    def export(self, spans: Sequence[Span]) -> None:
+        response = self._client.post(self._url, json=get_otlp_payload(spans))
+        response.raise_for_status()
@@ -0,0 +1,216 @@
+import functools
+import logging
+import os
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from types import CoroutineType
+from typing import Any, Protocol
+
+# Spans waiting for the exporter: any more, and new ones are dropped.
+MAX_QUEUED_SPANS = 2048
+# How many spans one export carries at most, and how long one waits to fill.
+MAX_BATCH_SIZE = 256
+EXPORT_INTERVAL = 5
+
+type Attribute = str | int | float | bool
+# What calling a coroutine function gives, as the protocols' async methods do.
+type _Coroutine[T] = CoroutineType[Any, Any, T]
+
+
+@dataclass
+class Span:  # pylint: disable=too-many-instance-attributes
+    """One timed step of a tick, and the step it was part of, if any."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    start_ns: int
+    end_ns: int = 0
+    attributes: dict[str, Attribute] = field(default_factory=dict)
+    # What the step failed on, if it did.
+    error: str | None = None
+
+
+class SpanExporter(Protocol):
+    """Where spans go once ended, a batch at a time, off the tick's thread."""
+
+    def export(self, spans: Sequence[Span]) -> None: ...
+
+
+class _BatchProcessor:
+    """Hands ended spans to the exporters in batches, on a thread of its own,
+    so that exporting never holds up the tick whose spans they are."""
+
+    def __init__(self, exporters: Sequence[SpanExporter]) -> None:
+        self._exporters = exporters
+        self._queue: queue.Queue[Span | None] = queue.Queue(MAX_QUEUED_SPANS)
+        self._lock = threading.Lock()
+        self._dropped = 0
+        self._thread = threading.Thread(target=self._run, name="tracing", daemon=True)
+        self._thread.start()
+
+    def add(self, ended: Span) -> None:
+        try:
+            self._queue.put_nowait(ended)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    def get_dropped(self) -> int:
+        with self._lock:
+            return self._dropped
+
+    def _export(self, batch: list[Span]) -> None:
+        for exporter in self._exporters:
+            try:
+                exporter.export(batch)
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                logging.warning("Could not export %d spans: %r", len(batch), error)
+
+    def _run(self) -> None:
+        is_closing = False
+        while not is_closing:
+            batch: list[Span] = []
+            # Set by a batch's first span: those ended until EXPORT_INTERVAL
+            # after it, such as the rest of its tick, go out along with it.
+            deadline: float | None = None
+            try:
+                while len(batch) < MAX_BATCH_SIZE:
+                    timeout = None
+                    if deadline is not None:
+                        timeout = max(deadline - time.monotonic(), 0)
+                    ended = self._queue.get(timeout=timeout)
+                    if ended is None:
+                        is_closing = True
+                        break
+                    if deadline is None:
+                        deadline = time.monotonic() + EXPORT_INTERVAL
+                    batch.append(ended)
+            except queue.Empty:
+                pass
+            if batch:
+                self._export(batch)
+
+    def close(self) -> None:
+        """Export whatever is left, and stop."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+_processor: _BatchProcessor | None = None  # pylint: disable=invalid-name
+_current: ContextVar[Span | None] = ContextVar("span", default=None)
+# What a span is when tracing is off: nothing, at the cost of nothing.
+_NO_SPAN: AbstractContextManager[None] = nullcontext()
+
+
+def enable(exporters: Sequence[SpanExporter]) -> None:
+    """Start recording spans, for `exporters` to be handed."""
+    global _processor  # pylint: disable=global-statement
+    _processor = _BatchProcessor(exporters)
+
+
+def disable() -> None:
+    """Stop recording spans, once those recorded are exported."""
+    global _processor  # pylint: disable=global-statement
+    if (processor := _processor) is not None:
+        _processor = None
+        processor.close()
+
+
+def get_dropped() -> int:
+    """How many spans were dropped for want of room in the queue."""
+    return 0 if _processor is None else _processor.get_dropped()
+
+
+def start_span(name: str, **attributes: Attribute) -> Span | None:
+    """Start a span under the current one, without making it current, for
+    steps that begin and end in callbacks. None while tracing is off."""
+    if _processor is None:
+        return None
+    parent = _current.get()
+    return Span(
+        name=name,
+        trace_id=os.urandom(16).hex() if parent is None else parent.trace_id,
+        span_id=os.urandom(8).hex(),
+        parent_id=None if parent is None else parent.span_id,
+        start_ns=time.time_ns(),
+        attributes=attributes,
+    )
+
+
+def end_span(started: Span | None, error: BaseException | None = None) -> None:
+    """End a span start_span started, and what it failed on if it did."""
+    if started is None or (processor := _processor) is None:
+        return
+    started.end_ns = time.time_ns()
+    if error is not None:
+        started.error = repr(error)
+    processor.add(started)
+
+
+def set_attribute(key: str, value: Attribute) -> None:
+    """Note something about the current step, if it is being traced."""
+    if (current := _current.get()) is not None:
+        current.attributes[key] = value
+
+
+@contextmanager
+def _record(started: Span) -> Iterator[Span]:
+    token = _current.set(started)
+    try:
+        yield started
+    except BaseException as error:
+        end_span(started, error)
+        raise
+    else:
+        end_span(started)
+    finally:
+        _current.reset(token)
+
+
+def span(name: str, **attributes: Attribute) -> AbstractContextManager[Span | None]:
+    """Time what runs within as a span, under the current one."""
+    if (started := start_span(name, **attributes)) is None:
+        return _NO_SPAN
+    return _record(started)
+
+
+def traced[**P, R](name: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Time every call to a function as a span, or only call it while
+    tracing is off."""
+
+    def decorate(function: Callable[P, R]) -> Callable[P, R]:
+        @functools.wraps(function)
+        def trace(*args: P.args, **kwargs: P.kwargs) -> R:
+            if _processor is None:
+                return function(*args, **kwargs)
+            with span(name):
+                return function(*args, **kwargs)
+
+        return trace
+
+    return decorate
+
+
+def traced_async[**P, R](
+    name: str,
+) -> Callable[[Callable[P, _Coroutine[R]]], Callable[P, _Coroutine[R]]]:
+    """The same traced, for a coroutine function."""
+
+    def decorate(function: Callable[P, _Coroutine[R]]) -> Callable[P, _Coroutine[R]]:
+        @functools.wraps(function)
+        async def trace(*args: P.args, **kwargs: P.kwargs) -> R:
+            if _processor is None:
+                return await function(*args, **kwargs)
+            with span(name):
+                return await function(*args, **kwargs)
+
+        return trace
+
+    return decorate
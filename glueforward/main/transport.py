@@ -0,0 +1,556 @@
+import asyncio
+import logging
+import socket
+import threading
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+
+from .clock import SystemClock
+from .deadline import TickOverran, bound, get_remaining
+from .limiter import HostLimiter
+from .ports import Clock
+from .recorder import AsyncRecordingTransport, FlightRecorder, RecordingTransport
+from .resolver import (
+    DEFAULT_DNS_CACHE_TTL,
+    DEFAULT_DNS_STALE_TIMEOUT,
+    AsyncResolvingBackend,
+    ResolutionStatistics,
+    Resolver,
+    ResolvingBackend,
+)
+from .timeouts import (
+    DEFAULT_TIMEOUT,
+    DEFAULT_TIMEOUT_CEILING,
+    DEFAULT_TIMEOUT_FLOOR,
+    DEFAULT_TIMEOUT_MULTIPLIER,
+    AdaptiveTimeouts,
+    LatencyStatistics,
+)
+from .tls import ResumingContext, TlsSettings, create_ssl_context
+from .tracing import Span, end_span, set_attribute, start_span
+
+# httpx's own, short enough never to outlive a server's idle timeout.
+DEFAULT_KEEPALIVE_EXPIRY = 5
+# Any more idle connections than requests at once to a host would never be used.
+DEFAULT_POOL_SIZE = 2
+# How long a connection is idle before the kernel starts probing it.
+TCP_KEEPALIVE_IDLE = 60
+
+type Tracer = Callable[[str, dict[str, Any]], None]
+type AsyncTracer = Callable[[str, dict[str, Any]], Awaitable[None]]
+
+# How a URL names a Unix domain socket rather than an address, as in
+# unix:///run/gluetun/control.sock
+UNIX_SCHEME = "unix://"
+# What requests over a socket are addressed to, the socket being the host.
+_UNIX_BASE_URL = "http://localhost"
+
+# httpcore's names for the steps of opening a connection.
+_CONNECT_EVENTS = ("connection.connect_tcp", "connection.connect_unix_socket")
+_HANDSHAKE_EVENT = "connection.start_tls"
+_SETUP_EVENTS = (*_CONNECT_EVENTS, _HANDSHAKE_EVENT)
+
+
+@dataclass(frozen=True)
+class ConnectionSettings:  # pylint: disable=too-many-instance-attributes
+    """How the connections to each service are kept between two requests."""
+
+    keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY
+    # Idle connections kept open, per service.
+    pool_size: int = DEFAULT_POOL_SIZE
+    tcp_keepalive: bool = False
+    # How long before a tick to open its connections, or 0 not to.
+    prewarm_lead: float = 0
+    # How long a hostname's address is kept, or 0 to look it up every time.
+    dns_cache_ttl: float = DEFAULT_DNS_CACHE_TTL
+    dns_stale_timeout: float = DEFAULT_DNS_STALE_TIMEOUT
+    # Whether to time requests out after their endpoint's latency, rather
+    # than after each service's fixed timeout.
+    adaptive_timeouts: bool = False
+    timeout_multiplier: float = DEFAULT_TIMEOUT_MULTIPLIER
+    timeout_floor: float = DEFAULT_TIMEOUT_FLOOR
+    timeout_ceiling: float = DEFAULT_TIMEOUT_CEILING
+
+
+@dataclass(frozen=True)
+class ConnectionStatistics:
+    """How often requests to a host found a connection already open, and
+    how often a TLS session, when they did not."""
+
+    requests: int
+    reused: int
+    connections_opened: int
+    # Opening connections and their TLS handshakes included, and so is
+    # resolving the hostname, which the resolution statistics tell apart.
+    connect_seconds: float
+    full_handshakes: int = 0
+    resumed_handshakes: int = 0
+
+    def get_reuse_ratio(self) -> float:
+        return self.reused / self.requests if self.requests else 0.0
+
+
+def get_host(url: str) -> str:
+    """Tell which service a URL points at: its address and port, or the path
+    to its socket. Requests to the same host share limits and counts."""
+    if url.startswith(UNIX_SCHEME):
+        return url.removeprefix(UNIX_SCHEME)
+    return httpx.URL(url).netloc.decode()
+
+
+def _wrap_network_backend(
+    transport: httpx.HTTPTransport | httpx.AsyncHTTPTransport,
+    wrap: Callable[[Any], Any],
+) -> None:
+    """Have a transport's pool connect through `wrap` around its own backend.
+
+    httpx has no say in how its pool connects, so the pool is told directly.
+    """
+    pool = transport._pool  # pylint: disable=protected-access
+    pool._network_backend = wrap(pool._network_backend)  # pylint: disable=protected-access
+
+
+class _EndpointTimer:
+    """Times a service's requests out, after their endpoint's latency when
+    timeouts follow it, where `default` would otherwise apply, and before
+    the tick under way runs out of time in any case."""
+
+    def __init__(
+        self,
+        timeouts: AdaptiveTimeouts | None,
+        host: str,
+        default: float,
+        clock: Clock,
+    ) -> None:
+        self._timeouts = timeouts
+        self._host = host
+        self._default = default
+        self._clock = clock
+
+    def _get_timeout(self, endpoint: str) -> float:
+        if self._timeouts is None:
+            return self._default
+        return self._timeouts.get_timeout(endpoint, self._default)
+
+    @contextmanager
+    def time(self, request: httpx.Request) -> Iterator[None]:
+        endpoint = self._host + request.url.path
+        timeout = self._get_timeout(endpoint)
+        timeouts = self._timeouts
+        if (remaining := get_remaining()) is not None and remaining < timeout:
+            if remaining <= 0:
+                raise httpx.TimeoutException(
+                    "The tick's deadline has passed", request=request
+                )
+            timeout = remaining
+            # Cut short by the deadline, a request says nothing of its endpoint.
+            timeouts = None
+        request.extensions["timeout"] = httpx.Timeout(timeout).as_dict()
+        started_at = self._clock.monotonic()
+        try:
+            yield
+        except httpx.TimeoutException:
+            if timeouts is not None:
+                timeouts.observe(endpoint, timeout)
+            raise
+        if timeouts is not None:
+            timeouts.observe(endpoint, self._clock.monotonic() - started_at)
+
+
+class _TimedTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.BaseTransport, timer: _EndpointTimer) -> None:
+        self._transport = transport
+        self._timer = timer
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with self._timer.time(request):
+            return self._transport.handle_request(request)
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class _AsyncTimedTransport(httpx.AsyncBaseTransport):
+    def __init__(
+        self, transport: httpx.AsyncBaseTransport, timer: _EndpointTimer
+    ) -> None:
+        self._transport = transport
+        self._timer = timer
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with self._timer.time(request):
+            return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class _HostCounts:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.reused = 0
+        self.connections_opened = 0
+        self.connect_seconds = 0.0
+        self.full_handshakes = 0
+        self.resumed_handshakes = 0
+
+
+class Connections:  # pylint: disable=too-many-instance-attributes
+    """Opens the clients' HTTP connection pools, and counts what they cost.
+
+    Every client opened here shares the same settings, and its requests are
+    followed to tell whether each found a connection open or had to open its
+    own, and how long that took. Clients opened here can also be made to
+    open their connections ahead of time, so that the next request finds
+    one waiting, holding a slot of `limiter` as any request would.
+    """
+
+    def __init__(
+        self,
+        settings: ConnectionSettings = ConnectionSettings(),
+        clock: Clock | None = None,
+        recorder: FlightRecorder | None = None,
+        limiter: HostLimiter | None = None,
+    ) -> None:
+        self._settings = settings
+        self._clock = clock or SystemClock()
+        self._recorder = recorder
+        self._limiter = limiter or HostLimiter()
+        # Shared by every client trusting alike: loading a CA bundle is a
+        # cost of its own, and a context only resumes the sessions it kept.
+        self._ssl_contexts: dict[TlsSettings, ResumingContext] = {}
+        self._lock = threading.Lock()
+        self._hosts: dict[str, _HostCounts] = {}
+        self._resolver = (
+            Resolver(settings.dns_cache_ttl, settings.dns_stale_timeout, self._clock)
+            if settings.dns_cache_ttl > 0
+            else None
+        )
+        self._timeouts = (
+            AdaptiveTimeouts(
+                settings.timeout_multiplier,
+                settings.timeout_floor,
+                settings.timeout_ceiling,
+            )
+            if settings.adaptive_timeouts
+            else None
+        )
+        self._clients: list[tuple[str, httpx.Client]] = []
+        self._async_clients: list[tuple[str, httpx.AsyncClient]] = []
+
+    def get_prewarm_lead(self) -> float:
+        return self._settings.prewarm_lead
+
+    def _get_limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            # The host limiter already caps requests at once, hence connections.
+            max_connections=None,
+            max_keepalive_connections=self._settings.pool_size,
+            keepalive_expiry=self._settings.keepalive_expiry,
+        )
+
+    def _get_socket_options(self, uds: str | None) -> list[tuple[int, int, int]]:
+        if not self._settings.tcp_keepalive or uds is not None:
+            return []
+        options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        # Linux only: elsewhere, the system-wide idle time applies.
+        if hasattr(socket, "TCP_KEEPIDLE"):  # pragma: no branch
+            options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, TCP_KEEPALIVE_IDLE))
+        return options
+
+    def _count_request(self, host: str, has_connected: bool) -> None:
+        with self._lock:
+            counts = self._hosts.setdefault(host, _HostCounts())
+            counts.requests += 1
+            counts.reused += not has_connected
+
+    def _count_connect(self, host: str, duration: float) -> None:
+        with self._lock:
+            counts = self._hosts.setdefault(host, _HostCounts())
+            counts.connect_seconds += duration
+            counts.connections_opened += 1
+        logging.debug("Opened a connection to %s in %.3f seconds", host, duration)
+
+    def _count_handshake(self, host: str, duration: float, ssl_object: Any) -> None:
+        with self._lock:
+            counts = self._hosts.setdefault(host, _HostCounts())
+            counts.connect_seconds += duration
+            if is_resumed := ssl_object.session_reused:
+                counts.resumed_handshakes += 1
+            else:
+                counts.full_handshakes += 1
+        logging.debug(
+            "%s TLS handshake with %s in %.3f seconds",
+            "Resumed" if is_resumed else "Full",
+            host,
+            duration,
+        )
+
+    def _trace(self, host: str, is_prewarm: bool) -> Tracer:
+        """Follow one request through httpcore, timing whatever setup it pays for.
+
+        A prewarm request is not counted as one: whether the requests that
+        matter found a connection open is what the counts are there to tell.
+        A certificate other than the one pinned raises httpx.ConnectError
+        once the handshake is complete, leaving the stream to be closed.
+        """
+        started_at = 0.0
+        has_connected = False
+        # Every phase of the request under way, as a span while tracing.
+        phases: dict[str, Span | None] = {}
+
+        def trace(name: str, info: dict[str, Any]) -> None:
+            nonlocal started_at, has_connected
+            event, _, stage = name.rpartition(".")
+            if stage == "started":
+                phases[event] = start_span(event)
+            else:
+                end_span(phases.pop(event, None), info.get("exception"))
+            if event.endswith(".send_request_headers"):
+                if stage == "started" and not is_prewarm:
+                    self._count_request(host, has_connected)
+            elif event in _SETUP_EVENTS:
+                if stage == "started":
+                    started_at = self._clock.monotonic()
+                elif stage == "complete":
+                    duration = self._clock.monotonic() - started_at
+                    if event == _HANDSHAKE_EVENT:
+                        ssl_object = info["return_value"].get_extra_info("ssl_object")
+                        ssl_object.context.check_pin(ssl_object)
+                        self._count_handshake(host, duration, ssl_object)
+                    else:
+                        has_connected = True
+                        self._count_connect(host, duration)
+
+        return trace
+
+    def _get_tracer(self, host: str, is_prewarm: bool) -> Tracer:
+        """The tracer of one request, closing a connection refused on its
+        certificate, which httpcore never got to hold."""
+        trace = self._trace(host, is_prewarm)
+
+        def checked_trace(name: str, info: dict[str, Any]) -> None:
+            try:
+                trace(name, info)
+            except httpx.ConnectError:
+                info["return_value"].close()
+                raise
+
+        return checked_trace
+
+    def _get_async_tracer(self, host: str, is_prewarm: bool) -> AsyncTracer:
+        """The same tracer, which httpcore's asyncio side wants awaitable."""
+        trace = self._trace(host, is_prewarm)
+
+        async def atrace(name: str, info: dict[str, Any]) -> None:
+            try:
+                trace(name, info)
+            except httpx.ConnectError:
+                await info["return_value"].aclose()
+                raise
+
+        return atrace
+
+    def _get_request_hook(self, host: str) -> Callable[[httpx.Request], None]:
+        def trace(request: httpx.Request) -> None:
+            if "trace" not in request.extensions:
+                request.extensions["trace"] = self._get_tracer(host, False)
+
+        return trace
+
+    def _get_async_request_hook(
+        self, host: str
+    ) -> Callable[[httpx.Request], Awaitable[None]]:
+        async def trace(request: httpx.Request) -> None:
+            if "trace" not in request.extensions:
+                request.extensions["trace"] = self._get_async_tracer(host, False)
+
+        return trace
+
+    @staticmethod
+    def _trace_response(response: httpx.Response) -> None:
+        set_attribute("http.status_code", response.status_code)
+
+    async def _trace_response_async(self, response: httpx.Response) -> None:
+        self._trace_response(response)
+
+    @staticmethod
+    def _keep_session(response: httpx.Response) -> None:
+        """Keep the TLS session a response came over, for the next connection
+        to resume, since TLS 1.3 only hands one over once data has flowed."""
+        if (stream := response.extensions.get("network_stream")) is None:
+            return
+        if (ssl_object := stream.get_extra_info("ssl_object")) is None:
+            return
+        if (session := ssl_object.session) is not None:
+            hostname = response.request.url.raw_host.decode("ascii")
+            ssl_object.context.keep_session(hostname, session)
+
+    async def _keep_session_async(self, response: httpx.Response) -> None:
+        self._keep_session(response)
+
+    def _get_ssl_context(self, tls: TlsSettings) -> ResumingContext:
+        with self._lock:
+            if (context := self._ssl_contexts.get(tls)) is None:
+                context = self._ssl_contexts[tls] = create_ssl_context(tls)
+            return context
+
+    @staticmethod
+    def _split_url(url: str) -> tuple[str, str | None]:
+        """The base URL to send requests to, and the socket to send them over."""
+        if url.startswith(UNIX_SCHEME):
+            return _UNIX_BASE_URL, url.removeprefix(UNIX_SCHEME)
+        return url, None
+
+    def open_client(
+        self,
+        url: str,
+        headers: dict[str, str] | None = None,
+        tls: TlsSettings = TlsSettings(),
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> httpx.Client:
+        """Open a client to `url`, which may also be a unix:// socket path."""
+        base_url, uds = self._split_url(url)
+        pool = httpx.HTTPTransport(
+            verify=self._get_ssl_context(tls),
+            limits=self._get_limits(),
+            uds=uds,
+            socket_options=self._get_socket_options(uds),
+        )
+        if self._resolver is not None:
+            resolver = self._resolver
+            _wrap_network_backend(
+                pool, lambda backend: ResolvingBackend(resolver, backend)
+            )
+        host = get_host(url)
+        timer = _EndpointTimer(self._timeouts, host, timeout, self._clock)
+        transport: httpx.BaseTransport = _TimedTransport(pool, timer)
+        if self._recorder is not None:
+            transport = RecordingTransport(transport, host, self._recorder, self._clock)
+        client = httpx.Client(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            transport=transport,
+            event_hooks={
+                "request": [self._get_request_hook(host)],
+                "response": [self._keep_session, self._trace_response],
+            },
+        )
+        self._clients.append((host, client))
+        return client
+
+    def open_async_client(
+        self,
+        url: str,
+        headers: dict[str, str] | None = None,
+        tls: TlsSettings = TlsSettings(),
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> httpx.AsyncClient:
+        base_url, uds = self._split_url(url)
+        pool = httpx.AsyncHTTPTransport(
+            verify=self._get_ssl_context(tls),
+            limits=self._get_limits(),
+            uds=uds,
+            socket_options=self._get_socket_options(uds),
+        )
+        if self._resolver is not None:
+            resolver = self._resolver
+            _wrap_network_backend(
+                pool, lambda backend: AsyncResolvingBackend(resolver, backend)
+            )
+        host = get_host(url)
+        timer = _EndpointTimer(self._timeouts, host, timeout, self._clock)
+        transport: httpx.AsyncBaseTransport = _AsyncTimedTransport(pool, timer)
+        if self._recorder is not None:
+            transport = AsyncRecordingTransport(
+                transport, host, self._recorder, self._clock
+            )
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            transport=transport,
+            event_hooks={
+                "request": [self._get_async_request_hook(host)],
+                "response": [self._keep_session_async, self._trace_response_async],
+            },
+        )
+        self._async_clients.append((host, client))
+        return client
+
+    def close_client(self, client: httpx.Client) -> None:
+        """Close a client opened here once it is replaced, its connections
+        with it, and stop prewarming it."""
+        self._clients = [entry for entry in self._clients if entry[1] is not client]
+        client.close()
+
+    async def close_async_client(self, client: httpx.AsyncClient) -> None:
+        """The same close_client, for an asyncio client."""
+        self._async_clients = [
+            entry for entry in self._async_clients if entry[1] is not client
+        ]
+        await client.aclose()
+
+    def _bind_prewarm(self) -> AbstractContextManager[None]:
+        """Give prewarming up once the tick it is for comes due, rather than
+        hold that tick up waiting on a service that is down."""
+        if (lead := self._settings.prewarm_lead) <= 0:
+            return nullcontext()
+        return bound(lead, self._clock)
+
+    def prewarm(self) -> None:
+        """Have every client open a connection, if it has none open already.
+
+        A HEAD request does it, its answer being of no interest: any will
+        leave the connection open behind it. Failing is not worth more than
+        a line in the logs, since the tick to come will find out anyway.
+        """
+        with self._bind_prewarm():
+            for host, client in self._clients:
+                tracer = self._get_tracer(host, True)
+                try:
+                    with self._limiter.slot(host):
+                        client.head("", extensions={"trace": tracer})
+                except (httpx.HTTPError, TickOverran) as error:
+                    logging.debug("Could not prewarm %s: %r", client.base_url, error)
+
+    async def prewarm_async(self) -> None:
+        """The same prewarm, for the asyncio clients, all at once."""
+
+        async def prewarm(host: str, client: httpx.AsyncClient) -> None:
+            tracer = self._get_async_tracer(host, True)
+            try:
+                async with self._limiter.async_slot(host):
+                    await client.head("", extensions={"trace": tracer})
+            except httpx.HTTPError as error:
+                logging.debug("Could not prewarm %s: %r", client.base_url, error)
+
+        with self._bind_prewarm():
+            await asyncio.gather(*(prewarm(*entry) for entry in self._async_clients))
+
+    def get_statistics(self) -> dict[str, ConnectionStatistics]:
+        with self._lock:
+            return {
+                host: ConnectionStatistics(
+                    requests=counts.requests,
+                    reused=counts.reused,
+                    connections_opened=counts.connections_opened,
+                    connect_seconds=counts.connect_seconds,
+                    full_handshakes=counts.full_handshakes,
+                    resumed_handshakes=counts.resumed_handshakes,
+                )
+                for host, counts in self._hosts.items()
+            }
+
+    def get_resolution_statistics(self) -> dict[str, ResolutionStatistics]:
+        """How each hostname was resolved, by the cache when there is one."""
+        return {} if self._resolver is None else self._resolver.get_statistics()
+
+    def get_latency_statistics(self) -> dict[str, LatencyStatistics]:
+        """How long each endpoint took, when timeouts follow it."""
+        return {} if self._timeouts is None else self._timeouts.get_statistics()
@@ -0,0 +1,115 @@
+"""Fixtures for the benchmarks.
+
+Each benchmark drives the real clients against local HTTP servers answering
+after a fixed delay, standing in for the round trip to a service across a
+network. What is measured is how many of those round trips are on the way,
+so the numbers hold for any latency, this one merely being easy to tell.
+"""
+
+# pytest resolves fixtures by parameter name, so the shadowing is deliberate.
+# pylint: disable=redefined-outer-name
+
+import http.server
+import json
+import socketserver
+import statistics
+import threading
+import time
+from collections.abc import Callable, Iterator
+from typing import Any
+
+import pytest
+
+from ..external_contracts import GLUETUN_PORT_FORWARD_PATH, GLUETUN_PORT_KEY
+
+# Long enough to stand out from the noise of a local request.
+ROUND_TRIP = 0.05
+FORWARDED_PORT = 51413
+
+
+class _UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class SlowServer:
+    """An HTTP server answering any request after `round_trip` seconds.
+
+    gluetun's endpoint is answered with FORWARDED_PORT, anything else with
+    a session cookie, which is all qBittorrent's two endpoints need to say.
+    Given a `socket_path`, it listens there rather than on a TCP port.
+    """
+
+    def __init__(
+        self, round_trip: float = ROUND_TRIP, socket_path: str | None = None
+    ) -> None:
+        handler = self._build_handler(round_trip)
+        self._server: socketserver.BaseServer
+        if socket_path is None:
+            server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+            host, port = server.server_address[:2]
+            self.url = f"http://{host!s}:{port}"
+            self._server = server
+        else:
+            self.url = f"unix://{socket_path}"
+            self._server = _UnixHTTPServer(socket_path, handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _build_handler(
+        round_trip: float,
+    ) -> type[http.server.BaseHTTPRequestHandler]:
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # One write per answer: headers and body apart would meet Nagle's
+            # algorithm and delayed ACKs, and add their own wait to every trip.
+            wbufsize = -1
+
+            def _answer(self) -> None:
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(round_trip)
+                body = json.dumps({GLUETUN_PORT_KEY: FORWARDED_PORT}).encode()
+                self.send_response(200)
+                if self.path != GLUETUN_PORT_FORWARD_PATH:
+                    self.send_header("Set-Cookie", "SID=benchmark")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = _answer  # pylint: disable=invalid-name
+
+            # pylint: disable-next=redefined-builtin
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def gluetun() -> Iterator[SlowServer]:
+    server = SlowServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def qbittorrent() -> Iterator[SlowServer]:
+    server = SlowServer()
+    yield server
+    server.close()
+
+
+def measure(run: Callable[[], object], rounds: int = 10) -> float:
+    """The median duration of `rounds` calls to `run`, in seconds."""
+    durations = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        run()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
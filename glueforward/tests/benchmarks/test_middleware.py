@@ -0,0 +1,71 @@
+"""How much going through a chain of middlewares costs a call.
+
+Each side is wrapped in every middleware it may be, around a stand-in
+answering at once, so that what is left is the chain's own overhead: a few
+method calls, the chain being compiled once rather than walked every time.
+The cache never answers from memory, and the port keeps changing, so that
+each middleware does its work on every call rather than cut it short.
+"""
+
+from glueforward.main.clock import SystemClock
+from glueforward.main.metrics import Metrics
+from glueforward.main.middleware import (
+    CACHE,
+    DEDUPE,
+    TIMING,
+    compile_chain,
+    get_forwarder_middlewares,
+    get_service_middlewares,
+)
+from glueforward.main.ports import PortForwarder, ServiceClient
+
+from .conftest import FORWARDED_PORT, measure
+
+CALLS = 10_000
+# Microseconds a call may add, loose for the noise of a shared machine.
+MAX_OVERHEAD = 20
+
+
+class _Forwarder:
+    def get_forwarded_port(self) -> int | None:
+        return FORWARDED_PORT
+
+
+class _Service:
+    def warm_up(self) -> None:
+        pass
+
+    def set_port(self, port: int) -> None:
+        pass
+
+
+def _time_calls(forwarder: PortForwarder, service: ServiceClient) -> float:
+    """The median duration of one call to each side, in seconds."""
+
+    def run() -> None:
+        for port in range(CALLS):
+            forwarder.get_forwarded_port()
+            service.set_port(port)
+
+    return measure(run) / CALLS
+
+
+def test_a_chain_adds_a_few_microseconds_a_call():
+    clock = SystemClock()
+    metrics = Metrics(clock)
+    forwarder = compile_chain(
+        _Forwarder(), [CACHE, TIMING], get_forwarder_middlewares(clock, 0, metrics)
+    )
+    service = compile_chain(
+        _Service(), [DEDUPE, TIMING], get_service_middlewares(metrics)
+    )
+
+    bare = _time_calls(_Forwarder(), _Service())
+    chained = _time_calls(forwarder, service)
+
+    overhead = (chained - bare) * 1e6
+    print(
+        f"\nmiddlewares: {bare * 1e6:.2f} µs a call bare, "
+        f"{chained * 1e6:.2f} µs through the chain, {overhead:.2f} µs added"
+    )
+    assert overhead < MAX_OVERHEAD
@@ -0,0 +1,50 @@
+"""How much a Unix domain socket saves over TCP, per request to gluetun.
+
+Both servers answer at once, so that what is left is the cost of the
+transport itself: the TCP stack on the loopback against a socket file.
+Requests are measured on a fresh connection each, as after an expired
+keep-alive, then on one kept open, where only the exchange itself is left.
+"""
+
+from glueforward.main.gluetun import GluetunClient
+from glueforward.main.transport import Connections, ConnectionSettings
+
+from .conftest import SlowServer, measure
+
+REQUESTS = 200
+
+
+def _time_requests(url: str, keepalive_expiry: float) -> float:
+    """The median duration of one request, in seconds."""
+    connections = Connections(ConnectionSettings(keepalive_expiry=keepalive_expiry))
+    client = GluetunClient(url, None, connections=connections)
+    client.get_forwarded_port()
+
+    def run() -> None:
+        for _ in range(REQUESTS):
+            client.get_forwarded_port()
+
+    return measure(run) / REQUESTS
+
+
+def _report(name: str, tcp: float, unix: float) -> None:
+    print(
+        f"\n{name}: {tcp * 1e6:.0f} µs a request over TCP, "
+        f"{unix * 1e6:.0f} µs over a Unix socket, "
+        f"{(1 - unix / tcp) * 100:.0f}% saved"
+    )
+
+
+def test_a_unix_socket_is_no_slower_than_tcp(tmp_path):
+    tcp_server = SlowServer(round_trip=0)
+    unix_server = SlowServer(round_trip=0, socket_path=str(tmp_path / "gluetun.sock"))
+    try:
+        for name, keepalive_expiry in [("fresh connection", 0), ("kept alive", 60)]:
+            tcp = _time_requests(tcp_server.url, keepalive_expiry)
+            unix = _time_requests(unix_server.url, keepalive_expiry)
+            _report(name, tcp, unix)
+            # Loose, the noise of a shared machine being what it is.
+            assert unix < tcp * 1.5
+    finally:
+        tcp_server.close()
+        unix_server.close()
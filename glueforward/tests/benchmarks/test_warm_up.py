@@ -0,0 +1,71 @@
+"""How much warming qBittorrent up alongside the port request saves.
+
+A cold start is three round trips one after the other when done in turn:
+the port from gluetun, a login, then the port written. With the login run
+alongside the port request, only two are left on the way. Building the
+clients is part of both, which only the difference cancels out.
+"""
+
+import asyncio
+
+from glueforward.main.clock import AsyncSystemClock, SystemClock
+from glueforward.main.gluetun import AsyncGluetunClient, GluetunClient
+from glueforward.main.port_synchronizer import AsyncPortSynchronizer, PortSynchronizer
+from glueforward.main.qbittorrent import AsyncQBittorrentClient, QBittorrentClient
+
+from .conftest import ROUND_TRIP, measure
+
+CREDENTIALS = {"username": "admin", "password": "benchmark"}
+
+
+def _report(name: str, in_turn: float, overlapped: float) -> None:
+    print(
+        f"\n{name}: cold start {in_turn * 1000:.0f} ms in turn, "
+        f"{overlapped * 1000:.0f} ms overlapped, "
+        f"{(in_turn - overlapped) / ROUND_TRIP:.1f} round trips saved"
+    )
+
+
+def test_a_cold_start_saves_a_round_trip(gluetun, qbittorrent):
+    def in_turn() -> None:
+        forwarder = GluetunClient(gluetun.url, None)
+        service = QBittorrentClient(qbittorrent.url, CREDENTIALS)
+        port = forwarder.get_forwarded_port()
+        assert port is not None
+        service.set_port(port)
+
+    def overlapped() -> None:
+        PortSynchronizer(
+            GluetunClient(gluetun.url, None),
+            QBittorrentClient(qbittorrent.url, CREDENTIALS),
+            SystemClock(),
+            wait_for_first_port_duration=0,
+        ).synchronize()
+
+    in_turn_duration, overlapped_duration = measure(in_turn), measure(overlapped)
+
+    _report("blocking", in_turn_duration, overlapped_duration)
+    assert in_turn_duration - overlapped_duration > ROUND_TRIP / 2
+
+
+def test_a_cold_start_saves_a_round_trip_on_asyncio(gluetun, qbittorrent):
+    async def in_turn() -> None:
+        forwarder = AsyncGluetunClient(gluetun.url, None)
+        service = AsyncQBittorrentClient(qbittorrent.url, CREDENTIALS)
+        port = await forwarder.get_forwarded_port()
+        assert port is not None
+        await service.set_port(port)
+
+    async def overlapped() -> None:
+        await AsyncPortSynchronizer(
+            AsyncGluetunClient(gluetun.url, None),
+            AsyncQBittorrentClient(qbittorrent.url, CREDENTIALS),
+            AsyncSystemClock(),
+            wait_for_first_port_duration=0,
+        ).synchronize()
+
+    in_turn_duration = measure(lambda: asyncio.run(in_turn()))
+    overlapped_duration = measure(lambda: asyncio.run(overlapped()))
+
+    _report("asyncio", in_turn_duration, overlapped_duration)
+    assert in_turn_duration - overlapped_duration > ROUND_TRIP / 2
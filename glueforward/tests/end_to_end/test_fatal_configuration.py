@@ -60,7 +60,8 @@ def test_invalid_gluetun_api_key_shuts_the_application_down(
 ):
     container = start_glueforward(
         gluetun_without_vpn,
-        # No qBittorrent: gluetun is called first, and never gets past its key.
+        # No qBittorrent: it being unreachable is retryable, so the key
+        # gluetun rejects alongside is what gets reported.
         QBITTORRENT_URL="http://qbittorrent:8080",
         QBITTORRENT_PASSWORD="unused",
         GLUETUN_API_KEY="not-the-api-key",
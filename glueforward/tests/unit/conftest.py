@@ -1,10 +1,16 @@
 """Shared pytest fixtures for glueforward tests."""
 
-from collections.abc import Callable
+import asyncio
+import inspect
+from collections.abc import Callable, Iterator, Sequence
+from typing import Any
 
 import httpx
 import pytest
 
+from glueforward.main import tracing
+from glueforward.main.tracing import Span
+
 # Distinctive enough to be searched for in the logs.
 GLUETUN_API_KEY = "gluetun-api-key-3f9a2c"
 QBITTORRENT_PASSWORD = "qbittorrent-password-7d1e04"
@@ -51,10 +57,46 @@ def clock() -> FakeClock:
     return FakeClock()
 
 
+class FakeAsyncClock:
+    """The asyncio face of a FakeClock, which keeps the time and the record."""
+
+    def __init__(self, fake_clock: FakeClock) -> None:
+        self._clock = fake_clock
+
+    def monotonic(self) -> float:
+        return self._clock.monotonic()
+
+    async def sleep(self, duration: float) -> None:
+        self._clock.sleep(duration)
+
+
+@pytest.fixture(params=[False, True], ids=["sync", "async"])
+def asynchronous(request: pytest.FixtureRequest) -> bool:
+    """Run the test against the blocking implementation, then the asyncio one."""
+    return request.param
+
+
+class Blocking:
+    """Drives an asyncio implementation through the blocking one's interface.
+
+    Every coroutine method is run to completion on a loop of its own, so that
+    one test body covers both implementations; anything else is passed through.
+    """
+
+    def __init__(self, wrapped: Any) -> None:
+        self._wrapped = wrapped
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._wrapped, name)
+        if not inspect.iscoroutinefunction(attribute):
+            return attribute
+        return lambda *args, **kwargs: asyncio.run(attribute(*args, **kwargs))
+
+
 @pytest.fixture
 def mock_httpx(monkeypatch: pytest.MonkeyPatch) -> Callable[[Callable], None]:
-    """Patch ``httpx.Client`` so every client created during the test drives a
-    real ``httpx.Client`` backed by an ``httpx.MockTransport``.
+    """Patch ``httpx.Client`` and ``httpx.AsyncClient`` so every client created
+    during the test drives a real one backed by an ``httpx.MockTransport``.
 
     The production code builds its own ``httpx.Client`` internally; this fixture
     intercepts that construction and injects a mock transport, letting each test
@@ -70,14 +112,45 @@ def mock_httpx(monkeypatch: pytest.MonkeyPatch) -> Callable[[Callable], None]:
             ...
     """
     real_client = httpx.Client
+    real_async_client = httpx.AsyncClient
 
     def install(handler: Callable[[httpx.Request], httpx.Response]) -> None:
         transport = httpx.MockTransport(handler)
 
-        def factory(*args: object, **kwargs: object) -> httpx.Client:
+        def factory(*args: Any, **kwargs: Any) -> httpx.Client:
             kwargs["transport"] = transport
             return real_client(*args, **kwargs)
 
+        def async_factory(*args: Any, **kwargs: Any) -> httpx.AsyncClient:
+            kwargs["transport"] = transport
+            return real_async_client(*args, **kwargs)
+
         monkeypatch.setattr(httpx, "Client", factory)
+        monkeypatch.setattr(httpx, "AsyncClient", async_factory)
 
     return install
+
+
+class _SpanList:
+    """Keeps every span exported, in the order they ended."""
+
+    def __init__(self) -> None:
+        self.spans: list[Span] = []
+
+    def export(self, spans: Sequence[Span]) -> None:
+        self.spans.extend(spans)
+
+
+@pytest.fixture
+def traces() -> Iterator[Callable[[], list[Span]]]:
+    """Trace for the test; calling the fixture's value stops tracing, once
+    every span ended so far is exported, and returns them."""
+    exported = _SpanList()
+    tracing.enable([exported])
+
+    def stop() -> list[Span]:
+        tracing.disable()
+        return exported.spans
+
+    yield stop
+    tracing.disable()
@@ -1,41 +1,93 @@
 """Unit tests for glueforward.main.application."""
 
-from unittest.mock import MagicMock
+import asyncio
+import logging
+from collections.abc import Callable
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock, call
 
 import pytest
 
-from glueforward.main.application import Application
+from glueforward.main.application import Application, AsyncApplication
+from glueforward.main.deadline import TickDeadline, TickOverran, get_remaining
 from glueforward.main.errors import RetryableError
+from glueforward.main.events import EventBus, FatalError, RetryScheduled
 from glueforward.main.gluetun import GluetunAuthFailed, GluetunServerError
+from glueforward.main.metrics import Metrics
 from glueforward.main.port_synchronizer import ForwardedPortNeverCame, NoForwardedPortYet
 from glueforward.main.qbittorrent import (
     QBittorrentAuthenticationNeeded,
     QBittorrentInvalidCredentials,
     QBittorrentUnreachable,
 )
+from glueforward.main.reload import Reconfiguration
 
-from .conftest import EndOfTest
+from .conftest import Blocking, EndOfTest, FakeAsyncClock
 
 # Distinct values, so the two intervals cannot be swapped unnoticed.
 RETRY_INTERVAL = 7
 SUCCESS_INTERVAL = 11
 
 
-def _make_application(clock, outcomes: list) -> tuple[Application, MagicMock]:
-    """An application whose every run has been decided in advance."""
-    synchronizer = MagicMock()
-    synchronizer.synchronize.side_effect = outcomes
-    application = Application(
-        synchronizer=synchronizer,
-        clock=clock,
-        retry_interval=RETRY_INTERVAL,
-        success_interval=SUCCESS_INTERVAL,
+@pytest.fixture(name="make_application")
+def make_application_fixture(asynchronous, clock) -> Callable[..., Any]:
+    """Build an application whose every run has been decided in advance,
+    blocking or asyncio alike."""
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def make(
+        outcomes: list,
+        connections: Any = None,
+        tick_deadline: Any = None,
+        metrics: Any = None,
+        events: Any = None,
+        leader: Any = None,
+        reloader: Any = None,
+    ) -> tuple[Any, MagicMock]:
+        if asynchronous:
+            synchronizer = MagicMock(synchronize=AsyncMock(side_effect=outcomes))
+            application = AsyncApplication(
+                synchronizer=synchronizer,
+                clock=FakeAsyncClock(clock),
+                retry_interval=RETRY_INTERVAL,
+                success_interval=SUCCESS_INTERVAL,
+                connections=connections,
+                tick_deadline=tick_deadline,
+                metrics=metrics,
+                events=events,
+                leader=leader,
+                reloader=reloader,
+            )
+            return Blocking(application), synchronizer
+        synchronizer = MagicMock()
+        synchronizer.synchronize.side_effect = outcomes
+        application = Application(
+            synchronizer=synchronizer,
+            clock=clock,
+            retry_interval=RETRY_INTERVAL,
+            success_interval=SUCCESS_INTERVAL,
+            connections=connections,
+            tick_deadline=tick_deadline,
+            metrics=metrics,
+            events=events,
+            leader=leader,
+            reloader=reloader,
+        )
+        return application, synchronizer
+
+    return make
+
+
+def _make_connections(prewarm_lead: float) -> MagicMock:
+    return MagicMock(
+        get_prewarm_lead=MagicMock(return_value=prewarm_lead),
+        prewarm=MagicMock(return_value=None),
+        prewarm_async=AsyncMock(),
     )
-    return application, synchronizer
 
 
-def test_a_successful_run_waits_out_the_success_interval(clock):
-    application, _ = _make_application(clock, [None, EndOfTest()])
+def test_a_successful_run_waits_out_the_success_interval(make_application, clock):
+    application, _ = make_application([None, EndOfTest()])
 
     with pytest.raises(EndOfTest):
         application.run()
@@ -43,9 +95,9 @@ def test_a_successful_run_waits_out_the_success_interval(clock):
     assert clock.slept == [SUCCESS_INTERVAL]
 
 
-def test_a_retryable_error_waits_out_the_retry_interval(clock):
+def test_a_retryable_error_waits_out_the_retry_interval(make_application, clock):
     """Waiting is what keeps a service that is down from being hammered."""
-    application, _ = _make_application(clock, [RetryableError("down"), EndOfTest()])
+    application, _ = make_application([RetryableError("down"), EndOfTest()])
 
     with pytest.raises(EndOfTest):
         application.run()
@@ -53,10 +105,10 @@ def test_a_retryable_error_waits_out_the_retry_interval(clock):
     assert clock.slept == [RETRY_INTERVAL]
 
 
-def test_an_immediate_retry_does_not_wait(clock):
+def test_an_immediate_retry_does_not_wait(make_application, clock):
     """Reauthenticating costs one request, so waiting on it is dead time."""
     outcomes = [RetryableError("expired", retry_immediately=True), EndOfTest()]
-    application, _ = _make_application(clock, outcomes)
+    application, _ = make_application(outcomes)
 
     with pytest.raises(EndOfTest):
         application.run()
@@ -64,9 +116,9 @@ def test_an_immediate_retry_does_not_wait(clock):
     assert clock.slept == []
 
 
-def test_an_unretryable_error_is_left_to_the_caller(clock):
+def test_an_unretryable_error_is_left_to_the_caller(make_application):
     """Turning it into an exit code is the entry point's job, not the loop's."""
-    application, synchronizer = _make_application(clock, [ValueError("unretryable")])
+    application, synchronizer = make_application([ValueError("unretryable")])
 
     with pytest.raises(ValueError):
         application.run()
@@ -74,6 +126,22 @@ def test_an_unretryable_error_is_left_to_the_caller(clock):
     assert synchronizer.synchronize.call_count == 1
 
 
+def test_retries_and_the_error_that_stops_the_run_are_published(make_application):
+    events = MagicMock(spec=EventBus)
+    expired = RetryableError("expired", retry_immediately=True)
+    outcomes = [RetryableError("down"), expired, ValueError("unretryable")]
+    application, _ = make_application(outcomes, events=events)
+
+    with pytest.raises(ValueError):
+        application.run()
+
+    assert events.publish.call_args_list == [
+        call(RetryScheduled("RetryableError('down')", RETRY_INTERVAL)),
+        call(RetryScheduled(repr(expired), 0)),
+        call(FatalError("ValueError('unretryable')")),
+    ]
+
+
 @pytest.mark.parametrize(
     "error",
     [
@@ -84,10 +152,10 @@ def test_an_unretryable_error_is_left_to_the_caller(clock):
     ],
     ids=["gluetun_outage", "no_forwarded_port", "qbittorrent_down", "session_expired"],
 )
-def test_run_survives_a_service_being_away(clock, error):
+def test_run_survives_a_service_being_away(make_application, error):
     """Each of these is routine: tunnels renegotiate, sessions expire, stacks restart."""
-    application, synchronizer = _make_application(
-        clock, [error(), error(), None, EndOfTest()]
+    application, synchronizer = make_application(
+        [error(), error(), None, EndOfTest()]
     )
 
     with pytest.raises(EndOfTest):
@@ -102,11 +170,186 @@ def test_run_survives_a_service_being_away(clock, error):
     [GluetunAuthFailed, QBittorrentInvalidCredentials, ForwardedPortNeverCame],
     ids=["bad_api_key", "bad_credentials", "port_forwarding_off"],
 )
-def test_run_stops_on_a_misconfiguration_without_retrying(clock, error):
+def test_run_stops_on_a_misconfiguration_without_retrying(make_application, error):
     """Retrying cannot fix a wrong secret, and gets us banned by qBittorrent."""
-    application, synchronizer = _make_application(clock, [error()])
+    application, synchronizer = make_application([error()])
 
     with pytest.raises(error):
         application.run()
 
     assert synchronizer.synchronize.call_count == 1
+
+
+def test_the_connections_are_prewarmed_shortly_before_the_next_run(
+    make_application, clock
+):
+    """The next run finds its connections open, rather than opening them."""
+    connections = _make_connections(prewarm_lead=3)
+    application, _ = make_application([None, EndOfTest()], connections)
+
+    with pytest.raises(EndOfTest):
+        application.run()
+
+    assert clock.slept == [SUCCESS_INTERVAL - 3, 3]
+    prewarms = connections.prewarm.call_count + connections.prewarm_async.await_count
+    assert prewarms == 1
+
+
+def test_a_prewarm_s_own_time_comes_out_of_its_lead(make_application, clock):
+    """A prewarm stalling on a service that is down must not delay the run."""
+    connections = _make_connections(prewarm_lead=3)
+
+    def stall() -> None:
+        clock.now += 1
+
+    connections.prewarm.side_effect = stall
+    connections.prewarm_async.side_effect = stall
+    application, _ = make_application([None, EndOfTest()], connections)
+
+    with pytest.raises(EndOfTest):
+        application.run()
+
+    assert clock.slept == [SUCCESS_INTERVAL - 3, 2]
+
+
+@pytest.mark.parametrize("prewarm_lead", [0, SUCCESS_INTERVAL])
+def test_no_prewarm_fits_in_a_wait_not_longer_than_its_lead(
+    make_application, clock, prewarm_lead
+):
+    connections = _make_connections(prewarm_lead)
+    application, _ = make_application([None, EndOfTest()], connections)
+
+    with pytest.raises(EndOfTest):
+        application.run()
+
+    assert clock.slept == [SUCCESS_INTERVAL]
+    connections.prewarm.assert_not_called()
+    connections.prewarm_async.assert_not_awaited()
+
+
+def test_the_scheduler_s_lag_is_exported_with_metrics(clock):
+    metrics = Metrics(clock)
+    Application(MagicMock(), clock, RETRY_INTERVAL, SUCCESS_INTERVAL, metrics=metrics)
+
+    assert "glueforward_scheduler_lag_seconds 0.0" in metrics.render().splitlines()
+
+
+def test_every_run_is_counted_with_what_it_failed_on(make_application):
+    metrics = MagicMock()
+    error = RetryableError("down")
+    application, _ = make_application([error, None, EndOfTest()], metrics=metrics)
+
+    with pytest.raises(EndOfTest):
+        application.run()
+
+    # The last run never ends, as far as the lifecycle is concerned.
+    assert metrics.count_tick.call_args_list == [call(error), call(None)]
+
+
+def test_a_run_is_bound_by_the_tick_deadline(make_application, clock):
+    remaining: list[float | None] = []
+    outcomes = iter([None, EndOfTest()])
+
+    def synchronize() -> None:
+        remaining.append(get_remaining())
+        if (outcome := next(outcomes)) is not None:
+            raise outcome
+
+    application, synchronizer = make_application([], None, TickDeadline(30, clock))
+    synchronizer.synchronize.side_effect = synchronize
+
+    with pytest.raises(EndOfTest):
+        application.run()
+
+    # Each run gets the whole of it, however long the wait before.
+    assert remaining == [30, 30]
+
+
+def test_a_run_overrunning_its_deadline_is_cancelled_and_retried(caplog, clock):
+    """A service that never answers must not stop the synchronization."""
+    calls = 0
+
+    async def synchronize() -> None:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            await asyncio.Event().wait()
+        raise EndOfTest()
+
+    application = AsyncApplication(
+        synchronizer=MagicMock(synchronize=synchronize),
+        clock=FakeAsyncClock(clock),
+        retry_interval=RETRY_INTERVAL,
+        success_interval=SUCCESS_INTERVAL,
+        tick_deadline=TickDeadline(0.01, clock),
+    )
+
+    with pytest.raises(EndOfTest):
+        asyncio.run(application.run())
+
+    assert calls == 2
+    assert clock.slept == [RETRY_INTERVAL]
+    assert TickOverran.__name__ in caplog.text
+
+
+def test_a_service_away_for_long_is_not_logged_every_retry(make_application, caplog):
+    caplog.set_level(logging.INFO)
+    outcomes = [NoForwardedPortYet()] * 3 + [None, EndOfTest()]
+    application, _ = make_application(outcomes)
+
+    with pytest.raises(EndOfTest):
+        application.run()
+
+    assert caplog.text.count("Retryable error in lifecycle") == 1
+    assert caplog.text.count("Retrying in") == 1
+    assert "Last error repeated 2 times" in caplog.text
+
+
+def test_an_immediate_retry_is_only_logged_the_first_time(make_application, caplog):
+    caplog.set_level(logging.INFO)
+    expired = QBittorrentAuthenticationNeeded()
+    application, _ = make_application([expired, expired, EndOfTest()])
+
+    with pytest.raises(EndOfTest):
+        application.run()
+
+    assert caplog.text.count("Retrying immediately") == 1
+
+
+def test_a_standby_only_synchronizes_once_it_leads(make_application, clock):
+    leader = MagicMock(
+        is_leader=MagicMock(side_effect=[False, False, True, True]),
+        get_standby_interval=MagicMock(return_value=3),
+    )
+    application, synchronizer = make_application([None, EndOfTest()], leader=leader)
+
+    with pytest.raises(EndOfTest):
+        application.run()
+
+    assert synchronizer.synchronize.call_count == 2
+    assert clock.slept == [3, 3, SUCCESS_INTERVAL]
+
+
+def test_a_reload_applies_from_the_next_tick(make_application, clock, asynchronous):
+    service = MagicMock()
+    close = AsyncMock() if asynchronous else MagicMock()
+    reconfiguration = Reconfiguration(
+        retry_interval=3,
+        success_interval=5,
+        tick_deadline=None,
+        wait_for_first_port_duration=30,
+        forwarder=None,
+        service=service,
+        retired=(close,),
+    )
+    reloads = [None, reconfiguration, None, None]
+    reloader = MagicMock(reload=MagicMock(side_effect=reloads))
+    outcomes = [None, None, NoForwardedPortYet(), EndOfTest()]
+    application, synchronizer = make_application(outcomes, reloader=reloader)
+
+    with pytest.raises(EndOfTest):
+        application.run()
+
+    synchronizer.reconfigure.assert_called_once_with(30, None, service)
+    close.assert_called_once_with()
+    assert clock.slept == [SUCCESS_INTERVAL, 5, 3]
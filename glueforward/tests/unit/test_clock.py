@@ -1,8 +1,9 @@
 """Unit tests for glueforward.main.clock."""
 
+import asyncio
 import time
 
-from glueforward.main.clock import SystemClock
+from glueforward.main.clock import AsyncSystemClock, SystemClock
 
 # Short enough not to slow the suite down, long enough to outlast the noise.
 A_SHORT_WAIT = 0.01
@@ -22,3 +23,12 @@ def test_sleep_waits_out_the_duration_it_was_given():
     clock.sleep(A_SHORT_WAIT)
 
     assert time.monotonic() - before >= A_SHORT_WAIT
+
+
+def test_async_sleep_waits_out_the_duration_it_was_given():
+    clock = AsyncSystemClock()
+
+    before = clock.monotonic()
+    asyncio.run(clock.sleep(A_SHORT_WAIT))
+
+    assert clock.monotonic() - before >= A_SHORT_WAIT
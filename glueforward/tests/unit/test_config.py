@@ -3,11 +3,16 @@
 import pytest
 
 from glueforward.main.config import (
+    ASYNCIO_RUNTIME,
+    SYNC_RUNTIME,
     ConfigurationError,
     QBittorrentConfig,
     get_configuration,
+    get_health_file,
 )
 from glueforward.main.errors import ReturnCodes
+from glueforward.main.tls import TlsSettings
+from glueforward.main.transport import ConnectionSettings
 
 from .conftest import GLUETUN_API_KEY, QBITTORRENT_PASSWORD
 
@@ -31,6 +36,12 @@ def test_the_intervals_have_defaults():
     assert config.retry_interval == 10
     assert config.success_interval == 300
     assert config.gluetun_port_wait_duration == 300
+    assert config.host_concurrency_limit == 2
+    assert config.gluetun_port_cache_ttl == 0
+    assert config.tick_deadline == 60
+    assert config.health_stale_intervals == 3
+    assert config.gluetun_timeout == config.service.timeout == 5
+    assert config.connections == ConnectionSettings()
 
 
 @pytest.mark.parametrize(
@@ -39,6 +50,11 @@ def test_the_intervals_have_defaults():
         ("RETRY_INTERVAL", "retry_interval"),
         ("SUCCESS_INTERVAL", "success_interval"),
         ("GLUETUN_PORT_WAIT_DURATION", "gluetun_port_wait_duration"),
+        ("HOST_CONCURRENCY_LIMIT", "host_concurrency_limit"),
+        ("GLUETUN_PORT_CACHE_TTL", "gluetun_port_cache_ttl"),
+        ("GLUETUN_TIMEOUT", "gluetun_timeout"),
+        ("TICK_DEADLINE", "tick_deadline"),
+        ("HEALTH_STALE_INTERVALS", "health_stale_intervals"),
     ],
 )
 def test_the_intervals_are_read_from_the_environment(monkeypatch, name, attribute):
@@ -93,6 +109,247 @@ def test_a_non_numeric_interval_is_reported(monkeypatch, name, value):
     assert repr(value) in str(error.value)
 
 
+def test_the_connection_settings_are_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv("CONNECTION_KEEPALIVE_EXPIRY", "600")
+    monkeypatch.setenv("CONNECTION_POOL_SIZE", "1")
+    monkeypatch.setenv("TCP_KEEPALIVE", "True")
+    monkeypatch.setenv("CONNECTION_PREWARM_LEAD", "2")
+    monkeypatch.setenv("DNS_CACHE_TTL", "0")
+    monkeypatch.setenv("DNS_STALE_TIMEOUT", "3")
+    monkeypatch.setenv("ADAPTIVE_TIMEOUTS", "true")
+    monkeypatch.setenv("ADAPTIVE_TIMEOUT_MULTIPLIER", "3")
+    monkeypatch.setenv("ADAPTIVE_TIMEOUT_FLOOR", "2")
+    monkeypatch.setenv("ADAPTIVE_TIMEOUT_CEILING", "20")
+
+    assert get_configuration().connections == ConnectionSettings(
+        keepalive_expiry=600,
+        pool_size=1,
+        tcp_keepalive=True,
+        prewarm_lead=2,
+        dns_cache_ttl=0,
+        dns_stale_timeout=3,
+        adaptive_timeouts=True,
+        timeout_multiplier=3,
+        timeout_floor=2,
+        timeout_ceiling=20,
+    )
+
+
+@pytest.mark.parametrize("value", ["0", "-1"])
+def test_a_host_concurrency_limit_letting_nothing_through_is_reported(
+    monkeypatch, value
+):
+    """With no slot to hand, every request would wait forever."""
+    monkeypatch.setenv("HOST_CONCURRENCY_LIMIT", value)
+
+    with pytest.raises(ConfigurationError, match="HOST_CONCURRENCY_LIMIT") as error:
+        get_configuration()
+
+    assert error.value.return_code == ReturnCodes.INVALID_ENVIRONMENT_VARIABLE
+
+
+@pytest.mark.parametrize("lead", ["30", "45"])
+def test_a_prewarm_lead_outlasting_the_keepalive_is_reported(monkeypatch, lead):
+    monkeypatch.setenv("CONNECTION_KEEPALIVE_EXPIRY", "30")
+    monkeypatch.setenv("CONNECTION_PREWARM_LEAD", lead)
+
+    with pytest.raises(ConfigurationError, match="CONNECTION_PREWARM_LEAD") as error:
+        get_configuration()
+
+    assert error.value.return_code == ReturnCodes.INVALID_ENVIRONMENT_VARIABLE
+
+
+def test_an_unreadable_switch_is_reported(monkeypatch):
+    monkeypatch.setenv("TCP_KEEPALIVE", "yes")
+
+    with pytest.raises(ConfigurationError) as error:
+        get_configuration()
+
+    assert error.value.return_code == ReturnCodes.INVALID_ENVIRONMENT_VARIABLE
+    assert "TCP_KEEPALIVE" in str(error.value)
+
+
+def test_the_qbittorrent_timeout_is_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv("QBITTORRENT_TIMEOUT", "30")
+
+    assert get_configuration().service.timeout == 30
+
+
+def test_the_usual_certificate_authorities_are_trusted_by_default():
+    config = get_configuration()
+
+    assert config.gluetun_tls == TlsSettings()
+    assert config.service.tls == TlsSettings()
+
+
+@pytest.mark.parametrize("prefix", ["GLUETUN", "QBITTORRENT"])
+def test_whom_to_trust_is_read_per_service(monkeypatch, tmp_path, prefix):
+    ca_file = tmp_path / "ca.pem"
+    ca_file.touch()
+    monkeypatch.setenv(f"{prefix}_CA_FILE", str(ca_file))
+    # As openssl prints it.
+    monkeypatch.setenv(f"{prefix}_CERT_SHA256", ":".join(["AB"] * 32))
+
+    config = get_configuration()
+
+    tls = config.gluetun_tls if prefix == "GLUETUN" else config.service.tls
+    assert tls == TlsSettings(ca_file=str(ca_file), pinned_sha256="ab" * 32)
+
+
+@pytest.mark.parametrize(
+    "name, value",
+    [
+        ("GLUETUN_CA_FILE", "/nowhere/ca.pem"),
+        ("QBITTORRENT_CERT_SHA256", "ab" * 31),
+        ("QBITTORRENT_CERT_SHA256", "xy" * 32),
+    ],
+)
+def test_an_unusable_trust_setting_is_reported(monkeypatch, name, value):
+    monkeypatch.setenv(name, value)
+
+    with pytest.raises(ConfigurationError) as error:
+        get_configuration()
+
+    assert error.value.return_code == ReturnCodes.INVALID_ENVIRONMENT_VARIABLE
+    assert name in str(error.value)
+    assert repr(value) in str(error.value)
+
+
+def test_the_server_is_off_unless_given_an_address():
+    assert get_configuration().server_address is None
+
+
+def test_the_server_address_is_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv("SERVER_ADDRESS", "0.0.0.0:8001")
+
+    assert get_configuration().server_address == ("0.0.0.0", 8001)
+
+
+@pytest.mark.parametrize("value", ["0.0.0.0", "localhost:http", ""])
+def test_an_unreadable_server_address_is_reported(monkeypatch, value):
+    monkeypatch.setenv("SERVER_ADDRESS", value)
+
+    with pytest.raises(ConfigurationError) as error:
+        get_configuration()
+
+    assert error.value.return_code == ReturnCodes.INVALID_ENVIRONMENT_VARIABLE
+    assert "SERVER_ADDRESS" in str(error.value)
+
+
+def test_metrics_are_off_unless_asked_for():
+    assert not get_configuration().metrics
+
+
+def test_metrics_are_served_on_the_server(monkeypatch):
+    monkeypatch.setenv("SERVER_ADDRESS", "0.0.0.0:8001")
+    monkeypatch.setenv("METRICS", "true")
+
+    assert get_configuration().metrics
+
+
+def test_metrics_without_a_server_are_reported(monkeypatch):
+    monkeypatch.setenv("METRICS", "true")
+
+    with pytest.raises(ConfigurationError) as error:
+        get_configuration()
+
+    assert error.value.return_code == ReturnCodes.MISSING_ENVIRONMENT_VARIABLE
+    assert "SERVER_ADDRESS" in str(error.value)
+
+
+def test_the_runtime_is_blocking_unless_asked_otherwise():
+    assert get_configuration().runtime == SYNC_RUNTIME
+
+
+def test_the_asyncio_runtime_can_be_asked_for(monkeypatch):
+    monkeypatch.setenv("RUNTIME", "asyncio")
+
+    assert get_configuration().runtime == ASYNCIO_RUNTIME
+
+
+def test_an_unknown_runtime_is_reported(monkeypatch):
+    monkeypatch.setenv("RUNTIME", "trio")
+
+    with pytest.raises(ConfigurationError) as error:
+        get_configuration()
+
+    assert error.value.return_code == ReturnCodes.INVALID_ENVIRONMENT_VARIABLE
+    assert "RUNTIME" in str(error.value)
+
+
+def test_the_middlewares_default_to_what_glueforward_always_did():
+    config = get_configuration()
+
+    assert config.gluetun_middlewares == ("cache", "timing")
+    assert config.service_middlewares == ("timing",)
+
+
+def test_the_middlewares_are_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv("GLUETUN_MIDDLEWARES", "timing, cache")
+    monkeypatch.setenv("SERVICE_MIDDLEWARES", "")
+
+    config = get_configuration()
+
+    assert config.gluetun_middlewares == ("timing", "cache")
+    assert not config.service_middlewares
+
+
+@pytest.mark.parametrize(
+    "name, value",
+    [
+        ("GLUETUN_MIDDLEWARES", "dedupe"),
+        ("SERVICE_MIDDLEWARES", "cache"),
+        ("SERVICE_MIDDLEWARES", "timing,timing"),
+    ],
+    ids=["service only", "gluetun only", "twice"],
+)
+def test_an_unusable_middleware_chain_is_reported(monkeypatch, name, value):
+    monkeypatch.setenv(name, value)
+
+    with pytest.raises(ConfigurationError) as error:
+        get_configuration()
+
+    assert error.value.return_code == ReturnCodes.INVALID_ENVIRONMENT_VARIABLE
+    assert name in str(error.value)
+    assert repr(value) in str(error.value)
+
+
+@pytest.mark.parametrize("name", ["GLUETUN_MIDDLEWARES", "SERVICE_MIDDLEWARES"])
+def test_metrics_need_the_calls_they_time_timed(monkeypatch, name):
+    monkeypatch.setenv("SERVER_ADDRESS", "127.0.0.1:8080")
+    monkeypatch.setenv("METRICS", "true")
+    monkeypatch.setenv(name, "")
+
+    with pytest.raises(ConfigurationError) as error:
+        get_configuration()
+
+    assert error.value.return_code == ReturnCodes.INVALID_ENVIRONMENT_VARIABLE
+    assert name in str(error.value)
+    assert "timing" in str(error.value)
+
+
+def test_the_history_is_kept_for_the_days_configured(monkeypatch):
+    assert get_configuration().history_file is None
+    assert get_configuration().history_retention == 90 * 24 * 60 * 60
+
+    monkeypatch.setenv("HISTORY_FILE", "/data/history.db")
+    monkeypatch.setenv("HISTORY_RETENTION_DAYS", "7")
+
+    assert get_configuration().history_file == "/data/history.db"
+    assert get_configuration().history_retention == 7 * 24 * 60 * 60
+
+
+def test_replicas_elect_a_leader_through_the_lease_file_configured(monkeypatch):
+    assert get_configuration().leader_lease_file is None
+    assert get_configuration().leader_lease_duration == 15
+
+    monkeypatch.setenv("LEADER_LEASE_FILE", "/shared/leader.lease")
+    monkeypatch.setenv("LEADER_LEASE_DURATION", "30")
+
+    assert get_configuration().leader_lease_file == "/shared/leader.lease"
+    assert get_configuration().leader_lease_duration == 30
+
+
 def test_a_missing_service_type_means_qbittorrent(monkeypatch):
     """The only service supported so far does not have to be asked for."""
     monkeypatch.delenv("SERVICE_TYPE")
@@ -110,3 +367,72 @@ def test_an_unknown_service_type_is_reported(monkeypatch):
 
     assert error.value.return_code == ReturnCodes.UNKNOWN_SERVICE_TYPE
     assert "transmission" in str(error.value)
+
+
+def _write_config_file(monkeypatch, tmp_path, content: str) -> str:
+    path = tmp_path / "glueforward.toml"
+    path.write_text(content)
+    monkeypatch.setenv("CONFIG_FILE", str(path))
+    return str(path)
+
+
+def test_the_config_file_is_read_over_the_environment(monkeypatch, tmp_path):
+    path = _write_config_file(
+        monkeypatch,
+        tmp_path,
+        'QBITTORRENT_PASSWORD = "rotated"\n'
+        "SUCCESS_INTERVAL = 60\n"
+        "TCP_KEEPALIVE = true\n"
+        'GLUETUN_MIDDLEWARES = ["timing"]\n'
+        'HEALTH_FILE = "/tmp/health.json"\n',
+    )
+
+    config = get_configuration()
+
+    assert config.config_file == path
+    assert config.service.password == "rotated"
+    assert config.success_interval == 60
+    assert config.connections.tcp_keepalive
+    assert config.gluetun_middlewares == ("timing",)
+    # Whatever the file leaves out is still read from the environment.
+    assert config.gluetun_api_key == GLUETUN_API_KEY
+    assert get_health_file() == "/tmp/health.json"
+
+
+def test_a_value_the_config_file_cannot_take_names_the_file(monkeypatch, tmp_path):
+    path = _write_config_file(monkeypatch, tmp_path, 'RETRY_INTERVAL = "soon"\n')
+
+    with pytest.raises(ConfigurationError) as error:
+        get_configuration()
+
+    assert error.value.return_code == ReturnCodes.INVALID_ENVIRONMENT_VARIABLE
+    assert f"Setting RETRY_INTERVAL in {path}" in str(error.value)
+
+
+@pytest.mark.parametrize(
+    "content, message",
+    [
+        ("RETRY_INTERVAL = 1.5\n", "RETRY_INTERVAL"),
+        ("[gluetun]\nurl = 'http://gluetun'\n", "gluetun"),
+        ("RETRY_INTERVAL = \n", "Could not read"),
+        ("RETRY_INTERVL = 10\n", "sets RETRY_INTERVL, which no setting is read from"),
+    ],
+    ids=["float", "table", "not toml", "misspelt"],
+)
+def test_an_unusable_config_file_is_reported(monkeypatch, tmp_path, content, message):
+    _write_config_file(monkeypatch, tmp_path, content)
+
+    with pytest.raises(ConfigurationError) as error:
+        get_configuration()
+
+    assert error.value.return_code == ReturnCodes.INVALID_CONFIG_FILE
+    assert message in str(error.value)
+
+
+def test_a_config_file_that_is_missing_is_reported(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONFIG_FILE", str(tmp_path / "missing.toml"))
+
+    with pytest.raises(ConfigurationError) as error:
+        get_configuration()
+
+    assert error.value.return_code == ReturnCodes.INVALID_CONFIG_FILE
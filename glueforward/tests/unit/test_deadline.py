@@ -0,0 +1,72 @@
+"""Unit tests for glueforward.main.deadline."""
+
+import asyncio
+import time
+
+from glueforward.main import deadline
+from glueforward.main.deadline import TickDeadline, TickOverran, get_remaining
+from glueforward.main.errors import RetryableError
+
+# Short enough for the watchdog to bark within a test.
+GRACE = 0.01
+
+
+def test_nothing_remains_outside_a_tick():
+    assert get_remaining() is None
+
+
+def test_what_remains_of_a_tick_runs_down_with_the_clock(clock):
+    with TickDeadline(30, clock).enforce():
+        assert get_remaining() == 30
+        clock.now = 25
+        assert get_remaining() == 5
+
+    assert get_remaining() is None
+
+
+def _wait_for_overrun(tick_deadline: TickDeadline) -> None:
+    """Stuck as a tick would be, until the watchdog has noticed."""
+    give_up_at = time.monotonic() + 5
+    while tick_deadline.get_overruns() == 0:
+        assert time.monotonic() < give_up_at
+        time.sleep(0.001)
+
+
+def test_a_tick_overrunning_has_its_stack_logged(monkeypatch, clock, caplog):
+    monkeypatch.setattr(deadline, "WATCHDOG_GRACE", GRACE)
+    tick_deadline = TickDeadline(0, clock)
+
+    with tick_deadline.enforce():
+        _wait_for_overrun(tick_deadline)
+
+    assert "Tick still running" in caplog.text
+    assert "_wait_for_overrun" in caplog.text
+
+
+def test_a_task_overrunning_has_its_stack_logged(monkeypatch, clock, caplog):
+    monkeypatch.setattr(deadline, "WATCHDOG_GRACE", GRACE)
+    tick_deadline = TickDeadline(0, clock)
+
+    async def stuck_tick() -> None:
+        with tick_deadline.enforce():
+            _wait_for_overrun(tick_deadline)
+
+    asyncio.run(stuck_tick())
+
+    assert "stuck_tick" in caplog.text
+
+
+def test_a_tick_on_time_is_not_reported(monkeypatch, clock, caplog):
+    monkeypatch.setattr(deadline, "WATCHDOG_GRACE", GRACE)
+    tick_deadline = TickDeadline(0, clock)
+
+    with tick_deadline.enforce():
+        pass
+    time.sleep(GRACE * 5)
+
+    assert tick_deadline.get_overruns() == 0
+    assert not caplog.text
+
+
+def test_an_overrun_is_retried():
+    assert isinstance(TickOverran(), RetryableError)
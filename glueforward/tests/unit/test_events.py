@@ -0,0 +1,110 @@
+"""Unit tests for glueforward.main.events."""
+
+import logging
+import threading
+
+from glueforward.main.events import (
+    Event,
+    EventBus,
+    LoggingSink,
+    PortApplied,
+    PortObserved,
+)
+
+FORWARDED_PORT = 51413
+
+
+class _Sink:
+    """Keeps what it is handed, once `handling` is set."""
+
+    def __init__(self) -> None:
+        self.handled: list[Event] = []
+        self.handling = threading.Event()
+        self.handling.set()
+        # Set once an event is being handled, held up or not.
+        self.started = threading.Event()
+
+    def handle(self, event: Event) -> None:
+        self.started.set()
+        self.handling.wait()
+        self.handled.append(event)
+
+
+class _FailingSink:
+    def handle(self, event: Event) -> None:
+        raise ValueError(event)
+
+
+def test_every_sink_is_handed_every_event_in_order():
+    bus = EventBus()
+    first, second = _Sink(), _Sink()
+    bus.subscribe(first)
+    bus.subscribe(second)
+
+    bus.publish(PortObserved(FORWARDED_PORT))
+    bus.publish(PortApplied(FORWARDED_PORT))
+    bus.close()
+
+    expected = [PortObserved(FORWARDED_PORT), PortApplied(FORWARDED_PORT)]
+    assert first.handled == second.handled == expected
+
+
+def test_a_slow_sink_misses_events_rather_than_holding_up_the_tick(caplog):
+    bus = EventBus()
+    slow, fast = _Sink(), _Sink()
+    slow.handling.clear()
+    bus.subscribe(slow, queue_size=1)
+    bus.subscribe(fast)
+
+    # Held up handling the first, the slow sink has room for one more.
+    bus.publish(PortObserved(0))
+    slow.started.wait()
+    for port in range(1, 5):
+        bus.publish(PortObserved(port))
+    dropped = bus.get_dropped()
+    slow.handling.set()
+    bus.close()
+
+    assert dropped == {"_Sink": 3}
+    assert slow.handled == [PortObserved(0), PortObserved(1)]
+    assert len(fast.handled) == 5
+    assert caplog.text.count("_Sink falls behind") == 1
+
+
+def test_a_sink_failing_is_only_logged(caplog):
+    bus = EventBus()
+    bus.subscribe(_FailingSink())
+    sink = _Sink()
+    bus.subscribe(sink)
+
+    bus.publish(PortApplied(FORWARDED_PORT))
+    bus.close()
+
+    assert "_FailingSink failed to handle PortApplied(port=51413)" in caplog.text
+    assert sink.handled == [PortApplied(FORWARDED_PORT)]
+
+
+def test_closing_gives_up_on_a_sink_stuck_with_a_full_queue():
+    bus = EventBus()
+    stuck = _Sink()
+    stuck.handling.clear()
+    bus.subscribe(stuck, queue_size=1)
+    bus.publish(PortObserved(1))
+    stuck.started.wait()
+    bus.publish(PortObserved(2))
+
+    bus.close(timeout=0.01)
+
+    assert not stuck.handled
+    stuck.handling.set()
+
+
+def test_events_can_be_logged(caplog):
+    bus = EventBus()
+    bus.subscribe(LoggingSink())
+
+    with caplog.at_level(logging.DEBUG):
+        bus.publish(PortApplied(FORWARDED_PORT))
+        bus.close()
+
+    assert "Event: PortApplied(port=51413)" in caplog.text
@@ -4,17 +4,24 @@ The status codes these tests script are the ones gluetun really returns,
 pinned against a live control server by the end-to-end contract tests.
 """
 
+from collections.abc import Callable
+from functools import partial
+from typing import Any
+
 import httpx
 import pytest
 
 from glueforward.main.errors import RetryableError
 from glueforward.main.gluetun import (
+    AsyncGluetunClient,
     GluetunAuthFailed,
     GluetunClient,
     GluetunServerError,
     GluetunUnexpectedResponse,
     GluetunUnreachable,
 )
+from glueforward.main.limiter import HostLimiter
+from glueforward.main.responses import SNIPPET_SIZE
 
 from ..external_contracts import (
     GLUETUN_API_KEY_HEADER,
@@ -23,12 +30,24 @@ from ..external_contracts import (
     GLUETUN_PORT_FORWARD_PATH,
     GLUETUN_PORT_KEY,
 )
+from .conftest import Blocking
 
 FORWARDED_PORT = 51413
 
 
-def _make_client(api_key: None | str = None) -> GluetunClient:
-    return GluetunClient(url="http://gluetun", api_key=api_key)
+@pytest.fixture(name="make_client")
+def make_client_fixture(asynchronous) -> Callable[..., Any]:
+    """Build the client under test, blocking or asyncio alike."""
+
+    def make(
+        api_key: None | str = None,
+        url: str = "http://gluetun",
+        limiter: HostLimiter | None = None,
+    ) -> Any:
+        client_class = AsyncGluetunClient if asynchronous else GluetunClient
+        return Blocking(client_class(url=url, api_key=api_key, limiter=limiter))
+
+    return make
 
 
 def _answer(port: int) -> httpx.Response:
@@ -49,31 +68,31 @@ def test_retry_policy(error, is_retryable):
     assert issubclass(error, RetryableError) is is_retryable
 
 
-def test_init_sets_api_key_header(mock_httpx):
+def test_init_sets_api_key_header(make_client, mock_httpx):
     def handler(request: httpx.Request) -> httpx.Response:
         assert request.headers[GLUETUN_API_KEY_HEADER] == "secret"
         return _answer(FORWARDED_PORT)
 
     mock_httpx(handler)
-    assert _make_client(api_key="secret").get_forwarded_port() == FORWARDED_PORT
+    assert make_client(api_key="secret").get_forwarded_port() == FORWARDED_PORT
 
 
-def test_init_without_api_key_header(mock_httpx):
+def test_init_without_api_key_header(make_client, mock_httpx):
     def handler(request: httpx.Request) -> httpx.Response:
         assert GLUETUN_API_KEY_HEADER not in request.headers
         return _answer(FORWARDED_PORT)
 
     mock_httpx(handler)
-    assert _make_client().get_forwarded_port() == FORWARDED_PORT
+    assert make_client().get_forwarded_port() == FORWARDED_PORT
 
 
-def test_get_forwarded_port_success(mock_httpx):
+def test_get_forwarded_port_success(make_client, mock_httpx):
     mock_httpx(lambda _: _answer(FORWARDED_PORT))
 
-    assert _make_client().get_forwarded_port() == FORWARDED_PORT
+    assert make_client().get_forwarded_port() == FORWARDED_PORT
 
 
-def test_get_forwarded_port_requests_the_control_server_endpoint(mock_httpx):
+def test_get_forwarded_port_requests_the_control_server_endpoint(make_client, mock_httpx):
     """The endpoint is gluetun's, so nothing in this repository can vouch for it."""
     seen: list[tuple[str, str]] = []
 
@@ -82,16 +101,26 @@ def test_get_forwarded_port_requests_the_control_server_endpoint(mock_httpx):
         return _answer(FORWARDED_PORT)
 
     mock_httpx(handler)
-    _make_client().get_forwarded_port()
+    make_client().get_forwarded_port()
 
     assert seen == [("GET", GLUETUN_PORT_FORWARD_PATH)]
 
 
-def test_no_forwarded_port_is_reported_as_none(mock_httpx):
+def test_get_forwarded_port_counts_against_gluetun_s_host(make_client, mock_httpx):
+    """A gluetun shared between deployments is one host, limited as one."""
+    limiter = HostLimiter()
+    mock_httpx(lambda _: _answer(FORWARDED_PORT))
+
+    make_client(url="http://gluetun:8000", limiter=limiter).get_forwarded_port()
+
+    assert list(limiter.get_statistics()) == ["gluetun:8000"]
+
+
+def test_no_forwarded_port_is_reported_as_none(make_client, mock_httpx):
     """Whether that is worth waiting out is the caller's to judge, not ours."""
     mock_httpx(lambda _: _answer(GLUETUN_NO_FORWARDED_PORT))
 
-    assert _make_client().get_forwarded_port() is None
+    assert make_client().get_forwarded_port() is None
 
 
 @pytest.mark.parametrize(
@@ -99,48 +128,61 @@ def test_no_forwarded_port_is_reported_as_none(mock_httpx):
     [httpx.ConnectError, httpx.ReadError, httpx.ReadTimeout, httpx.ConnectTimeout],
     ids=["connect_error", "read_error", "read_timeout", "connect_timeout"],
 )
-def test_get_forwarded_port_unreachable(mock_httpx, exception):
+def test_get_forwarded_port_unreachable(make_client, mock_httpx, exception):
     def handler(_: httpx.Request) -> httpx.Response:
         raise exception("boom")
 
     mock_httpx(handler)
     with pytest.raises(GluetunUnreachable):
-        _make_client().get_forwarded_port()
+        make_client().get_forwarded_port()
 
 
-def test_get_forwarded_port_unauthorized(mock_httpx):
+def test_get_forwarded_port_unauthorized(make_client, mock_httpx):
     mock_httpx(
         lambda _: httpx.Response(GLUETUN_INVALID_API_KEY_STATUS, text="unauthorized")
     )
 
     with pytest.raises(GluetunAuthFailed):
-        _make_client(api_key="bad").get_forwarded_port()
+        make_client(api_key="bad").get_forwarded_port()
 
 
 @pytest.mark.parametrize("status_code", [500, 502, 503])
-def test_get_forwarded_port_server_error(mock_httpx, status_code):
+def test_get_forwarded_port_server_error(make_client, mock_httpx, status_code):
     """A 5xx is gluetun having a bad moment, so it is worth waiting out."""
     mock_httpx(lambda _: httpx.Response(status_code, text="server error"))
 
     with pytest.raises(GluetunServerError):
-        _make_client().get_forwarded_port()
+        make_client().get_forwarded_port()
 
 
 @pytest.mark.parametrize(
     "response",
+    # Built afresh for every request, since a response read once is spent.
     [
-        httpx.Response(404, text="Not Found"),
-        httpx.Response(403, text="Forbidden"),
-        httpx.Response(302, headers={"location": "/login"}),
-        httpx.Response(200, text="<html>a login page</html>"),
-        httpx.Response(200, json={"ports": [51413]}),
-        httpx.Response(200, json=[51413]),
+        partial(httpx.Response, 404, text="Not Found"),
+        partial(httpx.Response, 403, text="Forbidden"),
+        partial(httpx.Response, 302, headers={"location": "/login"}),
+        partial(httpx.Response, 200, text="<html>a login page</html>"),
+        partial(httpx.Response, 200, json={"ports": [51413]}),
+        partial(httpx.Response, 200, json=[51413]),
     ],
     ids=["not_found", "forbidden", "redirect", "html", "no_port_key", "not_an_object"],
 )
-def test_get_forwarded_port_unexpected_response(mock_httpx, response):
+def test_get_forwarded_port_unexpected_response(make_client, mock_httpx, response):
     """A wrong GLUETUN_URL answers like this, and no retry will fix it."""
-    mock_httpx(lambda _: response)
+    mock_httpx(lambda _: response())
 
     with pytest.raises(GluetunUnexpectedResponse):
-        _make_client().get_forwarded_port()
+        make_client().get_forwarded_port()
+
+
+@pytest.mark.parametrize("status_code", [200, 404])
+def test_a_large_page_is_kept_short_in_the_error(make_client, mock_httpx, status_code):
+    """A URL pointing at a website answers with a page far too large to keep."""
+    page = "<html>" + "a website " * 100_000
+    mock_httpx(lambda _: httpx.Response(status_code, text=page))
+
+    with pytest.raises(GluetunUnexpectedResponse) as error:
+        make_client().get_forwarded_port()
+
+    assert len(str(error.value)) < SNIPPET_SIZE * 2
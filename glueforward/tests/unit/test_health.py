@@ -0,0 +1,185 @@
+"""Unit tests for glueforward.main.health."""
+
+import json
+import logging
+import os
+import time
+
+import pytest
+
+from glueforward.main.health import Health, HealthStatus, check_health_file
+
+FORWARDED_PORT = 51413
+STALE_AFTER = 900
+
+
+def test_glueforward_is_starting_until_a_port_is_applied(clock):
+    health = Health(clock, STALE_AFTER)
+
+    reply = health.serve({})
+
+    assert health.get_status() == HealthStatus.STARTING
+    assert reply.status == 503
+    assert json.loads(reply.body) == {"status": "starting", "port": None}
+
+
+def test_glueforward_is_ready_once_a_port_is_applied(clock):
+    health = Health(clock, STALE_AFTER)
+    health.port_applied(FORWARDED_PORT)
+    clock.now = STALE_AFTER
+
+    reply = health.serve({})
+
+    assert reply.status == 200
+    assert json.loads(reply.body) == {"status": "ready", "port": FORWARDED_PORT}
+
+
+def test_glueforward_is_degraded_once_updates_stop_succeeding(clock):
+    """Stuck retrying, it is alive, but no longer doing its job."""
+    health = Health(clock, STALE_AFTER)
+    health.port_applied(FORWARDED_PORT)
+    clock.now = STALE_AFTER + 1
+
+    assert health.serve({}).status == 503
+    assert health.get_status() == HealthStatus.DEGRADED
+
+    health.port_applied(FORWARDED_PORT)
+    assert health.get_status() == HealthStatus.READY
+
+
+def test_the_health_file_tells_the_same(clock, tmp_path):
+    path = str(tmp_path / "health.json")
+    assert check_health_file(path) == HealthStatus.STARTING
+
+    Health(clock, STALE_AFTER, path).port_applied(FORWARDED_PORT)
+    assert check_health_file(path) == HealthStatus.READY
+
+    # Written STALE_AFTER seconds ago and more, as no success came since.
+    written_at = time.time() - STALE_AFTER - 1
+    os.utime(path, (written_at, written_at))
+    assert check_health_file(path) == HealthStatus.DEGRADED
+
+
+def test_a_health_file_that_cannot_be_written_is_only_logged(clock, tmp_path, caplog):
+    health = Health(clock, STALE_AFTER, str(tmp_path / "missing" / "health.json"))
+
+    health.port_applied(FORWARDED_PORT)
+
+    assert health.get_status() == HealthStatus.READY
+    assert "Could not write the health file" in caplog.text
+    assert caplog.records[0].levelno == logging.WARNING
+
+
+def test_a_new_window_applies_to_the_health_file_too(clock, tmp_path):
+    path = str(tmp_path / "health.json")
+    health = Health(clock, STALE_AFTER, path)
+    health.set_stale_after(STALE_AFTER)
+    assert not os.path.exists(path)
+    health.port_applied(FORWARDED_PORT)
+    written_at = time.time() - STALE_AFTER - 1
+    os.utime(path, (written_at, written_at))
+    clock.now = STALE_AFTER + 1
+
+    health.set_stale_after(2 * STALE_AFTER)
+
+    assert health.get_status() == HealthStatus.READY
+    assert check_health_file(path) == HealthStatus.READY
+    # Still as old as the last success, not made fresh by the rewrite.
+    assert os.stat(path).st_mtime == written_at
+
+
+def test_a_health_file_gone_when_the_window_changes_is_only_logged(
+    clock, tmp_path, caplog
+):
+    path = tmp_path / "health.json"
+    health = Health(clock, STALE_AFTER, str(path))
+    health.port_applied(FORWARDED_PORT)
+    path.unlink()
+
+    health.set_stale_after(2 * STALE_AFTER)
+
+    assert "Could not write the health file" in caplog.text
+    assert not path.exists()
+
+
+def test_a_standby_is_healthy_while_it_checks_the_lease(clock, tmp_path):
+    path = str(tmp_path / "health.json")
+    health = Health(clock, STALE_AFTER, path)
+
+    health.standing_by()
+    clock.now = STALE_AFTER
+
+    assert health.serve({}).status == 200
+    assert health.get_status() == HealthStatus.STANDBY
+    assert check_health_file(path) == HealthStatus.STANDBY
+
+    clock.now = STALE_AFTER + 1
+    assert health.get_status() == HealthStatus.DEGRADED
+    written_at = time.time() - STALE_AFTER - 1
+    os.utime(path, (written_at, written_at))
+    assert check_health_file(path) == HealthStatus.DEGRADED
+
+
+def test_a_standby_taking_over_is_ready_once_it_applies_a_port(clock, tmp_path):
+    path = str(tmp_path / "health.json")
+    health = Health(clock, STALE_AFTER, path)
+    health.standing_by()
+
+    health.port_applied(FORWARDED_PORT)
+
+    assert health.get_status() == HealthStatus.READY
+    assert check_health_file(path) == HealthStatus.READY
+
+
+def test_a_standby_answers_so_when_asked(clock):
+    health = Health(clock, STALE_AFTER)
+
+    health.standing_by()
+
+    assert json.loads(health.serve({}).body) == {"status": "standby", "port": None}
+
+
+def test_a_health_file_that_cannot_be_replaced_leaves_nothing_behind(
+    clock, tmp_path, caplog
+):
+    (tmp_path / "health.json").mkdir()
+    health = Health(clock, STALE_AFTER, str(tmp_path / "health.json"))
+
+    health.port_applied(FORWARDED_PORT)
+
+    assert "Could not write the health file" in caplog.text
+    assert [path.name for path in tmp_path.iterdir()] == ["health.json"]
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "",
+        '{"port": 51413',
+        '{"port": 51413}',
+        '["stale_after"]',
+        '{"stale_after": "x"}',
+    ],
+    ids=["empty", "truncated", "missing", "not-an-object", "not-a-number"],
+)
+def test_a_health_file_that_cannot_be_read_is_unhealthy(tmp_path, content):
+    path = tmp_path / "health.json"
+    path.write_text(content)
+
+    assert check_health_file(str(path)) == HealthStatus.DEGRADED
+
+
+def test_a_health_file_out_of_reach_is_unhealthy(tmp_path, monkeypatch):
+    path = tmp_path / "health.json"
+    path.write_text('{"stale_after": 900}')
+
+    def deny(*_args, **_kwargs):
+        raise PermissionError(13, "Permission denied", str(path))
+
+    monkeypatch.setattr(os, "stat", deny)
+
+    assert check_health_file(str(path)) == HealthStatus.DEGRADED
+
+
+def test_a_health_file_that_is_a_directory_is_unhealthy(tmp_path):
+    assert check_health_file(str(tmp_path)) == HealthStatus.DEGRADED
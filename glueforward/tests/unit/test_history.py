@@ -0,0 +1,178 @@
+"""Unit tests for glueforward.main.history."""
+
+import sqlite3
+import time
+from contextlib import closing
+
+import pytest
+
+from glueforward.main.events import (
+    AuthRenewed,
+    FatalError,
+    PortApplied,
+    PortObserved,
+    PortUnchanged,
+    RetryScheduled,
+)
+from glueforward.main.history import (
+    BATCH_SIZE,
+    DAY,
+    FLUSH_INTERVAL,
+    HistoryReport,
+    PortHistory,
+    format_report,
+    read_history,
+)
+
+GLUETUN = "http://gluetun:8000"
+FORWARDED_PORT = 51413
+NEXT_PORT = 40000
+RETENTION = 7 * DAY
+
+
+def _read_rows(path) -> list[tuple]:
+    with closing(sqlite3.connect(path)) as connection:
+        query = "SELECT kind, port, error FROM events ORDER BY at"
+        return connection.execute(query).fetchall()
+
+
+def _insert(path, *rows: tuple) -> None:
+    """Record rows as of any time, each as (days ago, kind, port, delay, error)."""
+    now = time.time()
+    with closing(sqlite3.connect(path)) as connection:
+        with connection:
+            connection.executemany(
+                "INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)",
+                [(now - ago * DAY, GLUETUN, *row) for ago, *row in rows],
+            )
+
+
+def test_ports_and_failures_are_recorded(tmp_path, clock):
+    path = tmp_path / "history.db"
+    history = PortHistory(str(path), GLUETUN, RETENTION, clock)
+
+    for event in (
+        PortObserved(None),
+        RetryScheduled("NoForwardedPortYet()", 10),
+        PortObserved(FORWARDED_PORT),
+        PortApplied(FORWARDED_PORT),
+        # Only what the history tells of is kept.
+        PortUnchanged(FORWARDED_PORT),
+        AuthRenewed("qbittorrent"),
+        FatalError("ValueError()"),
+    ):
+        history.handle(event)
+    # Nothing is written until a batch is due, or the file closed.
+    assert not _read_rows(path)
+    history.close()
+
+    assert _read_rows(path) == [
+        ("observed", None, None),
+        ("failed", None, "NoForwardedPortYet()"),
+        ("observed", FORWARDED_PORT, None),
+        ("applied", FORWARDED_PORT, None),
+        ("failed", None, "ValueError()"),
+    ]
+
+
+def test_rows_are_written_once_a_batch_is_full_or_old(tmp_path, clock):
+    path = tmp_path / "history.db"
+    history = PortHistory(str(path), GLUETUN, RETENTION, clock)
+
+    for _ in range(BATCH_SIZE):
+        history.handle(PortObserved(FORWARDED_PORT))
+    assert len(_read_rows(path)) == BATCH_SIZE
+    history.handle(PortObserved(FORWARDED_PORT))
+    clock.now += FLUSH_INTERVAL
+    history.handle(PortObserved(FORWARDED_PORT))
+
+    assert len(_read_rows(path)) == BATCH_SIZE + 2
+
+
+def test_rows_past_the_retention_are_pruned(tmp_path, clock):
+    path = tmp_path / "history.db"
+    history = PortHistory(str(path), GLUETUN, RETENTION, clock)
+    _insert(path, (8, "observed", NEXT_PORT, None, None))
+
+    history.handle(PortObserved(FORWARDED_PORT))
+    history.close()
+
+    assert _read_rows(path) == [("observed", FORWARDED_PORT, None)]
+
+
+def test_a_history_that_cannot_be_written_is_only_logged(tmp_path, clock, caplog):
+    path = tmp_path / "history.db"
+    history = PortHistory(str(path), GLUETUN, RETENTION, clock)
+    with closing(sqlite3.connect(path)) as connection:
+        connection.execute("DROP TABLE events")
+
+    history.handle(PortObserved(FORWARDED_PORT))
+    history.close()
+
+    assert "Could not write 1 rows of history" in caplog.text
+
+
+def test_the_history_tells_how_ports_fared(tmp_path, clock):
+    path = tmp_path / "history.db"
+    PortHistory(str(path), GLUETUN, RETENTION, clock).close()
+    _insert(
+        path,
+        (40, "applied", 1000, None, None),
+        (4, "observed", FORWARDED_PORT, None, None),
+        (4, "applied", FORWARDED_PORT, 2.0, None),
+        (3, "observed", None, None, None),
+        (3, "failed", None, None, "NoForwardedPortYet()"),
+        # Applied again on a restart, which is no change.
+        (3, "applied", FORWARDED_PORT, None, None),
+        (2, "applied", NEXT_PORT, 4.0, None),
+        (1, "applied", FORWARDED_PORT, 6.0, None),
+    )
+
+    (report,) = read_history(str(path), days=5)
+
+    assert report.gluetun == GLUETUN
+    assert report.days == pytest.approx(5)
+    assert (report.observations, report.missing) == (2, 1)
+    assert report.changes == 3
+    assert report.lifetimes == pytest.approx([2 * DAY, DAY])
+    assert report.delays == [2.0, 4.0, 6.0]
+    assert report.failures == {"NoForwardedPortYet()": 1}
+
+
+def test_a_history_younger_than_asked_for_is_told_over_its_own_days(tmp_path, clock):
+    path = tmp_path / "history.db"
+    PortHistory(str(path), GLUETUN, RETENTION, clock).close()
+    _insert(path, (2, "applied", FORWARDED_PORT, None, None))
+
+    (report,) = read_history(str(path), days=30)
+
+    assert report.days == pytest.approx(2)
+    assert report.get_change_rate() == pytest.approx(0.5)
+
+
+def test_a_report_is_formatted_for_reading():
+    report = HistoryReport(
+        GLUETUN,
+        days=2,
+        observations=10,
+        missing=1,
+        lifetimes=[3 * 60 * 60],
+        changes=2,
+        delays=[0.5, 1.5, 90, 200],
+        failures={"GluetunServerError()": 1, "NoForwardedPortYet()": 3},
+    )
+
+    assert format_report(report).splitlines() == [
+        f"{GLUETUN}, over 2.0 days:",
+        "  Observations: 10, 1 without a port",
+        "  Port changes: 2, 1.00 a day",
+        "  Port lifetime: 3.0h",
+        "  Propagation delay: p50 45.8s, p90 2.8m, p99 3.3m",
+        "  Failures: 4",
+        "    3 × NoForwardedPortYet()",
+        "    1 × GluetunServerError()",
+    ]
+    empty = format_report(HistoryReport(GLUETUN, days=0))
+    assert "0.00 a day" in empty and "Port lifetime: none yet" in empty
+    long_lived = format_report(HistoryReport(GLUETUN, days=4, lifetimes=[3 * DAY]))
+    assert "Port lifetime: 3.0d" in long_lived
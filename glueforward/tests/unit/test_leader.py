@@ -0,0 +1,197 @@
+"""Unit tests for glueforward.main.leader."""
+
+import json
+import os
+import select
+import subprocess
+import sys
+import time
+from collections.abc import Callable
+from unittest.mock import MagicMock
+
+from glueforward.main.health import Health
+from glueforward.main.leader import (
+    RENEWALS_PER_LEASE,
+    LeaderElection,
+    LeaseFile,
+    get_holder,
+)
+
+DURATION = 0.3
+# The longest a standby may take to lead once the leader died: the lease
+# expiring, the standby's election noticing, then the lifecycle looking.
+TAKEOVER_BOUND = DURATION + 2 * DURATION / RENEWALS_PER_LEASE
+
+
+def _wait_for(condition: Callable[[], bool], timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_a_lease_is_held_by_one_replica_at_a_time(tmp_path):
+    path = str(tmp_path / "leader.lease")
+    first, second = LeaseFile(path, "first", 60), LeaseFile(path, "second", 60)
+
+    assert first.try_acquire() == 1
+    assert second.try_acquire() is None
+    # Renewed, the lease keeps its token.
+    assert first.try_acquire() == 1
+    assert first.holds(1) and not second.holds(1)
+
+
+def test_an_expired_lease_changes_hands_and_fences_off_its_holder(tmp_path):
+    path = str(tmp_path / "leader.lease")
+    first, second = LeaseFile(path, "first", 0), LeaseFile(path, "second", 60)
+    first.try_acquire()
+
+    assert not first.holds(1)
+    assert second.try_acquire() == 2
+    assert first.try_acquire() is None
+
+
+def test_a_lease_released_is_taken_at_once(tmp_path):
+    path = str(tmp_path / "leader.lease")
+    first, second = LeaseFile(path, "first", 60), LeaseFile(path, "second", 60)
+    first.try_acquire()
+
+    # Only by its holder, with the token it holds it with.
+    second.release(1)
+    first.release(2)
+    assert second.try_acquire() is None
+    first.release(1)
+
+    assert second.try_acquire() == 2
+
+
+def test_an_unreadable_lease_is_taken_over(tmp_path):
+    path = tmp_path / "leader.lease"
+    path.write_text("not a lease")
+
+    assert not LeaseFile(str(path), "first", 60).holds(1)
+    assert LeaseFile(str(path), "first", 60).try_acquire() == 1
+    assert json.loads(path.read_text())["holder"] == "first"
+
+
+def test_a_replica_leads_until_another_takes_over(tmp_path, caplog):
+    path = str(tmp_path / "leader.lease")
+    caplog.set_level("INFO")
+    leader = LeaderElection(LeaseFile(path, "first", DURATION), DURATION)
+    assert _wait_for(leader.is_leader)
+    standby = LeaderElection(LeaseFile(path, "second", DURATION), DURATION)
+
+    leader.stop()
+
+    assert _wait_for(standby.is_leader, TAKEOVER_BOUND)
+    assert not leader.is_leader()
+    standby.stop()
+    assert "Leading, with fencing token 2" in caplog.text
+    assert standby.get_standby_interval() == DURATION / RENEWALS_PER_LEASE
+
+
+def test_a_standby_tells_its_health_of_every_check(tmp_path):
+    path = str(tmp_path / "leader.lease")
+    leader = LeaderElection(LeaseFile(path, "first", DURATION), DURATION)
+    assert _wait_for(leader.is_leader)
+    health = MagicMock(spec=Health)
+
+    standby = LeaderElection(LeaseFile(path, "second", DURATION), DURATION, health)
+
+    assert _wait_for(lambda: health.standing_by.call_count >= 2)
+    standby.stop()
+    leader.stop()
+
+
+def test_a_leader_whose_lease_is_taken_stops_leading(tmp_path, caplog):
+    path = tmp_path / "leader.lease"
+    leader = LeaderElection(LeaseFile(str(path), "first", DURATION), DURATION)
+    assert _wait_for(leader.is_leader)
+
+    lease = {"holder": "second", "token": 2, "expires_at": time.time() + 60}
+    path.write_text(json.dumps(lease))
+
+    # Fenced off at once, before its election even notices.
+    assert not leader.is_leader()
+    assert _wait_for(lambda: "No longer leading" in caplog.text)
+    leader.stop()
+    assert json.loads(path.read_text()) == lease
+
+
+def test_a_lease_that_cannot_be_reached_is_not_led_on(tmp_path, caplog):
+    directory = tmp_path / "shared"
+    directory.mkdir()
+    leader = LeaderElection(
+        LeaseFile(str(directory / "leader.lease"), "first", 60), 60
+    )
+    assert _wait_for(leader.is_leader)
+    (directory / "leader.lease").unlink()
+    directory.rmdir()
+
+    assert not leader.is_leader()
+    assert "Could not check the leader lease" in caplog.text
+    leader.stop()
+    assert "Could not hand the leader lease over" in caplog.text
+    unreachable = LeaderElection(
+        LeaseFile(str(directory / "leader.lease"), "second", 60), 60
+    )
+    assert _wait_for(lambda: "Could not take the leader lease" in caplog.text)
+    assert not unreachable.is_leader()
+    unreachable.stop()
+
+
+def test_the_holder_tells_replicas_apart():
+    assert get_holder().endswith(f":{os.getpid()}")
+
+
+_REPLICA = """
+import sys, time
+from glueforward.main.leader import LeaderElection, LeaseFile, get_holder
+duration = float(sys.argv[2])
+election = LeaderElection(LeaseFile(sys.argv[1], get_holder(), duration), duration)
+while not election.is_leader():
+    time.sleep(0.01)
+print("leading", flush=True)
+time.sleep(60)
+"""
+
+
+def _start_replica(path: str) -> subprocess.Popen[str]:
+    return subprocess.Popen(
+        [sys.executable, "-c", _REPLICA, path, str(DURATION)],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+
+
+def _is_leading(replica: subprocess.Popen[str], timeout: float) -> bool:
+    assert replica.stdout is not None
+    readable, _, _ = select.select([replica.stdout], [], [], timeout)
+    return bool(readable) and replica.stdout.readline() == "leading\n"
+
+
+def test_a_standby_process_takes_over_a_dead_leader_in_bounded_time(tmp_path):
+    path = str(tmp_path / "leader.lease")
+    leader = _start_replica(path)
+    standby = None
+    try:
+        assert _is_leading(leader, timeout=10)
+        standby = _start_replica(path)
+        assert not _is_leading(standby, timeout=1)
+
+        # Killed, the leader hands nothing over: its lease has to expire.
+        leader.kill()
+        killed_at = time.monotonic()
+        assert _is_leading(standby, timeout=10)
+        takeover = time.monotonic() - killed_at
+
+        print(f"\nTakeover in {takeover:.2f}s, bound {TAKEOVER_BOUND:.2f}s")
+        # Loose, for the noise of a shared machine.
+        assert takeover < TAKEOVER_BOUND + 0.5
+    finally:
+        for replica in (leader, standby):
+            if replica is not None:
+                replica.kill()
+                replica.wait()
@@ -0,0 +1,211 @@
+"""Unit tests for glueforward.main.limiter."""
+
+import asyncio
+import threading
+import time
+from contextlib import AsyncExitStack
+
+import pytest
+
+from glueforward.main.clock import SystemClock
+from glueforward.main.deadline import TickDeadline, TickOverran
+from glueforward.main.limiter import HostLimiter, HostStatistics
+
+from .conftest import EndOfTest
+
+HOST = "qbittorrent:8080"
+OTHER_HOST = "gluetun:8000"
+
+# Long enough for a thread that was going to barge in to have done so.
+SETTLE_TIME = 0.05
+
+
+def _wait_for_queue_depth(limiter: HostLimiter, depth: int) -> None:
+    deadline = time.monotonic() + 5
+    while limiter.get_statistics()[HOST].queue_depth < depth:
+        assert time.monotonic() < deadline, "the waiter never queued up"
+        time.sleep(0.001)
+
+
+def _start_waiter(limiter: HostLimiter, name: str, order: list[str]) -> threading.Thread:
+    def wait_in_line() -> None:
+        with limiter.slot(HOST):
+            order.append(name)
+
+    thread = threading.Thread(target=wait_in_line)
+    thread.start()
+    return thread
+
+
+def test_requests_under_the_limit_do_not_wait():
+    limiter = HostLimiter(limit_per_host=2)
+
+    with limiter.slot(HOST), limiter.slot(HOST):
+        statistics = limiter.get_statistics()[HOST]
+
+    assert statistics == HostStatistics(
+        in_flight=2, queue_depth=0, wait_count=0, wait_seconds=0.0
+    )
+
+
+def test_a_request_over_the_limit_waits_for_a_slot():
+    limiter = HostLimiter(limit_per_host=1)
+    order: list[str] = []
+
+    with limiter.slot(HOST):
+        thread = _start_waiter(limiter, "waiter", order)
+        _wait_for_queue_depth(limiter, 1)
+        time.sleep(SETTLE_TIME)
+        assert not order
+        order.append("holder")
+    thread.join()
+
+    assert order == ["holder", "waiter"]
+    statistics = limiter.get_statistics()[HOST]
+    assert statistics.wait_count == 1
+    assert statistics.wait_seconds > 0
+    assert statistics.in_flight == 0
+
+
+def test_waiters_are_let_through_in_the_order_they_came():
+    """A freed slot goes to the oldest waiter, never to whoever asks next."""
+    limiter = HostLimiter(limit_per_host=1)
+    order: list[str] = []
+
+    with limiter.slot(HOST):
+        threads = []
+        for index, name in enumerate(["first", "second", "third"]):
+            threads.append(_start_waiter(limiter, name, order))
+            _wait_for_queue_depth(limiter, index + 1)
+    for thread in threads:
+        thread.join()
+
+    assert order == ["first", "second", "third"]
+
+
+def test_hosts_are_limited_separately():
+    """A slow WebUI must not hold back the gluetun next to it."""
+    limiter = HostLimiter(limit_per_host=1)
+
+    with limiter.slot(HOST), limiter.slot(OTHER_HOST):
+        statistics = limiter.get_statistics()
+
+    assert statistics[HOST].in_flight == 1
+    assert statistics[OTHER_HOST].in_flight == 1
+
+
+def test_a_slot_is_given_back_when_the_request_fails():
+    limiter = HostLimiter(limit_per_host=1)
+
+    with pytest.raises(EndOfTest), limiter.slot(HOST):
+        raise EndOfTest()
+
+    assert limiter.get_statistics()[HOST].in_flight == 0
+
+
+def test_a_request_waits_no_longer_than_its_tick_has_left():
+    limiter = HostLimiter(limit_per_host=1)
+
+    with limiter.slot(HOST):
+        with (
+            pytest.raises(TickOverran),
+            TickDeadline(SETTLE_TIME, SystemClock()).enforce(),
+            limiter.slot(HOST),
+        ):
+            pass
+        # Out of the line, rather than handed a slot nobody gives back.
+        assert limiter.get_statistics()[HOST].queue_depth == 0
+
+    assert limiter.get_statistics()[HOST].in_flight == 0
+
+
+def test_a_task_over_the_limit_awaits_a_slot():
+    limiter = HostLimiter(limit_per_host=1)
+    order: list[str] = []
+
+    async def wait_in_line(name: str) -> None:
+        async with limiter.async_slot(HOST):
+            order.append(name)
+
+    async def scenario() -> None:
+        async with limiter.async_slot(HOST):
+            waiters = asyncio.gather(wait_in_line("first"), wait_in_line("second"))
+            await asyncio.sleep(0)
+            assert limiter.get_statistics()[HOST].queue_depth == 2
+            order.append("holder")
+        await waiters
+
+    asyncio.run(scenario())
+
+    assert order == ["holder", "first", "second"]
+    assert limiter.get_statistics()[HOST].wait_count == 2
+
+
+def test_a_task_is_handed_a_slot_freed_by_a_thread():
+    """Both runtimes can share a limiter, whichever side frees the slot."""
+    limiter = HostLimiter(limit_per_host=1)
+
+    async def scenario() -> None:
+        holding = threading.Event()
+        leave = threading.Event()
+
+        def hold() -> None:
+            with limiter.slot(HOST):
+                holding.set()
+                leave.wait()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        holding.wait()
+        waiter = asyncio.ensure_future(_hold_async(limiter))
+        await asyncio.sleep(0)
+        leave.set()
+        await waiter
+        thread.join()
+
+    asyncio.run(scenario())
+
+    assert limiter.get_statistics()[HOST].in_flight == 0
+
+
+async def _hold_async(limiter: HostLimiter) -> None:
+    async with limiter.async_slot(HOST):
+        pass
+
+
+def test_a_task_cancelled_in_line_leaves_it():
+    limiter = HostLimiter(limit_per_host=1)
+
+    async def scenario() -> None:
+        async with limiter.async_slot(HOST):
+            waiter = asyncio.ensure_future(_hold_async(limiter))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert limiter.get_statistics()[HOST].queue_depth == 0
+
+    asyncio.run(scenario())
+
+    assert limiter.get_statistics()[HOST].in_flight == 0
+
+
+def test_a_task_cancelled_once_handed_a_slot_passes_it_on():
+    """A slot handed to a task that never gets to use it must not leak."""
+    limiter = HostLimiter(limit_per_host=1)
+
+    async def scenario() -> None:
+        holder = AsyncExitStack()
+        await holder.enter_async_context(limiter.async_slot(HOST))
+        cancelled = asyncio.ensure_future(_hold_async(limiter))
+        kept = asyncio.ensure_future(_hold_async(limiter))
+        await asyncio.sleep(0)
+        # The slot changes hands before the cancellation lands.
+        await holder.aclose()
+        cancelled.cancel()
+        await asyncio.gather(cancelled, kept, return_exceptions=True)
+        assert kept.done() and not kept.cancelled()
+
+    asyncio.run(scenario())
+
+    assert limiter.get_statistics()[HOST].in_flight == 0
@@ -0,0 +1,116 @@
+"""Unit tests for glueforward.main.logs."""
+
+import io
+import json
+import logging
+import queue
+import threading
+
+import pytest
+
+from glueforward.main.logs import (
+    FIELDS,
+    DroppingQueueHandler,
+    JsonFormatter,
+    get_dropped,
+    logged_tick,
+    start_queue_logging,
+)
+
+
+@pytest.fixture(name="root")
+def root_fixture():
+    """The root logger, its handlers put back as they were afterwards."""
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    root.setLevel(logging.INFO)
+    yield
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+def _format(**attributes) -> dict:
+    record = logging.makeLogRecord({"name": "glueforward", **attributes})
+    return json.loads(JsonFormatter().format(record))
+
+
+def test_every_line_has_the_same_keys():
+    line = _format(msg="Listening port set to %d", args=(51413,), port=51413)
+
+    assert line["message"] == "Listening port set to 51413"
+    assert line["logger"] == "glueforward"
+    assert line["port"] == 51413
+    assert list(line) == ["time", "level", "logger", "message", *FIELDS]
+    assert line["endpoint"] is line["latency"] is line["error"] is None
+
+
+def test_an_exception_is_named_and_its_traceback_kept():
+    exc_info = (ConnectionError, ConnectionError("refused"), None)
+
+    line = _format(msg="Retryable error in lifecycle", exc_info=exc_info)
+    named = _format(msg="Lost", exc_info=exc_info, error="GluetunUnreachable")
+
+    assert line["error"] == "ConnectionError"
+    assert line["traceback"].endswith("ConnectionError: refused\n")
+    assert named["error"] == "GluetunUnreachable"
+
+
+@pytest.mark.usefixtures("root")
+def test_records_are_written_off_the_thread_logging_them():
+    output = io.StringIO()
+    handler = logging.StreamHandler(output)
+    handler.setFormatter(JsonFormatter())
+    written_by: list[str] = []
+    handler.addFilter(lambda _: not written_by.append(threading.current_thread().name))
+    _, listener = start_queue_logging(handler)
+
+    with logged_tick() as tick:
+        logging.info("Listening port set to %d", 51413, extra={"port": 51413})
+    logging.info("Between ticks")
+    listener.stop()
+
+    during, between = (json.loads(line) for line in output.getvalue().splitlines())
+    assert during["tick"] == tick and during["port"] == 51413
+    assert between["tick"] is None
+    assert threading.current_thread().name not in written_by
+
+
+def test_ticks_are_numbered_in_turn():
+    with logged_tick() as first:
+        pass
+    with logged_tick() as second:
+        pass
+
+    assert second == first + 1
+
+
+def test_records_beyond_the_queue_are_dropped_counted_and_reported():
+    records: queue.Queue[logging.LogRecord] = queue.Queue(2)
+    handler = DroppingQueueHandler(records)
+    logger = logging.Logger("glueforward")
+    logger.addHandler(handler)
+
+    for number in range(4):
+        logger.warning("Record %d", number)
+    # The listener catches up.
+    while not records.empty():
+        records.get_nowait()
+    logger.warning("Record 4")
+
+    assert handler.get_dropped() == 2
+    assert [record.getMessage() for record in records.queue] == [
+        "Dropped 2 log records, the queue being full",
+        "Record 4",
+    ]
+
+
+@pytest.mark.usefixtures("root")
+def test_the_records_the_root_logger_dropped_are_counted():
+    logging.getLogger().handlers[:] = [logging.NullHandler()]
+    assert get_dropped() == 0
+
+    logging.getLogger().handlers.append(DroppingQueueHandler(queue.Queue(1)))
+    for number in range(3):
+        logging.warning("Record %d", number)
+
+    assert get_dropped() == 2
@@ -5,16 +5,50 @@ configuring logging process-wide, wiring the pieces together, and turning
 whatever stops the application into an exit code.
 """
 
+import asyncio
+import atexit
+import json
 import logging
+import os
 import signal
-from unittest.mock import MagicMock
+import sys
+from unittest.mock import MagicMock, call
+from urllib.parse import parse_qs
 
 import httpx
 import pytest
 
+from glueforward.main import tracing
 from glueforward.main.application import Application
+from glueforward.main.clock import SystemClock
+from glueforward.main.config import get_configuration
 from glueforward.main.errors import ReturnCodes
-from glueforward.main.main import configure_logging, handle_sigterm, main
+from glueforward.main.main import (
+    HEALTHCHECK_COMMAND,
+    HISTORY_COMMAND,
+    PORT_PATH,
+    build_metrics,
+    build_span_exporters,
+    build_tick_deadline,
+    configure_logging,
+    handle_sigterm,
+    main,
+    run_until_sigterm,
+    start_local_server,
+)
+from glueforward.main.events import EventBus, PortApplied, PortObserved
+from glueforward.main.health import HEALTH_PATH, Health, HealthStatus
+from glueforward.main.history import DAY, PortHistory
+from glueforward.main.leader import LeaderElection
+from glueforward.main.limiter import HostLimiter
+from glueforward.main.logs import DroppingQueueHandler
+from glueforward.main.metrics import CONTENT_TYPE, METRICS_PATH, Metrics
+from glueforward.main.port_board import PortBoard
+from glueforward.main.profiling import ALLOCATIONS_SIGNAL, PROFILE_SIGNAL
+from glueforward.main.recorder import RECORDER_PATH, FlightRecorder
+from glueforward.main.server import LocalServer
+from glueforward.main.trace_exporters import FileExporter, OtlpExporter
+from glueforward.main.transport import Connections
 
 from ..external_contracts import (
     GLUETUN_PORT_FORWARD_PATH,
@@ -28,11 +62,19 @@ FORWARDED_PORT = 51413
 
 
 @pytest.fixture(autouse=True)
-def restore_sigterm_handler():
-    """main() installs a process-wide handler, which must not outlive the test."""
-    original = signal.getsignal(signal.SIGTERM)
+def restore_signal_handlers():
+    """main() installs process-wide handlers, which must not outlive the test."""
+    signals = (signal.SIGTERM, PROFILE_SIGNAL, ALLOCATIONS_SIGNAL)
+    originals = [signal.getsignal(signalnum) for signalnum in signals]
     yield
-    signal.signal(signal.SIGTERM, original)
+    for signalnum, original in zip(signals, originals):
+        signal.signal(signalnum, original)
+
+
+@pytest.fixture(autouse=True)
+def no_arguments(monkeypatch):
+    """main() reads its command from sys.argv, which holds pytest's own."""
+    monkeypatch.setattr(sys, "argv", ["glueforward"])
 
 
 @pytest.fixture(autouse=True)
@@ -57,7 +99,7 @@ def _serve_one_cycle(requested: list[tuple[str, str]]):
 
     def handler(request: httpx.Request) -> httpx.Response:
         is_gluetun = request.url.path == GLUETUN_PORT_FORWARD_PATH
-        if requested and is_gluetun:
+        if is_gluetun and (request.method, request.url.path) in requested:
             raise EndOfTest()
         requested.append((request.method, request.url.path))
         if is_gluetun:
@@ -100,21 +142,134 @@ def test_httpx_is_silenced_unless_debugging(monkeypatch, log_level, httpx_level)
     assert logging.getLogger("httpx").getEffectiveLevel() == levels[httpx_level]
 
 
+def test_json_logs_are_written_through_a_queue(monkeypatch, capsys):
+    monkeypatch.setenv("LOG_FORMAT", "json")
+    register = MagicMock()
+    monkeypatch.setattr(atexit, "register", register)
+
+    configure_logging()
+    logging.info("Listening port set to %d", 51413, extra={"port": 51413})
+    (stop,) = register.call_args.args
+    stop()
+
+    assert isinstance(logging.getLogger().handlers[0], DroppingQueueHandler)
+    line = json.loads(capsys.readouterr().err)
+    assert line["message"] == "Listening port set to 51413"
+    assert line["port"] == 51413
+
+
 @pytest.mark.usefixtures("valid_environment")
-def test_main_wires_the_application_to_the_configured_services(monkeypatch, mock_httpx):
+@pytest.mark.parametrize("runtime", ["sync", "asyncio"])
+@pytest.mark.parametrize("metrics", [False, True], ids=["plain", "metrics"])
+def test_main_wires_the_application_to_the_configured_services(
+    monkeypatch, tmp_path, mock_httpx, runtime, metrics
+):
     """One whole cycle in memory, which is what proves the wiring holds."""
     monkeypatch.setenv("SUCCESS_INTERVAL", "0")
+    monkeypatch.setenv("RUNTIME", runtime)
+    monkeypatch.setenv("HEALTH_FILE", str(tmp_path / "health.json"))
+    if metrics:
+        monkeypatch.setenv("METRICS", "true")
+        monkeypatch.setenv("SERVER_ADDRESS", "127.0.0.1:0")
+        monkeypatch.setattr(LocalServer, "start", MagicMock())
     requested: list[tuple[str, str]] = []
     mock_httpx(_serve_one_cycle(requested))
 
     with pytest.raises(SystemExit):
         main()
 
-    assert requested == [
+    # The login runs alongside the port request, so either may come first.
+    assert sorted(requested[:2]) == [
         ("GET", GLUETUN_PORT_FORWARD_PATH),
         ("POST", QBITTORRENT_LOGIN_PATH),
-        ("POST", QBITTORRENT_SET_PREFERENCES_PATH),
     ]
+    assert requested[2:] == [("POST", QBITTORRENT_SET_PREFERENCES_PATH)]
+    assert (tmp_path / "health.json").exists()
+
+
+def _rewrite(path, content: str) -> None:
+    """Change the file, its time of change moved on in case the clock did not."""
+    stat = path.stat()
+    path.write_text(content)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+
+@pytest.mark.usefixtures("valid_environment")
+@pytest.mark.parametrize("runtime", ["sync", "asyncio"])
+def test_the_config_file_is_reloaded_between_ticks(
+    monkeypatch, tmp_path, mock_httpx, runtime
+):
+    """A change to the intervals keeps the session; one to the credentials
+    logs in again with them, and only then."""
+    path = tmp_path / "glueforward.toml"
+    path.write_text("SUCCESS_INTERVAL = 0\n")
+    monkeypatch.setenv("CONFIG_FILE", str(path))
+    monkeypatch.setenv("RUNTIME", runtime)
+    changes = [
+        "SUCCESS_INTERVAL = 0\nRETRY_INTERVAL = 1\n",
+        'SUCCESS_INTERVAL = 0\nQBITTORRENT_PASSWORD = "rotated"\n',
+    ]
+    logins: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == GLUETUN_PORT_FORWARD_PATH:
+            return httpx.Response(200, json={GLUETUN_PORT_KEY: FORWARDED_PORT})
+        if request.url.path == QBITTORRENT_LOGIN_PATH:
+            logins.append(parse_qs(request.content.decode())["password"][0])
+        elif not changes:
+            raise EndOfTest()
+        else:
+            _rewrite(path, changes.pop(0))
+        return httpx.Response(200, headers={"set-cookie": "SID=abc"})
+
+    mock_httpx(handler)
+
+    with pytest.raises(SystemExit):
+        main()
+
+    assert logins == [QBITTORRENT_PASSWORD, "rotated"]
+
+
+@pytest.mark.usefixtures("valid_environment")
+@pytest.mark.parametrize("runtime", ["sync", "asyncio"])
+def test_a_reload_to_another_target_leaves_one_client_per_target(
+    monkeypatch, tmp_path, mock_httpx, runtime
+):
+    """The client of the gluetun replaced is closed, not left in the pool."""
+    path = tmp_path / "glueforward.toml"
+    path.write_text("SUCCESS_INTERVAL = 0\n")
+    monkeypatch.setenv("CONFIG_FILE", str(path))
+    monkeypatch.setenv("RUNTIME", runtime)
+    change = 'SUCCESS_INTERVAL = 0\nGLUETUN_URL = "http://gluetun2"\n'
+    clients: list[httpx.Client | httpx.AsyncClient] = []
+    for name in ("open_client", "open_async_client"):
+        opened = getattr(Connections, name)
+
+        def open_client(self, *args, _opened=opened, **kwargs):
+            clients.append(client := _opened(self, *args, **kwargs))
+            return client
+
+        monkeypatch.setattr(Connections, name, open_client)
+    hosts: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == GLUETUN_PORT_FORWARD_PATH:
+            hosts.append(request.url.host)
+            if len(hosts) == 1:
+                _rewrite(path, change)
+            return httpx.Response(200, json={GLUETUN_PORT_KEY: FORWARDED_PORT})
+        if request.url.path == QBITTORRENT_SET_PREFERENCES_PATH and len(hosts) > 1:
+            raise EndOfTest()
+        return httpx.Response(200, headers={"set-cookie": "SID=abc"})
+
+    mock_httpx(handler)
+
+    with pytest.raises(SystemExit):
+        main()
+
+    assert hosts == ["gluetun", "gluetun2"]
+    live = sorted(client.base_url.host for client in clients if not client.is_closed)
+    assert live == ["gluetun2", "qbittorrent"]
 
 
 @pytest.mark.usefixtures("valid_environment")
@@ -153,6 +308,245 @@ def test_main_installs_the_sigterm_handler(monkeypatch):
     assert signal.getsignal(signal.SIGTERM) is handle_sigterm
 
 
+@pytest.mark.usefixtures("valid_environment")
+def test_main_profiles_when_signalled_to(monkeypatch, tmp_path):
+    monkeypatch.setenv("PROFILE_DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(Application, "run", MagicMock())
+
+    main()
+    os.kill(os.getpid(), PROFILE_SIGNAL)
+    os.kill(os.getpid(), PROFILE_SIGNAL)
+
+    (path,) = tmp_path.iterdir()
+    assert path.suffix == ".prof"
+
+
+@pytest.mark.usefixtures("valid_environment")
+def test_main_starts_the_local_server_when_given_an_address(monkeypatch):
+    monkeypatch.setenv("SERVER_ADDRESS", "127.0.0.1:0")
+    monkeypatch.setattr(Application, "run", MagicMock())
+    start = MagicMock()
+    monkeypatch.setattr(LocalServer, "start", start)
+
+    main()
+
+    start.assert_called_once()
+
+
+@pytest.mark.usefixtures("valid_environment")
+def test_main_starts_no_server_by_default(monkeypatch):
+    monkeypatch.setattr(Application, "run", MagicMock())
+    start = MagicMock()
+    monkeypatch.setattr(LocalServer, "start", start)
+
+    main()
+
+    start.assert_not_called()
+
+
+@pytest.mark.usefixtures("valid_environment")
+@pytest.mark.parametrize("tick_deadline, is_bound", [("60", True), ("0", False)])
+def test_ticks_are_bound_by_a_deadline_unless_it_is_zero(
+    monkeypatch, tick_deadline, is_bound
+):
+    monkeypatch.setenv("TICK_DEADLINE", tick_deadline)
+
+    built = build_tick_deadline(get_configuration(), SystemClock())
+
+    assert (built is not None) == is_bound
+
+
+@pytest.mark.usefixtures("valid_environment")
+def test_metrics_count_what_the_connections_count_when_enabled(monkeypatch):
+    limiter = HostLimiter(limit_per_host=1)
+    connections, events = Connections(limiter=limiter), EventBus()
+    assert build_metrics(get_configuration(), limiter, connections, events) is None
+
+    monkeypatch.setenv("SERVER_ADDRESS", "127.0.0.1:0")
+    monkeypatch.setenv("METRICS", "true")
+    metrics = build_metrics(get_configuration(), limiter, connections, events)
+    assert metrics is not None
+    with limiter.slot("gluetun:8000"):
+        rendered = metrics.render()
+
+    assert 'glueforward_host_requests_in_flight{host="gluetun:8000"} 1' in rendered
+    assert 'glueforward_host_queue_depth{host="gluetun:8000"} 0' in rendered
+    assert "# TYPE glueforward_host_requests_total counter" in rendered
+    assert "glueforward_dropped_spans_total 0" in rendered
+
+
+@pytest.mark.usefixtures("valid_environment")
+def test_spans_are_exported_where_configured(monkeypatch, tmp_path):
+    assert not build_span_exporters(get_configuration())
+
+    monkeypatch.setenv("TRACE_FILE", str(tmp_path / "spans.jsonl"))
+    monkeypatch.setenv("TRACE_OTLP_URL", "http://collector:4318/v1/traces")
+    exporters = build_span_exporters(get_configuration())
+
+    assert [type(exporter) for exporter in exporters] == [FileExporter, OtlpExporter]
+
+
+@pytest.mark.usefixtures("valid_environment")
+@pytest.mark.parametrize("is_traced", [True, False], ids=["traced", "untraced"])
+def test_main_traces_when_spans_have_somewhere_to_go(
+    monkeypatch, tmp_path, is_traced
+):
+    if is_traced:
+        monkeypatch.setenv("TRACE_FILE", str(tmp_path / "spans.jsonl"))
+    monkeypatch.setattr(Application, "run", MagicMock())
+    enable, register = MagicMock(), MagicMock()
+    monkeypatch.setattr(tracing, "enable", enable)
+    monkeypatch.setattr(atexit, "register", register)
+
+    main()
+
+    assert enable.called == is_traced
+    # The last spans are exported on the way out.
+    assert (call(tracing.disable) in register.call_args_list) == is_traced
+
+
+def test_the_local_server_serves_the_port_applied():
+    board = PortBoard()
+    board.port_applied(FORWARDED_PORT)
+    server = start_local_server(("127.0.0.1", 0), board)
+    host, port = server.get_address()
+
+    try:
+        response = httpx.get(f"http://{host}:{port}{PORT_PATH}")
+    finally:
+        server.close()
+
+    assert response.json() == {GLUETUN_PORT_KEY: FORWARDED_PORT}
+
+
+def test_the_local_server_serves_what_it_is_given(clock):
+    server = start_local_server(
+        ("127.0.0.1", 0),
+        PortBoard(),
+        health=Health(clock, 60),
+        metrics=Metrics(clock),
+        recorder=FlightRecorder(1),
+    )
+    host, port = server.get_address()
+
+    try:
+        health = httpx.get(f"http://{host}:{port}{HEALTH_PATH}")
+        metrics = httpx.get(f"http://{host}:{port}{METRICS_PATH}")
+        exchanges = httpx.get(f"http://{host}:{port}{RECORDER_PATH}")
+    finally:
+        server.close()
+
+    assert exchanges.json() == {"exchanges": []}
+    assert health.json()["status"] == HealthStatus.STARTING
+    assert metrics.headers["content-type"] == CONTENT_TYPE
+    assert "glueforward_ticks_total 0" in metrics.text
+
+
+@pytest.mark.parametrize(
+    ("told", "status", "code"),
+    [
+        ("port_applied", HealthStatus.READY, 0),
+        ("standing_by", HealthStatus.STANDBY, 0),
+        (None, HealthStatus.STARTING, 1),
+    ],
+)
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments
+def test_the_healthcheck_exits_on_the_health_file_s_status(
+    monkeypatch, tmp_path, capsys, clock, told, status, code
+):
+    path = tmp_path / "health.json"
+    monkeypatch.setenv("HEALTH_FILE", str(path))
+    health = Health(clock, 60, str(path))
+    if told == "port_applied":
+        health.port_applied(FORWARDED_PORT)
+    elif told == "standing_by":
+        health.standing_by()
+
+    with pytest.raises(SystemExit) as exit_attempt:
+        main([HEALTHCHECK_COMMAND])
+
+    assert exit_attempt.value.code == code
+    assert capsys.readouterr().out == f"{status}\n"
+
+
+def test_the_healthcheck_needs_the_health_file(capsys):
+    with pytest.raises(SystemExit) as exit_attempt:
+        main([HEALTHCHECK_COMMAND])
+
+    assert exit_attempt.value.code == ReturnCodes.MISSING_ENVIRONMENT_VARIABLE
+    assert "HEALTH_FILE" in capsys.readouterr().err
+
+
+@pytest.mark.usefixtures("valid_environment")
+def test_main_records_the_history_where_configured(monkeypatch, tmp_path, capsys):
+    path = tmp_path / "history.db"
+    monkeypatch.setenv("HISTORY_FILE", str(path))
+    monkeypatch.setattr(Application, "run", MagicMock())
+    register = MagicMock()
+    monkeypatch.setattr(atexit, "register", register)
+
+    main()
+    # As on the way out: the sinks catch up, then the history is closed.
+    for registered in reversed(register.call_args_list):
+        registered.args[0]()
+    with pytest.raises(SystemExit) as exit_attempt:
+        main([HISTORY_COMMAND, "--days", "7"])
+
+    assert exit_attempt.value.code == 0
+    assert capsys.readouterr().out == "No history recorded yet\n"
+
+
+@pytest.mark.usefixtures("valid_environment")
+def test_main_runs_for_election_where_configured(monkeypatch, tmp_path):
+    monkeypatch.setenv("LEADER_LEASE_FILE", str(tmp_path / "leader.lease"))
+    run = MagicMock()
+    monkeypatch.setattr(Application, "run", run)
+    register = MagicMock()
+    monkeypatch.setattr(atexit, "register", register)
+
+    main()
+
+    (leader,) = [
+        registered.args[0].__self__
+        for registered in register.call_args_list
+        if isinstance(getattr(registered.args[0], "__self__", None), LeaderElection)
+    ]
+    leader.stop()
+    assert run.called
+
+
+def test_the_history_is_reported(monkeypatch, tmp_path, capsys):
+    path = tmp_path / "history.db"
+    monkeypatch.setenv("HISTORY_FILE", str(path))
+    history = PortHistory(str(path), "http://gluetun", retention=DAY)
+    history.handle(PortObserved(FORWARDED_PORT))
+    history.handle(PortApplied(FORWARDED_PORT))
+    history.close()
+
+    with pytest.raises(SystemExit) as exit_attempt:
+        main([HISTORY_COMMAND])
+
+    assert exit_attempt.value.code == 0
+    output = capsys.readouterr().out
+    assert output.startswith("http://gluetun, over 0.0 days:")
+    assert "Port changes: 1" in output
+
+
+def test_the_history_needs_the_history_file(monkeypatch, tmp_path, capsys):
+    with pytest.raises(SystemExit) as exit_attempt:
+        main([HISTORY_COMMAND])
+
+    assert exit_attempt.value.code == ReturnCodes.MISSING_ENVIRONMENT_VARIABLE
+    assert "HISTORY_FILE" in capsys.readouterr().err
+
+    monkeypatch.setenv("HISTORY_FILE", str(tmp_path / "missing.db"))
+    with pytest.raises(SystemExit) as exit_attempt:
+        main([HISTORY_COMMAND])
+
+    assert exit_attempt.value.code == 1
+    assert "Could not read the history" in capsys.readouterr().err
+
+
 def test_sigterm_exits_without_an_error_code():
     with pytest.raises(SystemExit) as exit_attempt:
         handle_sigterm(signal.SIGTERM, None)
@@ -160,6 +554,31 @@ def test_sigterm_exits_without_an_error_code():
     assert exit_attempt.value.code == 0
 
 
+def test_sigterm_cancels_the_asyncio_application_midway(caplog):
+    """Whatever the application awaits is abandoned, a request included."""
+    cancelled = False
+
+    class Endless:
+        async def run(self) -> None:
+            nonlocal cancelled
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+    async def scenario() -> None:
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.01, os.kill, os.getpid(), signal.SIGTERM)
+        await run_until_sigterm(Endless())  # type: ignore[arg-type]
+
+    with caplog.at_level(logging.INFO):
+        asyncio.run(scenario())
+
+    assert cancelled
+    assert "Received SIGTERM, shutting down" in caplog.text
+
+
 @pytest.mark.usefixtures("valid_environment")
 def test_main_exits_on_a_configuration_error(monkeypatch, capsys):
     """The exit code is what a `docker compose` log leaves an operator with."""
@@ -174,10 +593,14 @@ def test_main_exits_on_a_configuration_error(monkeypatch, capsys):
 
 
 @pytest.mark.usefixtures("valid_environment")
-def test_main_exits_on_an_unretryable_error(monkeypatch):
+@pytest.mark.parametrize("size, is_dumped", [("64", True), ("0", False)])
+def test_main_exits_on_an_unretryable_error(monkeypatch, capsys, size, is_dumped):
+    monkeypatch.setenv("FLIGHT_RECORDER_SIZE", size)
     monkeypatch.setattr(Application, "run", MagicMock(side_effect=ValueError("boom")))
 
     with pytest.raises(SystemExit) as exit_attempt:
         main()
 
     assert exit_attempt.value.code == ReturnCodes.UNRETRYABLE_EXCEPTION_IN_LIFECYCLE
+    # What led to it follows, when recorded.
+    assert ("Exchanges leading to it" in capsys.readouterr().err) == is_dumped
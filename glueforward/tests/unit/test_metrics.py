@@ -0,0 +1,334 @@
+"""Unit tests for glueforward.main.metrics."""
+
+import asyncio
+from functools import partial
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from glueforward.main import logs, tracing
+from glueforward.main.events import EventBus
+from glueforward.main.gluetun import GluetunUnreachable
+from glueforward.main.limiter import HostLimiter, HostStatistics
+from glueforward.main.metrics import (
+    CONTENT_TYPE,
+    GET_FORWARDED_PORT,
+    SET_PORT,
+    AsyncTimedPortForwarder,
+    AsyncTimedServiceClient,
+    Histogram,
+    Metrics,
+    TimedPortForwarder,
+    TimedServiceClient,
+    collect_connections,
+    collect_dropped,
+    collect_host_limiter,
+    collect_latency,
+    collect_resolution,
+    collect_scheduler,
+)
+from glueforward.main.port_synchronizer import NoForwardedPortYet
+from glueforward.main.resolver import ResolutionStatistics
+from glueforward.main.scheduler import Scheduler
+from glueforward.main.timeouts import LatencyStatistics
+from glueforward.main.transport import ConnectionStatistics, Connections
+
+FORWARDED_PORT = 51413
+NEXT_PORT = 40000
+HOST = "gluetun:8000"
+HOST_LABELS = f'{{host="{HOST}"}}'
+
+
+def _get_samples(metrics: Metrics) -> dict[str, float]:
+    """The value of every line scraped, by name and labels."""
+    lines = metrics.render().splitlines()
+    samples = (line.rsplit(" ", 1) for line in lines if not line.startswith("#"))
+    return {name: float(value) for name, value in samples}
+
+
+def test_a_histogram_counts_observations_into_cumulative_buckets():
+    histogram = Histogram([0.5, 1])
+    for value in (0.25, 0.5, 0.75, 3):
+        histogram.observe(value)
+
+    assert list(histogram.render("latency")) == [
+        "# TYPE latency histogram",
+        'latency_bucket{le="0.5"} 2',
+        'latency_bucket{le="1"} 3',
+        'latency_bucket{le="+Inf"} 4',
+        "latency_sum 4.5",
+        "latency_count 4",
+    ]
+
+
+def test_ticks_are_counted_with_what_they_failed_on(clock):
+    metrics = Metrics(clock)
+    metrics.count_tick(None)
+    metrics.count_tick(NoForwardedPortYet())
+    metrics.count_tick(NoForwardedPortYet())
+
+    samples = _get_samples(metrics)
+
+    assert samples["glueforward_ticks_total"] == 3
+    assert samples["glueforward_successes_total"] == 1
+    assert samples['glueforward_retryable_errors_total{error="NoForwardedPortYet"}'] == 2
+
+
+def test_every_retryable_error_is_counted_from_zero(clock):
+    """A rate over a counter that only appears on its first error misses it."""
+    samples = _get_samples(Metrics(clock))
+
+    name = f'glueforward_retryable_errors_total{{error="{GluetunUnreachable.__name__}"}}'
+    assert samples[name] == 0
+
+
+def test_an_operation_is_timed_even_when_it_fails(clock):
+    metrics = Metrics(clock)
+
+    with pytest.raises(ValueError), metrics.time(SET_PORT):
+        clock.now += 0.2
+        raise ValueError()
+
+    samples = _get_samples(metrics)
+    assert samples['glueforward_set_port_seconds_bucket{le="0.1"}'] == 0
+    assert samples['glueforward_set_port_seconds_bucket{le="0.25"}'] == 1
+    assert samples["glueforward_get_forwarded_port_seconds_count"] == 0
+
+
+def test_a_port_change_is_timed_from_first_seen_to_applied(clock):
+    metrics = Metrics(clock)
+    metrics.port_observed(FORWARDED_PORT)
+    clock.now = 3
+    # Seen again while not applied yet: still timed from the first time.
+    metrics.port_observed(FORWARDED_PORT)
+    clock.now = 7
+    metrics.port_applied(FORWARDED_PORT)
+    # Applied again every tick after, which is not a change.
+    metrics.port_observed(FORWARDED_PORT)
+    metrics.port_applied(FORWARDED_PORT)
+
+    samples = _get_samples(metrics)
+
+    assert samples["glueforward_port_propagation_seconds_sum"] == 7
+    assert samples["glueforward_port_propagation_seconds_count"] == 1
+
+
+def test_a_missing_port_is_not_a_change(clock):
+    metrics = Metrics(clock)
+    metrics.port_observed(None)
+    metrics.port_applied(FORWARDED_PORT)
+
+    assert _get_samples(metrics)["glueforward_port_propagation_seconds_count"] == 0
+
+
+def test_the_port_applied_is_exposed_with_its_age(clock):
+    metrics = Metrics(clock)
+    assert "glueforward_forwarded_port" not in _get_samples(metrics)
+
+    metrics.port_applied(FORWARDED_PORT)
+    clock.now = 100
+    metrics.port_applied(FORWARDED_PORT)
+    clock.now = 160
+
+    samples = _get_samples(metrics)
+    assert samples["glueforward_forwarded_port"] == FORWARDED_PORT
+    assert samples["glueforward_forwarded_port_age_seconds"] == 160
+
+    metrics.port_applied(NEXT_PORT)
+    assert _get_samples(metrics)["glueforward_forwarded_port_age_seconds"] == 0
+
+
+def test_metrics_are_served_in_prometheus_format(clock):
+    reply = Metrics(clock).serve({})
+
+    assert reply.status == 200
+    assert reply.content_type == CONTENT_TYPE
+    assert reply.body.endswith(b"\n")
+
+
+def test_a_collector_is_rendered_afresh_on_every_scrape(clock):
+    metrics = Metrics(clock)
+    values = iter([1, 2])
+    metrics.register("collector", lambda: iter([f"custom {next(values)}"]))
+
+    assert _get_samples(metrics)["custom"] == 1
+    assert _get_samples(metrics)["custom"] == 2
+
+
+def test_a_collector_replaces_the_one_registered_under_its_name(clock):
+    metrics = Metrics(clock)
+    metrics.register("collector", lambda: iter(["old 1"]))
+    metrics.register("collector", lambda: iter(["new 1"]))
+
+    samples = _get_samples(metrics)
+
+    assert "old" not in samples
+    assert samples["new"] == 1
+
+
+def test_the_host_limiter_s_queues_and_waits_are_scraped(clock):
+    limiter = MagicMock(spec=HostLimiter)
+    limiter.get_statistics.return_value = {
+        HOST: HostStatistics(
+            in_flight=1, queue_depth=2, wait_count=3, wait_seconds=0.5
+        )
+    }
+    metrics = Metrics(clock)
+    metrics.register("limiter", partial(collect_host_limiter, limiter))
+
+    samples = _get_samples(metrics)
+
+    assert samples[f"glueforward_host_requests_in_flight{HOST_LABELS}"] == 1
+    assert samples[f"glueforward_host_queue_depth{HOST_LABELS}"] == 2
+    assert samples[f"glueforward_host_waits_total{HOST_LABELS}"] == 3
+    assert samples[f"glueforward_host_wait_seconds_total{HOST_LABELS}"] == 0.5
+
+
+def test_each_host_s_connection_reuse_is_scraped(clock):
+    connections = MagicMock(spec=Connections)
+    connections.get_statistics.return_value = {
+        HOST: ConnectionStatistics(
+            requests=4, reused=3, connections_opened=1, connect_seconds=0.25
+        )
+    }
+    metrics = Metrics(clock)
+    metrics.register("connections", partial(collect_connections, connections))
+
+    samples = _get_samples(metrics)
+
+    assert samples[f"glueforward_host_requests_total{HOST_LABELS}"] == 4
+    assert samples[f"glueforward_host_reused_requests_total{HOST_LABELS}"] == 3
+    assert samples[f"glueforward_host_connection_reuse_ratio{HOST_LABELS}"] == 0.75
+    assert samples[f"glueforward_host_connections_opened_total{HOST_LABELS}"] == 1
+    assert samples[f"glueforward_host_connect_seconds_total{HOST_LABELS}"] == 0.25
+
+
+def test_tls_handshakes_are_scraped_by_whether_they_resumed(clock):
+    connections = MagicMock(spec=Connections)
+    connections.get_statistics.return_value = {
+        HOST: ConnectionStatistics(
+            requests=3,
+            reused=0,
+            connections_opened=3,
+            connect_seconds=0.5,
+            full_handshakes=1,
+            resumed_handshakes=2,
+        )
+    }
+    metrics = Metrics(clock)
+    metrics.register("connections", partial(collect_connections, connections))
+
+    samples = _get_samples(metrics)
+
+    name = "glueforward_tls_handshakes_total"
+    assert samples[f'{name}{{host="{HOST}",kind="full"}}'] == 1
+    assert samples[f'{name}{{host="{HOST}",kind="resumed"}}'] == 2
+
+
+def test_each_host_s_name_resolution_is_scraped(clock):
+    connections = MagicMock(spec=Connections)
+    connections.get_resolution_statistics.return_value = {
+        HOST: ResolutionStatistics(
+            lookups=3,
+            failures=1,
+            cached_answers=5,
+            stale_answers=2,
+            lookup_seconds=0.5,
+        )
+    }
+    metrics = Metrics(clock)
+    metrics.register("resolution", partial(collect_resolution, connections))
+
+    samples = _get_samples(metrics)
+
+    assert samples[f"glueforward_dns_lookups_total{HOST_LABELS}"] == 3
+    assert samples[f"glueforward_dns_lookup_failures_total{HOST_LABELS}"] == 1
+    assert samples[f"glueforward_dns_cached_answers_total{HOST_LABELS}"] == 5
+    assert samples[f"glueforward_dns_stale_answers_total{HOST_LABELS}"] == 2
+    assert samples[f"glueforward_dns_lookup_seconds_total{HOST_LABELS}"] == 0.5
+
+
+def test_each_endpoint_s_latency_is_scraped_by_quantile(clock):
+    endpoint = f"{HOST}/v1/portforward"
+    connections = MagicMock(spec=Connections)
+    connections.get_latency_statistics.return_value = {
+        endpoint: LatencyStatistics(samples=20, p50=0.02, p99=0.3)
+    }
+    metrics = Metrics(clock)
+    metrics.register("latency", partial(collect_latency, connections))
+
+    samples = _get_samples(metrics)
+
+    name = "glueforward_endpoint_latency"
+    assert samples[f'{name}_samples{{endpoint="{endpoint}"}}'] == 20
+    assert samples[f'{name}_seconds{{endpoint="{endpoint}",quantile="0.5"}}'] == 0.02
+    assert samples[f'{name}_seconds{{endpoint="{endpoint}",quantile="0.99"}}'] == 0.3
+
+
+def test_the_scheduler_s_lag_is_scraped(clock):
+    scheduler = MagicMock(spec=Scheduler)
+    scheduler.get_lag.return_value = 2.5
+    metrics = Metrics(clock)
+    metrics.register("scheduler", partial(collect_scheduler, scheduler))
+
+    assert _get_samples(metrics)["glueforward_scheduler_lag_seconds"] == 2.5
+
+
+def test_dropped_events_spans_and_log_records_are_scraped(clock, monkeypatch):
+    events = MagicMock(spec=EventBus)
+    events.get_dropped.return_value = {"LoggingSink": 2}
+    monkeypatch.setattr(tracing, "get_dropped", lambda: 3)
+    monkeypatch.setattr(logs, "get_dropped", lambda: 4)
+    metrics = Metrics(clock)
+    metrics.register("dropped", partial(collect_dropped, events))
+
+    samples = _get_samples(metrics)
+
+    assert samples['glueforward_dropped_events_total{sink="LoggingSink"}'] == 2
+    assert samples["glueforward_dropped_spans_total"] == 3
+    assert samples["glueforward_dropped_log_records_total"] == 4
+
+
+def test_the_forwarder_is_timed_and_its_port_observed(clock, asynchronous):
+    metrics = Metrics(clock)
+
+    if asynchronous:
+        forwarder = AsyncMock(return_value=FORWARDED_PORT)
+        timed = AsyncTimedPortForwarder(
+            MagicMock(get_forwarded_port=forwarder), metrics
+        )
+        port = asyncio.run(timed.get_forwarded_port())
+    else:
+        forwarder = MagicMock(return_value=FORWARDED_PORT)
+        port = TimedPortForwarder(
+            MagicMock(get_forwarded_port=forwarder), metrics
+        ).get_forwarded_port()
+    metrics.port_applied(FORWARDED_PORT)
+
+    samples = _get_samples(metrics)
+    assert port == FORWARDED_PORT
+    assert samples[f"glueforward_{GET_FORWARDED_PORT}_seconds_count"] == 1
+    assert samples["glueforward_port_propagation_seconds_count"] == 1
+
+
+def test_the_service_is_timed_setting_the_port_only(clock, asynchronous):
+    metrics = Metrics(clock)
+
+    if asynchronous:
+        service = MagicMock(warm_up=AsyncMock(), set_port=AsyncMock())
+        timed = AsyncTimedServiceClient(service, metrics)
+
+        async def scenario() -> None:
+            await timed.warm_up()
+            await timed.set_port(FORWARDED_PORT)
+
+        asyncio.run(scenario())
+    else:
+        service = MagicMock()
+        timed_client = TimedServiceClient(service, metrics)
+        timed_client.warm_up()
+        timed_client.set_port(FORWARDED_PORT)
+
+    service.warm_up.assert_called_once()
+    service.set_port.assert_called_once_with(FORWARDED_PORT)
+    assert _get_samples(metrics)["glueforward_set_port_seconds_count"] == 1
@@ -0,0 +1,144 @@
+"""Unit tests for glueforward.main.middleware."""
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from glueforward.main.metrics import Metrics
+from glueforward.main.middleware import (
+    CACHE,
+    DEDUPE,
+    TIMING,
+    AsyncDedupedServiceClient,
+    DedupedServiceClient,
+    compile_chain,
+    get_async_forwarder_middlewares,
+    get_async_service_middlewares,
+    get_forwarder_middlewares,
+    get_service_middlewares,
+)
+
+from .conftest import Blocking, FakeAsyncClock
+
+FORWARDED_PORT = 51413
+NEXT_PORT = 40000
+
+
+def test_a_chain_wraps_the_first_middleware_outermost():
+    component = object()
+    middlewares = {
+        "outer": lambda wrapped: ("outer", wrapped),
+        "inner": lambda wrapped: ("inner", wrapped),
+    }
+
+    chain = compile_chain(component, ["outer", "inner"], middlewares)
+
+    assert chain == ("outer", ("inner", component))
+    assert compile_chain(component, [], middlewares) is component
+
+
+def _count_timed(metrics: Metrics, operation: str) -> str:
+    return next(
+        line
+        for line in metrics.render().splitlines()
+        if line.startswith(f"glueforward_{operation}_seconds_count")
+    )
+
+
+def test_the_forwarder_is_cached_outside_of_being_timed(clock, asynchronous):
+    metrics = Metrics(clock)
+    if asynchronous:
+        middlewares = get_async_forwarder_middlewares(FakeAsyncClock(clock), 5, metrics)
+        forwarder = AsyncMock(get_forwarded_port=AsyncMock(return_value=FORWARDED_PORT))
+        chain = Blocking(compile_chain(forwarder, [CACHE, TIMING], middlewares))
+    else:
+        middlewares = get_forwarder_middlewares(clock, 5, metrics)
+        forwarder = MagicMock(get_forwarded_port=MagicMock(return_value=FORWARDED_PORT))
+        chain = compile_chain(forwarder, [CACHE, TIMING], middlewares)
+
+    assert chain.get_forwarded_port() == chain.get_forwarded_port() == FORWARDED_PORT
+
+    # Only the request the cache could not answer was timed.
+    assert _count_timed(metrics, "get_forwarded_port").endswith(" 1")
+
+
+def test_the_cache_s_lookups_are_counted_on_metrics(clock, asynchronous):
+    metrics = Metrics(clock)
+    if asynchronous:
+        middlewares = get_async_forwarder_middlewares(FakeAsyncClock(clock), 5, metrics)
+        forwarder = AsyncMock(get_forwarded_port=AsyncMock(return_value=FORWARDED_PORT))
+        chain = Blocking(compile_chain(forwarder, [CACHE], middlewares))
+    else:
+        middlewares = get_forwarder_middlewares(clock, 5, metrics)
+        forwarder = MagicMock(get_forwarded_port=MagicMock(return_value=FORWARDED_PORT))
+        chain = compile_chain(forwarder, [CACHE], middlewares)
+
+    chain.get_forwarded_port()
+    chain.get_forwarded_port()
+
+    lines = metrics.render().splitlines()
+    assert 'glueforward_port_cache_lookups_total{result="hit"} 1' in lines
+    assert 'glueforward_port_cache_lookups_total{result="miss"} 1' in lines
+    assert 'glueforward_port_cache_lookups_total{result="coalesced"} 0' in lines
+
+
+def test_timing_is_left_out_without_metrics(clock):
+    forwarder, service = MagicMock(), MagicMock()
+
+    forwarders = get_forwarder_middlewares(clock, 0, None)
+    async_forwarders = get_async_forwarder_middlewares(FakeAsyncClock(clock), 0, None)
+
+    assert compile_chain(forwarder, [TIMING], forwarders) is forwarder
+    assert compile_chain(forwarder, [TIMING], async_forwarders) is forwarder
+    assert compile_chain(service, [TIMING], get_service_middlewares(None)) is service
+    assert (
+        compile_chain(service, [TIMING], get_async_service_middlewares(None))
+        is service
+    )
+
+
+def test_the_service_is_deduped_outside_of_being_timed(clock, asynchronous):
+    metrics = Metrics(clock)
+    if asynchronous:
+        middlewares = get_async_service_middlewares(metrics)
+        chain = Blocking(compile_chain(AsyncMock(), [DEDUPE, TIMING], middlewares))
+    else:
+        middlewares = get_service_middlewares(metrics)
+        chain = compile_chain(MagicMock(), [DEDUPE, TIMING], middlewares)
+
+    chain.set_port(FORWARDED_PORT)
+    chain.set_port(FORWARDED_PORT)
+
+    assert _count_timed(metrics, "set_port").endswith(" 1")
+
+
+def _make_deduped(asynchronous: bool, service: MagicMock):
+    if asynchronous:
+        return Blocking(AsyncDedupedServiceClient(service))
+    return DedupedServiceClient(service)
+
+
+def test_a_port_is_only_set_when_it_changes(asynchronous):
+    service = AsyncMock() if asynchronous else MagicMock()
+    deduped = _make_deduped(asynchronous, service)
+
+    for port in (FORWARDED_PORT, FORWARDED_PORT, NEXT_PORT, FORWARDED_PORT):
+        deduped.warm_up()
+        deduped.set_port(port)
+
+    ports = [call.args[0] for call in service.set_port.call_args_list]
+    assert ports == [FORWARDED_PORT, NEXT_PORT, FORWARDED_PORT]
+    assert service.warm_up.call_count == 4
+
+
+def test_a_port_that_failed_to_be_set_is_set_again(asynchronous):
+    service = AsyncMock() if asynchronous else MagicMock()
+    service.set_port.side_effect = [ConnectionError(), None, None]
+    deduped = _make_deduped(asynchronous, service)
+
+    with pytest.raises(ConnectionError):
+        deduped.set_port(FORWARDED_PORT)
+    deduped.set_port(FORWARDED_PORT)
+    deduped.set_port(FORWARDED_PORT)
+
+    assert service.set_port.call_count == 2
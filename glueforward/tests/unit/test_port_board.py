@@ -0,0 +1,92 @@
+"""Unit tests for glueforward.main.port_board."""
+
+import json
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from glueforward.main.port_board import MAX_WAIT, PortBoard
+
+FORWARDED_PORT = 51413
+NEXT_PORT = 40000
+
+# Long enough that an answer coming that late was waiting on the change.
+LONG_POLL_TIMEOUT = 5
+
+
+def test_the_port_is_answered_in_gluetun_s_shape():
+    board = PortBoard()
+    board.port_applied(FORWARDED_PORT)
+
+    reply = board.serve({})
+
+    assert reply.status == 200
+    assert json.loads(reply.body) == {"port": FORWARDED_PORT}
+
+
+def test_no_port_applied_yet_is_answered_as_gluetun_would():
+    """gluetun answers 0 while it has no port, and so do we."""
+    assert json.loads(PortBoard().serve({}).body) == {"port": 0}
+
+
+def test_a_port_already_different_is_answered_at_once():
+    board = PortBoard()
+    board.port_applied(NEXT_PORT)
+
+    reply = board.serve({"differs_from": str(FORWARDED_PORT)})
+
+    assert json.loads(reply.body) == {"port": NEXT_PORT}
+
+
+def test_a_long_poll_is_answered_as_soon_as_the_port_changes():
+    board = PortBoard()
+    board.port_applied(FORWARDED_PORT)
+    replies = []
+    waiter = threading.Thread(
+        target=lambda: replies.append(
+            board.serve(
+                {"differs_from": str(FORWARDED_PORT), "timeout": str(LONG_POLL_TIMEOUT)}
+            )
+        )
+    )
+    start = time.monotonic()
+    waiter.start()
+
+    board.port_applied(NEXT_PORT)
+    waiter.join()
+
+    assert time.monotonic() - start < LONG_POLL_TIMEOUT
+    assert json.loads(replies[0].body) == {"port": NEXT_PORT}
+
+
+def test_a_long_poll_with_no_change_runs_out():
+    board = PortBoard()
+    board.port_applied(FORWARDED_PORT)
+
+    reply = board.serve({"differs_from": str(FORWARDED_PORT), "timeout": "0.01"})
+
+    assert reply.status == 304
+    assert not reply.body
+
+
+def test_an_unreadable_query_is_a_bad_request():
+    assert PortBoard().serve({"differs_from": "a port"}).status == 400
+
+
+@pytest.mark.parametrize("timeout", ["nan", "inf", "-inf"])
+def test_a_timeout_that_is_not_finite_is_a_bad_request(timeout):
+    reply = PortBoard().serve({"differs_from": "0", "timeout": timeout})
+
+    assert reply.status == 400
+
+
+def test_a_timeout_above_the_maximum_is_capped(monkeypatch):
+    board = PortBoard()
+    wait_for_change = MagicMock(return_value=FORWARDED_PORT)
+    monkeypatch.setattr(board, "wait_for_change", wait_for_change)
+
+    board.serve({"differs_from": "0", "timeout": str(MAX_WAIT * 10)})
+
+    wait_for_change.assert_called_once_with(0, MAX_WAIT)
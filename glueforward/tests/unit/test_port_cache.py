@@ -0,0 +1,267 @@
+"""Unit tests for glueforward.main.port_cache."""
+
+import asyncio
+import threading
+import time
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from glueforward.main.gluetun import GluetunUnreachable
+from glueforward.main.port_cache import (
+    AsyncCachedPortForwarder,
+    CachedPortForwarder,
+    CacheStatistics,
+)
+
+from .conftest import Blocking, FakeAsyncClock
+
+TTL = 5.0
+FORWARDED_PORT = 51413
+OTHER_PORT = 40000
+CONCURRENT_CALLERS = 4
+
+
+class _Interrupted(BaseException):
+    """What stops a request without being an error, as KeyboardInterrupt does."""
+
+
+@pytest.fixture(name="forwarder")
+def forwarder_fixture(asynchronous) -> MagicMock:
+    forwarder = MagicMock()
+    if asynchronous:
+        forwarder.get_forwarded_port = AsyncMock()
+    forwarder.get_forwarded_port.return_value = FORWARDED_PORT
+    return forwarder
+
+
+@pytest.fixture(name="cache")
+def cache_fixture(asynchronous, forwarder, clock) -> Any:
+    """The cache under test, blocking or asyncio alike."""
+    if asynchronous:
+        return Blocking(AsyncCachedPortForwarder(forwarder, FakeAsyncClock(clock), TTL))
+    return CachedPortForwarder(forwarder, clock, ttl=TTL)
+
+
+def test_the_port_is_answered_from_memory_within_the_ttl(cache, forwarder, clock):
+    assert cache.get_forwarded_port() == FORWARDED_PORT
+    clock.now = TTL - 1
+    assert cache.get_forwarded_port() == FORWARDED_PORT
+
+    assert forwarder.get_forwarded_port.call_count == 1
+    assert cache.get_statistics() == CacheStatistics(hits=1, misses=1, coalesced=0)
+
+
+def test_the_port_is_asked_again_once_the_ttl_is_over(cache, forwarder, clock):
+    cache.get_forwarded_port()
+    forwarder.get_forwarded_port.return_value = OTHER_PORT
+    clock.now = TTL
+
+    assert cache.get_forwarded_port() == OTHER_PORT
+    assert cache.get_statistics().misses == 2
+
+
+def test_no_forwarded_port_is_cached_like_any_other_answer(cache, forwarder):
+    forwarder.get_forwarded_port.return_value = None
+
+    assert cache.get_forwarded_port() is None
+    assert cache.get_forwarded_port() is None
+
+    assert forwarder.get_forwarded_port.call_count == 1
+
+
+def test_an_error_is_never_cached(cache, forwarder):
+    """gluetun being down a moment ago says nothing about it now."""
+    forwarder.get_forwarded_port.side_effect = [GluetunUnreachable(), FORWARDED_PORT]
+
+    with pytest.raises(GluetunUnreachable):
+        cache.get_forwarded_port()
+
+    assert cache.get_forwarded_port() == FORWARDED_PORT
+
+
+def test_invalidating_asks_the_forwarder_again(cache, forwarder):
+    """A reconnection means the port cached is likely gone already."""
+    cache.get_forwarded_port()
+    forwarder.get_forwarded_port.return_value = OTHER_PORT
+
+    cache.invalidate()
+
+    assert cache.get_forwarded_port() == OTHER_PORT
+
+
+def test_an_answer_invalidated_in_flight_is_not_cached(cache, forwarder):
+    def answer_then_be_invalidated() -> int:
+        cache.invalidate()
+        return FORWARDED_PORT
+
+    forwarder.get_forwarded_port.side_effect = answer_then_be_invalidated
+    assert cache.get_forwarded_port() == FORWARDED_PORT
+
+    forwarder.get_forwarded_port.side_effect = None
+    forwarder.get_forwarded_port.return_value = OTHER_PORT
+    assert cache.get_forwarded_port() == OTHER_PORT
+
+
+def test_callers_after_an_invalidation_do_not_share_the_stale_flight(clock):
+    forwarder = MagicMock()
+    cache = CachedPortForwarder(forwarder, clock, ttl=TTL)
+
+    def answer_after_another_caller() -> int:
+        if forwarder.get_forwarded_port.call_count == 1:
+            cache.invalidate()
+            assert cache.get_forwarded_port() == OTHER_PORT
+            return FORWARDED_PORT
+        return OTHER_PORT
+
+    forwarder.get_forwarded_port.side_effect = answer_after_another_caller
+
+    assert cache.get_forwarded_port() == FORWARDED_PORT
+    # The stale flight landing last did not overwrite the newer answer.
+    assert cache.get_forwarded_port() == OTHER_PORT
+    assert forwarder.get_forwarded_port.call_count == 2
+
+
+def test_asyncio_callers_after_an_invalidation_do_not_share_it_either(clock):
+    async def scenario() -> tuple[int | None, int | None]:
+        forwarder = MagicMock()
+        cache = AsyncCachedPortForwarder(forwarder, FakeAsyncClock(clock), TTL)
+
+        async def answer_after_another_caller() -> int:
+            if forwarder.get_forwarded_port.call_count == 1:
+                cache.invalidate()
+                assert await cache.get_forwarded_port() == OTHER_PORT
+                return FORWARDED_PORT
+            return OTHER_PORT
+
+        forwarder.get_forwarded_port = AsyncMock(
+            side_effect=answer_after_another_caller
+        )
+        first = await cache.get_forwarded_port()
+        return first, await cache.get_forwarded_port()
+
+    assert asyncio.run(scenario()) == (FORWARDED_PORT, OTHER_PORT)
+
+
+def test_an_interrupted_request_caches_nothing(clock):
+    forwarder = MagicMock()
+    forwarder.get_forwarded_port.side_effect = _Interrupted()
+    cache = CachedPortForwarder(forwarder, clock, ttl=TTL)
+    with pytest.raises(_Interrupted):
+        cache.get_forwarded_port()
+
+    forwarder.get_forwarded_port.side_effect = None
+    forwarder.get_forwarded_port.return_value = FORWARDED_PORT
+
+    assert cache.get_forwarded_port() == FORWARDED_PORT
+
+
+def _call_concurrently(clock, side_effect, release: threading.Event) -> list:
+    """Have CONCURRENT_CALLERS threads ask at once, while the first request hangs."""
+    forwarder = MagicMock()
+    forwarder.get_forwarded_port.side_effect = side_effect
+    cache = CachedPortForwarder(forwarder, clock, ttl=TTL)
+    answers: list = []
+
+    def call() -> None:
+        try:
+            answers.append(cache.get_forwarded_port())
+        except (GluetunUnreachable, _Interrupted) as error:
+            answers.append(error)
+
+    threads = [threading.Thread(target=call) for _ in range(CONCURRENT_CALLERS)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while cache.get_statistics().coalesced < CONCURRENT_CALLERS - 1:
+        assert time.monotonic() < deadline, "the callers never coalesced"
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert forwarder.get_forwarded_port.call_count == 1
+    return answers
+
+
+def test_concurrent_threads_share_one_request(clock):
+    release = threading.Event()
+
+    def slow_answer() -> int:
+        release.wait()
+        return FORWARDED_PORT
+
+    answers = _call_concurrently(clock, slow_answer, release)
+
+    assert answers == [FORWARDED_PORT] * CONCURRENT_CALLERS
+
+
+def test_concurrent_threads_share_one_error(clock):
+    release = threading.Event()
+    error = GluetunUnreachable()
+
+    def slow_failure() -> int:
+        release.wait()
+        raise error
+
+    answers = _call_concurrently(clock, slow_failure, release)
+
+    assert answers == [error] * CONCURRENT_CALLERS
+
+
+def test_concurrent_threads_share_one_interruption_rather_than_none(clock):
+    release = threading.Event()
+    interruption = _Interrupted()
+
+    def slow_interruption() -> int:
+        release.wait()
+        raise interruption
+
+    answers = _call_concurrently(clock, slow_interruption, release)
+
+    assert answers == [interruption] * CONCURRENT_CALLERS
+
+
+def _make_slow_cache(clock, release: asyncio.Event) -> AsyncCachedPortForwarder:
+    """A cache over a forwarder whose answer only comes once `release` is set."""
+
+    async def slow_answer() -> int:
+        await release.wait()
+        return FORWARDED_PORT
+
+    forwarder = MagicMock(get_forwarded_port=AsyncMock(side_effect=slow_answer))
+    return AsyncCachedPortForwarder(forwarder, FakeAsyncClock(clock), TTL)
+
+
+def test_concurrent_tasks_share_one_request(clock):
+    async def scenario() -> tuple[list[int | None], CacheStatistics]:
+        release = asyncio.Event()
+        cache = _make_slow_cache(clock, release)
+        calls = [cache.get_forwarded_port() for _ in range(CONCURRENT_CALLERS)]
+        gathered = asyncio.gather(*calls)
+        await asyncio.sleep(0)
+        release.set()
+        return await gathered, cache.get_statistics()
+
+    answers, statistics = asyncio.run(scenario())
+
+    assert answers == [FORWARDED_PORT] * CONCURRENT_CALLERS
+    assert statistics == CacheStatistics(
+        hits=0, misses=1, coalesced=CONCURRENT_CALLERS - 1
+    )
+
+
+def test_a_cancelled_task_leaves_the_shared_request_to_the_others(clock):
+    """SIGTERM cancelling one caller must not fail every other one waiting."""
+
+    async def scenario() -> int | None:
+        release = asyncio.Event()
+        cache = _make_slow_cache(clock, release)
+        cancelled = asyncio.ensure_future(cache.get_forwarded_port())
+        kept = asyncio.ensure_future(cache.get_forwarded_port())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        release.set()
+        return await kept
+
+    assert asyncio.run(scenario()) == FORWARDED_PORT
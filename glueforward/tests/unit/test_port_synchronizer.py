@@ -1,43 +1,91 @@
 """Unit tests for glueforward.main.port_synchronizer."""
 
+import asyncio
 import logging
-from unittest.mock import MagicMock, call
+import threading
+from collections.abc import Callable, Sequence
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock, call
 
 import pytest
 
+from glueforward.main.deadline import TickDeadline, get_remaining
 from glueforward.main.errors import RetryableError
+from glueforward.main.events import (
+    EventBus,
+    PortApplied,
+    PortObserved,
+    PortUnchanged,
+)
 from glueforward.main.port_synchronizer import (
+    AsyncPortSynchronizer,
     ForwardedPortNeverCame,
     NoForwardedPortYet,
     PortSynchronizer,
 )
+from glueforward.main.ports import PortListener
+
+from .conftest import Blocking, EndOfTest, FakeAsyncClock
 
 WAIT_FOR_FIRST_PORT = 300.0
 FORWARDED_PORT = 51413
 
 
 @pytest.fixture(name="forwarder")
-def forwarder_fixture() -> MagicMock:
+def forwarder_fixture(asynchronous) -> MagicMock:
     """The VPN side, whose forwarded port a test changes between two runs."""
     forwarder = MagicMock()
+    if asynchronous:
+        forwarder.get_forwarded_port = AsyncMock()
     forwarder.get_forwarded_port.return_value = None
     return forwarder
 
 
 @pytest.fixture(name="service")
-def service_fixture() -> MagicMock:
-    return MagicMock()
+def service_fixture(asynchronous) -> MagicMock:
+    service = MagicMock()
+    if asynchronous:
+        service.warm_up = AsyncMock(return_value=None)
+        service.set_port = AsyncMock()
+    return service
+
+
+@pytest.fixture(name="make_synchronizer")
+def make_synchronizer_fixture(
+    asynchronous, forwarder, service, clock
+) -> Callable[..., Any]:
+    """Build a synchronizer whose deadline for a first port is WAIT_FOR_FIRST_PORT
+    away, blocking or asyncio alike."""
+
+    def make(
+        listeners: Sequence[PortListener] = (), events: EventBus | None = None
+    ) -> Any:
+        if asynchronous:
+            return Blocking(
+                AsyncPortSynchronizer(
+                    forwarder=forwarder,
+                    service=service,
+                    clock=FakeAsyncClock(clock),
+                    wait_for_first_port_duration=WAIT_FOR_FIRST_PORT,
+                    listeners=listeners,
+                    events=events,
+                )
+            )
+        return PortSynchronizer(
+            forwarder=forwarder,
+            service=service,
+            clock=clock,
+            wait_for_first_port_duration=WAIT_FOR_FIRST_PORT,
+            listeners=listeners,
+            events=events,
+        )
+
+    return make
 
 
 @pytest.fixture(name="synchronizer")
-def synchronizer_fixture(forwarder, service, clock) -> PortSynchronizer:
-    """A synchronizer whose deadline for a first port is WAIT_FOR_FIRST_PORT away."""
-    return PortSynchronizer(
-        forwarder=forwarder,
-        service=service,
-        clock=clock,
-        wait_for_first_port_duration=WAIT_FOR_FIRST_PORT,
-    )
+def synchronizer_fixture(make_synchronizer) -> Any:
+    return make_synchronizer()
 
 
 @pytest.mark.parametrize(
@@ -121,6 +169,25 @@ def test_a_first_port_arriving_late_is_still_accepted(
     assert service.set_port.call_args_list == [call(FORWARDED_PORT)]
 
 
+def test_a_reconfigured_synchronizer_runs_on_what_it_is_given(
+    synchronizer, asynchronous, service, clock
+):
+    """Either side left out is kept, and the wait is from the start still."""
+    forwarder = MagicMock()
+    if asynchronous:
+        forwarder.get_forwarded_port = AsyncMock()
+    forwarder.get_forwarded_port.return_value = None
+    clock.now = WAIT_FOR_FIRST_PORT
+
+    synchronizer.reconfigure(WAIT_FOR_FIRST_PORT * 2, forwarder=forwarder)
+    with pytest.raises(NoForwardedPortYet):
+        synchronizer.synchronize()
+    forwarder.get_forwarded_port.return_value = FORWARDED_PORT
+    synchronizer.synchronize()
+
+    assert service.set_port.call_args_list == [call(FORWARDED_PORT)]
+
+
 def test_the_port_that_was_set_is_logged(synchronizer, forwarder, caplog):
     """The one line telling an operator the deployment is doing its job."""
     caplog.set_level(logging.INFO)
@@ -129,3 +196,166 @@ def test_the_port_that_was_set_is_logged(synchronizer, forwarder, caplog):
     synchronizer.synchronize()
 
     assert str(FORWARDED_PORT) in caplog.text
+
+
+def test_listeners_are_told_of_the_port_applied(make_synchronizer, forwarder):
+    listener = MagicMock()
+    synchronizer = make_synchronizer(listeners=[listener])
+    forwarder.get_forwarded_port.return_value = FORWARDED_PORT
+
+    synchronizer.synchronize()
+
+    assert listener.port_applied.call_args_list == [call(FORWARDED_PORT)]
+
+
+def test_listeners_are_not_told_of_a_port_the_service_refused(
+    make_synchronizer, forwarder, service
+):
+    """Consumers trust what they are told to be what qBittorrent listens on."""
+    listener = MagicMock()
+    synchronizer = make_synchronizer(listeners=[listener])
+    forwarder.get_forwarded_port.return_value = FORWARDED_PORT
+    service.set_port.side_effect = RetryableError("down")
+
+    with pytest.raises(RetryableError):
+        synchronizer.synchronize()
+
+    listener.port_applied.assert_not_called()
+
+
+def test_ports_observed_and_applied_are_published(make_synchronizer, forwarder):
+    events = MagicMock(spec=EventBus)
+    synchronizer = make_synchronizer(events=events)
+
+    for port in (None, FORWARDED_PORT, FORWARDED_PORT):
+        forwarder.get_forwarded_port.return_value = port
+        try:
+            synchronizer.synchronize()
+        except NoForwardedPortYet:
+            pass
+
+    assert events.publish.call_args_list == [
+        call(PortObserved(None)),
+        call(PortObserved(FORWARDED_PORT)),
+        call(PortApplied(FORWARDED_PORT)),
+        call(PortObserved(FORWARDED_PORT)),
+        call(PortUnchanged(FORWARDED_PORT)),
+    ]
+
+
+def test_the_service_is_warmed_up_while_no_port_is_forwarded(synchronizer, service):
+    """The login is long done by the time a first port comes."""
+    with pytest.raises(NoForwardedPortYet):
+        synchronizer.synchronize()
+
+    service.warm_up.assert_called_once()
+    service.set_port.assert_not_called()
+
+
+def test_a_service_refusing_to_warm_up_is_reported_first(synchronizer, service):
+    """Rejected credentials are fatal, however long the port is in coming."""
+    service.warm_up.side_effect = EndOfTest()
+
+    with pytest.raises(EndOfTest):
+        synchronizer.synchronize()
+
+
+def test_the_forwarder_s_error_is_reported_once_warmed_up(synchronizer, forwarder):
+    forwarder.get_forwarded_port.side_effect = RetryableError("gluetun down")
+
+    with pytest.raises(RetryableError, match="gluetun down"):
+        synchronizer.synchronize()
+
+
+def test_the_forwarder_s_error_keeps_its_cause(synchronizer, forwarder, service):
+    """What it failed on, DNS, connecting or TLS, is what the retry log tells."""
+    refused = ConnectionRefusedError("Connection refused")
+    error = RetryableError("gluetun down")
+    error.__cause__ = refused
+    forwarder.get_forwarded_port.side_effect = error
+    service.warm_up.side_effect = EndOfTest()
+
+    with pytest.raises(EndOfTest) as raised:
+        synchronizer.synchronize()
+    assert "Raised alongside RetryableError('gluetun down')" in raised.value.__notes__
+    service.warm_up.side_effect = None
+
+    with pytest.raises(RetryableError) as raised:
+        synchronizer.synchronize()
+    assert raised.value.__cause__ is refused
+
+
+@pytest.mark.parametrize("fatal_side", ["forwarder", "service"])
+def test_an_error_no_retry_can_fix_wins_over_a_retryable_one(
+    synchronizer, forwarder, service, fatal_side
+):
+    """A rejected API key must not hide behind a qBittorrent still starting."""
+    fatal, retryable = EndOfTest(), RetryableError("still starting")
+    forwarder.get_forwarded_port.side_effect = (
+        fatal if fatal_side == "forwarder" else retryable
+    )
+    service.warm_up.side_effect = fatal if fatal_side == "service" else retryable
+
+    with pytest.raises(EndOfTest):
+        synchronizer.synchronize()
+
+
+def test_the_warm_up_keeps_to_the_tick_s_deadline(synchronizer, service, clock):
+    """Even on a thread of its own, the warm-up's requests are bound by it."""
+    remaining: list[float | None] = []
+    service.warm_up.side_effect = lambda: remaining.append(get_remaining())
+
+    with TickDeadline(30, clock).enforce(), pytest.raises(NoForwardedPortYet):
+        synchronizer.synchronize()
+
+    assert remaining == [30]
+
+
+def test_the_warm_up_overlaps_the_port_request(clock):
+    """Neither answers before the other has started: they run side by side."""
+    warming = threading.Event()
+    asked = threading.Event()
+
+    def warm_up() -> None:
+        warming.set()
+        assert asked.wait(timeout=5), "the port was not asked meanwhile"
+
+    def get_forwarded_port() -> int:
+        asked.set()
+        assert warming.wait(timeout=5), "the service was not warmed up meanwhile"
+        return FORWARDED_PORT
+
+    service = MagicMock(warm_up=MagicMock(side_effect=warm_up))
+    forwarder = MagicMock(get_forwarded_port=MagicMock(side_effect=get_forwarded_port))
+    synchronizer = PortSynchronizer(forwarder, service, clock, WAIT_FOR_FIRST_PORT)
+
+    synchronizer.synchronize()
+
+    service.set_port.assert_called_once_with(FORWARDED_PORT)
+
+
+def test_the_warm_up_overlaps_the_port_request_on_asyncio(clock):
+    async def scenario() -> MagicMock:
+        warming = asyncio.Event()
+        asked = asyncio.Event()
+
+        async def warm_up() -> None:
+            warming.set()
+            await asked.wait()
+
+        async def get_forwarded_port() -> int:
+            asked.set()
+            await warming.wait()
+            return FORWARDED_PORT
+
+        service = MagicMock(warm_up=AsyncMock(side_effect=warm_up), set_port=AsyncMock())
+        forwarder = MagicMock(get_forwarded_port=AsyncMock(side_effect=get_forwarded_port))
+        synchronizer = AsyncPortSynchronizer(
+            forwarder, service, FakeAsyncClock(clock), WAIT_FOR_FIRST_PORT
+        )
+        await asyncio.wait_for(synchronizer.synchronize(), timeout=5)
+        return service
+
+    service = asyncio.run(scenario())
+
+    service.set_port.assert_awaited_once_with(FORWARDED_PORT)
@@ -0,0 +1,64 @@
+"""Unit tests for glueforward.main.profiling."""
+
+import logging
+import pstats
+import tracemalloc
+
+import pytest
+
+from glueforward.main.profiling import Profiler
+
+
+@pytest.fixture(autouse=True)
+def stop_tracking_allocations():
+    """Tracking allocations is process-wide, and slows every test after."""
+    yield
+    tracemalloc.stop()
+
+
+def _allocate() -> list[bytes]:
+    return [bytes(1024) for _ in range(100)]
+
+
+def test_a_profile_is_written_once_profiling_is_toggled_off(tmp_path):
+    profiler = Profiler(str(tmp_path))
+
+    profiler.toggle_profile()
+    _allocate()
+    assert not list(tmp_path.iterdir())
+    profiler.toggle_profile()
+
+    (path,) = tmp_path.iterdir()
+    assert path.name.startswith("glueforward-profile-")
+    profile = pstats.Stats(str(path)).get_stats_profile()
+    assert "_allocate" in profile.func_profiles
+
+
+def test_allocations_are_written_since_the_last_signal(tmp_path):
+    profiler = Profiler(str(tmp_path))
+
+    profiler.compare_allocations()
+    assert tracemalloc.is_tracing() and not list(tmp_path.iterdir())
+    kept = _allocate()
+    profiler.compare_allocations()
+    kept += _allocate()
+    profiler.compare_allocations()
+
+    first, second = sorted(tmp_path.iterdir())
+    assert "test_profiling.py" in first.read_text(encoding="utf-8")
+    # A diff: what changed since, and by how much.
+    assert "(+" in second.read_text(encoding="utf-8")
+    assert len(kept) == 200
+
+
+def test_failing_to_write_is_only_logged(tmp_path, caplog):
+    profiler = Profiler(str(tmp_path / "missing"))
+
+    with caplog.at_level(logging.INFO):
+        profiler.toggle_profile()
+        profiler.toggle_profile()
+        profiler.compare_allocations()
+        profiler.compare_allocations()
+
+    assert "Could not write the profile" in caplog.text
+    assert "Could not write the allocations" in caplog.text
@@ -8,13 +8,18 @@ each one is pinned against a live instance by an end-to-end contract test.
 # pylint: disable=protected-access
 
 import json
+from collections.abc import Callable
+from typing import Any
+from unittest.mock import MagicMock
 from urllib.parse import parse_qs, urlencode
 
 import httpx
 import pytest
 
 from glueforward.main.errors import RetryableError
+from glueforward.main.events import AuthRenewed, EventBus
 from glueforward.main.qbittorrent import (
+    AsyncQBittorrentClient,
     QBittorrentAuthenticationNeeded,
     QBittorrentBanned,
     QBittorrentClient,
@@ -23,6 +28,8 @@ from glueforward.main.qbittorrent import (
     QBittorrentUnexpectedResponse,
     QBittorrentUnreachable,
 )
+from glueforward.main.limiter import HostLimiter
+from glueforward.main.responses import SNIPPET_SIZE
 
 from ..external_contracts import (
     QBITTORRENT_BANNED_STATUS,
@@ -31,6 +38,7 @@ from ..external_contracts import (
     QBITTORRENT_LOGIN_PATH as LOGIN_PATH,
     QBITTORRENT_SET_PREFERENCES_PATH as SET_PREFS_PATH,
 )
+from .conftest import Blocking
 
 CREDENTIALS = {"username": "user", "password": "pass"}
 
@@ -58,18 +66,37 @@ def test_only_reauthentication_is_retried_immediately():
     assert QBittorrentUnreachable().get_retry_immediately() is False
 
 
+@pytest.fixture(name="make_client")
+def make_client_fixture(asynchronous) -> Callable[..., Any]:
+    """Build the client under test, blocking or asyncio alike."""
+
+    def make(
+        url: str = "http://qbittorrent",
+        limiter: HostLimiter | None = None,
+        events: EventBus | None = None,
+    ) -> Any:
+        client_class = AsyncQBittorrentClient if asynchronous else QBittorrentClient
+        return Blocking(
+            client_class(
+                url=url, credentials=CREDENTIALS, limiter=limiter, events=events
+            )
+        )
+
+    return make
+
+
 def _login_ok(_: httpx.Request) -> httpx.Response:
     return httpx.Response(204, headers={"set-cookie": "SID=abc"})
 
 
-def test_set_port_authenticates_then_succeeds(mock_httpx):
+def test_set_port_authenticates_then_succeeds(make_client, mock_httpx):
     def handler(request: httpx.Request) -> httpx.Response:
         if request.url.path == LOGIN_PATH:
             return _login_ok(request)
         return httpx.Response(200)
 
     mock_httpx(handler)
-    client = QBittorrentClient(url="http://qbittorrent", credentials=CREDENTIALS)
+    client = make_client()
 
     # First call: not authenticated yet, so it authenticates first.
     client.set_port(11111)
@@ -79,7 +106,38 @@ def test_set_port_authenticates_then_succeeds(mock_httpx):
     client.set_port(22222)
 
 
-def test_set_port_sends_the_requests_qbittorrent_expects(mock_httpx):
+def test_warm_up_logs_in_once_ahead_of_the_port(make_client, mock_httpx):
+    """Once warm, writing a port is a single round trip."""
+    seen: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.path)
+        if request.url.path == LOGIN_PATH:
+            return _login_ok(request)
+        return httpx.Response(200)
+
+    mock_httpx(handler)
+    client = make_client()
+
+    client.warm_up()
+    client.warm_up()
+    client.set_port(4242)
+
+    assert seen == [LOGIN_PATH, SET_PREFS_PATH]
+
+
+def test_each_login_is_published(make_client, mock_httpx):
+    mock_httpx(_login_ok)
+    events = MagicMock(spec=EventBus)
+    client = make_client(events=events)
+
+    client.warm_up()
+    client.warm_up()
+
+    events.publish.assert_called_once_with(AuthRenewed("qbittorrent"))
+
+
+def test_set_port_sends_the_requests_qbittorrent_expects(make_client, mock_httpx):
     """Both endpoints take form data, and setPreferences wraps its own JSON."""
     seen: list[tuple[str, str, str]] = []
 
@@ -90,7 +148,7 @@ def test_set_port_sends_the_requests_qbittorrent_expects(mock_httpx):
         return httpx.Response(200)
 
     mock_httpx(handler)
-    client = QBittorrentClient(url="http://qbittorrent", credentials=CREDENTIALS)
+    client = make_client()
 
     client.set_port(4242)
 
@@ -105,34 +163,58 @@ def test_set_port_sends_the_requests_qbittorrent_expects(mock_httpx):
     }
 
 
-def test_authenticate_invalid_credentials(mock_httpx):
+def test_set_port_counts_against_qbittorrent_s_host(make_client, mock_httpx):
+    """Both requests hold a slot, and give it back once answered."""
+    limiter = HostLimiter()
+    mock_httpx(_login_ok)
+    client = make_client(url="http://qbittorrent:8080", limiter=limiter)
+
+    client.set_port(4242)
+
+    statistics = limiter.get_statistics()
+    assert list(statistics) == ["qbittorrent:8080"]
+    assert statistics["qbittorrent:8080"].in_flight == 0
+
+
+def test_authenticate_invalid_credentials(make_client, mock_httpx):
     def handler(_: httpx.Request) -> httpx.Response:
         return httpx.Response(QBITTORRENT_INVALID_CREDENTIALS_STATUS)
 
     mock_httpx(handler)
-    client = QBittorrentClient(url="http://qbittorrent", credentials=CREDENTIALS)
+    client = make_client()
     with pytest.raises(QBittorrentInvalidCredentials):
         client.set_port(11111)
 
 
-def test_authenticate_banned(mock_httpx):
+def test_authenticate_banned(make_client, mock_httpx):
     def handler(_: httpx.Request) -> httpx.Response:
         return httpx.Response(
             QBITTORRENT_BANNED_STATUS, text="Your IP address has been banned"
         )
 
     mock_httpx(handler)
-    client = QBittorrentClient(url="http://qbittorrent", credentials=CREDENTIALS)
+    client = make_client()
     with pytest.raises(QBittorrentBanned):
         client.set_port(11111)
 
 
-def test_authenticate_server_error(mock_httpx):
+def test_a_ban_page_is_kept_short_in_the_error(make_client, mock_httpx):
+    """Whatever stands in front of qBittorrent may answer at any length."""
+    page = "Your IP address has been banned. " * 100_000
+    mock_httpx(lambda _: httpx.Response(QBITTORRENT_BANNED_STATUS, text=page))
+
+    with pytest.raises(QBittorrentBanned) as error:
+        make_client().set_port(11111)
+
+    assert len(str(error.value)) < SNIPPET_SIZE * 2
+
+
+def test_authenticate_server_error(make_client, mock_httpx):
     def handler(_: httpx.Request) -> httpx.Response:
         return httpx.Response(500)
 
     mock_httpx(handler)
-    client = QBittorrentClient(url="http://qbittorrent", credentials=CREDENTIALS)
+    client = make_client()
     with pytest.raises(QBittorrentServerError):
         client.set_port(11111)
 
@@ -140,14 +222,14 @@ def test_authenticate_server_error(mock_httpx):
 @pytest.mark.parametrize(
     "status_code", [404, 400, 302], ids=["not_found", "bad_request", "redirect"]
 )
-def test_authenticate_unexpected_response(mock_httpx, status_code):
+def test_authenticate_unexpected_response(make_client, mock_httpx, status_code):
     """A wrong QBITTORRENT_URL answers like this, and no retry will fix it."""
 
     def handler(_: httpx.Request) -> httpx.Response:
         return httpx.Response(status_code, text="nothing to do with qBittorrent")
 
     mock_httpx(handler)
-    client = QBittorrentClient(url="http://qbittorrent", credentials=CREDENTIALS)
+    client = make_client()
     with pytest.raises(QBittorrentUnexpectedResponse):
         client.set_port(11111)
 
@@ -157,31 +239,31 @@ def test_authenticate_unexpected_response(mock_httpx, status_code):
     [httpx.ConnectError, httpx.ReadError, httpx.ReadTimeout, httpx.ConnectTimeout],
     ids=["connect_error", "read_error", "read_timeout", "connect_timeout"],
 )
-def test_authenticate_unreachable(mock_httpx, exception):
+def test_authenticate_unreachable(make_client, mock_httpx, exception):
     def handler(_: httpx.Request) -> httpx.Response:
         raise exception("boom")
 
     mock_httpx(handler)
-    client = QBittorrentClient(url="http://qbittorrent", credentials=CREDENTIALS)
+    client = make_client()
     with pytest.raises(QBittorrentUnreachable):
         client.set_port(11111)
 
 
-def test_set_port_session_expired(mock_httpx):
+def test_set_port_session_expired(make_client, mock_httpx):
     def handler(request: httpx.Request) -> httpx.Response:
         if request.url.path == LOGIN_PATH:
             return _login_ok(request)
         return httpx.Response(QBITTORRENT_EXPIRED_SESSION_STATUS)
 
     mock_httpx(handler)
-    client = QBittorrentClient(url="http://qbittorrent", credentials=CREDENTIALS)
+    client = make_client()
     with pytest.raises(QBittorrentAuthenticationNeeded):
         client.set_port(11111)
     # The expired session must have been reset.
     assert client._get_is_authenticated() is False
 
 
-def test_set_port_server_error(mock_httpx):
+def test_set_port_server_error(make_client, mock_httpx):
     """Authenticating already waits out a 5xx, and so should writing the port."""
 
     def handler(request: httpx.Request) -> httpx.Response:
@@ -190,12 +272,12 @@ def test_set_port_server_error(mock_httpx):
         return httpx.Response(500)
 
     mock_httpx(handler)
-    client = QBittorrentClient(url="http://qbittorrent", credentials=CREDENTIALS)
+    client = make_client()
     with pytest.raises(QBittorrentServerError):
         client.set_port(11111)
 
 
-def test_set_port_unexpected_response(mock_httpx):
+def test_set_port_unexpected_response(make_client, mock_httpx):
     """Authentication went through, so a 404 here is the wrong URL entirely."""
 
     def handler(request: httpx.Request) -> httpx.Response:
@@ -204,7 +286,7 @@ def test_set_port_unexpected_response(mock_httpx):
         return httpx.Response(404)
 
     mock_httpx(handler)
-    client = QBittorrentClient(url="http://qbittorrent", credentials=CREDENTIALS)
+    client = make_client()
     with pytest.raises(QBittorrentUnexpectedResponse):
         client.set_port(11111)
 
@@ -214,13 +296,13 @@ def test_set_port_unexpected_response(mock_httpx):
     [httpx.ConnectError, httpx.ReadError, httpx.ReadTimeout, httpx.ConnectTimeout],
     ids=["connect_error", "read_error", "read_timeout", "connect_timeout"],
 )
-def test_set_port_unreachable(mock_httpx, exception):
+def test_set_port_unreachable(make_client, mock_httpx, exception):
     def handler(request: httpx.Request) -> httpx.Response:
         if request.url.path == LOGIN_PATH:
             return _login_ok(request)
         raise exception("boom")
 
     mock_httpx(handler)
-    client = QBittorrentClient(url="http://qbittorrent", credentials=CREDENTIALS)
+    client = make_client()
     with pytest.raises(QBittorrentUnreachable):
         client.set_port(11111)
@@ -0,0 +1,129 @@
+"""Unit tests for glueforward.main.recorder."""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from glueforward.main.recorder import (
+    REDACTED,
+    AsyncRecordingTransport,
+    FlightRecorder,
+    RecordingTransport,
+)
+from glueforward.main.responses import SNIPPET_SIZE
+
+from .conftest import GLUETUN_API_KEY
+
+HOST = "gluetun:8000"
+LATENCY = 0.25
+
+
+def _stream(content: bytes) -> httpx.Response:
+    """An answer still to be read, as a real transport's is."""
+    return httpx.Response(200, stream=httpx.ByteStream(content))
+
+
+def _get(recorder: FlightRecorder, clock, asynchronous: bool, path: str) -> None:
+    """Ask `path` of a service answering it with its own name, or failing
+    to when the path says so."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        clock.now += LATENCY
+        if request.url.path == "/unreachable":
+            raise httpx.ConnectError("Connection refused")
+        return _stream(request.url.path.encode())
+
+    mock = httpx.MockTransport(handler)
+    url = f"http://{HOST}{path}"
+    if asynchronous:
+        transport = AsyncRecordingTransport(mock, HOST, recorder, clock)
+
+        async def get() -> None:
+            async with httpx.AsyncClient(transport=transport) as client:
+                await client.get(url)
+
+        asyncio.run(get())
+    else:
+        transport = RecordingTransport(mock, HOST, recorder, clock)
+        with httpx.Client(transport=transport) as client:
+            client.get(url)
+
+
+def test_the_last_exchanges_are_kept_in_order(clock, asynchronous):
+    recorder = FlightRecorder(2)
+
+    for path in ("/first", "/second", "/third"):
+        _get(recorder, clock, asynchronous, path)
+
+    exchanges = recorder.get_exchanges()
+    assert [exchange.body for exchange in exchanges] == ["/second", "/third"]
+    assert exchanges[0].endpoint == f"{HOST}/second"
+    assert (exchanges[0].method, exchanges[0].status) == ("GET", 200)
+    assert exchanges[0].latency == LATENCY
+
+
+def test_a_request_that_failed_is_kept_with_its_error(clock, asynchronous):
+    recorder = FlightRecorder(2)
+
+    with pytest.raises(httpx.ConnectError):
+        _get(recorder, clock, asynchronous, "/unreachable")
+
+    (exchange,) = recorder.get_exchanges()
+    assert exchange.status is None
+    assert exchange.error == "ConnectError('Connection refused')"
+    assert exchange.latency == LATENCY
+
+
+def test_only_the_start_of_a_body_is_kept(clock):
+    recorder = FlightRecorder(2)
+    chunks = [b"x" * (SNIPPET_SIZE // 2)] * 3
+    mock = httpx.MockTransport(lambda _: httpx.Response(200, content=iter(chunks)))
+
+    transport = RecordingTransport(mock, HOST, recorder, clock)
+    with httpx.Client(transport=transport) as client:
+        client.get(f"http://{HOST}/")
+        # Closed before being read: kept, without a body.
+        with client.stream("GET", f"http://{HOST}/"):
+            pass
+
+    read, unread = recorder.get_exchanges()
+    assert read.body == "x" * SNIPPET_SIZE
+    assert not unread.body
+
+
+def test_secrets_are_redacted_wherever_they_show(clock):
+    recorder = FlightRecorder(2, [GLUETUN_API_KEY, None])
+
+    _get(recorder, clock, False, f"/{GLUETUN_API_KEY}")
+    with pytest.raises(httpx.ConnectError):
+        _get(recorder, clock, False, "/unreachable")
+
+    dump = recorder.dump()
+    assert GLUETUN_API_KEY not in dump
+    assert recorder.get_exchanges()[0].body == f"/{REDACTED}"
+
+
+def test_exchanges_are_dumped_a_line_each(clock):
+    recorder = FlightRecorder(2)
+    assert recorder.dump() == "No exchange recorded"
+
+    _get(recorder, clock, False, "/v1/portforward")
+    with pytest.raises(httpx.ConnectError):
+        _get(recorder, clock, False, "/unreachable")
+
+    answered, failed = recorder.dump().splitlines()
+    assert answered.endswith(f"GET {HOST}/v1/portforward 200 0.250s '/v1/portforward'")
+    assert failed.endswith("- 0.250s ConnectError('Connection refused')")
+
+
+def test_exchanges_are_served_as_json(clock):
+    recorder = FlightRecorder(1)
+    _get(recorder, clock, False, "/v1/portforward")
+
+    reply = recorder.serve({})
+
+    (exchange,) = json.loads(reply.body)["exchanges"]
+    assert exchange["endpoint"] == f"{HOST}/v1/portforward"
+    assert exchange["status"] == 200
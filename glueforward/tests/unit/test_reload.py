@@ -0,0 +1,172 @@
+"""Unit tests for glueforward.main.reload."""
+
+import os
+from unittest.mock import MagicMock
+
+import pytest
+
+from glueforward.main.clock import SystemClock
+from glueforward.main.config import get_configuration
+from glueforward.main.deadline import TickDeadline
+from glueforward.main.health import DEFAULT_STALE_INTERVALS, Health
+from glueforward.main.recorder import FlightRecorder
+from glueforward.main.reload import ConfigReloader, ConfigWatcher
+
+from .conftest import GLUETUN_API_KEY
+
+pytestmark = pytest.mark.usefixtures("valid_environment")
+
+
+@pytest.fixture(name="config_file")
+def config_file_fixture(monkeypatch, tmp_path):
+    path = tmp_path / "glueforward.toml"
+    path.write_text("RETRY_INTERVAL = 10\n")
+    monkeypatch.setenv("CONFIG_FILE", str(path))
+    return path
+
+
+def _rewrite(path, content: str) -> None:
+    """Change the file, its time of change moved on in case the clock did not."""
+    stat = path.stat()
+    path.write_text(content)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+
+def test_a_file_left_as_it_was_is_not_read_again(config_file):
+    watcher = ConfigWatcher(str(config_file), get_configuration())
+
+    assert watcher.poll() is None
+
+
+def test_a_change_is_answered_once(config_file):
+    config = get_configuration()
+    watcher = ConfigWatcher(str(config_file), config)
+
+    _rewrite(config_file, "RETRY_INTERVAL = 20\n")
+
+    assert watcher.poll() == (config, get_configuration())
+    assert watcher.poll() is None
+
+
+def test_a_change_that_only_applies_on_restarting_is_told(config_file, caplog):
+    config = get_configuration()
+    watcher = ConfigWatcher(str(config_file), config)
+
+    _rewrite(config_file, 'RETRY_INTERVAL = 10\nRUNTIME = "asyncio"\n')
+
+    assert watcher.poll() is None
+    assert "Changes to runtime only apply on restarting" in caplog.text
+
+
+def test_an_invalid_change_keeps_the_configuration_as_it_was(config_file, caplog):
+    config = get_configuration()
+    watcher = ConfigWatcher(str(config_file), config)
+
+    _rewrite(config_file, 'RETRY_INTERVAL = "soon"\n')
+    assert watcher.poll() is None
+    config_file.unlink()
+    assert watcher.poll() is None
+
+    assert caplog.text.count("Kept the configuration as it was") == 2
+
+
+def test_credentials_changed_are_redacted_too(config_file):
+    recorder = MagicMock(spec=FlightRecorder)
+    watcher = ConfigWatcher(str(config_file), get_configuration(), recorder)
+
+    _rewrite(config_file, 'QBITTORRENT_PASSWORD = "rotated"\n')
+    watcher.poll()
+
+    recorder.add_secrets.assert_called_once_with(GLUETUN_API_KEY, "rotated")
+
+
+def _make_side() -> tuple[MagicMock, MagicMock]:
+    return MagicMock(), MagicMock()
+
+
+def _make_reloader(path) -> tuple[ConfigReloader, MagicMock, MagicMock]:
+    build_forwarder = MagicMock(return_value=_make_side())
+    build_service = MagicMock(return_value=_make_side())
+    reloader = ConfigReloader(
+        ConfigWatcher(str(path), get_configuration()),
+        build_forwarder,
+        build_service,
+        lambda config: TickDeadline(config.tick_deadline, SystemClock()),
+        forwarder=_make_side(),
+        service=_make_side(),
+    )
+    return reloader, build_forwarder, build_service
+
+
+def test_only_the_side_whose_settings_changed_is_rebuilt(config_file, caplog):
+    caplog.set_level("INFO")
+    reloader, build_forwarder, build_service = _make_reloader(config_file)
+
+    _rewrite(config_file, 'RETRY_INTERVAL = 20\nQBITTORRENT_PASSWORD = "rotated"\n')
+    reconfiguration = reloader.reload()
+
+    assert reconfiguration is not None
+    assert reconfiguration.retry_interval == 20
+    assert reconfiguration.tick_deadline is not None
+    assert reconfiguration.tick_deadline.get_duration() == 60
+    assert reconfiguration.forwarder is None
+    assert reconfiguration.service is build_service.return_value[0]
+    build_forwarder.assert_not_called()
+    assert build_service.call_args.args[0].service.password == "rotated"
+    assert "with new service, retry_interval" in caplog.text
+
+
+def test_gluetun_s_side_is_rebuilt_on_its_own(config_file):
+    reloader, build_forwarder, build_service = _make_reloader(config_file)
+
+    _rewrite(config_file, 'RETRY_INTERVAL = 10\nGLUETUN_TIMEOUT = 2\n')
+    reconfiguration = reloader.reload()
+
+    assert reconfiguration is not None
+    assert reconfiguration.forwarder is build_forwarder.return_value[0]
+    assert reconfiguration.service is None
+    build_service.assert_not_called()
+    assert reloader.reload() is None
+
+
+def test_the_client_of_a_side_replaced_is_retired_once(config_file):
+    forwarder = _make_side()
+    reloader = ConfigReloader(
+        ConfigWatcher(str(config_file), get_configuration()),
+        MagicMock(side_effect=lambda config: _make_side()),
+        MagicMock(),
+        lambda config: None,
+        forwarder=forwarder,
+        service=_make_side(),
+    )
+
+    _rewrite(config_file, 'RETRY_INTERVAL = 10\nGLUETUN_TIMEOUT = 2\n')
+    first = reloader.reload()
+    _rewrite(config_file, 'RETRY_INTERVAL = 10\nGLUETUN_TIMEOUT = 3\n')
+    second = reloader.reload()
+
+    assert first is not None and second is not None
+    assert first.retired == (forwarder[1],)
+    assert len(second.retired) == 1
+    assert second.retired[0] is not forwarder[1]
+
+
+def test_the_health_window_follows_the_success_interval(config_file):
+    health = MagicMock(spec=Health)
+    reloader = ConfigReloader(
+        ConfigWatcher(str(config_file), get_configuration()),
+        MagicMock(),
+        MagicMock(),
+        lambda config: None,
+        forwarder=_make_side(),
+        service=_make_side(),
+        health=health,
+    )
+
+    _rewrite(config_file, "RETRY_INTERVAL = 20\n")
+    reloader.reload()
+    health.set_stale_after.assert_not_called()
+    _rewrite(config_file, "RETRY_INTERVAL = 20\nSUCCESS_INTERVAL = 60\n")
+    reloader.reload()
+
+    health.set_stale_after.assert_called_once_with(60 * DEFAULT_STALE_INTERVALS)
@@ -0,0 +1,277 @@
+"""Unit tests for glueforward.main.resolver.
+
+Lookups are answered by a fake DNS standing in for getaddrinfo, which the
+test can make fail, or stall until released.
+"""
+
+# pytest resolves fixtures by parameter name, so the shadowing is deliberate.
+# pylint: disable=redefined-outer-name
+
+import asyncio
+import http.server
+import logging
+import socket
+import threading
+import time
+from collections.abc import Iterator
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock
+
+import httpcore
+import httpx
+import pytest
+
+from glueforward.main.resolver import (
+    AsyncResolvingBackend,
+    ResolutionStatistics,
+    Resolver,
+    ResolvingBackend,
+)
+from glueforward.main.transport import Connections, ConnectionSettings
+
+# Long enough for a test to tell a stalled lookup from an answered one.
+STALE_TIMEOUT = 0.05
+
+
+class FakeDNS:
+    """Answers getaddrinfo from `addresses`, counting what it was asked.
+
+    Addresses are left to the real getaddrinfo, since connecting to one
+    goes through it too.
+    """
+
+    def __init__(self) -> None:
+        self._getaddrinfo = socket.getaddrinfo
+        self.addresses: dict[str, str] = {"gluetun": "10.0.0.2"}
+        self.asked: list[str] = []
+        self.error: BaseException | None = None
+        # Cleared to have lookups wait until it is set again.
+        self.answering = threading.Event()
+        self.answering.set()
+
+    def getaddrinfo(self, host: str, *args: Any, **kwargs: Any) -> list[Any]:
+        if host[0].isdigit():
+            return self._getaddrinfo(host, *args, **kwargs)
+        self.asked.append(host)
+        self.answering.wait()
+        if self.error is not None:
+            raise self.error
+        address = self.addresses[host]
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, 0))]
+
+
+@pytest.fixture
+def dns(monkeypatch) -> Iterator[FakeDNS]:
+    fake = FakeDNS()
+    monkeypatch.setattr(socket, "getaddrinfo", fake.getaddrinfo)
+    yield fake
+    # No lookup is left waiting on a test that is over.
+    fake.answering.set()
+
+
+@pytest.fixture
+def resolver(clock) -> Resolver:
+    return Resolver(ttl=60, stale_timeout=STALE_TIMEOUT, clock=clock)
+
+
+def _wait_for_lookups(resolver: Resolver, count: int) -> None:
+    deadline = time.monotonic() + 5
+    while resolver.get_statistics()["gluetun"].lookups < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def _resolve(resolver: Resolver, asynchronous: bool, host: str = "gluetun") -> str:
+    if asynchronous:
+        return asyncio.run(resolver.resolve_async(host))
+    return resolver.resolve(host)
+
+
+def test_an_address_is_kept_until_it_expires(dns, resolver, clock, asynchronous):
+    assert _resolve(resolver, asynchronous) == "10.0.0.2"
+    clock.now = 59
+    assert _resolve(resolver, asynchronous) == "10.0.0.2"
+    assert dns.asked == ["gluetun"]
+
+    dns.addresses["gluetun"] = "10.0.0.3"
+    clock.now = 60
+    assert _resolve(resolver, asynchronous) == "10.0.0.3"
+    assert dns.asked == ["gluetun", "gluetun"]
+
+
+def test_an_address_is_not_looked_up(dns, resolver, asynchronous):
+    assert _resolve(resolver, asynchronous, "172.17.0.2") == "172.17.0.2"
+    assert not dns.asked
+
+
+def test_an_expired_address_is_used_when_the_lookup_fails(
+    dns, resolver, clock, caplog, asynchronous
+):
+    _resolve(resolver, asynchronous)
+    dns.error = socket.gaierror("Temporary failure in name resolution")
+    clock.now = 60
+
+    assert _resolve(resolver, asynchronous) == "10.0.0.2"
+    assert "Could not resolve gluetun in time" in caplog.text
+
+
+def test_an_expired_address_is_used_while_the_lookup_stalls(
+    dns, resolver, clock, asynchronous
+):
+    _resolve(resolver, asynchronous)
+    dns.addresses["gluetun"] = "10.0.0.3"
+    dns.answering.clear()
+    clock.now = 60
+
+    assert _resolve(resolver, asynchronous) == "10.0.0.2"
+    assert _resolve(resolver, asynchronous) == "10.0.0.2"
+    # The stalled lookup is shared, not started again by each caller.
+    assert dns.asked == ["gluetun", "gluetun"]
+
+    dns.answering.set()
+    _wait_for_lookups(resolver, 2)
+    assert _resolve(resolver, asynchronous) == "10.0.0.3"
+
+
+def test_a_host_never_resolved_fails_to_connect(dns, resolver, asynchronous):
+    dns.error = socket.gaierror("Name or service not known")
+
+    with pytest.raises(httpcore.ConnectError, match="gluetun"):
+        _resolve(resolver, asynchronous)
+
+
+def test_a_name_that_cannot_be_encoded_fails_like_any_other(
+    dns, resolver, asynchronous
+):
+    dns.error = UnicodeError("label too long")
+
+    with pytest.raises(httpcore.ConnectError, match="label too long"):
+        _resolve(resolver, asynchronous)
+
+    # The failed lookup is not left in place for every caller after to share.
+    dns.error = None
+    assert _resolve(resolver, asynchronous) == "10.0.0.2"
+    assert resolver.get_statistics()["gluetun"].failures == 1
+
+
+def test_an_interrupted_lookup_is_not_shared_with_the_next_caller(dns, resolver):
+    dns.error = KeyboardInterrupt()
+    with pytest.raises(KeyboardInterrupt):
+        resolver.resolve("gluetun")
+
+    dns.error = None
+    assert resolver.resolve("gluetun") == "10.0.0.2"
+
+
+def test_an_expired_address_is_looked_up_again_first(dns, resolver):
+    resolver.resolve("gluetun")
+    dns.addresses["gluetun"] = "10.0.0.3"
+
+    resolver.expire("gluetun")
+    resolver.expire("qbittorrent")
+
+    assert resolver.resolve("gluetun") == "10.0.0.3"
+
+
+def test_lookups_are_counted_and_timed(dns, resolver, clock):
+    resolver.resolve("gluetun")
+    resolver.resolve("gluetun")
+    dns.error = socket.gaierror("Name or service not known")
+    clock.now = 60
+    resolver.resolve("gluetun")
+
+    assert resolver.get_statistics() == {
+        "gluetun": ResolutionStatistics(
+            lookups=2,
+            failures=1,
+            cached_answers=1,
+            stale_answers=1,
+            lookup_seconds=0.0,
+        )
+    }
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        self.send_response(204)
+        self.end_headers()
+
+    # pylint: disable-next=redefined-builtin
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+@pytest.fixture(scope="module")
+def port() -> Iterator[int]:
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def _get(connections: Connections, url: str, asynchronous: bool) -> int:
+    if asynchronous:
+
+        async def get() -> int:
+            return (await connections.open_async_client(url).get("/")).status_code
+
+        return asyncio.run(get())
+    return connections.open_client(url).get("/").status_code
+
+
+def test_connections_resolve_through_the_cache(dns, port, asynchronous):
+    dns.addresses["gluetun"] = "127.0.0.1"
+    connections = Connections(ConnectionSettings(keepalive_expiry=0))
+
+    assert _get(connections, f"http://gluetun:{port}", asynchronous) == 204
+    assert _get(connections, f"http://gluetun:{port}", asynchronous) == 204
+
+    statistics = connections.get_resolution_statistics()["gluetun"]
+    assert (statistics.lookups, statistics.cached_answers) == (1, 1)
+
+
+def test_a_host_that_moved_is_found_at_its_new_address(
+    dns, port, caplog, asynchronous
+):
+    """Nothing listens on 127.0.0.2, the address the container had before."""
+    dns.addresses["gluetun"] = "127.0.0.2"
+    connections = Connections(ConnectionSettings(keepalive_expiry=0))
+    # Looked up again, the address is the same: the failure stands.
+    with pytest.raises(httpx.ConnectError):
+        _get(connections, f"http://gluetun:{port}", asynchronous)
+
+    dns.addresses["gluetun"] = "127.0.0.1"
+    with caplog.at_level(logging.INFO):
+        assert _get(connections, f"http://gluetun:{port}", asynchronous) == 204
+
+    assert "gluetun moved from 127.0.0.2 to 127.0.0.1" in caplog.text
+    assert connections.get_resolution_statistics()["gluetun"].lookups == 3
+
+
+def test_a_lookup_is_a_span_of_the_request(dns, port, traces, asynchronous):
+    dns.addresses["gluetun"] = "127.0.0.1"
+    connections = Connections(ConnectionSettings(keepalive_expiry=0))
+
+    _get(connections, f"http://gluetun:{port}", asynchronous)
+
+    resolve = next(ended for ended in traces() if ended.name == "dns.resolve")
+    assert resolve.attributes == {"host": "gluetun"}
+
+
+def test_without_a_cache_nothing_is_counted(port, asynchronous):
+    connections = Connections(ConnectionSettings(dns_cache_ttl=0))
+
+    assert _get(connections, f"http://127.0.0.1:{port}", asynchronous) == 204
+    assert not connections.get_resolution_statistics()
+
+
+def test_the_backends_pass_waiting_through(resolver):
+    """httpcore only waits between retries, which httpx never asks for."""
+    backend, async_backend = MagicMock(), AsyncMock()
+
+    ResolvingBackend(resolver, backend).sleep(1)
+    asyncio.run(AsyncResolvingBackend(resolver, async_backend).sleep(1))
+
+    backend.sleep.assert_called_once_with(1)
+    async_backend.sleep.assert_awaited_once_with(1)
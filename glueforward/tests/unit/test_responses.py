@@ -0,0 +1,71 @@
+"""Unit tests for glueforward.main.responses."""
+
+import asyncio
+
+import httpx
+import pytest
+
+from glueforward.main.responses import (
+    MAX_BODY_SIZE,
+    SNIPPET_SIZE,
+    Body,
+    read_body,
+    read_body_async,
+)
+
+
+class _Chunks(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """A body arriving in chunks, as it would over the network."""
+
+    def __init__(self, *chunks: bytes) -> None:
+        self._chunks = chunks
+        self.read = 0
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            self.read += 1
+            yield chunk
+
+    async def __aiter__(self):
+        for chunk in self:
+            yield chunk
+
+
+def _read(stream: _Chunks, asynchronous: bool, limit: int) -> Body:
+    response = httpx.Response(200, stream=stream)
+    if asynchronous:
+        return asyncio.run(read_body_async(response, limit))
+    return read_body(response, limit)
+
+
+def test_a_small_body_is_read_whole(asynchronous):
+    stream = _Chunks(b'{"port": ', b"51413}")
+
+    body = _read(stream, asynchronous, limit=100)
+
+    assert body == Body(b'{"port": 51413}')
+    assert body.get_json() == {"port": 51413}
+
+
+def test_a_large_body_is_read_no_further_than_the_limit(asynchronous):
+    stream = _Chunks(b"a" * 6, b"b" * 6, b"c" * 6)
+
+    body = _read(stream, asynchronous, limit=10)
+
+    assert body == Body(b"a" * 6 + b"b" * 4, is_truncated=True)
+    assert stream.read == 2
+
+
+def test_a_truncated_body_is_never_parsed():
+    """What is left of it could still happen to be valid JSON."""
+    with pytest.raises(ValueError, match=str(MAX_BODY_SIZE)):
+        Body(b"[1, 2]", is_truncated=True).get_json()
+
+
+def test_a_snippet_is_short_and_always_text():
+    body = Body(b"\xff" + b"x" * MAX_BODY_SIZE)
+
+    snippet = body.get_snippet()
+
+    assert snippet.startswith("�")
+    assert len(snippet) == SNIPPET_SIZE
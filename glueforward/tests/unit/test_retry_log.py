@@ -0,0 +1,80 @@
+"""Unit tests for glueforward.main.retry_log."""
+
+import logging
+
+import pytest
+
+from glueforward.main.gluetun import GluetunServerError
+from glueforward.main.port_synchronizer import NoForwardedPortYet
+from glueforward.main.retry_log import RetryLog
+
+SUMMARY_INTERVAL = 100
+
+
+@pytest.fixture(name="log")
+def log_fixture(clock) -> RetryLog:
+    return RetryLog(clock, SUMMARY_INTERVAL)
+
+
+def _get_lines(caplog: pytest.LogCaptureFixture) -> list[tuple[str, bool]]:
+    """Every line logged, and whether it came with a traceback."""
+    return [
+        (record.getMessage(), record.exc_info is not None) for record in caplog.records
+    ]
+
+
+def test_the_same_error_again_is_only_counted(log, clock, caplog):
+    assert log.error(NoForwardedPortYet())
+    for _ in range(3):
+        clock.now += 10
+        assert not log.error(NoForwardedPortYet())
+
+    assert _get_lines(caplog) == [("Retryable error in lifecycle", True)]
+
+
+def test_a_run_of_errors_is_summed_up_once_it_ends(log, clock, caplog):
+    log.error(NoForwardedPortYet())
+    for _ in range(3):
+        clock.now += 10
+        log.error(NoForwardedPortYet())
+    log.success()
+    log.error(NoForwardedPortYet())
+
+    assert _get_lines(caplog) == [
+        ("Retryable error in lifecycle", True),
+        ("Last error repeated 3 times in 30 seconds", False),
+        # After a success, the same error starts a run of its own.
+        ("Retryable error in lifecycle", True),
+    ]
+
+
+def test_a_long_run_of_errors_is_summed_up_every_interval(log, clock, caplog):
+    log.error(NoForwardedPortYet())
+    for _ in range(25):
+        clock.now += 10
+        log.error(NoForwardedPortYet())
+
+    assert [line for line, _ in _get_lines(caplog)[1:]] == [
+        "Last error repeated 10 times in 100 seconds",
+        "Last error repeated 10 times in 100 seconds",
+    ]
+
+
+def test_another_error_is_logged_whole_only_when_of_another_type(log, caplog):
+    unavailable = GluetunServerError("503")
+    log.error(GluetunServerError("502"))
+    log.error(unavailable)
+    log.error(NoForwardedPortYet())
+
+    assert _get_lines(caplog) == [
+        ("Retryable error in lifecycle", True),
+        (f"Retryable error in lifecycle: {unavailable!r}", False),
+        ("Retryable error in lifecycle", True),
+    ]
+    assert all(record.levelno == logging.ERROR for record in caplog.records)
+
+
+def test_a_success_without_errors_logs_nothing(log, caplog):
+    log.success()
+
+    assert not caplog.records
@@ -0,0 +1,218 @@
+"""Unit tests for glueforward.main.scheduler."""
+
+import logging
+import random
+
+import pytest
+
+from glueforward.main.scheduler import LAG_WARNING_INTERVAL, Scheduler
+
+from .conftest import EndOfTest
+
+RESOLUTION = 1.0
+SLOT_COUNT = 8
+
+
+def _make_scheduler(clock) -> Scheduler:
+    """A small wheel, so that a test goes around it in a handful of ticks."""
+    return Scheduler(
+        clock, resolution=RESOLUTION, slot_count=SLOT_COUNT, rng=random.Random(0)
+    )
+
+
+def _record(ran: list[tuple[str, float]], clock, name: str, then=None):
+    """A job noting when it ran, which then waits `then` or stops."""
+
+    def job() -> float | None:
+        ran.append((name, clock.now))
+        return then
+
+    return job
+
+
+def test_jobs_run_in_deadline_order(clock):
+    scheduler = _make_scheduler(clock)
+    ran: list[tuple[str, float]] = []
+    scheduler.schedule(_record(ran, clock, "late"), delay=5)
+    scheduler.schedule(_record(ran, clock, "early"), delay=2)
+    scheduler.schedule(_record(ran, clock, "now"))
+
+    scheduler.run()
+
+    assert ran == [("now", 0.0), ("early", 2.0), ("late", 5.0)]
+
+
+def test_jobs_sharing_a_slot_run_in_deadline_order(clock):
+    """A slot spans a whole resolution, which is not the precision we wait to."""
+    scheduler = _make_scheduler(clock)
+    ran: list[tuple[str, float]] = []
+    scheduler.schedule(_record(ran, clock, "second"), delay=2.75)
+    scheduler.schedule(_record(ran, clock, "first"), delay=2.25)
+
+    scheduler.run()
+
+    assert ran == [("first", 2.25), ("second", 2.75)]
+
+
+def test_the_clock_waits_straight_for_the_next_deadline(clock):
+    """Sleeping slot by slot would cost a wake-up per resolution for nothing."""
+    scheduler = _make_scheduler(clock)
+    scheduler.schedule(lambda: None, delay=3)
+
+    scheduler.run()
+
+    assert clock.slept == [3]
+
+
+def test_a_job_runs_again_after_the_delay_it_answers(clock):
+    scheduler = _make_scheduler(clock)
+    delays = iter([4, 2, None])
+    ran: list[float] = []
+
+    def job() -> float | None:
+        ran.append(clock.now)
+        return next(delays)
+
+    scheduler.schedule(job)
+    scheduler.run()
+
+    assert ran == [0, 4, 6]
+    assert scheduler.get_pending_count() == 0
+
+
+def test_a_job_further_than_a_revolution_is_not_run_early(clock):
+    """It shares a slot with nearer jobs, until its own revolution comes."""
+    scheduler = _make_scheduler(clock)
+    ran: list[tuple[str, float]] = []
+    far = SLOT_COUNT * RESOLUTION * 3 + 1
+    scheduler.schedule(_record(ran, clock, "far"), delay=far)
+    scheduler.schedule(_record(ran, clock, "near"), delay=1)
+
+    scheduler.run()
+
+    assert ran == [("near", 1.0), ("far", far)]
+
+
+def test_a_cancelled_job_never_runs(clock):
+    scheduler = _make_scheduler(clock)
+    ran: list[tuple[str, float]] = []
+    timer = scheduler.schedule(_record(ran, clock, "cancelled"), delay=1)
+    scheduler.schedule(_record(ran, clock, "kept"), delay=2)
+
+    scheduler.cancel(timer)
+    scheduler.run()
+
+    assert ran == [("kept", 2.0)]
+
+
+def test_cancelling_twice_is_harmless(clock):
+    scheduler = _make_scheduler(clock)
+    timer = scheduler.schedule(lambda: None, delay=1)
+
+    scheduler.cancel(timer)
+    scheduler.cancel(timer)
+
+    assert scheduler.get_pending_count() == 0
+
+
+def test_a_job_cancelled_while_running_is_not_run_again(clock):
+    scheduler = _make_scheduler(clock)
+    ran: list[float] = []
+
+    def job() -> float:
+        ran.append(clock.now)
+        scheduler.cancel(timer)
+        return 1
+
+    timer = scheduler.schedule(job)
+    scheduler.run()
+
+    assert ran == [0]
+
+
+def test_spread_jobs_start_apart(clock):
+    """Thousands of jobs sharing an interval must not all come due at once."""
+    scheduler = _make_scheduler(clock)
+    interval = 60
+    ran: list[tuple[str, float]] = []
+    for index in range(20):
+        scheduler.schedule(_record(ran, clock, str(index)), spread=interval)
+
+    scheduler.run()
+
+    starts = [start for _, start in ran]
+    assert all(0 <= start < interval for start in starts)
+    assert len(set(starts)) == len(starts)
+
+
+def test_the_lag_behind_a_deadline_is_reported(clock, caplog):
+    """A job overrunning delays every one after it, which is worth knowing."""
+    scheduler = _make_scheduler(clock)
+
+    def slow() -> None:
+        clock.now += 10
+
+    scheduler.schedule(slow)
+    scheduler.schedule(lambda: None, delay=2)
+
+    scheduler.run()
+
+    assert scheduler.get_lag() == 8
+    assert "late" in caplog.text
+
+
+def test_running_late_is_warned_of_once_an_hour_at_most(clock, caplog):
+    """A job stalling on every run would otherwise have every run warn."""
+    scheduler = _make_scheduler(clock)
+    overruns = iter([10, 10, 10, LAG_WARNING_INTERVAL])
+
+    def stall() -> float | None:
+        clock.now += next(overruns)
+        return 1 if clock.now < LAG_WARNING_INTERVAL else None
+
+    watches = iter(range(3, -1, -1))
+
+    def watch() -> float | None:
+        return 1 if next(watches) else None
+
+    scheduler.schedule(stall)
+    scheduler.schedule(watch, delay=1)
+
+    scheduler.run()
+
+    warnings = [record for record in caplog.records if "late" in record.message]
+    assert len(warnings) == 2
+
+
+def test_no_lag_is_reported_on_time(clock, caplog):
+    caplog.set_level(logging.WARNING)
+    scheduler = _make_scheduler(clock)
+    scheduler.schedule(lambda: None, delay=2)
+
+    scheduler.run()
+
+    assert scheduler.get_lag() == 0
+    assert not caplog.text
+
+
+def test_what_a_job_raises_is_left_to_the_caller(clock):
+    scheduler = _make_scheduler(clock)
+
+    def job() -> None:
+        raise EndOfTest()
+
+    scheduler.schedule(job)
+
+    with pytest.raises(EndOfTest):
+        scheduler.run()
+
+
+def test_thousands_of_jobs_cost_one_slot_each(clock):
+    """Scheduling and cancelling never walk the other jobs pending."""
+    scheduler = Scheduler(clock)
+    timers = [scheduler.schedule(lambda: None, delay=index) for index in range(5000)]
+
+    for timer in timers[::2]:
+        scheduler.cancel(timer)
+
+    assert scheduler.get_pending_count() == 2500
@@ -0,0 +1,77 @@
+"""Unit tests for glueforward.main.server."""
+
+# pytest resolves fixtures by parameter name, so the shadowing is deliberate.
+# pylint: disable=redefined-outer-name
+
+import logging
+import threading
+from collections.abc import Iterator
+
+import httpx
+import pytest
+
+from glueforward.main.server import LocalServer, Reply
+
+
+@pytest.fixture(scope="module")
+def server() -> Iterator[LocalServer]:
+    """Shared, since shutting one down waits out its polling interval."""
+    server = LocalServer(("127.0.0.1", 0))
+    server.start()
+    yield server
+    server.close()
+
+
+def _get(server: LocalServer, path: str) -> httpx.Response:
+    host, port = server.get_address()
+    return httpx.get(f"http://{host}:{port}{path}")
+
+
+def test_a_route_answers_with_its_reply(server):
+    server.add_route("/hello", lambda _: Reply(200, b"hi", "text/plain"))
+
+    response = _get(server, "/hello")
+
+    assert response.status_code == 200
+    assert response.text == "hi"
+    assert response.headers["content-type"] == "text/plain"
+
+
+def test_a_route_is_given_the_query_parameters(server):
+    seen: list[dict[str, str]] = []
+    server.add_route("/seen", lambda query: seen.append(query) or Reply(204))
+
+    _get(server, "/seen?differs_from=1&timeout=2")
+
+    assert seen == [{"differs_from": "1", "timeout": "2"}]
+
+
+def test_an_unknown_path_is_not_found(server):
+    assert _get(server, "/nothing-here").status_code == 404
+
+
+def test_a_blocked_route_holds_up_no_other(server):
+    """A long poll waiting on a change must not stall everyone else."""
+    release = threading.Event()
+    server.add_route("/blocked", lambda _: Reply(200) if release.wait(5) else Reply(500))
+    server.add_route("/free", lambda _: Reply(200))
+    blocked = threading.Thread(target=_get, args=(server, "/blocked"))
+    blocked.start()
+
+    try:
+        assert _get(server, "/free").status_code == 200
+    finally:
+        release.set()
+        blocked.join()
+
+
+def test_requests_are_logged_at_debug_level_only(server, caplog):
+    """Consumers poll it constantly, which would drown every line worth reading."""
+    caplog.set_level(logging.DEBUG)
+    server.add_route("/hello", lambda _: Reply(200))
+
+    _get(server, "/hello")
+
+    records = [record for record in caplog.records if "Local server" in record.message]
+    assert records
+    assert all(record.levelno == logging.DEBUG for record in records)
@@ -0,0 +1,59 @@
+"""Unit tests for glueforward.main.timeouts."""
+
+import pytest
+
+from glueforward.main.timeouts import AdaptiveTimeouts, LatencyStatistics
+
+ENDPOINT = "gluetun:8000/v1/portforward"
+
+
+def _observe(timeouts: AdaptiveTimeouts, *latencies: float) -> None:
+    for latency in latencies:
+        timeouts.observe(ENDPOINT, latency)
+
+
+def test_the_default_stands_until_enough_is_known():
+    timeouts = AdaptiveTimeouts()
+    _observe(timeouts, *[0.002] * 19)
+
+    assert timeouts.get_timeout(ENDPOINT, 5) == 5
+
+
+@pytest.mark.parametrize(
+    "latency, timeout",
+    [(0.002, 1), (0.5, 2), (30, 60)],
+    ids=["floor", "multiple", "ceiling"],
+)
+def test_the_timeout_is_a_multiple_of_the_p99_within_bounds(latency, timeout):
+    timeouts = AdaptiveTimeouts(multiplier=4, floor=1, ceiling=60)
+    _observe(timeouts, *[latency] * 20)
+
+    assert timeouts.get_timeout(ENDPOINT, 5) == timeout
+
+
+def test_the_p99_is_that_of_the_latest_requests():
+    """A service that was slow once is not held against it forever."""
+    timeouts = AdaptiveTimeouts(multiplier=1, floor=0, ceiling=60)
+    _observe(timeouts, 10, 10, *[0.5] * 98)
+    assert timeouts.get_timeout(ENDPOINT, 5) == 10
+
+    # One slow request in the latest hundred is below their p99.
+    _observe(timeouts, 0.5)
+
+    assert timeouts.get_timeout(ENDPOINT, 5) == 0.5
+
+
+def test_endpoints_are_followed_apart():
+    timeouts = AdaptiveTimeouts(multiplier=1, floor=0, ceiling=60)
+    _observe(timeouts, *[0.5] * 20)
+
+    assert timeouts.get_timeout("qbittorrent/api/v2/auth/login", 5) == 5
+
+
+def test_latencies_are_summed_up_as_percentiles():
+    timeouts = AdaptiveTimeouts()
+    _observe(timeouts, *range(1, 101))
+
+    assert timeouts.get_statistics() == {
+        ENDPOINT: LatencyStatistics(samples=100, p50=50, p99=99)
+    }
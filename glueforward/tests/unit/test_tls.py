@@ -0,0 +1,52 @@
+"""Unit tests for glueforward.main.tls.
+
+Resuming sessions and checking pins against a real server is tested along
+with the connections, in test_transport.
+"""
+
+import ssl
+from unittest.mock import MagicMock
+
+from glueforward.main.tls import ResumingContext, TlsSettings, create_ssl_context
+
+
+def _wrap(
+    context: ssl.SSLContext, server_hostname: str | bytes | None = None
+) -> ssl.SSLObject:
+    return context.wrap_bio(
+        ssl.MemoryBIO(), ssl.MemoryBIO(), server_hostname=server_hostname
+    )
+
+
+def test_a_context_is_a_client_one_verifying_by_default():
+    context = create_ssl_context(TlsSettings())
+
+    assert isinstance(context, ResumingContext)
+    assert context.verify_mode == ssl.CERT_REQUIRED
+    assert context.check_hostname
+
+
+def test_a_pin_alone_skips_the_usual_verification():
+    """A self-signed certificate could never pass it."""
+    context = create_ssl_context(TlsSettings(pinned_sha256="ab" * 32))
+
+    assert context.verify_mode == ssl.CERT_NONE
+    assert not context.check_hostname
+
+
+def test_no_session_is_resumed_for_a_host_never_met():
+    context = create_ssl_context(TlsSettings())
+
+    assert _wrap(context, server_hostname="gluetun").session is None
+
+
+def test_the_session_kept_is_looked_up_by_hostname_bytes_too(monkeypatch):
+    """asyncio hands the hostname over as bytes."""
+    context = create_ssl_context(TlsSettings())
+    sessions = MagicMock(get=MagicMock(return_value=None))
+    monkeypatch.setattr(context, "_sessions", sessions)
+
+    _wrap(context, server_hostname=b"gluetun")
+    _wrap(context)
+
+    sessions.get.assert_called_once_with("gluetun")
@@ -0,0 +1,125 @@
+"""Unit tests for glueforward.main.trace_exporters."""
+
+# pytest resolves fixtures by parameter name, so the shadowing is deliberate.
+# pylint: disable=redefined-outer-name
+
+import http.server
+import json
+import threading
+from collections.abc import Iterator
+from typing import Any
+
+import httpx
+import pytest
+
+from glueforward.main.trace_exporters import (
+    SERVICE_NAME,
+    FileExporter,
+    OtlpExporter,
+    get_otlp_payload,
+)
+from glueforward.main.tracing import Span
+
+TRACE_ID = "0af7651916cd43dd8448eb211c80319c"
+
+
+def _get_span(name: str = "tick", **kwargs: Any) -> Span:
+    return Span(
+        name=name,
+        trace_id=TRACE_ID,
+        span_id="b7ad6b7169203331",
+        parent_id=None,
+        start_ns=1_000_000_000,
+        end_ns=1_500_000_000,
+        **kwargs,
+    )
+
+
+def test_spans_are_written_as_json_lines(tmp_path):
+    path = tmp_path / "spans.jsonl"
+
+    FileExporter(str(path)).export([_get_span(), _get_span("synchronize")])
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["name"] for line in lines] == ["tick", "synchronize"]
+    assert json.loads(lines[0])["end_ns"] == 1_500_000_000
+
+
+def test_the_file_is_rotated_keeping_its_backups(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    line_size = len(json.dumps(_get_span().__dict__)) + 1
+    exporter = FileExporter(str(path), max_bytes=line_size, backups=1)
+
+    exporter.export([_get_span("first"), _get_span("second"), _get_span("third")])
+
+    assert sorted(file.name for file in tmp_path.iterdir()) == [
+        "spans.jsonl",
+        "spans.jsonl.1",
+    ]
+    assert json.loads(path.read_text(encoding="utf-8"))["name"] == "third"
+
+
+def test_spans_are_translated_to_otlp():
+    failed = _get_span(
+        "synchronize",
+        attributes={"port": 51413, "ratio": 0.5, "cached": False, "host": "gluetun"},
+        error="ValueError()",
+    )
+    failed.parent_id = "00f067aa0ba902b7"
+
+    payload = get_otlp_payload([_get_span(), failed])
+
+    resource_spans = payload["resourceSpans"][0]
+    assert resource_spans["resource"]["attributes"] == [
+        {"key": "service.name", "value": {"stringValue": SERVICE_NAME}}
+    ]
+    tick, synchronize = resource_spans["scopeSpans"][0]["spans"]
+    assert "parentSpanId" not in tick and "status" not in tick
+    assert tick["startTimeUnixNano"] == "1000000000"
+    assert synchronize["parentSpanId"] == "00f067aa0ba902b7"
+    assert synchronize["status"] == {"code": 2, "message": "ValueError()"}
+    assert synchronize["attributes"] == [
+        {"key": "port", "value": {"intValue": "51413"}},
+        {"key": "ratio", "value": {"doubleValue": 0.5}},
+        {"key": "cached", "value": {"boolValue": False}},
+        {"key": "host", "value": {"stringValue": "gluetun"}},
+    ]
+
+
+class _Collector(http.server.BaseHTTPRequestHandler):
+    """Stands in for an OpenTelemetry collector, keeping what it is sent."""
+
+    received: list[Any] = []
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        length = int(self.headers["Content-Length"])
+        self.received.append(json.loads(self.rfile.read(length)))
+        self.send_response(500 if self.path.endswith("/failing") else 200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    # pylint: disable-next=redefined-builtin
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+@pytest.fixture
+def collector_url() -> Iterator[str]:
+    _Collector.received = []
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Collector)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1/traces"
+    server.shutdown()
+    server.server_close()
+
+
+def test_spans_are_posted_to_the_collector(collector_url):
+    OtlpExporter(collector_url).export([_get_span()])
+
+    assert _Collector.received == [get_otlp_payload([_get_span()])]
+
+
+def test_a_collector_refusing_spans_fails_the_export(collector_url):
+    """For the exporting thread to log it."""
+    with pytest.raises(httpx.HTTPStatusError):
+        OtlpExporter(f"{collector_url}/failing").export([_get_span()])
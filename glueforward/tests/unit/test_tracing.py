@@ -0,0 +1,152 @@
+"""Unit tests for glueforward.main.tracing."""
+
+import asyncio
+import logging
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from glueforward.main import tracing
+from glueforward.main.tracing import (
+    MAX_QUEUED_SPANS,
+    end_span,
+    set_attribute,
+    span,
+    start_span,
+    traced,
+    traced_async,
+)
+
+
+def test_spans_nest_within_one_trace(traces):
+    with span("tick") as tick:
+        with span("synchronize", attempt=1):
+            set_attribute("port", 51413)
+        started = start_span("connect")
+        end_span(started)
+
+    child, connect, parent = traces()
+
+    assert tick is parent
+    assert parent.name == "tick" and parent.parent_id is None
+    assert child.attributes == {"attempt": 1, "port": 51413}
+    assert child.parent_id == connect.parent_id == parent.span_id
+    assert child.trace_id == connect.trace_id == parent.trace_id
+    assert parent.start_ns <= child.start_ns <= child.end_ns <= parent.end_ns
+
+
+def test_each_tick_is_a_trace_of_its_own(traces):
+    with span("tick"):
+        pass
+    with span("tick"):
+        pass
+
+    first, second = traces()
+
+    assert first.trace_id != second.trace_id
+
+
+def test_what_a_span_failed_on_is_recorded(traces):
+    with pytest.raises(ValueError), span("tick"):
+        raise ValueError("no port")
+    end_span(start_span("connect"), ConnectionError())
+
+    tick, connect = traces()
+
+    assert tick.error == "ValueError('no port')"
+    assert connect.error == "ConnectionError()"
+
+
+def test_nothing_is_recorded_while_tracing_is_off():
+    with span("tick") as tick:
+        set_attribute("port", 51413)
+        started = start_span("connect")
+        end_span(started)
+
+    assert tick is None and started is None
+    assert tracing.get_dropped() == 0
+
+
+def test_functions_are_traced_under_their_name(traces):
+    @traced("get")
+    def get(value: int) -> int:
+        return value
+
+    @traced_async("get_async")
+    async def get_async(value: int) -> int:
+        return value
+
+    assert get(1) == 1
+    assert asyncio.run(get_async(2)) == 2
+
+    assert [ended.name for ended in traces()] == ["get", "get_async"]
+    # Off, they are only called.
+    assert get(3) == 3
+    assert asyncio.run(get_async(4)) == 4
+
+
+def test_spans_beyond_the_queue_are_dropped_and_counted(monkeypatch):
+    # The thread exporting is never started, so the queue only fills; and
+    # tracing is turned off by hand, as closing would wait on that thread.
+    monkeypatch.setattr(tracing.threading.Thread, "start", MagicMock())
+    monkeypatch.setattr(tracing, "_processor", None)
+    tracing.enable([MagicMock()])
+
+    for _ in range(MAX_QUEUED_SPANS + 3):
+        with span("tick"):
+            pass
+
+    assert tracing.get_dropped() == 3
+
+
+def test_spans_are_exported_in_batches_of_at_most_the_batch_size(monkeypatch):
+    monkeypatch.setattr(tracing, "MAX_BATCH_SIZE", 2)
+    exporter = MagicMock()
+    # The thread exporting is only started once every span is queued.
+    stalled: list[threading.Thread] = []
+
+    def stall(thread: threading.Thread) -> None:
+        stalled.append(thread)
+
+    with monkeypatch.context() as patched:
+        patched.setattr(threading.Thread, "start", stall)
+        tracing.enable([exporter])
+    for _ in range(3):
+        end_span(start_span("connect"))
+    stalled[0].start()
+    tracing.disable()
+
+    batches = [len(call.args[0]) for call in exporter.export.call_args_list]
+    assert batches == [2, 1]
+
+
+def test_spans_ended_within_the_interval_are_exported_together(monkeypatch):
+    monkeypatch.setattr(tracing, "EXPORT_INTERVAL", 0.5)
+    exported = threading.Event()
+    exporter = MagicMock(export=MagicMock(side_effect=lambda _: exported.set()))
+    tracing.enable([exporter])
+
+    for _ in range(3):
+        end_span(start_span("connect"))
+        time.sleep(0.01)
+
+    # Exported as one batch, once the interval is over rather than on closing.
+    assert exported.wait(5)
+    tracing.disable()
+    batches = [len(call.args[0]) for call in exporter.export.call_args_list]
+    assert batches == [3]
+
+
+def test_an_exporter_failing_is_only_logged(caplog):
+    failing = MagicMock(export=MagicMock(side_effect=OSError("disk full")))
+    working = MagicMock()
+    tracing.enable([failing, working])
+    with span("tick"):
+        pass
+    tracing.disable()
+
+    assert "Could not export 1 spans: OSError('disk full')" in caplog.text
+    assert caplog.records[0].levelno == logging.WARNING
+    working.export.assert_called_once()
@@ -0,0 +1,620 @@
+"""Unit tests for glueforward.main.transport.
+
+Whether a connection, or a TLS session, was reused only shows on a real
+one, so these tests run against local servers keeping their connections
+alive, one of them over TLS with a self-signed certificate.
+"""
+
+# pytest resolves fixtures by parameter name, so the shadowing is deliberate.
+# pylint: disable=redefined-outer-name
+
+import asyncio
+import http.server
+import logging
+import socket
+import socketserver
+import ssl
+import threading
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+from httpcore._backends.anyio import AnyIOStream
+from httpcore._backends.sync import SyncStream
+
+from glueforward.main.clock import SystemClock
+from glueforward.main.deadline import TickDeadline
+from glueforward.main.limiter import HostLimiter
+from glueforward.main.recorder import FlightRecorder
+from glueforward.main.transport import (
+    Connections,
+    ConnectionSettings,
+    ConnectionStatistics,
+    get_host,
+)
+from glueforward.main.tls import TlsSettings
+from glueforward.main.tracing import span
+
+# Nothing listens there, so connecting to it is refused at once.
+UNREACHABLE_URL = "http://127.0.0.1:1"
+
+# Has a request answered late enough to time out on, at the same endpoint.
+SLOW_QUERY = "?slow"
+SLOW_LATENCY = 0.3
+
+# Self-signed for localhost and 127.0.0.1, valid for a century.
+CERTIFICATES = Path(__file__).parent / "certificates"
+CERT_FILE = str(CERTIFICATES / "cert.pem")
+KEY_FILE = str(CERTIFICATES / "key.pem")
+CERT_SHA256 = "55e390d49ff78be4d6c11cd3be1f0ad503af7afcc9374fe1715101fac9f04b80"
+
+
+class _KeepAliveHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        if self.path.endswith(SLOW_QUERY):
+            time.sleep(SLOW_LATENCY)
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_HEAD = do_GET  # pylint: disable=invalid-name
+
+    # pylint: disable-next=redefined-builtin
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def _serve(context: ssl.SSLContext | None = None) -> Iterator[str]:
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    server.daemon_threads = True
+    if context is not None:
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    yield f"{'http' if context is None else 'https'}://localhost:{port}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope="module")
+def url() -> Iterator[str]:
+    """Shared, since shutting one down waits out its polling interval."""
+    yield from _serve()
+
+
+@pytest.fixture(scope="module")
+def tls_url() -> Iterator[str]:
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(CERT_FILE, KEY_FILE)
+    yield from _serve(context)
+
+
+class _UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+@pytest.fixture(scope="module")
+def unix_url(tmp_path_factory) -> Iterator[str]:
+    path = tmp_path_factory.mktemp("sockets") / "service.sock"
+    server = _UnixHTTPServer(str(path), _KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"unix://{path}"
+    server.shutdown()
+    server.server_close()
+
+
+def _get_host(url: str) -> str:
+    return url.partition("://")[2]
+
+
+def _get_stream(session_reused: bool) -> MagicMock:
+    """What httpcore hands over once a TLS handshake is done."""
+    ssl_object = MagicMock(session_reused=session_reused)
+    return MagicMock(get_extra_info=MagicMock(return_value=ssl_object))
+
+
+def test_a_connection_is_reused_while_kept_alive(url):
+    connections = Connections()
+    client = connections.open_client(url)
+
+    client.get("/")
+    client.get("/")
+
+    statistics = connections.get_statistics()[_get_host(url)]
+    assert statistics.requests == 2
+    assert statistics.reused == 1
+    assert statistics.connections_opened == 1
+    assert statistics.connect_seconds > 0
+    assert statistics.get_reuse_ratio() == 0.5
+
+
+def test_a_tls_handshake_counts_as_setup_time_but_no_connection(clock):
+    """What httpcore reports of a connection to an HTTPS URL, step by step."""
+    connections = Connections(clock=clock)
+    # pylint: disable-next=protected-access
+    trace = connections._get_tracer("qbittorrent:443", is_prewarm=False)
+
+    for name, now, info in [
+        ("connection.connect_tcp.started", 0.0, {}),
+        ("connection.connect_tcp.complete", 0.25, {}),
+        ("connection.start_tls.started", 0.25, {}),
+        ("connection.start_tls.complete", 1.0, {"return_value": _get_stream(False)}),
+        ("http11.send_request_headers.started", 1.0, {}),
+    ]:
+        clock.now = now
+        trace(name, info)
+
+    assert connections.get_statistics()["qbittorrent:443"] == ConnectionStatistics(
+        requests=1,
+        reused=0,
+        connections_opened=1,
+        connect_seconds=1.0,
+        full_handshakes=1,
+    )
+
+
+def test_a_connection_expired_is_opened_again(url):
+    connections = Connections(ConnectionSettings(keepalive_expiry=0))
+    client = connections.open_client(url)
+
+    client.get("/")
+    client.get("/")
+
+    assert connections.get_statistics()[_get_host(url)].connections_opened == 2
+
+
+def test_no_request_means_no_reuse_ratio():
+    statistics = ConnectionStatistics(
+        requests=0, reused=0, connections_opened=0, connect_seconds=0.0
+    )
+
+    assert statistics.get_reuse_ratio() == 0.0
+
+
+def test_tcp_keepalive_is_asked_of_the_socket(url):
+    """A connection kept idle across ticks must not be dropped silently."""
+    client = Connections(ConnectionSettings(tcp_keepalive=True)).open_client(url)
+
+    with client.stream("GET", "/") as response:
+        sock = response.extensions["network_stream"].get_extra_info("socket")
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+
+
+def test_a_prewarmed_connection_is_found_open_by_the_next_request(url):
+    connections = Connections()
+    client = connections.open_client(url)
+
+    connections.prewarm()
+    client.get("/")
+
+    # The prewarm itself is not counted: only whether the request reused.
+    statistics = connections.get_statistics()[_get_host(url)]
+    assert (statistics.requests, statistics.reused) == (1, 1)
+    assert statistics.connections_opened == 1
+
+
+def test_a_prewarm_waits_its_turn_at_the_host_as_any_request(url):
+    limiter = HostLimiter(limit_per_host=1)
+    connections = Connections(limiter=limiter)
+    connections.open_client(url)
+    host = _get_host(url)
+
+    with limiter.slot(host):
+        thread = threading.Thread(target=connections.prewarm)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while limiter.get_statistics()[host].queue_depth < 1:
+            assert time.monotonic() < deadline, "the prewarm never queued up"
+            time.sleep(0.001)
+    thread.join()
+
+    assert limiter.get_statistics()[host].wait_count == 1
+
+
+def test_an_asyncio_prewarm_waits_its_turn_alike(url):
+    limiter = HostLimiter(limit_per_host=1)
+    connections = Connections(limiter=limiter)
+    connections.open_async_client(url)
+    host = _get_host(url)
+
+    async def scenario() -> int:
+        async with limiter.async_slot(host):
+            prewarm = asyncio.ensure_future(connections.prewarm_async())
+            while limiter.get_statistics()[host].queue_depth < 1:
+                await asyncio.sleep(0)
+        await prewarm
+        return limiter.get_statistics()[host].wait_count
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_a_prewarm_failing_is_only_logged(caplog):
+    connections = Connections()
+    connections.open_client(UNREACHABLE_URL)
+
+    with caplog.at_level(logging.DEBUG):
+        connections.prewarm()
+
+    assert "Could not prewarm" in caplog.text
+
+
+@pytest.fixture
+def silent_url() -> Iterator[str]:
+    """Where connections are taken, and then never answered."""
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        yield f"http://127.0.0.1:{listener.getsockname()[1]}"
+
+
+def test_a_prewarm_gives_up_once_the_tick_is_due(silent_url, caplog, asynchronous):
+    """Waiting on a service that is down would only hold the tick up."""
+    connections = Connections(ConnectionSettings(prewarm_lead=0.1))
+    started_at = time.monotonic()
+
+    with caplog.at_level(logging.DEBUG):
+        if asynchronous:
+            connections.open_async_client(silent_url, timeout=5)
+            asyncio.run(connections.prewarm_async())
+        else:
+            connections.open_client(silent_url, timeout=5)
+            connections.prewarm()
+
+    assert time.monotonic() - started_at < 1
+    assert "Could not prewarm" in caplog.text
+
+
+def test_a_prewarm_gives_up_its_place_in_line_once_the_tick_is_due(url, caplog):
+    limiter = HostLimiter(limit_per_host=1)
+    connections = Connections(ConnectionSettings(prewarm_lead=0.1), limiter=limiter)
+    connections.open_client(url)
+
+    with caplog.at_level(logging.DEBUG), limiter.slot(_get_host(url)):
+        connections.prewarm()
+
+    assert "Could not prewarm" in caplog.text
+    assert limiter.get_statistics()[_get_host(url)].queue_depth == 0
+
+
+def test_asyncio_clients_are_counted_and_prewarmed_alike(url):
+    connections = Connections()
+    client = connections.open_async_client(url)
+
+    async def scenario() -> None:
+        await connections.prewarm_async()
+        await client.get("/")
+        await client.get("/")
+
+    asyncio.run(scenario())
+
+    statistics = connections.get_statistics()[_get_host(url)]
+    assert (statistics.requests, statistics.reused) == (2, 2)
+
+
+def test_an_asyncio_prewarm_failing_is_only_logged(caplog):
+    connections = Connections()
+    connections.open_async_client(UNREACHABLE_URL)
+
+    with caplog.at_level(logging.DEBUG):
+        asyncio.run(connections.prewarm_async())
+
+    assert "Could not prewarm" in caplog.text
+
+
+def test_a_client_closed_here_is_no_longer_prewarmed(caplog):
+    connections = Connections()
+    client = connections.open_client(UNREACHABLE_URL)
+    async_client = connections.open_async_client(UNREACHABLE_URL)
+
+    connections.close_client(client)
+    asyncio.run(connections.close_async_client(async_client))
+    with caplog.at_level(logging.DEBUG):
+        connections.prewarm()
+        asyncio.run(connections.prewarm_async())
+
+    assert client.is_closed and async_client.is_closed
+    assert "Could not prewarm" not in caplog.text
+
+
+def test_the_prewarm_lead_is_the_settings_one():
+    connections = Connections(ConnectionSettings(prewarm_lead=5))
+
+    assert connections.get_prewarm_lead() == 5
+
+
+def test_a_request_without_a_server_counts_nothing():
+    """A connection never opened has no setup time to count."""
+    connections = Connections()
+    client = connections.open_client(UNREACHABLE_URL)
+
+    with pytest.raises(httpx.ConnectError):
+        client.get("/")
+
+    assert not connections.get_statistics()
+
+
+def test_a_tls_session_is_resumed_by_the_next_connection(tls_url):
+    """Every connection expires at once, so each request opens its own."""
+    connections = Connections(ConnectionSettings(keepalive_expiry=0))
+    client = connections.open_client(tls_url, tls=TlsSettings(ca_file=CERT_FILE))
+
+    for _ in range(3):
+        client.get("/")
+
+    statistics = connections.get_statistics()[_get_host(tls_url)]
+    assert statistics.connections_opened == 3
+    assert (statistics.full_handshakes, statistics.resumed_handshakes) == (1, 2)
+
+
+def test_a_tls_session_is_resumed_on_asyncio_too(tls_url):
+    connections = Connections(ConnectionSettings(keepalive_expiry=0))
+    client = connections.open_async_client(
+        tls_url, tls=TlsSettings(ca_file=CERT_FILE)
+    )
+
+    async def scenario() -> None:
+        for _ in range(3):
+            await client.get("/")
+
+    asyncio.run(scenario())
+
+    statistics = connections.get_statistics()[_get_host(tls_url)]
+    assert (statistics.full_handshakes, statistics.resumed_handshakes) == (1, 2)
+
+
+def test_clients_trusting_alike_resume_each_other_sessions(tls_url):
+    connections = Connections()
+    tls = TlsSettings(ca_file=CERT_FILE)
+
+    connections.open_client(tls_url, tls=tls).get("/")
+    connections.open_client(tls_url, tls=tls).get("/")
+
+    statistics = connections.get_statistics()[_get_host(tls_url)]
+    assert (statistics.full_handshakes, statistics.resumed_handshakes) == (1, 1)
+
+
+def test_no_session_is_kept_before_the_server_hands_one_over():
+    """TLS 1.3 hands a session over after the handshake, maybe not yet."""
+    ssl_object = MagicMock(session=None)
+    stream = MagicMock(get_extra_info=MagicMock(return_value=ssl_object))
+    response = MagicMock(extensions={"network_stream": stream})
+
+    Connections().open_client(UNREACHABLE_URL).event_hooks["response"][0](response)
+
+    ssl_object.context.keep_session.assert_not_called()
+
+
+def test_a_self_signed_certificate_is_refused_by_default(tls_url):
+    client = Connections().open_client(tls_url)
+
+    with pytest.raises(httpx.ConnectError):
+        client.get("/")
+
+
+def test_the_pinned_certificate_is_accepted_alone(tls_url):
+    tls = TlsSettings(pinned_sha256=CERT_SHA256)
+    client = Connections().open_client(tls_url, tls=tls)
+
+    assert client.get("/").status_code == 200
+
+
+def test_another_certificate_than_the_pinned_one_is_refused(tls_url, caplog):
+    tls = TlsSettings(ca_file=CERT_FILE, pinned_sha256="0" * 64)
+    client = Connections().open_client(tls_url, tls=tls)
+
+    with pytest.raises(httpx.ConnectError, match="pinned"):
+        client.get("/")
+
+    assert CERT_SHA256 in caplog.text
+
+
+def test_a_connection_refused_on_its_certificate_is_closed(
+    monkeypatch, tls_url, asynchronous
+):
+    closed: list[Any] = []
+    close, aclose = SyncStream.close, AnyIOStream.aclose
+
+    def spy_close(stream: SyncStream) -> None:
+        closed.append(stream)
+        close(stream)
+
+    async def spy_aclose(stream: AnyIOStream) -> None:
+        closed.append(stream)
+        await aclose(stream)
+
+    monkeypatch.setattr(SyncStream, "close", spy_close)
+    monkeypatch.setattr(AnyIOStream, "aclose", spy_aclose)
+    tls = TlsSettings(ca_file=CERT_FILE, pinned_sha256="0" * 64)
+
+    with pytest.raises(httpx.ConnectError, match="pinned"):
+        if asynchronous:
+            client = Connections().open_async_client(tls_url, tls=tls)
+            asyncio.run(client.get("/"))
+        else:
+            Connections().open_client(tls_url, tls=tls).get("/")
+
+    assert len(closed) == 1
+
+
+@pytest.mark.parametrize(
+    "url, host",
+    [
+        ("http://gluetun:8000/", "gluetun:8000"),
+        ("https://qbittorrent", "qbittorrent"),
+        ("unix:///run/gluetun/control.sock", "/run/gluetun/control.sock"),
+    ],
+)
+def test_the_host_is_the_address_or_the_socket(url, host):
+    assert get_host(url) == host
+
+
+def test_a_unix_socket_is_reached_and_counted_by_its_path(unix_url):
+    # TCP keep-alive has no meaning for a socket, and is not asked of it.
+    connections = Connections(ConnectionSettings(tcp_keepalive=True))
+    client = connections.open_client(unix_url)
+
+    connections.prewarm()
+    assert client.get("/").status_code == 200
+
+    statistics = connections.get_statistics()[get_host(unix_url)]
+    assert (statistics.requests, statistics.reused) == (1, 1)
+    assert statistics.connections_opened == 1
+
+
+def test_a_unix_socket_is_reached_on_asyncio_too(unix_url):
+    connections = Connections()
+    client = connections.open_async_client(unix_url)
+
+    async def scenario() -> int:
+        await connections.prewarm_async()
+        return (await client.get("/")).status_code
+
+    assert asyncio.run(scenario()) == 200
+    assert connections.get_statistics()[get_host(unix_url)].reused == 1
+
+
+def test_a_missing_socket_fails_to_connect(tmp_path):
+    client = Connections().open_client(f"unix://{tmp_path}/missing.sock")
+
+    with pytest.raises(httpx.ConnectError):
+        client.get("/")
+
+
+def test_a_request_is_timed_out_after_the_service_timeout(url):
+    client = Connections().open_client(url, timeout=SLOW_LATENCY / 3)
+
+    with pytest.raises(httpx.ReadTimeout):
+        client.get(f"/{SLOW_QUERY}")
+
+
+def _get_adaptive_connections() -> Connections:
+    """Timing requests out after their latency alone, however short."""
+    return Connections(
+        ConnectionSettings(
+            adaptive_timeouts=True,
+            timeout_multiplier=1,
+            timeout_floor=SLOW_LATENCY / 3,
+            timeout_ceiling=60,
+        )
+    )
+
+
+def test_an_endpoint_is_timed_out_after_its_latency(url):
+    connections = _get_adaptive_connections()
+    client = connections.open_client(url)
+    for _ in range(20):
+        client.get("/")
+
+    with pytest.raises(httpx.ReadTimeout):
+        client.get(f"/{SLOW_QUERY}")
+
+    # Timing out counted as taking the whole timeout.
+    statistics = connections.get_latency_statistics()[f"{_get_host(url)}/"]
+    assert statistics.samples == 21
+    assert statistics.p99 == SLOW_LATENCY / 3
+
+
+def test_an_endpoint_is_timed_out_after_its_latency_on_asyncio(url):
+    connections = _get_adaptive_connections()
+    client = connections.open_async_client(url)
+
+    async def scenario() -> None:
+        for _ in range(20):
+            await client.get("/")
+        await client.get(f"/{SLOW_QUERY}")
+
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(scenario())
+
+
+def test_latencies_are_only_followed_for_adaptive_timeouts(url):
+    connections = Connections()
+    connections.open_client(url).get("/")
+
+    assert not connections.get_latency_statistics()
+
+
+def test_a_request_is_timed_out_when_the_tick_runs_out(url):
+    """Its endpoint's latency is none the longer for it."""
+    connections = _get_adaptive_connections()
+    client = connections.open_client(url)
+    for _ in range(20):
+        client.get("/")
+
+    with TickDeadline(SLOW_LATENCY / 6, SystemClock()).enforce():
+        with pytest.raises(httpx.ReadTimeout):
+            client.get(f"/{SLOW_QUERY}")
+
+    assert connections.get_latency_statistics()[f"{_get_host(url)}/"].samples == 20
+
+
+def test_no_request_is_sent_once_the_tick_has_run_out(url, clock, asynchronous):
+    connections = Connections()
+
+    with TickDeadline(0, clock).enforce():
+        with pytest.raises(httpx.TimeoutException, match="deadline"):
+            if asynchronous:
+                asyncio.run(connections.open_async_client(url).get("/"))
+            else:
+                connections.open_client(url).get("/")
+
+    assert not connections.get_statistics()
+
+
+def test_each_phase_of_a_request_is_a_span(url, traces, asynchronous):
+    connections = Connections()
+
+    with span("request"):
+        if asynchronous:
+            asyncio.run(connections.open_async_client(url).get("/"))
+        else:
+            connections.open_client(url).get("/")
+
+    *phases, request = traces()
+    assert request.attributes == {"http.status_code": 200}
+    assert {phase.parent_id for phase in phases} == {request.span_id}
+    assert {"connection.connect_tcp", "http11.send_request_headers"} <= {
+        phase.name.removeprefix("async_") for phase in phases
+    }
+
+
+def test_the_phase_a_request_failed_in_is_a_span_that_failed(traces):
+    with pytest.raises(httpx.ConnectError):
+        Connections().open_client(UNREACHABLE_URL).get("/")
+
+    *_, connect = traces()
+    assert connect.name == "connection.connect_tcp"
+    assert connect.error is not None and "ConnectError" in connect.error
+
+
+def test_requests_are_recorded_when_given_a_recorder(url, asynchronous):
+    recorder = FlightRecorder(1)
+    connections = Connections(recorder=recorder)
+
+    if asynchronous:
+        asyncio.run(connections.open_async_client(url).get("/v1/portforward"))
+    else:
+        connections.open_client(url).get("/v1/portforward")
+
+    (exchange,) = recorder.get_exchanges()
+    assert exchange.endpoint == f"{_get_host(url)}/v1/portforward"
+    assert exchange.status == 200
+
+
+def test_closing_a_client_closes_its_pool(monkeypatch, url):
+    close, aclose = MagicMock(), AsyncMock()
+    monkeypatch.setattr(httpx.HTTPTransport, "close", close)
+    monkeypatch.setattr(httpx.AsyncHTTPTransport, "aclose", aclose)
+    connections = Connections()
+
+    connections.open_client(url).close()
+    asyncio.run(connections.open_async_client(url).aclose())
+
+    close.assert_called_once()
+    aclose.assert_awaited_once()